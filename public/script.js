@@ -193,6 +193,10 @@ window.addEventListener("DOMContentLoaded", () => {
     if (saveActiveButton) saveActiveButton.addEventListener('click', saveActiveCreativeOutput);
     if (copyActiveButton) copyActiveButton.addEventListener('click', copyActiveCreativeOutput);
     if (clearActiveButton) clearActiveButton.addEventListener('click', clearActiveCreativeOutput);
+    const runActiveButton = document.getElementById('run-active-creative');
+    const stopActiveButton = document.getElementById('stop-active-creative');
+    if (runActiveButton) runActiveButton.addEventListener('click', runActiveCreativeOutput);
+    if (stopActiveButton) stopActiveButton.addEventListener('click', stopActiveCreativeRun);
     // The clearAllCreativeOutputs function is still available but not tied to a button in this structure
 
 
@@ -1499,12 +1503,7 @@ function displayCreativeOutput(index) {
                     // Attempt to detect language based on content or type
                     let language = 'plaintext'; // Default
                     if (output.type === 'code') {
-                       // Simple attempt to guess language based on content
-                       // Corrected 'or' to '||'
-                       if (output.content.includes('def ') || output.content.includes('import ')) language = 'python';
-                       else if (output.content.includes('<html') || output.content.includes('<body')) language = 'html';
-                       else if (output.content.includes('function ') || output.content.includes('console.log')) language = 'javascript';
-                       // Add more language detections as needed
+                       language = guessCodeLanguage(output.content);
                     }
                     console.log(`Applying syntax highlighting with language: ${language}`);
                     // Set the language class on the code element before highlighting
@@ -1545,6 +1544,15 @@ function displayCreativeOutput(index) {
     }
 }
 
+// Simple attempt to guess a code output's language based on its content
+function guessCodeLanguage(content) {
+    if (content.includes('def ') || content.includes('import ')) return 'python';
+    if (content.includes('<html') || content.includes('<body')) return 'html';
+    if (content.includes('function ') || content.includes('console.log')) return 'javascript';
+    // Add more language detections as needed
+    return 'plaintext';
+}
+
 // Handler for when the creative output dropdown selection changes
 function handleCreativeOutputSelectChange() {
     const selectElement = document.getElementById('creative-output-select');
@@ -1644,6 +1652,138 @@ function clearActiveCreativeOutput() {
     }
 }
 
+// --- Streamed Execution of Code Outputs ---
+// Runs the active code output through /execute_code/stream and appends stdout/stderr
+// to #creative-run-output as Server-Sent Events arrive. EventSource only supports GET,
+// so the stream is read with fetch() and parsed here.
+let activeRunId = null; // run_id of the streamed run in progress
+let activeRunController = null; // AbortController for the streaming fetch
+
+function appendRunOutput(text, className) {
+    const runOutput = document.getElementById('creative-run-output');
+    if (!runOutput) return;
+    const span = document.createElement('span');
+    if (className) span.classList.add(className);
+    span.textContent = text;
+    runOutput.appendChild(span);
+    runOutput.scrollTop = runOutput.scrollHeight;
+}
+
+function setRunButtonsState(running) {
+    const runActiveButton = document.getElementById('run-active-creative');
+    const stopActiveButton = document.getElementById('stop-active-creative');
+    if (runActiveButton) runActiveButton.disabled = running;
+    if (stopActiveButton) stopActiveButton.disabled = !running;
+}
+
+function handleRunEvent(event) {
+    switch (event.event) {
+        case 'start':
+            activeRunId = event.run_id;
+            break;
+        case 'stdout':
+            appendRunOutput(event.data);
+            break;
+        case 'stderr':
+            appendRunOutput(event.data, 'stream-stderr');
+            break;
+        case 'truncated':
+            appendRunOutput(event.data, 'stream-truncated');
+            break;
+        case 'exit': {
+            let status = `\n[exit code ${event.return_code} after ${event.wall_time}s`;
+            if (event.cancelled) status += ', cancelled';
+            if (event.timed_out) status += ', timed out';
+            appendRunOutput(status + ']\n', 'stream-status');
+            if (event.return_code !== 0) triggerOrbAnimation(true);
+            break;
+        }
+    }
+}
+
+async function runActiveCreativeOutput() {
+    if (currentCreativeOutputIndex === -1 || creativeOutputs.length <= currentCreativeOutputIndex) {
+        alert("No creative output is currently displayed to run.");
+        return;
+    }
+    const activeOutput = creativeOutputs[currentCreativeOutputIndex];
+    const language = guessCodeLanguage(activeOutput.content);
+    if (activeOutput.type !== 'code' || !['python', 'javascript'].includes(language)) {
+        alert("Only Python and JavaScript code outputs can be run.");
+        return;
+    }
+
+    const runOutput = document.getElementById('creative-run-output');
+    if (runOutput) {
+        runOutput.innerHTML = '';
+        runOutput.style.display = 'block';
+    }
+    setRunButtonsState(true);
+    activeRunController = new AbortController();
+
+    try {
+        const response = await fetch(`${API_BASE_URL}/execute_code/stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ code: activeOutput.content, language: language }),
+            signal: activeRunController.signal
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        if (!(response.headers.get('content-type') || '').startsWith('text/event-stream')) {
+            // The run never started (e.g. missing interpreter) - the backend sent a plain result
+            const result = await response.json();
+            appendRunOutput(result.error || result.content || JSON.stringify(result), 'stream-stderr');
+            return;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            // Events are separated by a blank line; keep any partial event in the buffer
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLines = rawEvent.split('\n').filter(line => line.startsWith('data:'));
+                if (dataLines.length === 0) continue; // keep-alive comment
+                handleRunEvent(JSON.parse(dataLines.map(line => line.slice(5).trim()).join('\n')));
+            }
+        }
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error("Error during streamed execution:", error);
+            appendRunOutput(`\n[stream error: ${error.message}]\n`, 'stream-stderr');
+            triggerOrbAnimation(true);
+        }
+    } finally {
+        activeRunId = null;
+        activeRunController = null;
+        setRunButtonsState(false);
+    }
+}
+
+async function stopActiveCreativeRun() {
+    if (!activeRunId) {
+        // Nothing registered yet - dropping the connection also makes the backend kill the run
+        if (activeRunController) activeRunController.abort();
+        return;
+    }
+    try {
+        // The stream stays open and ends with an 'exit' event marked cancelled
+        await fetch(`${API_BASE_URL}/execute_code/cancel/${encodeURIComponent(activeRunId)}`, { method: 'POST' });
+    } catch (error) {
+        console.error("Error cancelling run:", error);
+        if (activeRunController) activeRunController.abort();
+    }
+}
+
+
 // Clear All Creative Outputs Function
 // This function is still available but not tied to a button in the current HTML structure
 function clearAllCreativeOutputs() {
@@ -1772,45 +1912,30 @@ function stopResize() {
 
 // --- Document Attachment Functions ---
 
-// Handles the file selection and reads the file content
+// Handles the file selection; the File itself is uploaded, so it is never read into memory here
 function handleDocumentSelection(event) {
     const file = event.target.files[0]; // Get the selected file
 
     if (file) {
-        const reader = new FileReader();
-
-        reader.onload = (e) => {
-            const fileContent = e.target.result;
-            const fileName = file.name;
+        console.log(`File selected: ${file.name} (${file.size} bytes)`);
 
-            console.log(`File selected: ${fileName}`);
-            console.log(`File content (first 100 chars): ${fileContent.substring(0, 100)}...`);
+        // Send the file to the backend
+        uploadDocumentToBackend(file);
 
-            // Send the file content to the backend
-            uploadDocumentToBackend(fileName, fileContent);
-
-            // Clear the file input so the same file can be selected again
-            event.target.value = '';
-        };
-
-        reader.onerror = (e) => {
-            console.error("Error reading file:", e);
-            alert("Error reading file. Please try again.");
-        };
-
-        // Read the file as text
-        reader.readAsText(file);
+        // Clear the file input so the same file can be selected again
+        event.target.value = '';
     }
 }
 
-// Sends the document content to the backend
-async function uploadDocumentToBackend(fileName, fileContent) {
+// Streams the document to the backend as the raw request body
+async function uploadDocumentToBackend(file) {
+    const fileName = file.name;
     console.log(`Uploading document '${fileName}' to backend...`);
     try {
-        const response = await fetch(`${API_BASE_URL}/upload_document`, {
+        const response = await fetch(`${API_BASE_URL}/upload_document/stream?file_name=${encodeURIComponent(fileName)}`, {
             method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ fileName: fileName, fileContent: fileContent })
+            headers: { "Content-Type": "application/octet-stream" },
+            body: file
         });
 
         if (!response.ok) {
@@ -1822,6 +1947,9 @@ async function uploadDocumentToBackend(fileName, fileContent) {
 
         const responseData = await response.json();
         console.log("Document upload response:", responseData);
+        if (responseData.upload) {
+            console.log(`Document ingest: ${responseData.upload.bytes} bytes, received at ${responseData.upload.receive_mb_per_s} MB/s, processed at ${responseData.upload.process_mb_per_s} MB/s`);
+        }
 
         // Display the backend's confirmation message in the chat
         if (responseData.type === 'text' && responseData.content) {
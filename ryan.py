@@ -1,14 +1,25 @@
 from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 import time
 import logging
 import traceback
 import json
-from typing import Optional, Dict, Any, List
+import threading
+from typing import Optional, Dict, Any, List, Literal
 import os
 from datetime import datetime, timedelta
+from ryan_exec_scheduler import get_execution_scheduler
+from ryan_exec_cache import get_exec_cache
+from ryan_exec_stream import STREAM_MAX_SECONDS
+from ryan_sessions import SESSION_MAX_CELL_TIMEOUT
+from ryan_compile import get_compile_cache
+from ryan_static_check import get_precheck_stats
+from ryan_project import decode_archive, ProjectError
+from ryan_upload import spool_upload, UploadTooLarge, UPLOAD_MAX_BYTES
+from ryan_doc_index import DOC_RETRIEVAL_K
 try:
     from firebase_admin import firestore
 except ImportError:
@@ -87,23 +98,100 @@ class UsageStats(BaseModel):
 class CodeExecutionRequest(BaseModel):
     code: str
     language: str
+    warm: Optional[bool] = None # Use the pre-forked worker pool (None = server default)
+    stdin: Optional[str] = None # Fed to the program's standard input
+    cache: Optional[bool] = None # Reuse results of identical deterministic runs (None = RYAN_EXEC_CACHE)
+    deterministic: bool = False # Caller vouches the snippet's output depends only on code + stdin
+    profile: bool = False # Run under cProfile/tracemalloc (Python) or V8's profiler (JavaScript)
+    benchmark: bool = False # Time the snippet (median/IQR/ops per sec) instead of running it once
+    compare_code: Optional[str] = None # Benchmark against this alternative (implies benchmark)
+    setup_code: Optional[str] = None # Untimed benchmark setup (imports, test data)
+
+class CodeStreamRequest(BaseModel):
+    code: str
+    language: str
+    timeout: Optional[float] = Field(None, gt=0, le=STREAM_MAX_SECONDS) # Seconds before the run is killed (None = RYAN_STREAM_TIMEOUT)
+
+class TestCase(BaseModel):
+    stdin: Optional[str] = None
+    args: Optional[List[str]] = None
+    expected: Optional[str] = None # Expected stdout (None = only the return code is checked)
+    expected_return_code: int = 0
+    name: Optional[str] = None
+
+class CodeTestRequest(BaseModel):
+    code: str
+    language: str
+    cases: List[TestCase]
+    warm: bool = True # Run Python/JavaScript cases in the warm worker pool
+    compare: str = "strip" # 'exact', 'strip' (ignore trailing whitespace) or 'tokens'
+    timeout: Optional[float] = None # Per case, seconds (None = RYAN_TEST_CASE_TIMEOUT)
+
+class SessionCreateRequest(BaseModel):
+    language: str = "python"
+
+class SessionExecuteRequest(BaseModel):
+    code: str
+    stdin: Optional[str] = None # Python sessions only
+    timeout: Optional[float] = Field(None, gt=0, le=SESSION_MAX_CELL_TIMEOUT) # Seconds before the cell is interrupted (None = RYAN_SESSION_CELL_TIMEOUT)
+
+class NotebookRunRequest(BaseModel):
+    cells: List[str] # Python source of each cell, in order
+    session_id: Optional[str] = None # Session from the previous run of this notebook (None = new session)
+    timeout: Optional[float] = Field(None, gt=0, le=SESSION_MAX_CELL_TIMEOUT) # Per cell, seconds
 
 class CodeDebugRequest(BaseModel):
     code: str
     error_output: str
     language: str
     context: Optional[str] = None
+    test_cases: Optional[List[TestCase]] = None # Run the suggested code against these
 
 class CodeFixRequest(BaseModel):
     original_code: str
     suggested_fix: str
     language: str
     context: Optional[str] = None
+    test_cases: Optional[List[TestCase]] = None # Run the fixed code against these
+    mode: Literal["full", "diff"] = "full" # 'diff': the model returns edits that are applied locally (falls back to 'full')
+
+class AutoFixRequest(BaseModel):
+    code: str
+    language: str
+    max_iterations: Optional[int] = None # Debug/fix rounds before giving up (None = RYAN_AUTO_FIX_MAX_ITERATIONS)
+    test_cases: Optional[List[TestCase]] = None # Success = all cases pass (default: the code exits with 0)
+    stream: bool = True # Server-Sent Events progress; False answers once with the final state
+    fix_mode: Literal["full", "diff"] = "full" # fix_code mode for suggestions without code: 'full' or 'diff'
 
 class CodeAnalysisRequest(BaseModel):
     code: str
     task_description: Optional[str] = None
     context: Optional[str] = None
+    language: Optional[str] = None
+    profile: bool = False # Profile a run first and give the model the hot spots
+    chunked: Optional[bool] = None # Map-reduce over chunks; None = automatic for large files
+
+class BatchAnalysisItem(BaseModel):
+    code: str
+    task_description: Optional[str] = None
+    context: Optional[str] = None
+    language: Optional[str] = None
+    chunked: Optional[bool] = None
+    id: Optional[str] = None # Echoed back with the item's result
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[BatchAnalysisItem]
+    max_concurrency: Optional[int] = None # Model calls in flight (capped at RYAN_ANALYSIS_BATCH_CONCURRENCY)
+    stream: bool = False # NDJSON, one line per item as it completes, then a summary line
+
+class ProjectAnalyzeRequest(BaseModel):
+    name: Optional[str] = None # Project id for re-submissions (required for archives; default for a path: derived from it)
+    path: Optional[str] = None # Directory (or archive file) on the server, under RYAN_PROJECT_ROOT
+    archive_base64: Optional[str] = None # zip or tar(.gz) archive of the project
+    archive_name: Optional[str] = None
+
+class ProjectQuestionRequest(BaseModel):
+    question: str
 
 # --- Existing Chat Endpoint ---
 @app.post("/chat")
@@ -116,7 +204,7 @@ async def chat(message: Message):
          return JSONResponse(content={"type": "error", "content": "AI backend is not available."}, status_code=500)
 
     try:
-        response_dict = ryan.chatbot(message.message, creative_context=message.creative_context)
+        response_dict = await run_in_threadpool(ryan.chatbot, message.message, creative_context=message.creative_context)
         logging.info(f"Generated response (type: {response_dict.get('type', 'unknown')}): {str(response_dict.get('content', 'No content'))[:100]}...")
         return JSONResponse(content=response_dict)
     except Exception as e:
@@ -142,6 +230,164 @@ async def upload_document(document: DocumentUpload):
         logging.error(traceback.format_exc())
         return JSONResponse(content={"type": "error", "content": f"Error processing document: {str(e)}"}, status_code=500)
 
+@app.post("/upload_document/stream")
+async def upload_document_stream(request: Request, file_name: str = Query(...)):
+    """
+    Streaming upload: the request body is the raw file (any Content-Type, chunked or not), spooled to disk
+    as it arrives and parsed incrementally (see ryan_upload.py). The response includes MB/s figures under "upload".
+    """
+    logging.info(f"Received streaming document upload: {file_name}")
+    if ryan is None or not hasattr(ryan, 'process_document_file'):
+         return JSONResponse(content={"type": "error", "content": "Document processing is not available."}, status_code=500)
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES:
+        return JSONResponse(content={"type": "error", "content": f"The upload is larger than the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB limit."}, status_code=413)
+    try:
+        upload = await spool_upload(os.path.basename(file_name), request.stream())
+    except UploadTooLarge as e:
+        return JSONResponse(content={"type": "error", "content": str(e)}, status_code=413)
+    try:
+        result = await run_in_threadpool(ryan.process_document_file, upload)
+        return JSONResponse(content=result, status_code=400 if result.get("type") == "error" else 200)
+    except Exception as e:
+        logging.error(f"Error processing streamed upload '{file_name}': {e}")
+        logging.error(traceback.format_exc())
+        return JSONResponse(content={"type": "error", "content": f"Error processing document: {str(e)}"}, status_code=500)
+    finally:
+        upload.remove()
+
+@app.get("/documents")
+async def list_documents_endpoint():
+    """Uploaded documents in the retrieval index."""
+    if ryan is None or not hasattr(ryan, 'list_documents'):
+         return JSONResponse(content={"type": "error", "content": "Document index is not available."}, status_code=500)
+    return JSONResponse(content=await run_in_threadpool(ryan.list_documents))
+
+
+@app.get("/documents/search")
+async def search_documents_endpoint(q: str = Query(..., min_length=1), k: int = Query(DOC_RETRIEVAL_K, ge=1, le=50),
+                                    doc_id: Optional[List[str]] = Query(None)):
+    """Top-k relevant chunks of the uploaded documents (optionally only from the given doc_id values)."""
+    if ryan is None or not hasattr(ryan, 'search_documents'):
+         return JSONResponse(content={"type": "error", "content": "Document index is not available."}, status_code=500)
+    result = await run_in_threadpool(ryan.search_documents, q, k, doc_id)
+    return JSONResponse(content=result, status_code=500 if result.get("type") == "error" else 200)
+
+
+@app.post("/documents/ingest")
+async def ingest_documents_endpoint(http_request: Request, ingest_id: str = Query(..., min_length=1), path: Optional[str] = Query(None),
+                                   analyze: bool = Query(False), stream: bool = Query(False)):
+    """
+    Ingests a whole zip/tar archive (the raw request body) or a server-side folder under RYAN_INGEST_ROOT (path) as "<ingest_id>/<file>"
+    documents, preparing files in parallel worker processes. Re-ingesting the same ingest_id skips unchanged
+    files and removes missing ones. With stream=true, progress is NDJSON: {"event": "file", ...} per file,
+    then {"event": "done", "summary"} (see ryan_ingest.py).
+    """
+    logging.info(f"Received ingest request '{ingest_id}' ({'folder ' + path if path else 'archive upload'}).")
+    if ryan is None or not hasattr(ryan, 'start_ingest'):
+         return JSONResponse(content={"type": "error", "content": "Document ingestion is not available."}, status_code=500)
+    upload = None
+    if not path:
+        declared = http_request.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES:
+            return JSONResponse(content={"type": "error", "content": f"The upload is larger than the {UPLOAD_MAX_BYTES // (1024 * 1024)} MB limit."}, status_code=413)
+        try:
+            upload = await spool_upload(f"{ingest_id}.archive", http_request.stream())
+        except UploadTooLarge as e:
+            return JSONResponse(content={"type": "error", "content": str(e)}, status_code=413)
+    started = ryan.start_ingest(path or upload.path, ingest_id, analyze=analyze, uploaded=upload is not None)
+    if started.get("type") != "ingest_started":
+        if upload:
+            upload.remove()
+        return JSONResponse(content=started, status_code=400)
+    run = started["run"]
+
+    def run_and_clean_up() -> Dict[str, Any]:
+        try:
+            return ryan.run_ingest(run)
+        finally:
+            if upload:
+                upload.remove()
+
+    if not stream:
+        result = await run_in_threadpool(run_and_clean_up)
+        return JSONResponse(content=result, status_code=400 if result.get("type") == "error" else 200)
+
+    runner = threading.Thread(target=run_and_clean_up, name="ryan-ingest-runner", daemon=True)
+    runner.start()
+
+    async def lines():
+        while True:
+            event = await run_in_threadpool(run.next_event, 1.0)
+            if event is None:
+                if await http_request.is_disconnected():
+                    logging.info("Client disconnected from a streamed ingest, stopping after the files in progress.")
+                    run.cancel()
+                    break
+                continue
+            yield json.dumps(event) + "\n"
+            if event["event"] == "done":
+                break
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/symbols/lookup")
+async def symbol_lookup_endpoint(name: str = Query(..., min_length=1), calls_only: bool = Query(False)):
+    """
+    Definitions (with signature and docstring), references, callers and imports of a name across the uploaded
+    and ingested Python/JavaScript files. Answered from the symbol index, without a model call.
+    """
+    if ryan is None or not hasattr(ryan, 'lookup_symbol'):
+         return JSONResponse(content={"type": "error", "content": "Symbol index is not available."}, status_code=500)
+    result = await run_in_threadpool(ryan.lookup_symbol, name, calls_only)
+    return JSONResponse(content=result, status_code=500 if result.get("type") == "error" else 200)
+
+
+@app.get("/symbols/outline")
+async def symbol_outline_endpoint(file_name: str = Query(..., min_length=1)):
+    """The definitions and imports of one indexed file, in line order."""
+    if ryan is None or not hasattr(ryan, 'symbol_outline'):
+         return JSONResponse(content={"type": "error", "content": "Symbol index is not available."}, status_code=500)
+    result = await run_in_threadpool(ryan.symbol_outline, file_name)
+    return JSONResponse(content=result, status_code=404 if result.get("type") == "error" else 200)
+
+
+@app.get("/documents/storage")
+async def document_storage_endpoint():
+    """Blob store totals: logical bytes uploaded against bytes stored after deduplication and compression."""
+    if ryan is None or not hasattr(ryan, 'get_storage_stats'):
+         return JSONResponse(content={"type": "error", "content": "Document storage is not available."}, status_code=500)
+    return JSONResponse(content=await run_in_threadpool(ryan.get_storage_stats))
+
+
+@app.get("/documents/{doc_id}/content")
+async def document_content_endpoint(doc_id: str, offset: int = Query(0, ge=0), length: Optional[int] = Query(None, ge=0)):
+    """
+    Raw bytes of an uploaded document, or of the range [offset, offset + length). Only the stored chunks that
+    overlap the range are decompressed; the X-Ryan-* headers report how many and the decode MB/s.
+    """
+    if ryan is None or not hasattr(ryan, 'read_document_content'):
+         return JSONResponse(content={"type": "error", "content": "Document storage is not available."}, status_code=500)
+    result = await run_in_threadpool(ryan.read_document_content, doc_id, offset, length)
+    if result.get("type") == "error":
+        return JSONResponse(content=result, status_code=404)
+    read = result["read"]
+    headers = {
+        "X-Ryan-Size": str(read["size"]),
+        "X-Ryan-Chunks-Decoded": f"{read['chunks_decoded']}/{read['chunks_total']}",
+        "X-Ryan-Decode-MBps": str(read["decode_mb_per_s"]),
+    }
+    return Response(content=result["data"], media_type="application/octet-stream", headers=headers)
+
+
+@app.delete("/documents/{doc_id}")
+async def delete_document_endpoint(doc_id: str):
+    if ryan is None or not hasattr(ryan, 'delete_document'):
+         return JSONResponse(content={"type": "error", "content": "Document index is not available."}, status_code=500)
+    result = await run_in_threadpool(ryan.delete_document, doc_id)
+    return JSONResponse(content=result, status_code=404 if result.get("type") == "error" else 200)
+
 # --- Existing Logs Endpoint ---
 @app.get("/logs")
 async def get_logs(limit: int = Query(50, ge=1), offset: int = Query(0, ge=0)):
@@ -311,9 +557,16 @@ async def execute_code_endpoint(request: CodeExecutionRequest):
          logging.error("RyanAI instance or execute_code method is not available.")
          return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
     try:
-        # Call the execute_code method from RyanAI
-        result = ryan.execute_code(request.code, request.language)
+        # Call the execute_code method from RyanAI.
+        # It blocks (queue wait + run), so keep it off the event loop to leave chat/model calls responsive.
+        result = await run_in_threadpool(ryan.execute_code, request.code, request.language, warm=request.warm,
+                                          stdin=request.stdin, cache=request.cache, deterministic=request.deterministic,
+                                          profile=request.profile, benchmark=request.benchmark,
+                                          compare_code=request.compare_code, setup_code=request.setup_code)
         logging.info(f"Code execution result: Success={result.get('success')}, ReturnCode={result.get('return_code')}")
+        if result.get("rejected"):
+            # Execution queue full / timed out waiting for a slot
+            return JSONResponse(content=result, status_code=429)
         return JSONResponse(content=result)
     except Exception as e:
         logging.error(f"Error executing code: {e}")
@@ -321,6 +574,174 @@ async def execute_code_endpoint(request: CodeExecutionRequest):
         return JSONResponse(content={"type": "error", "content": f"An internal error occurred during code execution: {str(e)}"}, status_code=500)
 
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/execute_code/stream")
+async def execute_code_stream_endpoint(request: CodeStreamRequest, http_request: Request):
+    """
+    Runs code and streams stdout/stderr as Server-Sent Events while it is produced.
+    Events: start {run_id}, stdout/stderr {data}, truncated {data, limit}, exit {return_code, ...}.
+    The run can be stopped with POST /execute_code/cancel/{run_id}, or by closing the connection.
+    """
+    logging.info(f"Received request to stream {request.language} code execution.")
+    if ryan is None or not hasattr(ryan, 'start_code_stream'):
+         logging.error("RyanAI instance or start_code_stream method is not available.")
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+
+    # May wait in the execution scheduler's queue for a slot
+    started = await run_in_threadpool(ryan.start_code_stream, request.code, request.language, timeout=request.timeout)
+    if started.get("type") != "code_stream_started":
+        # Unsupported language / missing interpreter / queue full - same shape as /execute_code
+        status_code = 500 if started.get("type") == "error" else 429 if started.get("rejected") else 200
+        return JSONResponse(content=started, status_code=status_code)
+    stream = started["stream"]
+
+    async def event_source():
+        yield _sse_event("start", {"event": "start", "run_id": stream.run_id, "language": stream.language})
+        try:
+            while True:
+                # Blocking queue read happens in the threadpool so the event loop stays free
+                event = await run_in_threadpool(stream.next_event, 1.0)
+                if event is None:
+                    if await http_request.is_disconnected():
+                        logging.info(f"Client disconnected from streamed run {stream.run_id}, cancelling.")
+                        stream.cancel()
+                        break
+                    yield ": keep-alive\n\n" # SSE comment, keeps proxies from closing an idle stream
+                    continue
+                yield _sse_event(event["event"], event)
+                if event["event"] == "exit":
+                    break
+        finally:
+            # Generator closed early (client went away mid-write) - don't leave the process running
+            stream.cancel()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/execute_tests")
+async def execute_tests_endpoint(request: CodeTestRequest):
+    """Runs code against many stdin/argument cases in parallel and returns a per-case pass/fail table with timings."""
+    logging.info(f"Received request to run {len(request.cases)} {request.language} test cases.")
+    if ryan is None or not hasattr(ryan, 'execute_tests'):
+         logging.error("RyanAI instance or execute_tests method is not available.")
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    try:
+        result = await run_in_threadpool(ryan.execute_tests, request.code, request.language, [case.model_dump() for case in request.cases],
+                                         warm=request.warm, compare=request.compare, timeout=request.timeout)
+        if result.get("type") == "error":
+            return JSONResponse(content=result, status_code=400)
+        logging.info(f"Test run result: {result['summary']['passed']}/{result['summary']['total']} passed")
+        return JSONResponse(content=result)
+    except Exception as e:
+        logging.error(f"Error running test cases: {e}")
+        logging.error(traceback.format_exc())
+        return JSONResponse(content={"type": "error", "content": f"An internal error occurred while running test cases: {str(e)}"}, status_code=500)
+
+
+@app.get("/execute_code/stats")
+async def execute_code_stats_endpoint():
+    """Execution scheduler state: running/waiting runs, rejections, queue wait and configured limits, plus result and compile cache counters."""
+    return JSONResponse(content={"type": "execution_stats", **get_execution_scheduler().stats(), "cache": get_exec_cache().stats(),
+                                 "compile_cache": get_compile_cache().stats()})
+
+
+@app.post("/execute_code/cancel/{run_id}")
+async def cancel_code_stream_endpoint(run_id: str):
+    logging.info(f"Received request to cancel streamed run {run_id}.")
+    if ryan is None or not hasattr(ryan, 'cancel_code_stream'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    result = ryan.cancel_code_stream(run_id)
+    return JSONResponse(content=result, status_code=404 if result.get("type") == "error" else 200)
+
+
+# --- Persistent REPL sessions (ryan_sessions.py) ---
+# HTTP status for each SessionError kind
+SESSION_ERROR_STATUS = {"not_found": 404, "limit": 429, "busy": 409, "lost": 410, "unsupported": 400}
+
+
+def _session_response(result: Dict[str, Any]) -> JSONResponse:
+    if result.get("session_error"):
+        return JSONResponse(content=result, status_code=SESSION_ERROR_STATUS.get(result["session_error"], 400))
+    if result.get("rejected"):
+        return JSONResponse(content=result, status_code=429)
+    return JSONResponse(content=result)
+
+
+@app.post("/sessions")
+async def create_session_endpoint(request: SessionCreateRequest):
+    """Starts an interpreter session whose variables and imports persist across /sessions/{id}/execute calls."""
+    logging.info(f"Received request to create a {request.language} session.")
+    if ryan is None or not hasattr(ryan, 'create_session'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    return _session_response(await run_in_threadpool(ryan.create_session, request.language))
+
+
+@app.get("/sessions")
+async def list_sessions_endpoint():
+    if ryan is None or not hasattr(ryan, 'list_sessions'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    return JSONResponse(content=ryan.list_sessions())
+
+
+@app.post("/sessions/{session_id}/execute")
+async def execute_in_session_endpoint(session_id: str, request: SessionExecuteRequest):
+    logging.info(f"Received request to execute a cell in session {session_id}.")
+    if ryan is None or not hasattr(ryan, 'execute_in_session'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    try:
+        result = await run_in_threadpool(ryan.execute_in_session, session_id, request.code, stdin=request.stdin, timeout=request.timeout)
+        return _session_response(result)
+    except Exception as e:
+        logging.error(f"Error executing cell in session {session_id}: {e}")
+        logging.error(traceback.format_exc())
+        return JSONResponse(content={"type": "error", "content": f"An internal error occurred during session execution: {str(e)}"}, status_code=500)
+
+
+@app.post("/sessions/{session_id}/interrupt")
+async def interrupt_session_endpoint(session_id: str):
+    logging.info(f"Received request to interrupt session {session_id}.")
+    if ryan is None or not hasattr(ryan, 'interrupt_session'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    return _session_response(ryan.interrupt_session(session_id))
+
+
+@app.delete("/sessions/{session_id}")
+async def close_session_endpoint(session_id: str):
+    logging.info(f"Received request to close session {session_id}.")
+    if ryan is None or not hasattr(ryan, 'close_session'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    return _session_response(await run_in_threadpool(ryan.close_session, session_id))
+
+
+@app.post("/notebooks/run")
+async def run_notebook_endpoint(request: NotebookRunRequest):
+    """
+    Runs a multi-cell Python document in a session. Send the returned session_id with the next submission:
+    only cells affected by the edits re-run, the others come back with status 'cached'.
+    """
+    logging.info(f"Received request to run a notebook of {len(request.cells)} cells.")
+    if ryan is None or not hasattr(ryan, 'run_notebook'):
+         return JSONResponse(content={"type": "error", "content": "Code execution service is not available."}, status_code=500)
+    try:
+        result = await run_in_threadpool(ryan.run_notebook, request.cells, session_id=request.session_id, timeout=request.timeout)
+        return _session_response(result)
+    except Exception as e:
+        logging.error(f"Error running notebook: {e}")
+        logging.error(traceback.format_exc())
+        return JSONResponse(content={"type": "error", "content": f"An internal error occurred while running the notebook: {str(e)}"}, status_code=500)
+
+
+@app.get("/debug_code/stats")
+async def debug_code_stats_endpoint():
+    """Static pre-check counters: debug requests seen, answered locally (and their share), and prompts given findings."""
+    return JSONResponse(content={"type": "debug_stats", **get_precheck_stats().stats()})
+
+
 @app.post("/debug_code")
 async def debug_code_endpoint(request: CodeDebugRequest):
     logging.info(f"Received request to debug {request.language} code.")
@@ -329,7 +750,10 @@ async def debug_code_endpoint(request: CodeDebugRequest):
          return JSONResponse(content={"type": "error", "content": "Code debugging service is not available."}, status_code=500)
     try:
         # Call the debug_code method from RyanAI
-        result = ryan.debug_code(request.code, request.error_output, request.language, context=request.context)
+        test_cases = [case.model_dump() for case in request.test_cases] if request.test_cases else None
+        # Verification runs code, so keep it off the event loop
+        result = await run_in_threadpool(ryan.debug_code, request.code, request.error_output, request.language,
+                                         context=request.context, test_cases=test_cases)
         logging.info(f"Code debugging result: Success={result.get('success')}")
         return JSONResponse(content=result)
     except Exception as e:
@@ -346,7 +770,9 @@ async def fix_code_endpoint(request: CodeFixRequest):
          return JSONResponse(content={"type": "error", "content": "Code fixing service is not available."}, status_code=500)
     try:
         # Call the fix_code method from RyanAI
-        result = ryan.fix_code(request.original_code, request.suggested_fix, request.language, context=request.context)
+        test_cases = [case.model_dump() for case in request.test_cases] if request.test_cases else None
+        result = await run_in_threadpool(ryan.fix_code, request.original_code, request.suggested_fix, request.language,
+                                         context=request.context, test_cases=test_cases, mode=request.mode)
         logging.info(f"Code fixing result: Success={result.get('success')}")
         return JSONResponse(content=result)
     except Exception as e:
@@ -355,6 +781,149 @@ async def fix_code_endpoint(request: CodeFixRequest):
         return JSONResponse(content={"type": "error", "content": f"An internal error occurred during code fixing: {str(e)}"}, status_code=500)
 
 
+@app.post("/auto_fix")
+async def auto_fix_endpoint(request: AutoFixRequest, http_request: Request):
+    """
+    Runs code and, while it fails, debugs it, applies the fix and runs it again - up to max_iterations.
+    Streams events: start {run_id}, run, debug, fix, iteration {latency, usage}, done {final state}.
+    The state stays on the server: GET /auto_fix/{run_id}, POST /auto_fix/{run_id}/cancel.
+    Closing the connection cancels the run.
+    """
+    logging.info(f"Received auto-fix request for {request.language} code.")
+    if ryan is None or not hasattr(ryan, 'start_auto_fix'):
+         return JSONResponse(content={"type": "error", "content": "Code fixing service is not available."}, status_code=500)
+    test_cases = [case.model_dump() for case in request.test_cases] if request.test_cases else None
+    started = await run_in_threadpool(ryan.start_auto_fix, request.code, request.language,
+                                      max_iterations=request.max_iterations, test_cases=test_cases, fix_mode=request.fix_mode)
+    if started.get("type") != "auto_fix_started":
+        return JSONResponse(content=started, status_code=500)
+    run = started["run"]
+
+    if not request.stream:
+        while True:
+            event = await run_in_threadpool(run.next_event, 1.0)
+            if event is not None and event["event"] == "done":
+                return JSONResponse(content={"type": "auto_fix_result", **run.summary()})
+            if event is None and await http_request.is_disconnected():
+                logging.info(f"Client disconnected from auto-fix run {run.run_id}, cancelling.")
+                ryan.cancel_auto_fix(run.run_id)
+                return JSONResponse(content={"type": "auto_fix_result", **run.summary()})
+
+    async def event_source():
+        try:
+            while True:
+                event = await run_in_threadpool(run.next_event, 1.0)
+                if event is None:
+                    if await http_request.is_disconnected():
+                        logging.info(f"Client disconnected from auto-fix run {run.run_id}, cancelling.")
+                        ryan.cancel_auto_fix(run.run_id)
+                        break
+                    yield ": keep-alive\n\n" # Model calls can take a while
+                    continue
+                yield _sse_event(event["event"], event)
+                if event["event"] == "done":
+                    break
+        finally:
+            # Generator closed early (client went away mid-write) - don't leave the loop spending model calls
+            ryan.cancel_auto_fix(run.run_id)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/auto_fix/{run_id}")
+async def get_auto_fix_endpoint(run_id: str):
+    if ryan is None or not hasattr(ryan, 'get_auto_fix'):
+         return JSONResponse(content={"type": "error", "content": "Code fixing service is not available."}, status_code=500)
+    result = ryan.get_auto_fix(run_id)
+    return JSONResponse(content=result, status_code=404 if result.get("type") == "error" else 200)
+
+
+@app.post("/auto_fix/{run_id}/cancel")
+async def cancel_auto_fix_endpoint(run_id: str):
+    logging.info(f"Received request to cancel auto-fix run {run_id}.")
+    if ryan is None or not hasattr(ryan, 'cancel_auto_fix'):
+         return JSONResponse(content={"type": "error", "content": "Code fixing service is not available."}, status_code=500)
+    result = ryan.cancel_auto_fix(run_id)
+    return JSONResponse(content=result, status_code=404 if result.get("type") == "error" else 200)
+
+
+@app.post("/analyze_code/batch")
+async def analyze_code_batch_endpoint(request: BatchAnalysisRequest, http_request: Request):
+    """
+    Analyzes many snippets: identical inputs are analyzed once, distinct ones concurrently, and a failing
+    item doesn't fail the batch. Returns the results in input order, or with stream=True NDJSON lines
+    {"event": "item", "index", ...} as items complete, then {"event": "done", "summary"}.
+    """
+    logging.info(f"Received batch analysis request with {len(request.items)} items.")
+    if ryan is None or not hasattr(ryan, 'start_analysis_batch'):
+         return JSONResponse(content={"type": "error", "content": "Code analysis service is not available."}, status_code=500)
+    started = ryan.start_analysis_batch([item.model_dump() for item in request.items], max_concurrency=request.max_concurrency)
+    if started.get("type") != "analysis_batch_started":
+        return JSONResponse(content=started, status_code=400)
+    batch = started["batch"]
+    if not request.stream:
+        return JSONResponse(content=await run_in_threadpool(ryan.run_analysis_batch, batch))
+
+    runner = threading.Thread(target=ryan.run_analysis_batch, args=(batch,), name="ryan-batch-runner", daemon=True)
+    runner.start()
+
+    async def lines():
+        while True:
+            event = await run_in_threadpool(batch.next_event, 1.0)
+            if event is None:
+                if await http_request.is_disconnected():
+                    logging.info("Client disconnected from a streamed analysis batch, cancelling the rest.")
+                    batch.cancel()
+                    break
+                continue
+            yield json.dumps(event) + "\n"
+            if event["event"] == "done":
+                break
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def _project_response(result: Dict[str, Any]) -> JSONResponse:
+    """Maps project errors to status codes (bad input 400, unknown project 404)."""
+    if result.get("type") != "error":
+        return JSONResponse(content=result)
+    status = {"invalid": 400, "not_found": 404}.get(result.get("project_error"), 500)
+    return JSONResponse(content=result, status_code=status)
+
+
+@app.post("/projects/analyze")
+async def analyze_project_endpoint(request: ProjectAnalyzeRequest):
+    """Summarises a project module by module along its import graph; re-submissions re-analyze only what changed."""
+    logging.info(f"Received request to analyze project {request.name or request.path}.")
+    if ryan is None or not hasattr(ryan, 'analyze_project'):
+         return JSONResponse(content={"type": "error", "content": "Project analysis service is not available."}, status_code=500)
+    if bool(request.path) == bool(request.archive_base64):
+        return JSONResponse(content={"type": "error", "content": "Give either a path or an archive."}, status_code=400)
+    try:
+        archive = decode_archive(request.archive_base64) if request.archive_base64 else None
+    except ProjectError as e:
+        return JSONResponse(content={"type": "error", "content": str(e)}, status_code=400)
+    result = await run_in_threadpool(ryan.analyze_project, path=request.path, archive=archive,
+                                     archive_name=request.archive_name, name=request.name)
+    return _project_response(result)
+
+
+@app.get("/projects/{project_id}")
+async def get_project_endpoint(project_id: str):
+    if ryan is None or not hasattr(ryan, 'get_project'):
+         return JSONResponse(content={"type": "error", "content": "Project analysis service is not available."}, status_code=500)
+    return _project_response(await run_in_threadpool(ryan.get_project, project_id))
+
+
+@app.post("/projects/{project_id}/ask")
+async def ask_project_endpoint(project_id: str, request: ProjectQuestionRequest):
+    """Answers a whole-project question from the stored module summaries."""
+    if ryan is None or not hasattr(ryan, 'ask_project'):
+         return JSONResponse(content={"type": "error", "content": "Project analysis service is not available."}, status_code=500)
+    return _project_response(await run_in_threadpool(ryan.ask_project, project_id, request.question))
+
+
 @app.post("/analyze_code")
 async def analyze_code_endpoint(request: CodeAnalysisRequest):
     logging.info(f"Received request to analyze code.")
@@ -363,7 +932,9 @@ async def analyze_code_endpoint(request: CodeAnalysisRequest):
          return JSONResponse(content={"type": "error", "content": "Code analysis service is not available."}, status_code=500)
     try:
         # Call the analyze_code method from RyanAI
-        result = ryan.analyze_code(request.code, request.task_description, context=request.context)
+        # Profiling runs the code, so keep it off the event loop
+        result = await run_in_threadpool(ryan.analyze_code, request.code, request.task_description, context=request.context,
+                                         language=request.language, profile=request.profile, chunked=request.chunked)
         logging.info(f"Code analysis result: Success={result.get('success')}")
         return JSONResponse(content=result)
     except Exception as e:
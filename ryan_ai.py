@@ -11,9 +11,37 @@ import importlib
 import logging
 import traceback
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Iterable
 import subprocess # Import subprocess to run external commands (like code execution)
 import sys # Import sys to get Python executable path
+from ryan_plugin_pool import get_plugin_pool, is_isolated, PluginWorkerError
+from ryan_intent import classify_intent
+from ryan_pipeline import Pipeline, FunctionStage, PipelineContext
+from concurrent.futures import ThreadPoolExecutor
+from ryan_exec_pool import get_exec_pool, ExecPoolError, EXEC_POOL_ENABLED
+from ryan_exec_stream import get_stream_registry, STREAM_TIMEOUT
+from ryan_exec_scheduler import get_execution_scheduler, run_limited, limit_exceeded, ExecutionRejected, EXEC_LIMITS
+from ryan_compile import run_compiled, is_compiled_language
+from ryan_benchmark import run_benchmark, BENCHMARKED_LANGUAGES, BENCH_REPEATS
+from ryan_profiler import run_profiled, PROFILED_LANGUAGES
+from ryan_sessions import get_session_manager, SessionError, SESSION_CELL_TIMEOUT
+from ryan_notebook import run_notebook
+from ryan_static_check import precheck, format_findings, get_precheck_stats
+from ryan_prompt_slice import slice_for_traceback, apply_sliced_fix
+from ryan_chunked_analysis import analyze_chunked, ANALYSIS_CHUNK_THRESHOLD_LINES
+from ryan_project import (load_project_files, project_id_for, project_context, get_project_store, ProjectError,
+                          analyze_project as run_project_analysis)
+from ryan_analysis_batch import AnalysisBatch, ANALYSIS_BATCH_MAX_ITEMS
+from ryan_upload import SpooledUpload, DOCUMENT_LANGUAGES, UPLOAD_MAX_CODE_BYTES, UPLOAD_REPORTED_ACTIONS, iter_lines, iter_key_values, throughput
+from ryan_ingest import (IngestRun, IngestError, INGEST_WORKERS, INGEST_MEMORY_BATCH, memory_key_for, resolve_ingest_path,
+                         check_ingest_id)
+from ryan_blob_store import get_blob_store, BlobStoreError
+from ryan_doc_index import get_document_index, format_chunks, DOC_EMBEDDINGS_ENABLED, DOC_RETRIEVAL_K, DOC_CHAT_MIN_COVERAGE
+from ryan_symbol_index import get_symbol_index, parse_symbol_question, format_symbol_answer, SYMBOL_LANGUAGES
+from ryan_patch import parse_edits, apply_edits, token_savings, PatchError
+from ryan_auto_fix import AutoFixRun, run_auto_fix, get_auto_fix_registry, AUTO_FIX_MAX_ITERATIONS
+from ryan_test_runner import run_test_cases, format_test_table, TEST_CASE_TIMEOUT
+from ryan_exec_cache import get_exec_cache, deterministic_check, is_cacheable_result, cache_key as exec_cache_key, EXEC_CACHE_ENABLED
 
 # load .env
 dotenv_path = "ryanEnv.env"
@@ -24,6 +52,12 @@ SEARCH_API_KEY = os.getenv("SEARCH_API_KEY")
 SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
 FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# Start the chat model call while memory/plugin stages are still running when the prompt can't change
+SPECULATIVE_MODEL_CALLS = os.getenv("RYAN_SPECULATIVE_MODEL_CALLS", "1") == "1"
+DOC_EMBEDDING_MODEL = os.getenv("RYAN_DOC_EMBEDDING_MODEL", "models/text-embedding-004")
+MEMORY_ANSWER_MIN_SCORE = 0.5 # Share of the question's keywords a memory entry must contain to be answered locally
+MEMORY_ANSWER_MAX_ENTRIES = 5
+_FILE_MEMORY_PREFIXES = ("file_content_", "file_summary_") # Document manifests and summaries, not facts to recite
 
 # --- Configure Logging ---
 # Ensure logging is configured only once
@@ -67,11 +101,51 @@ except Exception as e:
     model = None
 
 
+def model_usage(response: Any) -> Optional[Dict[str, int]]:
+    """Token counts of a generate_content response (None if the response carries no usage metadata)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(usage, "total_token_count", 0) or 0,
+    }
+
+
+def generate_text(prompt: str) -> Tuple[str, Optional[Dict[str, int]]]:
+    """One model call for the fan-out helpers (chunked and project analysis): (text, usage). Raises on a blocked or empty response."""
+    response = model.generate_content(prompt)
+    if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
+        raise RuntimeError(f"prompt blocked ({response.prompt_feedback.block_reason})")
+    if hasattr(response, 'candidates') and not response.candidates:
+        raise RuntimeError("no candidates returned")
+    return response.text, model_usage(response)
+
+
+def embed_texts(texts: List[str], task_type: str = "retrieval_document") -> Optional[List[List[float]]]:
+    """Embedding vectors for the document index (None when embeddings are unavailable)."""
+    try:
+        result = genai.embed_content(model=DOC_EMBEDDING_MODEL, content=texts, task_type=task_type)
+    except Exception as e:
+        logging.warning(f"Embedding request failed: {e}")
+        return None
+    vectors = result.get("embedding") if isinstance(result, dict) else None
+    return vectors if vectors and len(vectors) == len(texts) else None
+
+
 # --- RyanAI Class ---
 class RyanAI:
     def __init__(self, db_instance):
         self.db = db_instance
         self.memory_collection = self.db.collection('users').document(CURRENT_USER_ID).collection('memory') if self.db else None
+        self.chat_plugins = None # Lazily loaded plugin instances used by the intent router
+        # Shared pool for concurrent pipeline stages
+        self.executor = ThreadPoolExecutor(max_workers=int(os.getenv("RYAN_STAGE_WORKERS", "8")), thread_name_prefix="ryan-stage")
+        # Speculative model calls get their own small pool: they block for a whole model round trip,
+        # and on the stage pool they would hold the threads the stages waiting on them need
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("RYAN_PREFETCH_WORKERS", "2")), thread_name_prefix="ryan-prefetch")
+        self.chat_pipeline = self._build_chat_pipeline()
         logging.info(f"RyanAI instance created. Memory enabled: {self.db is not None}")
 
     # --- Memory Functions (Keep existing functions) ---
@@ -109,6 +183,31 @@ class RyanAI:
             logging.error(traceback.format_exc())
             return False
 
+    def save_memory_batch(self, entries: Dict[str, Any]) -> int:
+        """Saves many key-value pairs with Firestore batched writes (bulk ingestion). Returns how many were written."""
+        if not self.db or not self.memory_collection:
+            logging.warning("Memory system not available. Cannot save memory batch.")
+            return 0
+        written = 0
+        try:
+            batch = self.db.batch()
+            for key, value in entries.items():
+                if not key or not value:
+                    continue
+                # Same document ids as save_memory
+                sanitized_key = re.sub(r'[/.#\[\]*]', '_', key) or "memory_" + str(uuid.uuid4())
+                batch.set(self.memory_collection.document(sanitized_key), {'value': value, 'timestamp': firestore.SERVER_TIMESTAMP})
+                written += 1
+                if written % INGEST_MEMORY_BATCH == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            batch.commit()
+            logging.info(f"Memory batch saved: {written} entries for user '{CURRENT_USER_ID}'.")
+        except Exception as e:
+            logging.error(f"Error saving memory batch for user '{CURRENT_USER_ID}': {e}")
+            logging.error(traceback.format_exc())
+        return written
+
     def get_memory(self, key: str) -> Optional[Any]:
         """Retrieves a value from the user's memory by key."""
         if not self.db or not self.memory_collection:
@@ -202,14 +301,162 @@ class RyanAI:
 
     # --- New Coding Genius Functions ---
 
-    def execute_code(self, code_string: str, language: str) -> Dict[str, Any]:
+    def execute_code(self, code_string: str, language: str, warm: Optional[bool] = None, stdin: Optional[str] = None,
+                     cache: Optional[bool] = None, deterministic: bool = False, profile: bool = False,
+                     benchmark: bool = False, compare_code: Optional[str] = None, setup_code: Optional[str] = None) -> Dict[str, Any]:
         """
         Executes a string of code in the specified language on the local machine.
-        Returns output, errors, and exit code.
+        Returns output, errors, and exit code, plus wall_time, cpu_time and peak_rss_kb of the run.
+        Runs go through the execution scheduler (ryan_exec_scheduler.py): they may wait in its queue,
+        are rejected when the queue is full, and run under CPU/memory/open-file rlimits.
+        warm=True runs Python/JavaScript in the pre-forked worker pool (ryan_exec_pool.py);
+        None uses the RYAN_EXEC_POOL setting. stdin is fed to the program's standard input.
+        C, C++, Java and Go are compiled first (ryan_compile.py, with an artifact cache); their results
+        add compile_time, run_time and compile_cached (compile_failed when the compiler rejected the code).
+        cache=True reuses the result of an identical earlier run (ryan_exec_cache.py) if the snippet is
+        deterministic - marked so by the caller, or passing the static check; None uses RYAN_EXEC_CACHE.
+        The result carries "cached" (and "cache_reason" when the snippet could not be cached).
+        profile=True runs Python under cProfile + tracemalloc and JavaScript under V8's CPU/heap profiler
+        (ryan_profiler.py) and adds "profile": hot functions, top allocations, totals and a text summary.
+        Profiled runs never use the warm pool or the result cache.
+        benchmark=True (or a compare_code) times the snippet instead of running it once; see benchmark_code.
         """
         logging.info(f"Attempting to execute {language} code.")
         logging.debug(f"Code:\n{code_string[:500]}...") # Log first 500 chars of code
 
+        compiled = is_compiled_language(language)
+        command = None if compiled else self._execution_command(code_string, language)
+        if command is None and not compiled:
+            logging.warning(f"Unsupported language for execution: {language}")
+            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Unsupported language: {language}", "return_code": 1}
+
+        if benchmark or compare_code:
+            return self.benchmark_code(code_string, language, compare_code=compare_code, setup_code=setup_code)
+
+        if profile and language.lower() not in PROFILED_LANGUAGES:
+            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Profiling is supported for {', '.join(PROFILED_LANGUAGES)} only.", "return_code": 1}
+
+        # Result cache lookup happens before taking a scheduler slot, so hits never queue
+        cache_key_value = None
+        cache_reason = None
+        if (EXEC_CACHE_ENABLED if cache is None else cache) and not profile:
+            cacheable, cache_reason = (True, None) if deterministic else deterministic_check(code_string, language)
+            if cacheable:
+                cache_key_value = exec_cache_key(language, code_string, stdin)
+                cached_result = get_exec_cache().get(cache_key_value)
+                if cached_result is not None:
+                    logging.info(f"Returning cached {language} execution result.")
+                    return cached_result
+            else:
+                logging.debug(f"Execution result not cacheable: {cache_reason}")
+
+        use_warm_pool = EXEC_POOL_ENABLED if warm is None else warm
+        try:
+            with get_execution_scheduler().slot() as queue_wait:
+                run = None
+                if profile:
+                    run = run_profiled(code_string, language, stdin=stdin, timeout=30)
+                elif compiled:
+                    # Compile (or reuse the cached artifact), then run the binary in a fresh workspace
+                    run = run_compiled(code_string, language, stdin=stdin, timeout=30)
+                elif use_warm_pool and language.lower() in ("python", "javascript"):
+                    try:
+                        run = get_exec_pool().run(language, code_string, stdin=stdin, timeout=30)
+                    except ExecPoolError as e:
+                        # Pool unavailable (no fork, node missing, dead zygote) - fall back to a cold run
+                        logging.warning(f"Warm execution pool unavailable, falling back to cold run: {e}")
+                if run is None:
+                    logging.debug(f"Executing command: {' '.join(command)}")
+                    # 30 second timeout; the child is reaped with wait4() so its CPU time and peak RSS can be reported
+                    run = run_limited(command, language, stdin=stdin, timeout=30)
+        except ExecutionRejected as e:
+            logging.warning(f"Code execution rejected by scheduler ({e.kind}): {e}")
+            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": str(e), "return_code": 1, "rejected": e.kind}
+        except FileNotFoundError as e:
+            program = command[0] if command else (e.filename or language)
+            logging.error(f"Interpreter for {language} not found. Command: {program}")
+            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Interpreter for {language} not found. Make sure '{program}' is installed and in your PATH.", "return_code": 1}
+        except Exception as e:
+            logging.error(f"An error occurred during code execution for {language}: {e}")
+            logging.error(traceback.format_exc())
+            # Return a structured error response
+            return {"type": "error", "content": f"An unexpected error occurred during code execution: {str(e)}"}
+
+        logging.info(f"Code execution finished for {language}. Return code: {run['return_code']} (wall {run['wall_time']}s, cpu {run['cpu_time']}s, peak RSS {run['peak_rss_kb']} KB)")
+        logging.debug(f"STDOUT:\n{run['stdout'][:500]}...")
+        logging.debug(f"STDERR:\n{run['stderr'][:500]}...")
+
+        result = {
+            "type": "code_execution_result",
+            "success": run["return_code"] == 0 and not run["timed_out"], # Success if return code is 0
+            "language": language,
+            "output": run["stdout"],
+            "error": run["stderr"],
+            "return_code": run["return_code"],
+            "wall_time": run["wall_time"],
+            "cpu_time": run["cpu_time"],
+            "peak_rss_kb": run["peak_rss_kb"],
+            "queue_wait": round(queue_wait, 6),
+        }
+        if run["timed_out"]:
+            logging.warning(f"Code execution timed out after 30 seconds for {language}.")
+            result["error"] = f"Code execution timed out after 30 seconds."
+            result["return_code"] = 1
+        exceeded = run.get("limit_exceeded") or limit_exceeded(run["return_code"])
+        if exceeded == "cpu":
+            result["limit_exceeded"] = exceeded
+            result["error"] += f"\nCPU time limit of {EXEC_LIMITS.cpu_seconds} seconds exceeded."
+        if "worker" in run:
+            result["worker"] = run["worker"]
+        if profile:
+            result["profile"] = run["profile"]
+        if compiled:
+            result["compile_time"] = run["compile_time"]
+            result["run_time"] = run["run_time"]
+            result["compile_cached"] = run["compile_cached"]
+            if run.get("compile_failed"):
+                result["compile_failed"] = True
+        if cache_key_value is not None and is_cacheable_result(result):
+            get_exec_cache().put(cache_key_value, result)
+        result["cached"] = False
+        if cache_reason:
+            result["cache_reason"] = cache_reason
+        return result
+
+
+    def benchmark_code(self, code_string: str, language: str, compare_code: Optional[str] = None,
+                       setup_code: Optional[str] = None, repeats: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Micro-benchmarks a snippet, or compares two (code_string = A, compare_code = B), with a timeit-style
+        harness in an isolated process (ryan_benchmark.py): loop calibration, warmup, repeated interleaved
+        samples, outlier rejection. Reports median, IQR and ops/sec per variant and a Mann-Whitney verdict.
+        setup_code runs once before timing (imports, test data) and is not timed.
+        """
+        logging.info(f"Attempting to benchmark {language} code{' against an alternative' if compare_code else ''}.")
+        if language.lower() not in BENCHMARKED_LANGUAGES:
+            return {"type": "error", "content": f"Benchmarking is supported for {', '.join(BENCHMARKED_LANGUAGES)} only."}
+        try:
+            # run_benchmark keeps benchmarks from overlapping, then holds a scheduler slot like any run
+            result = run_benchmark(code_string, language, compare_code=compare_code, setup=setup_code or "",
+                                   repeats=repeats or BENCH_REPEATS)
+        except ExecutionRejected as e:
+            logging.warning(f"Benchmark rejected by scheduler ({e.kind}): {e}")
+            return {"type": "error", "content": str(e), "rejected": e.kind}
+        except FileNotFoundError as e:
+            return {"type": "error", "content": f"Interpreter for {language} not found. Make sure '{e.filename or language}' is installed and in your PATH."}
+        except Exception as e:
+            logging.error(f"An error occurred while benchmarking {language} code: {e}")
+            logging.error(traceback.format_exc())
+            return {"type": "error", "content": f"An unexpected error occurred while benchmarking: {str(e)}"}
+        if "error" in result:
+            return {"type": "benchmark_result", "success": False, "language": language,
+                    "content": f"Benchmark failed:\n{result['error']}", **result}
+        logging.info(f"Benchmark finished:\n{result['summary']}")
+        return {"type": "benchmark_result", "success": True, "language": language, "content": result["summary"], **result}
+
+
+    def _execution_command(self, code_string: str, language: str) -> Optional[List[str]]:
+        """Returns the command line that runs code_string for the language, or None if unsupported."""
         # Define commands to run code based on language
         # IMPORTANT: This is a basic implementation.
         # For a real application, consider security implications of running arbitrary code.
@@ -223,67 +470,230 @@ class RyanAI:
             # Example for C++ (requires saving to a .cpp file first):
             # 'cpp': ['g++', '-o', 'temp_exec', 'Temp.cpp', '&&', './temp_exec'] # More complex
         }
+        return commands.get(language.lower())
 
-        language_lower = language.lower()
-        if language_lower not in commands:
-            logging.warning(f"Unsupported language for execution: {language}")
-            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Unsupported language: {language}", "return_code": 1}
-
-        command = commands[language_lower]
-        process = None # Initialize process variable
 
+    def start_code_stream(self, code_string: str, language: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Starts a streamed run (ryan_exec_stream.py). Returns {"type": "code_stream_started", "stream": ExecutionStream}
+        or a code_execution_result/error dict if the run could not be started.
+        """
+        logging.info(f"Attempting to stream {language} code execution.")
+        command = self._execution_command(code_string, language)
+        if command is None:
+            logging.warning(f"Unsupported language for streamed execution: {language}")
+            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Unsupported language: {language}", "return_code": 1}
+        scheduler = get_execution_scheduler()
         try:
-            logging.debug(f"Executing command: {' '.join(command)}")
-            # Use subprocess.run for Python 3.5+
-            # capture_output=True captures stdout and stderr
-            # text=True decodes stdout/stderr as text using default encoding
-            # timeout can prevent infinite loops
-            # Added check=False so it doesn't raise CalledProcessError for non-zero exit codes
-            process = subprocess.run(command, capture_output=True, text=True, timeout=30, check=False) # 30 second timeout
-
-            logging.info(f"Code execution finished for {language}. Return code: {process.returncode}")
-            logging.debug(f"STDOUT:\n{process.stdout[:500]}...")
-            logging.debug(f"STDERR:\n{process.stderr[:500]}...")
-
-            return {
-                "type": "code_execution_result",
-                "success": process.returncode == 0, # Success if return code is 0
-                "language": language,
-                "output": process.stdout,
-                "error": process.stderr,
-                "return_code": process.returncode
-            }
-
+            queue_wait = scheduler.acquire()
+        except ExecutionRejected as e:
+            logging.warning(f"Streamed execution rejected by scheduler ({e.kind}): {e}")
+            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": str(e), "return_code": 1, "rejected": e.kind}
+        try:
+            # The slot is held until the stream's process exits
+            stream = get_stream_registry().start(command, language, timeout=timeout or STREAM_TIMEOUT, on_finish=scheduler.release)
+            stream.queue_wait = round(queue_wait, 6)
+            return {"type": "code_stream_started", "stream": stream}
         except FileNotFoundError:
+            scheduler.release()
             logging.error(f"Interpreter for {language} not found. Command: {command[0]}")
             return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Interpreter for {language} not found. Make sure '{command[0]}' is installed and in your PATH.", "return_code": 1}
-        except subprocess.TimeoutExpired:
-            logging.warning(f"Code execution timed out after 30 seconds for {language}.")
-            # If the process is still running after timeout, terminate it
-            if process and process.poll() is None:
-                 try:
-                      process.terminate()
-                      process.wait(timeout=5) # Wait a bit for termination
-                 except subprocess.TimeoutExpired:
-                      process.kill() # If termination fails, kill it
-            return {"type": "code_execution_result", "success": False, "language": language, "output": "", "error": f"Code execution timed out after 30 seconds.", "return_code": 1}
         except Exception as e:
-            logging.error(f"An error occurred during code execution for {language}: {e}")
+            scheduler.release()
+            logging.error(f"An error occurred starting streamed execution for {language}: {e}")
             logging.error(traceback.format_exc())
-            # Return a structured error response
             return {"type": "error", "content": f"An unexpected error occurred during code execution: {str(e)}"}
 
 
-    def debug_code(self, code_string: str, error_output: str, language: str, context: Optional[str] = None) -> Dict[str, Any]:
+    def cancel_code_stream(self, run_id: str) -> Dict[str, Any]:
+        """Cancels a streamed run started by start_code_stream."""
+        cancelled = get_stream_registry().cancel(run_id)
+        if cancelled is None:
+            return {"type": "error", "content": f"Unknown run_id: {run_id}"}
+        return {"type": "code_stream_cancelled", "run_id": run_id, "cancelled": cancelled}
+
+
+    def create_session(self, language: str) -> Dict[str, Any]:
+        """Starts a persistent REPL session (ryan_sessions.py) whose namespace survives between execute_in_session calls."""
+        logging.info(f"Creating {language} REPL session.")
+        try:
+            session = get_session_manager().create(language)
+        except SessionError as e:
+            return {"type": "error", "content": str(e), "session_error": e.kind}
+        except FileNotFoundError as e:
+            return {"type": "error", "content": f"Interpreter for {language} not found. Make sure '{e.filename or language}' is installed and in your PATH.", "session_error": "unsupported"}
+        return {"type": "session_created", **session.info()}
+
+
+    def execute_in_session(self, session_id: str, code_string: str, stdin: Optional[str] = None,
+                           timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Runs a cell in an existing session. The result has the same shape as execute_code's, plus
+        interrupted, execution_count and session_id. A cell past its timeout is interrupted (state kept);
+        session_lost / session_closed report a kernel that had to be killed or was reclaimed.
+        """
+        logging.info(f"Executing cell in session {session_id}.")
+        try:
+            with get_execution_scheduler().slot() as queue_wait:
+                run = get_session_manager().execute(session_id, code_string, stdin=stdin, timeout=timeout or SESSION_CELL_TIMEOUT)
+        except ExecutionRejected as e:
+            logging.warning(f"Session cell rejected by scheduler ({e.kind}): {e}")
+            return {"type": "code_execution_result", "success": False, "output": "", "error": str(e), "return_code": 1, "rejected": e.kind}
+        except SessionError as e:
+            return {"type": "error", "content": str(e), "session_error": e.kind}
+        logging.info(f"Session {session_id} cell {run['execution_count']} finished. Return code: {run['return_code']} (wall {run.get('wall_time')}s)")
+        return {
+            "type": "code_execution_result",
+            "success": run["return_code"] == 0 and not run["timed_out"],
+            "output": run["stdout"],
+            "error": run["stderr"],
+            "return_code": run["return_code"],
+            "timed_out": run["timed_out"],
+            "interrupted": run["interrupted"],
+            "wall_time": run.get("wall_time"),
+            "cpu_time": run.get("cpu_time"),
+            "queue_wait": round(queue_wait, 6),
+            "execution_count": run["execution_count"],
+            "session_id": session_id,
+            "session_lost": run.get("session_lost", False),
+            "session_closed": run.get("session_closed"),
+        }
+
+
+    def run_notebook(self, cells: List[str], session_id: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Runs a multi-cell Python document in a REPL session (ryan_notebook.py). Resubmitting the document
+        re-runs only the cells an edit affects (ast def/use analysis); the rest are served from the previous
+        run. Without a session_id (or if the session was reclaimed) a new session is started.
+        """
+        logging.info(f"Running notebook of {len(cells)} cells in session {session_id or '(new)'}.")
+        manager = get_session_manager()
+        note = None
+        try:
+            if session_id is not None:
+                try:
+                    manager.get(session_id)
+                except SessionError as e:
+                    if e.kind != "not_found":
+                        raise
+                    note = f"{e} Started a new session."
+                    session_id = None
+            if session_id is None:
+                session_id = manager.create("python").session_id
+            # One scheduler slot for the whole document; its cells run back to back
+            with get_execution_scheduler().slot() as queue_wait:
+                result = run_notebook(session_id, cells, timeout=timeout or SESSION_CELL_TIMEOUT)
+        except ExecutionRejected as e:
+            logging.warning(f"Notebook run rejected by scheduler ({e.kind}): {e}")
+            return {"type": "error", "content": str(e), "rejected": e.kind}
+        except SessionError as e:
+            return {"type": "error", "content": str(e), "session_error": e.kind}
+        except FileNotFoundError:
+            return {"type": "error", "content": "Python interpreter for the notebook session not found.", "session_error": "unsupported"}
+        summary = result["summary"]
+        summary["queue_wait"] = round(queue_wait, 6)
+        if note:
+            summary["note"] = note
+        return {"type": "notebook_result", "success": summary["failed_cell"] is None, **result}
+
+
+    def interrupt_session(self, session_id: str) -> Dict[str, Any]:
+        """Interrupts the cell running in a session (SIGINT); the session's state is kept."""
+        try:
+            was_running = get_session_manager().interrupt(session_id)
+        except SessionError as e:
+            return {"type": "error", "content": str(e), "session_error": e.kind}
+        return {"type": "session_interrupted", "session_id": session_id, "was_running": was_running}
+
+
+    def close_session(self, session_id: str) -> Dict[str, Any]:
+        """Ends a session and frees its interpreter."""
+        manager = get_session_manager()
+        try:
+            manager.get(session_id)
+        except SessionError as e:
+            return {"type": "error", "content": str(e), "session_error": e.kind}
+        manager.close(session_id)
+        return {"type": "session_closed", "session_id": session_id}
+
+
+    def list_sessions(self) -> Dict[str, Any]:
+        manager = get_session_manager()
+        return {"type": "session_list", "sessions": manager.list(), "stats": manager.stats()}
+
+
+    def execute_tests(self, code_string: str, language: str, cases: List[Dict[str, Any]], warm: bool = True,
+                      compare: str = "strip", timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Runs code against a list of stdin/argument cases in parallel (ryan_test_runner.py) and compares
+        each output with the expected one. Returns a per-case pass/fail table with timings plus a summary.
+        """
+        logging.info(f"Attempting to run {len(cases)} test cases for {language} code.")
+        command = None if is_compiled_language(language) else self._execution_command(code_string, language)
+        try:
+            result = run_test_cases(code_string, language, cases, command=command, warm=warm, compare=compare,
+                                    timeout=timeout or TEST_CASE_TIMEOUT)
+        except ValueError as e:
+            return {"type": "error", "content": str(e)}
+        except FileNotFoundError as e:
+            program = e.filename or (command[0] if command else language)
+            return {"type": "error", "content": f"Interpreter for {language} not found. Make sure '{program}' is installed and in your PATH."}
+        except Exception as e:
+            logging.error(f"An error occurred while running test cases for {language}: {e}")
+            logging.error(traceback.format_exc())
+            return {"type": "error", "content": f"An unexpected error occurred while running test cases: {str(e)}"}
+        return {"type": "test_run_result", "success": result["summary"].get("all_passed", False), **result, "table": format_test_table(result)}
+
+
+    def _verify_with_tests(self, code_string: str, language: str, test_cases: Optional[List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Runs test_cases against suggested code. Returns the summary plus the text table, or None without cases."""
+        if not test_cases or not code_string:
+            return None
+        result = self.execute_tests(code_string, language, test_cases)
+        if result.get("type") != "test_run_result":
+            return {"verified": False, "error": result.get("content")}
+        return {"verified": result["success"], **result["summary"], "table": result["table"]}
+
+
+    def debug_code(self, code_string: str, error_output: str, language: str, context: Optional[str] = None,
+                   test_cases: Optional[List[Dict[str, Any]]] = None, memory: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Uses the AI model to analyze code and an error message, suggesting fixes.
-        Includes relevant memory as context.
+        Includes relevant memory as context (memory = an already fetched get_all_memory() snapshot).
+        With test_cases, corrected code from the suggestion is run against them and the result is
+        returned under "verification". "usage" holds the model's token counts.
+        Python and JavaScript code first goes through the local static pre-check (ryan_static_check.py):
+        simple errors are answered without the model ("answered_locally"), otherwise its findings
+        are added to the prompt. For large files the prompt holds only the code around the traceback
+        (ryan_prompt_slice.py, reported under "prompt_slice"); corrected_code is still the whole file.
         """
         logging.info(f"Attempting to debug {language} code using AI.")
         logging.debug(f"Code:\n{code_string[:500]}...")
         logging.debug(f"Error Output:\n{error_output[:500]}...")
         logging.debug(f"Context:\n{context[:500] if context else 'None'}...")
 
+        static_report = precheck(code_string, error_output, language)
+        get_precheck_stats().record(static_report)
+        if static_report and static_report["answer"]:
+            logging.info(f"Debug request answered by the static pre-check in {static_report['time'] * 1000:.1f} ms.")
+            result = {
+                "type": "ai_debug_result",
+                "success": True,
+                "suggestion": static_report["answer"]["suggestion"],
+                "corrected_code": static_report["answer"]["corrected_code"],
+                "raw_ai_response": None,
+                "usage": None,
+                "answered_locally": True,
+                "static_findings": static_report["findings"],
+            }
+            verification = self._verify_with_tests(result["corrected_code"], language, test_cases)
+            if verification is not None:
+                result["verification"] = verification
+            return result
+        static_context_string = ""
+        if static_report and static_report["findings"]:
+            static_context_string = "Static analysis findings (local checker, may be incomplete):\n" + format_findings(static_report["findings"]) + "\n"
+
         if model is None:
             logging.error("AI model is not initialized. Cannot debug code.")
             return {"type": "ai_debug_result", "success": False, "suggestion": "AI model is not available."}
@@ -291,26 +701,49 @@ class RyanAI:
         # Fetch relevant memory entries to provide context to the AI
         # This is a simplified example; you might need more sophisticated context retrieval
         memory_context_string = ""
-        if self.db:
-            all_memory = self.get_all_memory()
+        if self.db or memory is not None:
+            all_memory = memory if memory is not None else self.get_all_memory()
             if all_memory:
                  # Simple approach: include all memory for now.
                  # A better approach would be to filter memory based on the code content,
                  # language, or error message.
                  memory_context_string = "Relevant Memory (for context):\n" + "\n".join([f"- {k}: {v}" for k, v in all_memory.items()]) + "\n\n"
 
+        # Excerpts of uploaded documents that match the error (only the top-k chunks, not whole files)
+        document_chunks = []
+        try:
+            document_chunks = self.retrieve_document_chunks(error_output[-4000:])
+        except Exception as e:
+            logging.warning(f"Document retrieval for debugging failed: {e}")
+        document_context_string = format_chunks(document_chunks)
+
+        prompt_slice = slice_for_traceback(code_string, error_output, language)
+        if prompt_slice:
+            code_section = f"""Relevant parts of the code ({language}; {prompt_slice['sliced_lines']} of {prompt_slice['original_lines']} lines, the headers give their line numbers in the file):
+```{language}
+{prompt_slice['text']}
+```"""
+            corrected_code_instruction = """5. Give the fix as one or more SEARCH/REPLACE blocks against the code shown, copying the SEARCH lines exactly (without the '--- lines' headers):
+<<<<<<< SEARCH
+original lines
+=======
+corrected lines
+>>>>>>> REPLACE"""
+        else:
+            code_section = f"""Code ({language}):
+```{language}
+{code_string}
+```"""
+            corrected_code_instruction = "5. If you can provide the corrected code, include it in a separate code block."
 
         # Craft a detailed prompt for the AI
         prompt = f"""
 You are Ryan, an expert coding assistant. Your task is to analyze the provided code and the error message, identify the root cause of the error, and suggest a fix.
 
 {memory_context_string if memory_context_string else ''}
-
-Code ({language}):
-```{language}
-{code_string}
-```
-
+{document_context_string}
+{code_section}
+{static_context_string}
 Error Output:
 ```
 {error_output}
@@ -321,7 +754,7 @@ Task:
 2. Identify the specific line(s) causing the error if possible.
 3. Explain the reason for the error in simple terms.
 4. Provide a clear suggestion for how to fix the error.
-5. If you can provide the corrected code, include it in a separate code block.
+{corrected_code_instruction}
 
 Respond in a helpful and clear manner. If you cannot determine the fix, explain why.
 """
@@ -353,19 +786,39 @@ Respond in a helpful and clear manner. If you cannot determine the fix, explain
 
             # Look for a code block in the response
             code_match = re.search(r'```(?:\w+)?\n(.*?)\n```', ai_response_text, re.DOTALL)
-            if code_match:
+            if prompt_slice:
+                # The response edits (or redefines) parts of the file; apply them to the whole of it
+                corrected_code, applied = apply_sliced_fix(code_string, ai_response_text, language)
+                prompt_slice["applied"] = applied
+                suggestion = re.sub(r"^<{5,9} SEARCH.*?^>{5,9} REPLACE[^\n]*$", "", ai_response_text, flags=re.DOTALL | re.MULTILINE)
+                if applied == "definitions":
+                    suggestion = suggestion.replace(code_match.group(0), "")
+                suggestion = re.sub(r"\n{3,}", "\n\n", suggestion).strip()
+            elif code_match:
                 corrected_code = code_match.group(1).strip()
                 # Optionally, remove the code block from the suggestion text
                 suggestion = ai_response_text.replace(code_match.group(0), "").strip()
 
 
-            return {
+            result = {
                 "type": "ai_debug_result",
                 "success": True,
                 "suggestion": suggestion,
                 "corrected_code": corrected_code,
-                "raw_ai_response": ai_response_text # Include raw response for debugging
+                "raw_ai_response": ai_response_text, # Include raw response for debugging
+                "usage": model_usage(response),
+                "answered_locally": False,
             }
+            if static_report and static_report["findings"]:
+                result["static_findings"] = static_report["findings"]
+            if prompt_slice:
+                result["prompt_slice"] = {key: value for key, value in prompt_slice.items() if key != "text"}
+            if document_chunks:
+                result["document_excerpts"] = [{key: chunk[key] for key in ("doc_id", "file_name", "start_line", "end_line", "score")} for chunk in document_chunks]
+            verification = self._verify_with_tests(corrected_code, language, test_cases)
+            if verification is not None:
+                result["verification"] = verification
+            return result
 
         except Exception as e:
             logging.error(f"Error during AI debugging: {e}")
@@ -374,11 +827,14 @@ Respond in a helpful and clear manner. If you cannot determine the fix, explain
             return {"type": "error", "content": f"An error occurred during AI debugging: {str(e)}"}
 
 
-    def fix_code(self, original_code: str, suggested_fix: str, language: str, context: Optional[str] = None) -> Dict[str, Any]:
+    def fix_code(self, original_code: str, suggested_fix: str, language: str, context: Optional[str] = None,
+                 test_cases: Optional[List[Dict[str, Any]]] = None, mode: str = "full") -> Dict[str, Any]:
         """
         Applies a suggested fix to the original code.
         This could be as simple as replacing the code with the 'corrected_code' from debug_code,
         or more complex if the fix is a description.
+        With test_cases, the fixed code is run against them and the result is returned under "verification".
+        mode="diff" asks the model for edits instead of the whole file (see _fix_with_edits).
         """
         logging.info(f"Attempting to apply fix to {language} code.")
         logging.debug(f"Original Code:\n{original_code[:500]}...")
@@ -395,12 +851,16 @@ Respond in a helpful and clear manner. If you cannot determine the fix, explain
         if code_match:
             corrected_code = code_match.group(1).strip()
             logging.info("Applied fix by replacing with provided code block.")
-            return {
+            result = {
                 "type": "code_fix_result",
                 "success": True,
                 "fixed_code": corrected_code,
                 "message": "Applied fix using the provided code block."
             }
+            verification = self._verify_with_tests(corrected_code, language, test_cases)
+            if verification is not None:
+                result["verification"] = verification
+            return result
         else:
             # If the fix is not a code block, you might need to use the AI to apply it.
             # This is more complex and requires another AI call.
@@ -409,6 +869,8 @@ Respond in a helpful and clear manner. If you cannot determine the fix, explain
             if model is None:
                  logging.error("AI model is not initialized. Cannot use AI to apply fix.")
                  return {"type": "code_fix_result", "success": False, "message": "AI model is not available to apply the fix."}
+            if mode == "diff":
+                return self._fix_with_edits(original_code, suggested_fix, language, test_cases)
 
             # Craft a prompt for the AI to apply the natural language fix
             prompt = f"""
@@ -454,19 +916,25 @@ Provide only the corrected code in a code block, or an explanation if you cannot
                 if code_match_in_response:
                     corrected_code = code_match_in_response.group(1).strip()
                     logging.info("Applied fix using AI interpretation.")
-                    return {
+                    result = {
                         "type": "code_fix_result",
                         "success": True,
                         "fixed_code": corrected_code,
-                        "message": "Applied fix using AI interpretation of the suggestion."
+                        "message": "Applied fix using AI interpretation of the suggestion.",
+                        "usage": model_usage(response),
                     }
+                    verification = self._verify_with_tests(corrected_code, language, test_cases)
+                    if verification is not None:
+                        result["verification"] = verification
+                    return result
                 else:
                     # If the AI didn't provide a code block, return its explanation
                     logging.warning("AI did not provide a code block for the fix.")
                     return {
                         "type": "code_fix_result",
                         "success": False,
-                        "message": f"AI could not apply the fix or did not provide corrected code. AI response: {ai_response_text.strip()[:200]}..." # Return snippet of AI response
+                        "message": f"AI could not apply the fix or did not provide corrected code. AI response: {ai_response_text.strip()[:200]}...", # Return snippet of AI response
+                        "usage": model_usage(response),
                     }
 
             except Exception as e:
@@ -476,10 +944,127 @@ Provide only the corrected code in a code block, or an explanation if you cannot
                 return {"type": "error", "content": f"An error occurred during AI fix application: {str(e)}"}
 
 
-    def analyze_code(self, code_string: str, task_description: Optional[str] = None, context: Optional[str] = None) -> Dict[str, Any]:
+    def _fix_with_edits(self, original_code: str, suggested_fix: str, language: str,
+                        test_cases: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        Diff mode of fix_code: the model returns SEARCH/REPLACE blocks (or a unified diff) and the edits are
+        applied locally with a fuzzy matcher (ryan_patch.py), so a small fix to a large file doesn't cost the
+        whole file in output tokens. Falls back to full regeneration if the edits don't apply.
+        "token_savings" compares the output tokens with re-emitting the whole file.
+        """
+        prompt = f"""
+You are Ryan, an expert coding assistant. Apply the following suggested fix to the original code.
+
+Original Code ({language}):
+```{language}
+{original_code}
+```
+
+Suggested Fix (Description):
+{suggested_fix}
+
+Task:
+Return ONLY the changes, as one or more SEARCH/REPLACE blocks in exactly this format:
+
+<<<<<<< SEARCH
+lines copied exactly from the original code (enough of them to be unique)
+=======
+the lines that replace them
+>>>>>>> REPLACE
+
+Do not repeat unchanged code outside the blocks. A unified diff with @@ hunks is also accepted.
+"""
+        logging.debug(f"Prompt for AI Fix Edits:\n{prompt[:1000]}...")
+        usage = None
+        fallback_reason = None
+        try:
+            response = model.generate_content(prompt)
+            usage = model_usage(response)
+            response_text = response.text
+            edits = parse_edits(response_text)
+            fixed_code, report = apply_edits(original_code, edits)
+            if fixed_code.strip() == original_code.strip():
+                fallback_reason = "The edits did not change the code."
+        except PatchError as e:
+            fallback_reason = str(e)
+        except ValueError as e:
+            fallback_reason = f"Could not read the AI's edit response: {e}"
+        except Exception as e:
+            logging.error(f"Error during AI fix edits: {e}")
+            logging.error(traceback.format_exc())
+            fallback_reason = f"An error occurred while requesting edits: {e}"
+
+        if fallback_reason:
+            logging.warning(f"Diff-mode fix failed ({fallback_reason}); falling back to full regeneration.")
+            result = self.fix_code(original_code, suggested_fix, language, test_cases=test_cases, mode="full")
+            full_usage = result.get("usage") or {}
+            result["fix_mode"] = "full"
+            result["fallback"] = fallback_reason
+            result["diff_attempt_usage"] = usage
+            # Both calls count; the savings report shows what the failed attempt cost
+            result["usage"] = {key: (usage or {}).get(key, 0) + full_usage.get(key, 0) for key in ("prompt_tokens", "output_tokens", "total_tokens")}
+            return result
+
+        logging.info(f"Applied fix from {len(edits)} AI edit(s).")
+        result = {
+            "type": "code_fix_result",
+            "success": True,
+            "fixed_code": fixed_code,
+            "message": f"Applied {len(edits)} edit(s) from the AI's patch.",
+            "fix_mode": "diff",
+            "edits": report,
+            "usage": usage,
+            "token_savings": token_savings(usage["output_tokens"] if usage else None, response_text, fixed_code, language),
+        }
+        verification = self._verify_with_tests(fixed_code, language, test_cases)
+        if verification is not None:
+            result["verification"] = verification
+        return result
+
+
+    def start_auto_fix(self, code_string: str, language: str, max_iterations: Optional[int] = None,
+                       test_cases: Optional[List[Dict[str, Any]]] = None, fix_mode: str = "full") -> Dict[str, Any]:
+        """
+        Starts the run -> debug -> fix -> run loop (ryan_auto_fix.py) on a background thread.
+        Returns {"type": "auto_fix_started", "run": AutoFixRun}; follow it with run.next_event().
+        """
+        logging.info(f"Starting auto-fix loop for {language} code.")
+        if model is None:
+            return {"type": "error", "content": "AI model is not available."}
+        # Memory is fetched once here instead of on every debug_code call
+        memory = (self.get_all_memory() or {}) if self.db else None
+        run = AutoFixRun(code_string, language, max_iterations=max_iterations or AUTO_FIX_MAX_ITERATIONS, test_cases=test_cases,
+                         fix_mode=fix_mode)
+        get_auto_fix_registry().start(run, lambda r: run_auto_fix(r, self.execute_code, self.execute_tests,
+                                                                   self.debug_code, self.fix_code, memory=memory))
+        return {"type": "auto_fix_started", "run": run}
+
+
+    def get_auto_fix(self, run_id: str) -> Dict[str, Any]:
+        """Current state of an auto-fix run (iterations so far, status, fixed code)."""
+        run = get_auto_fix_registry().get(run_id)
+        if run is None:
+            return {"type": "error", "content": f"Unknown auto-fix run: {run_id}"}
+        return {"type": "auto_fix_result", **run.summary()}
+
+
+    def cancel_auto_fix(self, run_id: str) -> Dict[str, Any]:
+        cancelled = get_auto_fix_registry().cancel(run_id)
+        if cancelled is None:
+            return {"type": "error", "content": f"Unknown auto-fix run: {run_id}"}
+        return {"type": "auto_fix_cancelled", "run_id": run_id, "cancelled": cancelled}
+
+
+    def analyze_code(self, code_string: str, task_description: Optional[str] = None, context: Optional[str] = None,
+                     language: Optional[str] = None, profile: bool = False, chunked: Optional[bool] = None,
+                     memory: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Uses the AI model to analyze code, explain it, or determine if it meets a task description.
-        Includes relevant memory as context.
+        Includes relevant memory (memory = an already fetched get_all_memory() snapshot) and the caller's context.
+        profile=True first runs the code under the profiler (Python/JavaScript) and gives the model the
+        profile summary, so performance questions get advice about the actual hot spots.
+        chunked=True analyzes the code chunk by chunk and merges the results (ryan_chunked_analysis.py);
+        None does so for files of RYAN_ANALYSIS_CHUNK_THRESHOLD_LINES lines or more.
         """
         logging.info(f"Attempting to analyze code using AI.")
         logging.debug(f"Code:\n{code_string[:500]}...")
@@ -492,11 +1077,26 @@ Provide only the corrected code in a code block, or an explanation if you cannot
 
         # Fetch relevant memory entries for context
         memory_context_string = ""
-        if self.db:
-            all_memory = self.get_all_memory()
+        if self.db or memory is not None:
+            all_memory = memory if memory is not None else self.get_all_memory()
             if all_memory:
                  memory_context_string = "Relevant Memory (for context):\n" + "\n".join([f"- {k}: {v}" for k, v in all_memory.items()]) + "\n\n"
 
+        profile_result = None
+        if profile:
+            profile_result = self.execute_code(code_string, language or "python", profile=True)
+            if profile_result.get("profile"):
+                profile_context = "Profile of a run of this code:\n" + profile_result["profile"]["summary"]
+                context = f"{context}\n\n{profile_context}" if context else profile_context
+        context_string = f"Additional Context:\n{context}\n" if context else ""
+
+        if chunked or (chunked is None and len(code_string.splitlines()) >= ANALYSIS_CHUNK_THRESHOLD_LINES):
+            result = self._analyze_code_chunked(code_string, language, task_description or "Explain what this code does in detail.",
+                                                memory_context_string + context_string)
+            if profile_result and profile_result.get("profile") and result.get("success"):
+                result["profile"] = profile_result["profile"]
+            return result
+
         # Craft a prompt for the AI to analyze the code
         prompt = f"""
 You are Ryan, an expert coding assistant. Analyze the provided code.
@@ -504,10 +1104,12 @@ You are Ryan, an expert coding assistant. Analyze the provided code.
 {memory_context_string if memory_context_string else ''}
 
 Code:
-```
+```{language or ''}
 {code_string}
 ```
 
+{context_string}
+
 Task:
 {task_description if task_description else "Explain what this code does in detail."}
 
@@ -534,12 +1136,15 @@ Provide a clear and concise analysis or explanation. If the task description ask
 
             logging.info(f"AI Analysis response received (text): '{ai_response_text[:500]}...'")
 
-            return {
+            result = {
                 "type": "ai_analysis_result",
                 "success": True,
                 "analysis": ai_response_text.strip(),
                 "raw_ai_response": ai_response_text # Include raw response for debugging
             }
+            if profile_result and profile_result.get("profile"):
+                result["profile"] = profile_result["profile"]
+            return result
 
         except Exception as e:
             logging.error(f"Error during AI analysis: {e}")
@@ -548,12 +1153,152 @@ Provide a clear and concise analysis or explanation. If the task description ask
             return {"type": "error", "content": f"An error occurred during AI analysis: {str(e)}"}
 
 
+    def _analyze_code_chunked(self, code_string: str, language: Optional[str], task: str, preamble: str) -> Dict[str, Any]:
+        """Chunked (map-reduce) mode of analyze_code. "chunked" reports the chunks, how many came from the cache, and timings."""
+        try:
+            outcome = analyze_chunked(code_string, language, task, generate_text, preamble=preamble)
+        except Exception as e:
+            logging.error(f"Error during chunked AI analysis: {e}")
+            logging.error(traceback.format_exc())
+            return {"type": "error", "content": f"An error occurred during AI analysis: {str(e)}"}
+        logging.info(f"Chunked AI analysis done: {outcome['report']['chunk_count']} chunks, {outcome['report']['cached']} from cache.")
+        return {
+            "type": "ai_analysis_result",
+            "success": True,
+            "analysis": outcome["analysis"],
+            "raw_ai_response": outcome["analysis"],
+            "chunked": outcome["report"],
+            "usage": outcome["report"]["usage"],
+        }
+
+
+    def start_analysis_batch(self, items: List[Dict[str, Any]], max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Creates a batch of analyze_code inputs (code, task_description, context, language, chunked, id) - see
+        ryan_analysis_batch.py. Returns {"type": "analysis_batch_started", "batch"}; run it with run_analysis_batch.
+        """
+        if not items:
+            return {"type": "error", "content": "The batch is empty."}
+        if len(items) > ANALYSIS_BATCH_MAX_ITEMS:
+            return {"type": "error", "content": f"A batch can hold at most {ANALYSIS_BATCH_MAX_ITEMS} items."}
+        return {"type": "analysis_batch_started", "batch": AnalysisBatch(items, max_concurrency=max_concurrency)}
+
+
+    def run_analysis_batch(self, batch: AnalysisBatch) -> Dict[str, Any]:
+        """Analyzes every distinct input of the batch (memory is fetched once) and returns the results in input order."""
+        logging.info(f"Running analysis batch: {len(batch.items)} items, {len(batch.duplicates)} distinct, concurrency {batch.max_concurrency}.")
+        memory = (self.get_all_memory() or {}) if self.db else None
+        batch.run(lambda item: self.analyze_code(item["code"], item.get("task_description"), context=item.get("context"),
+                                                 language=item.get("language"), chunked=item.get("chunked"), memory=memory))
+        summary = batch.summary()
+        logging.info(f"Analysis batch done: {summary['succeeded']}/{summary['items']} succeeded in {summary['wall_time']:.2f}s.")
+        return {"type": "analysis_batch_result", "results": batch.results, "summary": summary}
+
+
+    def analyze_project(self, path: Optional[str] = None, archive: Optional[bytes] = None, archive_name: Optional[str] = None,
+                        name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Summarises a project (a server-side directory or a zip/tar archive) module by module in dependency order
+        (ryan_project.py). Re-submitting re-analyzes only changed modules and the modules that import them.
+        """
+        logging.info(f"Attempting to analyze project {name or path}.")
+        if model is None:
+            logging.error("AI model is not initialized. Cannot analyze project.")
+            return {"type": "error", "content": "AI model is not available."}
+        try:
+            files = load_project_files(path=path, archive=archive, archive_name=archive_name)
+            project_id = project_id_for(name, path)
+            outcome = run_project_analysis(files, generate_text, project_id)
+        except ProjectError as e:
+            logging.warning(f"Project analysis rejected: {e}")
+            return {"type": "error", "content": str(e), "project_error": "invalid"}
+        except Exception as e:
+            logging.error(f"Error during project analysis: {e}")
+            logging.error(traceback.format_exc())
+            return {"type": "error", "content": f"An error occurred during project analysis: {str(e)}"}
+        manifest = outcome["manifest"]
+        return {
+            "type": "project_analysis_result",
+            "success": not outcome["report"]["failed"],
+            "project_id": project_id,
+            **outcome["report"],
+            "graph": {path: info["imports"] for path, info in manifest["modules"].items()},
+            "cycles": manifest["cycles"],
+        }
+
+
+    def get_project(self, project_id: str) -> Dict[str, Any]:
+        """The stored manifest of an analyzed project: modules, content hashes, imports and dependency layers."""
+        manifest = get_project_store().get_manifest(project_id)
+        if manifest is None:
+            return {"type": "error", "content": f"Unknown project '{project_id}'.", "project_error": "not_found"}
+        return {"type": "project_info", **manifest}
+
+
+    def ask_project(self, project_id: str, question: str) -> Dict[str, Any]:
+        """Answers a whole-project question from the stored module summaries and import graph, without re-reading the code."""
+        logging.info(f"Answering question about project {project_id}.")
+        manifest = get_project_store().get_manifest(project_id)
+        if manifest is None:
+            return {"type": "error", "content": f"Unknown project '{project_id}'. Analyze it first.", "project_error": "not_found"}
+        if model is None:
+            return {"type": "error", "content": "AI model is not available."}
+        context_text, included = project_context(manifest, question)
+        prompt = f"""
+You are Ryan, an expert coding assistant. Answer a question about a software project from summaries of its modules.
+
+{context_text}
+
+Question:
+{question}
+
+Answer from the summaries and the import graph. Name the modules (file paths) your answer relies on. If the summaries don't contain enough information, say which modules would need a closer look.
+"""
+        try:
+            answer, usage = generate_text(prompt)
+        except Exception as e:
+            logging.error(f"Error answering project question: {e}")
+            logging.error(traceback.format_exc())
+            return {"type": "error", "content": f"An error occurred while answering: {str(e)}"}
+        return {
+            "type": "project_answer",
+            "success": True,
+            "project_id": project_id,
+            "answer": answer.strip(),
+            "modules_used": included,
+            "modules_total": len(manifest["modules"]),
+            "usage": usage,
+        }
+
+
     # --- Modified Chatbot Function to Route Coding Tasks ---
 
+    def _build_chat_pipeline(self) -> Pipeline:
+        """
+        Builds the staged chat pipeline. Cheap regex/classifier routing runs first,
+        then symbol questions answered from the code symbol index, then document retrieval, then memory retrieval, plugin candidate evaluation and a
+        speculative model call run concurrently, then the code/intent routes and the final generation.
+        """
+        return Pipeline("chat", [
+            FunctionStage("memory_save", self._stage_memory_save),
+            FunctionStage("route", self._stage_route),
+            FunctionStage("symbol_lookup", self._stage_symbol_lookup),
+            FunctionStage("document_lookup", self._stage_document_lookup),
+            [
+                FunctionStage("memory_lookup", self._stage_memory_lookup),
+                FunctionStage("plugin_candidates", self._stage_plugin_candidates),
+                FunctionStage("model_prefetch", self._stage_model_prefetch),
+            ],
+            FunctionStage("code_task", self._stage_code_task),
+            FunctionStage("intent_route", self._stage_intent_route),
+            FunctionStage("generate", self._stage_generate),
+        ], executor=self.executor)
+
     def chatbot(self, user_input: str, creative_context: Optional[str] = None) -> Dict[str, Any]:
         """
         Processes user input, interacts with memory/tools, and generates a response.
-        Now includes routing for coding tasks.
+        Now includes routing for coding tasks. Runs as a staged pipeline (see _build_chat_pipeline);
+        per-stage timings are returned under 'stage_timings'.
         """
         logging.info(f"Received user input: '{user_input}'")
         logging.debug(f"Received creative_context: {creative_context}")
@@ -566,7 +1311,17 @@ Provide a clear and concise analysis or explanation. If the task description ask
             # Let's allow memory commands to pass through.
             pass # Continue to check for memory commands
 
-        lower_input = user_input.lower().strip()
+        ctx = PipelineContext(user_input, creative_context)
+        response = self.chat_pipeline.run(ctx)
+        if response is None:
+            # The generate stage always answers, so this only happens if a stage misbehaves
+            response = {"type": "error", "content": "I couldn't process that request."}
+        response["stage_timings"] = ctx.timings
+        return response
+
+    def _stage_memory_save(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Handles 'remember/save/store ...' commands. Short-circuits with the confirmation."""
+        lower_input = ctx.lower_input
 
         # --- Memory Interaction Logic (Keep existing logic) ---
         # Check for memory saving, retrieval, deletion commands first
@@ -696,27 +1451,111 @@ Provide a clear and concise analysis or explanation. If the task description ask
         # let the AI handle it as a regular query.
         if save_command_detected and not memory_save_response:
              logging.warning("Memory save command detected but no valid save occurred. Passing to AI.")
+        return None
 
+    def _stage_route(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """
+        Pure-CPU routing: evaluates every regex route and the local intent classifier
+        up front so the concurrent stages know what work is actually needed.
+        """
+        lower_input = ctx.lower_input
 
         # --- Check for specific memory retrieval commands (e.g., "what do I like", "what is my bday") ---
         # Prioritize these direct questions before general entity queries
         # Added a new pattern specifically for asking about user's likes
-        get_my_likes_match = re.match(r"^(?:what do i like|what do you know i like|what are my likes)\s*\??$", lower_input)
+        ctx.data["get_my_likes_match"] = re.match(r"^(?:what do i like|what do you know i like|what are my likes)\s*\??$", lower_input)
 
         # Refined existing regexes to be more flexible with "my" or "your" and the attribute
         # Added more question words and made the attribute capture more flexible
-        get_attribute_match = re.match(r"^(?:what|when|where|who) is (my|your)\s+(.*?)\s*$", lower_input) # Catches "what is my name", "when is my bday"
-        get_do_you_know_match = re.match(r"^do you know (my|your)\s+(.*?)\s*$", lower_input) # Catches "do you know my name"
-        get_what_about_match = re.match(r"^what about (my|your)\s+(.*?)\s*$", lower_input) # Catches "what about my job"
+        ctx.data["get_attribute_match"] = re.match(r"^(?:what|when|where|who) is (my|your)\s+(.*?)\s*$", lower_input) # Catches "what is my name", "when is my bday"
+        ctx.data["get_do_you_know_match"] = re.match(r"^do you know (my|your)\s+(.*?)\s*$", lower_input) # Catches "do you know my name"
+        ctx.data["get_what_about_match"] = re.match(r"^what about (my|your)\s+(.*?)\s*$", lower_input) # Catches "what about my job"
+
+        # --- Enhanced: Check if the user is asking about a specific entity in memory ---
+        # This regex attempts to capture phrases like "what do you know about X", "tell me about Y", "who is Z", "what about X", "what does X like"
+        # Added more flexible matching for the entity name and question phrasing.
+        # Crucially, ensure group 2 is always captured if there's a match.
+        # Made the entity capture more robust by including common possessives like "'s"
+        # Added more question starters and made the entity capture more flexible
+        # Added word boundaries (\b) around the trigger phrases for more accurate matching
+        ctx.data["entity_query_match"] = re.search(r"\b(?:tell me about|what do you know about|who is|what about|what does|info on|details on)\b\s+(.+?)(?:'s)?(?:\s+like|\s+prefer|\s+have|\s+work at|\s+live in|enjoys?|hates?|loves?|wants?)?(?:\?)?$", lower_input) # Added more starters, 's, optional relations/question mark
+
+        # --- New: Check for Coding Task Commands ---
+        # These regexes are examples; you'll need to refine them based on
+        # the natural language commands you want Ryan to understand.
+        # Matched case-insensitively on the original input: the code itself must keep its case (Java, C, Go are case-sensitive)
+        code_input = ctx.user_input.strip()
+        # Example: "run this python code: ```python ... ```"
+        # Capture the language and the code block
+        ctx.data["run_code_match"] = re.search(r"^(?:run|execute)(?: this)?\s+(python|javascript|java|cpp|c|ruby|go)?\s*code:\s*```(?:\w+)?\n(.*?)\n```", code_input, re.DOTALL | re.IGNORECASE)
+        # Example: "debug this error in my code: ```...``` Error: ..."
+        # Capture the code block and the error message
+        ctx.data["debug_code_match"] = re.search(r"^(?:debug|fix|help with)(?: this)?(?: error)?(?: in my)?\s+(python|javascript|java|cpp|c|ruby|go)?\s*code:\s*```(?:\w+)?\n(.*?)\n```(?:\s*error:?\s*(.*?))?$", code_input, re.DOTALL | re.IGNORECASE)
+        # Example: "analyze this code: ```...``` What does it do?"
+        # Capture the code block and the task description
+        ctx.data["analyze_code_match"] = re.search(r"^(?:analyze|explain|what does)(?: this)?\s+(python|javascript|java|cpp|c|ruby|go)?\s*code:\s*```(?:\w+)?\n(.*?)\n```(?:\s*(.*?))?$", code_input, re.DOTALL | re.IGNORECASE)
+
+        ctx.data["retrieval_requested"] = bool(self.db and (ctx.data["get_my_likes_match"] or ctx.data["get_attribute_match"]
+                                                            or ctx.data["get_do_you_know_match"] or ctx.data["get_what_about_match"]))
+        ctx.data["entity_search_requested"] = bool(self.db and ctx.data["entity_query_match"] and not ctx.data["retrieval_requested"])
+        ctx.data["code_route_matched"] = bool(ctx.data["run_code_match"] or ctx.data["debug_code_match"] or ctx.data["analyze_code_match"])
+
+        # --- Local intent classifier: skip the LLM round trip for clear-cut intents ---
+        # Only consulted when no regex route answered. Low-confidence predictions (or a
+        # missing model file) return None and we fall through to the existing LLM path.
+        # Classification itself is sub-millisecond (see ryan_intent.py); the intent_route stage applies it.
+        ctx.data["intent"] = None
+        if not ctx.data["code_route_matched"]:
+            ctx.data["intent"] = classify_intent(ctx.user_input)
+        return None
+
+    def _stage_symbol_lookup(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Answers "where is X defined", "what calls X" etc. from the symbol index (ryan_symbol_index.py), without a model call."""
+        if ctx.data["retrieval_requested"] or ctx.data["code_route_matched"]:
+            return None
+        question = parse_symbol_question(ctx.user_input)
+        if not question:
+            return None
+        try:
+            result = get_symbol_index().lookup(question[1], calls_only=question[0] == "callers")
+        except Exception as e:
+            logging.warning(f"Symbol lookup for chat failed: {e}")
+            return None
+        answer = format_symbol_answer(question[0], question[1], result)
+        if answer is None:
+            logging.debug(f"Symbol index has nothing on '{question[1]}'. Falling back to AI.")
+            return None
+        return {"type": "text", "content": answer, "symbols": result}
 
+    def _stage_document_lookup(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Top-k uploaded document excerpts for the chat prompt (before the prefetch, which needs the final prompt)."""
+        ctx.data["document_context_string"] = ""
+        if ctx.data["retrieval_requested"] or ctx.data["code_route_matched"]:
+            return None
+        try:
+            chunks = self.retrieve_document_chunks(ctx.user_input, min_coverage=DOC_CHAT_MIN_COVERAGE)
+        except Exception as e:
+            logging.warning(f"Document retrieval for chat failed: {e}")
+            return None
+        if chunks:
+            ctx.data["document_context_string"] = format_chunks(chunks)
+            logging.debug(f"Including {len(chunks)} document excerpts in the chat prompt.")
+        return None
+
+    def _stage_memory_lookup(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Direct memory retrievals (short-circuit when found) and entity memory search for the prompt."""
+        ctx.data["memory_context_string"] = ""
+        ctx.data["queried_entity_name"] = None # Store the extracted entity name
+        get_my_likes_match = ctx.data["get_my_likes_match"]
+        get_attribute_match = ctx.data["get_attribute_match"]
+        get_do_you_know_match = ctx.data["get_do_you_know_match"]
+        get_what_about_match = ctx.data["get_what_about_match"]
 
         retrieved_value = None
         retrieval_key = None
-        retrieval_detected = False # Flag to indicate if a retrieval pattern was matched
 
         # --- Check for user likes retrieval first ---
         if get_my_likes_match and self.db:
-             retrieval_detected = True
              logging.debug("Detected 'what do I like' pattern. Attempting to retrieve 'user_likes' memory.")
              retrieved_value = self.get_memory("user_likes")
 
@@ -728,7 +1567,6 @@ Provide a clear and concise analysis or explanation. If the task description ask
 
         # --- Check for other specific attribute retrievals ---
         elif get_attribute_match and self.db:
-             retrieval_detected = True
              retrieval_key_part = get_attribute_match.group(2).strip() # e.g., "bday", "name"
              # Construct potential keys to check in memory
              potential_keys = [retrieval_key_part, f"my {retrieval_key_part}", f"your {retrieval_key_part}"]
@@ -760,7 +1598,6 @@ Provide a clear and concise analysis or explanation. If the task description ask
                  pass # Fall through to AI if not found by direct key
 
         elif get_do_you_know_match and self.db:
-             retrieval_detected = True
              retrieval_key_part = get_do_you_know_match.group(2).strip() # e.g., "name"
              potential_keys = [retrieval_key_part, f"my {retrieval_key_part}", f"your {retrieval_key_part}"]
              logging.debug(f"Detected 'do you know my/your X' pattern. Potential keys: {potential_keys}")
@@ -778,7 +1615,6 @@ Provide a clear and concise analysis or explanation. If the task description ask
                  pass # Fall through
 
         elif get_what_about_match and self.db:
-             retrieval_detected = True
              retrieval_key_part = get_what_about_match.group(2).strip() # e.g., "job"
              potential_keys = [retrieval_key_part, f"my {retrieval_key_part}", f"your {retrieval_key_part}"]
              logging.debug(f"Detected 'what about my/your X' pattern. Potential keys: {potential_keys}")
@@ -795,25 +1631,13 @@ Provide a clear and concise analysis or explanation. If the task description ask
                  logging.debug(f"Specific memory keys not found for 'what about my/your X'. Proceeding to AI.")
                  pass # Fall through
 
-
-        # --- Enhanced: Check if the user is asking about a specific entity in memory ---
-        # This regex attempts to capture phrases like "what do you know about X", "tell me about Y", "who is Z", "what about X", "what does X like"
-        # Added more flexible matching for the entity name and question phrasing.
-        # Crucially, ensure group 2 is always captured if there's a match.
-        # Made the entity capture more robust by including common possessives like "'s"
-        # Added more question starters and made the entity capture more flexible
-        # Added word boundaries (\b) around the trigger phrases for more accurate matching
-        entity_query_match = re.search(r"\b(?:tell me about|what do you know about|who is|what about|what does|info on|details on)\b\s+(.+?)(?:'s)?(?:\s+like|\s+prefer|\s+have|\s+work at|\s+live in|enjoys?|hates?|loves?|wants?)?(?:\?)?$", lower_input) # Added more starters, 's, optional relations/question mark
-
-
-        memory_context_string = ""
-        queried_entity_name = None # Store the extracted entity name
-
         # Only perform general entity search if no specific retrieval pattern was matched
-        if entity_query_match and self.db and not retrieval_detected:
+        entity_query_match = ctx.data["entity_query_match"]
+        if ctx.data["entity_search_requested"]:
             # Check if group 2 exists and is not empty before accessing it
-            if len(entity_query_match.groups()) >= 1 and entity_query_match.group(1): # Corrected group index to 1 for the entity capture
+            if len(entity_query_match.groups()) >= 1 and entity_query_match.group(1):
                 queried_entity_name = entity_query_match.group(1).strip()
+                ctx.data["queried_entity_name"] = queried_entity_name
                 logging.info(f"Detected query about entity: '{queried_entity_name}'. Searching memory.")
 
                 # Fetch all memory entries
@@ -871,45 +1695,87 @@ Provide a clear and concise analysis or explanation. If the task description ask
                              memory_context_string += f"- {key}: {value}\n"
 
                     memory_context_string += "\n" # Add a newline to separate from the user query
+                    ctx.data["memory_context_string"] = memory_context_string
                     logging.debug("Formatted memory context:\n" + memory_context_string)
                 else:
                     logging.debug(f"No relevant memory found for '{queried_entity_name}'.")
             else:
                  # If entity_query_match was true but entity name could not be extracted
-                 logging.warning(f"Entity query pattern matched, but entity name could not be extracted from '{user_input}'.")
+                 logging.warning(f"Entity query pattern matched, but entity name could not be extracted from '{ctx.user_input}'.")
                  # Fall through to general AI processing without memory context
-                 pass # Continue to prompt preparation
+        return None
+
+    def _stage_plugin_candidates(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Evaluates plugin handle_command candidates when the classifier says this is a plugin request."""
+        ctx.data["plugin_response"] = None
+        intent = ctx.data.get("intent")
+        if intent and intent[0] == "plugin":
+            ctx.data["plugin_response"] = self._try_chat_plugins(ctx.user_input)
+        return None # Applied by the intent_route stage, after higher-priority routes
+
+    def _build_chat_prompt(self, user_input: str, memory_context_string: str, creative_context: Optional[str],
+                           document_context_string: str = "") -> str:
+        """Assembles the general chat prompt."""
+        prompt_parts = []
 
+        # Add a system instruction or persona
+        prompt_parts.append("You are Ryan, a friendly, conversational, and helpful AI assistant. You aim to sound human-like. Your primary function is to chat with the user and remember facts they tell you. **CRITICAL INSTRUCTION:** Below, under 'Relevant Memory', I might provide facts I have saved about the topic the user is asking about. If 'Relevant Memory' is present and directly relates to the user's question, you ABSOLUTELY MUST use that information to answer the question. Do NOT ignore the 'Relevant Memory' if it's relevant. If the user asks about something and there is NO 'Relevant Memory' provided for that specific topic, then you can politely say you don't have information on that, maintaining a helpful and friendly tone. Be concise and directly address the user's input.\n\n")
 
-        # --- New: Check for Coding Task Commands ---
-        # These regexes are examples; you'll need to refine them based on
-        # the natural language commands you want Ryan to understand.
+        # Include the memory context if found (from entity query or general retrieval attempt)
+        if memory_context_string:
+            prompt_parts.append(memory_context_string)
 
-        # Example: "run this python code: ```python ... ```"
-        # Capture the language and the code block
-        run_code_match = re.search(r"^(?:run|execute)(?: this)?\s+(python|javascript|java|cpp|c|ruby|go)?\s*code:\s*```(?:\w+)?\n(.*?)\n```", lower_input, re.DOTALL)
+        # Include excerpts of uploaded documents that match the input (see ryan_doc_index.py)
+        if document_context_string:
+            prompt_parts.append(document_context_string + "\n")
 
-        # Example: "debug this error in my code: ```...``` Error: ..."
-        # Capture the code block and the error message
-        debug_code_match = re.search(r"^(?:debug|fix|help with)(?: this)?(?: error)?(?: in my)?\s+(python|javascript|java|cpp|c|ruby|go)?\s*code:\s*```(?:\w+)?\n(.*?)\n```(?:\s*error:?\s*(.*?))?$", lower_input, re.DOTALL)
+        # Include the creative context if provided (e.g., from a UI)
+        if creative_context:
+            prompt_parts.append(f"User is currently viewing this content:\n{creative_context}\n\n")
+            logging.debug("Including creative context in prompt.")
 
-        # Example: "analyze this code: ```...``` What does it do?"
-        # Capture the code block and the task description
-        analyze_code_match = re.search(r"^(?:analyze|explain|what does)(?: this)?\s+(python|javascript|java|cpp|c|ruby|go)?\s*code:\s*```(?:\w+)?\n(.*?)\n```(?:\s*(.*?))?$", lower_input, re.DOTALL)
+        # Add the user's current input
+        prompt_parts.append(user_input)
+        return "".join(prompt_parts)
 
+    def _stage_model_prefetch(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """
+        Starts the model call early when the final prompt is already known: no memory
+        lookup can change it and no local route is expected to answer. The generate stage
+        reuses the in-flight call instead of starting a new round trip.
+        """
+        if model is None or not SPECULATIVE_MODEL_CALLS:
+            return None
+        intent = ctx.data.get("intent")
+        if (ctx.data["retrieval_requested"] or ctx.data["entity_search_requested"] or ctx.data["code_route_matched"]
+                or (intent and intent[0] != "chat")):
+            return None
+        prompt = self._build_chat_prompt(ctx.user_input, "", ctx.creative_context, ctx.data.get("document_context_string", ""))
+        ctx.data["prefetch_prompt"] = prompt
+        ctx.data["prefetch_future"] = self.prefetch_executor.submit(model.generate_content, prompt)
+        logging.debug("Started speculative model call for chat input.")
+        return None
+
+    def _stage_code_task(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Routes explicit 'run/debug/analyze ... code:' commands."""
+        memory_context_string = ctx.data.get("memory_context_string", "")
+        creative_context = ctx.creative_context
+        run_code_match = ctx.data["run_code_match"]
+        debug_code_match = ctx.data["debug_code_match"]
+        analyze_code_match = ctx.data["analyze_code_match"]
 
         # --- Route to appropriate function based on command ---
 
         if run_code_match:
             logging.info("Detected 'run code' command.")
-            language = run_code_match.group(1) or 'python' # Default to python if language not specified
+            language = (run_code_match.group(1) or 'python').lower() # Default to python if language not specified
             code_string = run_code_match.group(2).strip()
             # Call the new execute_code method
             return self.execute_code(code_string, language)
 
         elif debug_code_match:
             logging.info("Detected 'debug code' command.")
-            language = debug_code_match.group(1) or 'unknown' # Default to unknown if language not specified
+            language = (debug_code_match.group(1) or 'unknown').lower() # Default to unknown if language not specified
             code_string = debug_code_match.group(2).strip()
             error_output = debug_code_match.group(3).strip() if debug_code_match.group(3) else ""
             # Call the new debug_code method
@@ -919,13 +1785,31 @@ Provide a clear and concise analysis or explanation. If the task description ask
 
         elif analyze_code_match:
             logging.info("Detected 'analyze code' command.")
-            language = analyze_code_match.group(1) or 'unknown' # Language might not be strictly needed for analysis by AI
+            language = (analyze_code_match.group(1) or 'unknown').lower() # Language might not be strictly needed for analysis by AI
             code_string = analyze_code_match.group(2).strip()
             task_description = analyze_code_match.group(3).strip() if analyze_code_match.group(3) else None
             # Call the new analyze_code method
             context_for_analyze = creative_context if creative_context else memory_context_string
             return self.analyze_code(code_string, task_description, context=context_for_analyze)
-
+        return None
+
+    def _stage_intent_route(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Local intent classifier: skip the LLM round trip for clear-cut intents."""
+        intent = ctx.data.get("intent")
+        if not intent:
+            return None # Low-confidence predictions (or no model file) fall through to the LLM
+        intent_label, intent_confidence = intent
+        logging.info(f"Intent classifier routed input to '{intent_label}' (confidence {intent_confidence:.2f}).")
+        if intent_label == "plugin":
+            # Already evaluated concurrently by the plugin_candidates stage
+            return ctx.data.get("plugin_response")
+        context = ctx.creative_context if ctx.creative_context else ctx.data.get("memory_context_string", "")
+        return self._route_by_intent(intent_label, ctx.user_input, context)
+
+    def _stage_generate(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Builds the final prompt and calls the model (or collects the speculative call)."""
+        memory_context_string = ctx.data.get("memory_context_string", "")
+        queried_entity_name = ctx.data.get("queried_entity_name")
 
         # --- If no specific command matched, proceed to general chat or memory retrieval ---
 
@@ -940,31 +1824,20 @@ Provide a clear and concise analysis or explanation. If the task description ask
             logging.error("AI model is not initialized. Cannot process general chat.")
             return {"type": "error", "content": "AI model is not available for general chat."}
 
-        prompt_parts = []
-
-        # Add a system instruction or persona
-        prompt_parts.append("You are Ryan, a friendly, conversational, and helpful AI assistant. You aim to sound human-like. Your primary function is to chat with the user and remember facts they tell you. **CRITICAL INSTRUCTION:** Below, under 'Relevant Memory', I might provide facts I have saved about the topic the user is asking about. If 'Relevant Memory' is present and directly relates to the user's question, you ABSOLUTELY MUST use that information to answer the question. Do NOT ignore the 'Relevant Memory' if it's relevant. If the user asks about something and there is NO 'Relevant Memory' provided for that specific topic, then you can politely say you don't have information on that, maintaining a helpful and friendly tone. Be concise and directly address the user's input.\n\n")
-
-
-        # Include the memory context if found (from entity query or general retrieval attempt)
-        if memory_context_string:
-            prompt_parts.append(memory_context_string)
-
-        # Include the creative context if provided (e.g., from a UI)
-        if creative_context:
-            prompt_parts.append(f"User is currently viewing this content:\n{creative_context}\n\n")
-            logging.debug("Including creative context in prompt.")
-
-        # Add the user's current input
-        prompt_parts.append(user_input)
-
-        final_prompt = "".join(prompt_parts)
+        final_prompt = self._build_chat_prompt(ctx.user_input, memory_context_string, ctx.creative_context,
+                                               ctx.data.get("document_context_string", ""))
         logging.debug(f"Final prompt sent to AI:\n{final_prompt}")
 
 
         # --- Generate Response using AI Model (for general chat) ---
         try:
-            response = model.generate_content(final_prompt)
+            prefetch_future = ctx.data.get("prefetch_future")
+            if prefetch_future is not None and ctx.data.get("prefetch_prompt") == final_prompt and not prefetch_future.cancel():
+                logging.debug("Using speculative model call result.")
+                response = prefetch_future.result()
+            else:
+                # No prefetch, a different prompt, or the prefetch was still queued behind other requests (cancelled above)
+                response = model.generate_content(final_prompt)
 
             # Check for safety ratings
             if hasattr(response, 'prompt_feedback') and response.prompt_feedback.block_reason:
@@ -1042,6 +1915,141 @@ Provide a clear and concise analysis or explanation. If the task description ask
                  # If no memory was found and AI failed to respond
                  return {"type": "text", "content": f"I ran into a problem trying to generate a response. Could you try asking in a different way?"}
 
+    def query_model(self, prompt: str, temperature: Optional[float] = None, max_new_tokens: Optional[int] = None) -> Optional[str]:
+        """Plain text generation helper for plugins (e.g. JokePlugin). Returns None on failure."""
+        if model is None:
+            return None
+        generation_config = {}
+        if temperature is not None:
+            generation_config["temperature"] = temperature
+        if max_new_tokens is not None:
+            generation_config["max_output_tokens"] = max_new_tokens
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config or None)
+            return response.text
+        except Exception as e:
+            logging.error(f"query_model failed: {e}")
+            return None
+
+
+    # --- Intent Routing Helpers (used by the local intent classifier) ---
+
+    def _route_by_intent(self, intent_label: str, user_input: str, context: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Tries to answer locally for a classified intent.
+        Returns None when the route can't produce an answer, so the caller falls back to the LLM.
+        """
+        if intent_label == "memory":
+            return self._answer_from_memory(user_input)
+        elif intent_label == "plugin":
+            return self._try_chat_plugins(user_input)
+        elif intent_label == "code":
+            return self._route_code_intent(user_input, context)
+        return None # 'chat' (or unknown labels) always goes to the LLM
+
+    def _answer_from_memory(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """Answers a memory lookup phrased freely by keyword-matching saved entries."""
+        if not self.db:
+            return None
+        stopwords = {"what", "do", "you", "remember", "about", "recall", "did", "i", "tell", "know", "the", "a", "an",
+                     "is", "are", "my", "me", "your", "for", "in", "of", "have", "told", "said", "before", "still",
+                     "anything", "memory", "saved", "look", "up", "remind", "what's", "whats", "to", "on", "it"}
+
+        def terms(text: str) -> set:
+            # Whole words, with a trailing plural "s" dropped so "dogs" matches "dog"
+            return {word[:-1] if len(word) > 3 and word.endswith("s") else word
+                    for word in re.findall(r"[a-z0-9']+", text.lower().replace("_", " "))}
+
+        keywords = terms(" ".join(word for word in re.findall(r"[a-z0-9']+", user_input.lower()) if word not in stopwords and len(word) > 1))
+        if not keywords:
+            return None
+        all_memory = self.get_all_memory()
+        scored = []
+        for key, value in all_memory.items():
+            if key.startswith(_FILE_MEMORY_PREFIXES) or not isinstance(value, (str, int, float)):
+                continue
+            score = len(keywords & terms(f"{key} {value}")) / len(keywords)
+            if score >= MEMORY_ANSWER_MIN_SCORE:
+                scored.append((score, key))
+        if not scored:
+            logging.debug(f"Intent router found no memory entries for keywords {sorted(keywords)}. Falling back to AI.")
+            return None
+        matches = {key: all_memory[key] for _, key in sorted(scored, key=lambda item: (-item[0], item[1]))[:MEMORY_ANSWER_MAX_ENTRIES]}
+        lines = []
+        for key in sorted(matches.keys()):
+            value = matches[key]
+            if key == "user_likes":
+                lines.append(f"- You like {value}")
+            elif key.startswith("fact_"):
+                lines.append(f"- {value}")
+            else:
+                lines.append(f"- {key.replace('_', ' ')}: {value}")
+        return {"type": "text", "content": "Here's what I remember:\n" + "\n".join(lines)}
+
+    def _load_chat_plugins(self) -> List[Any]:
+        """Imports plugin classes from the plugins package (TimePlugin for time_plugin.py, etc.)."""
+        if self.chat_plugins is not None:
+            return self.chat_plugins
+        self.chat_plugins = []
+        plugins_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plugins")
+        if not os.path.isdir(plugins_dir):
+            return self.chat_plugins
+        for file_name in sorted(os.listdir(plugins_dir)):
+            if not file_name.endswith(".py") or file_name.startswith("_"):
+                continue
+            plugin_name = file_name[:-3]
+            if is_isolated(plugin_name):
+                # Isolated plugins are instantiated inside the worker pool, not here
+                self.chat_plugins.append(plugin_name)
+                continue
+            class_name = "".join(part.capitalize() for part in plugin_name.split("_"))
+            try:
+                plugin_module = importlib.import_module(f"plugins.{plugin_name}")
+                plugin_class = getattr(plugin_module, class_name, None)
+                if plugin_class and hasattr(plugin_class, "handle_command"):
+                    self.chat_plugins.append(plugin_class(self))
+            except Exception as e:
+                logging.error(f"Failed to load chat plugin '{plugin_name}': {e}")
+        logging.info(f"Loaded {len(self.chat_plugins)} chat plugins for intent routing.")
+        return self.chat_plugins
+
+    def _try_chat_plugins(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """Offers the input to each plugin's handle_command; the first non-None answer wins."""
+        for plugin in self._load_chat_plugins():
+            try:
+                if isinstance(plugin, str):
+                    plugin_response = get_plugin_pool().call(plugin, user_input, entry_point="handle_command", query_model=self.query_model)
+                else:
+                    plugin_response = plugin.handle_command(user_input)
+            except Exception as e:
+                logging.error(f"Chat plugin {plugin} failed: {e}")
+                continue
+            if plugin_response is not None:
+                logging.info(f"Chat plugin {plugin if isinstance(plugin, str) else type(plugin).__name__} handled the input.")
+                return {"type": "text", "content": plugin_response}
+        return None
+
+    def _route_code_intent(self, user_input: str, context: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Routes a freely phrased coding request that includes a fenced code block."""
+        code_block_match = re.search(r"```(\w+)?\n?(.*?)```", user_input, re.DOTALL)
+        if not code_block_match or not code_block_match.group(2).strip():
+            return None # Without code there's nothing to run locally; let the LLM answer
+        language = (code_block_match.group(1) or "python").lower()
+        code_string = code_block_match.group(2).strip()
+        instruction = (user_input[:code_block_match.start()] + " " + user_input[code_block_match.end():]).strip()
+        lower_instruction = instruction.lower()
+        # "is A faster than B?" / "benchmark this" - measure instead of letting the model guess
+        if language in BENCHMARKED_LANGUAGES and re.search(r"\b(faster|benchmark|which is quicker|how fast|time it)\b", lower_instruction):
+            blocks = [block for block in re.findall(r"```(?:\w+)?\n?(.*?)```", user_input, re.DOTALL) if block.strip()]
+            return self.benchmark_code(blocks[0].strip(), language, compare_code=blocks[1].strip() if len(blocks) > 1 else None)
+        if re.search(r"\b(run|execute|output of)\b", lower_instruction):
+            return self.execute_code(code_string, language)
+        error_match = re.search(r"\b(?:error|traceback|exception)\b:?\s*(.*)$", instruction, re.IGNORECASE | re.DOTALL)
+        if re.search(r"\b(debug|bug|fix|crash|error|exception|traceback)\b", lower_instruction):
+            return self.debug_code(code_string, error_match.group(1).strip() if error_match else "", language, context=context)
+        # "why is this slow?" - profile first so the advice is about the measured hot spots
+        wants_profile = language in PROFILED_LANGUAGES and re.search(r"\b(slow|slower|faster|speed up|performance|perf|profile|bottleneck|optimi[sz]e)\b", lower_instruction)
+        return self.analyze_code(code_string, instruction or None, context=context, language=language, profile=bool(wants_profile))
 
     # --- Placeholder for other functionalities like web search ---
     def web_search(self, query: str) -> Optional[Dict[str, Any]]:
@@ -1076,6 +2084,21 @@ Provide a clear and concise analysis or explanation. If the task description ask
     # --- Placeholder for Plugin System ---
     def run_plugin(self, plugin_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Loads and runs a plugin dynamically."""
+        # Plugins configured in RYAN_ISOLATED_PLUGINS run in the warm worker pool
+        # so a leaking or CPU-hungry plugin can't degrade the API process.
+        if is_isolated(plugin_name):
+            try:
+                logging.info(f"Running plugin in isolated worker: {plugin_name}")
+                result = get_plugin_pool().call(plugin_name, parameters, query_model=self.query_model)
+                return {"type": "plugin_result", "content": result, "isolated": True}
+            except PluginWorkerError as e:
+                logging.error(f"Isolated plugin '{plugin_name}' failed ({e.kind}): {e}")
+                if e.kind == "import_error":
+                    return {"type": "error", "content": f"Plugin '{plugin_name}' not found."}
+                if e.kind == "not_runnable":
+                    return {"type": "error", "content": f"Plugin '{plugin_name}' is not runnable."}
+                return {"type": "error", "content": f"Error running plugin '{plugin_name}': {str(e)}"}
+
         try:
             # Example: Dynamically import a plugin module
             # Ensure the 'plugins' directory is in your Python path if using this
@@ -1131,20 +2154,31 @@ Provide a clear and concise analysis or explanation. If the task description ask
 
         logging.info(f"Detected potential language '{language}' for file '{file_name}'.")
 
-        # Option 1: Save the entire file content to memory (be mindful of size limits)
-        # Use a key that includes the filename and maybe a hash for versioning
-        file_memory_key = f"file_content_{file_name.replace('.', '_').replace('/', '_')}"
-        success_save_content = self.save_memory(file_memory_key, file_content)
-        if success_save_content:
-             processed_facts.append(f"Saved content of file '{file_name}' to memory.")
+        # Option 1: Index the content in chunks for retrieval (ryan_doc_index.py) and keep the bytes in the deduplicated
+        # blob store (ryan_blob_store.py); memory only holds the manifest, so the file never becomes one large memory value
+        index_report = self.index_document(file_name, file_content.splitlines(), None if language == "unknown" else language)
+        if index_report:
+             processed_facts.append(f"Indexed content of file '{file_name}' for retrieval ({index_report['chunks']} chunks).")
+        else:
+             processed_facts.append(f"Failed to index content of file '{file_name}'.")
+        storage_report = self._store_document(file_name, index_report, data=file_content.encode("utf-8"))
+        if storage_report:
+             processed_facts.append(f"Stored content of file '{file_name}' ({storage_report['new_chunks']} of {storage_report['chunks']} chunks new, {storage_report['stored_bytes']} bytes written).")
         else:
-             processed_facts.append(f"Failed to save content of file '{file_name}' to memory.")
+             processed_facts.append(f"Failed to store content of file '{file_name}'.")
+        if language in SYMBOL_LANGUAGES:
+             symbol_report = self.index_symbols(file_name, file_content, language)
+             if symbol_report and not symbol_report["error"]:
+                  processed_facts.append(f"Indexed {symbol_report['definitions']} definitions and {symbol_report['references']} references in file '{file_name}'.")
+             else:
+                  processed_facts.append(f"Failed to index symbols of file '{file_name}'{': ' + symbol_report['error'] if symbol_report else ''}.")
 
 
         # Option 2: Use AI to summarize or extract key info from the code
         if model and language != "unknown":
              logging.info(f"Attempting to use AI to analyze content of '{file_name}'.")
-             analysis_result = self.analyze_code(file_content, task_description=f"Summarize this {language} code and explain its main purpose and key functions/classes.")
+             analysis_result = self.analyze_code(file_content, task_description=f"Summarize this {language} code and explain its main purpose and key functions/classes.",
+                                                 language=language)
              if analysis_result.get("success"):
                   analysis_key = f"file_summary_{file_name.replace('.', '_').replace('/', '_')}"
                   success_save_analysis = self.save_memory(analysis_key, analysis_result.get("analysis"))
@@ -1187,6 +2221,204 @@ Provide a clear and concise analysis or explanation. If the task description ask
 
         logging.info(confirmation)
         return confirmation
+
+
+    def process_document_file(self, upload: SpooledUpload) -> Dict[str, Any]:
+        """
+        Processes a document spooled to disk by /upload_document/stream (ryan_upload.py). Text documents are
+        parsed line by line without loading the file; code files go through process_document.
+        Returns {"type": "text", "content": confirmation, "upload": sizes, counts and MB/s}.
+        """
+        logging.info(f"Processing spooled document: {upload.file_name} ({upload.size} bytes)")
+        start = time.perf_counter()
+        language = DOCUMENT_LANGUAGES.get(os.path.splitext(upload.file_name)[1].lower())
+        report: Dict[str, Any] = {"bytes": upload.size, "receive_seconds": round(upload.receive_seconds, 6),
+                                  "receive_mb_per_s": throughput(upload.size, upload.receive_seconds)}
+        if language:
+            if upload.size > UPLOAD_MAX_CODE_BYTES:
+                return {"type": "error", "content": f"Code files are limited to {UPLOAD_MAX_CODE_BYTES // 1024} KB for analysis.", "upload": report}
+            with open(upload.path, "r", encoding="utf-8", errors="replace") as handle:
+                confirmation = self.process_document(upload.file_name, handle.read())
+        else:
+            index_report = self.index_document(upload.file_name, (line for _, line in iter_lines(upload.path)))
+            report["chunks_indexed"] = index_report["chunks"] if index_report else 0
+            storage_report = self._store_document(upload.file_name, index_report, path=upload.path)
+            if storage_report:
+                report["storage"] = {key: storage_report[key] for key in ("file_id", "chunks", "new_chunks", "stored_bytes", "saved_bytes", "mb_per_s")}
+            saved, failed, listed = 0, 0, []
+            for number, key, value in iter_key_values(upload.path):
+                if self.save_memory(key, value):
+                    saved += 1
+                    if len(listed) < UPLOAD_REPORTED_ACTIONS:
+                        listed.append(f"Saved fact '{key}': '{value[:200]}' from '{upload.file_name}'")
+                else:
+                    failed += 1
+                    if len(listed) < UPLOAD_REPORTED_ACTIONS:
+                        listed.append(f"Failed to save fact '{key}' (line {number}) from '{upload.file_name}'")
+            report.update({"facts_saved": saved, "facts_failed": failed})
+            if listed:
+                more = saved + failed - len(listed)
+                confirmation = f"Successfully processed document '{upload.file_name}'. Actions taken:\n" + "\n".join(listed)
+                if more > 0:
+                    confirmation += f"\n... and {more} more ({saved} facts saved, {failed} failed in total)."
+            else:
+                confirmation = f"Successfully processed document '{upload.file_name}', but did not find specific actions to take (e.g., no code or Key: Value facts)."
+        process_seconds = time.perf_counter() - start
+        report.update({"process_seconds": round(process_seconds, 6), "process_mb_per_s": throughput(upload.size, process_seconds)})
+        logging.info(f"Document '{upload.file_name}' ingested: received at {report['receive_mb_per_s']} MB/s, processed at {report['process_mb_per_s']} MB/s.")
+        return {"type": "text", "content": confirmation, "upload": report}
+
+
+    def _store_document(self, file_name: str, index_report: Optional[Dict[str, Any]], data: Optional[bytes] = None,
+                        path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Puts the document's bytes in the blob store and saves its manifest (not its content) to memory. None on failure.
+        Nothing is stored for a document that wasn't indexed: its content is served by doc_id, so it would be unreachable.
+        """
+        if index_report is None:
+            logging.warning(f"Not storing document '{file_name}': it has no index entry to reach it by.")
+            return None
+        try:
+            store = get_blob_store()
+            storage_report = store.put_file(file_name, path) if path is not None else store.put_bytes(file_name, data or b"")
+        except Exception as e:
+            logging.error(f"Storing document '{file_name}' failed: {e}")
+            logging.error(traceback.format_exc())
+            return None
+        self.save_memory(memory_key_for(file_name), {"file_name": file_name, "blob": storage_report["file_id"], "bytes": storage_report["size"],
+                                                     "chunks": storage_report["chunks"], "doc_id": index_report["doc_id"]})
+        return storage_report
+
+    def read_document_content(self, doc_id: str, offset: int = 0, length: Optional[int] = None) -> Dict[str, Any]:
+        """A byte range of an uploaded document from the blob store: {"type": "document_content", "data": bytes, "read": report}."""
+        file_name = get_document_index().file_name_for(doc_id)
+        if file_name is None:
+            return {"type": "error", "content": f"Unknown document: {doc_id}"}
+        try:
+            data, read_report = get_blob_store().read(file_name, offset, length)
+        except BlobStoreError as e:
+            return {"type": "error", "content": str(e)}
+        return {"type": "document_content", "data": data, "read": read_report}
+
+    def start_ingest(self, source: str, ingest_id: str, analyze: bool = False, uploaded: bool = False) -> Dict[str, Any]:
+        """
+        Creates an ingest of a folder or a zip/tar archive file (ryan_ingest.py); run it with run_ingest.
+        Files are stored as "<ingest_id>/<path>", and re-ingesting the same ingest_id skips unchanged files.
+        source is a server-side path under RYAN_INGEST_ROOT unless uploaded (a spooled upload of the server's own).
+        """
+        if not ingest_id or not ingest_id.strip("/"):
+            return {"type": "error", "content": "An ingest id is required."}
+        try:
+            if not uploaded:
+                source = resolve_ingest_path(source)
+            check_ingest_id(ingest_id.strip("/"))
+        except IngestError as e:
+            logging.warning(f"Ingest '{ingest_id}' rejected: {e}")
+            return {"type": "error", "content": str(e)}
+        return {"type": "ingest_started", "run": IngestRun(source, ingest_id, analyze=analyze)}
+
+    def run_ingest(self, run: IngestRun) -> Dict[str, Any]:
+        """Ingests every changed file in parallel, then (optionally) summarises the Python/JavaScript files."""
+        logging.info(f"Ingesting {run.source} as '{run.ingest_id}' with {INGEST_WORKERS} workers.")
+        try:
+            run.run(self.save_memory_batch, self.delete_memory, embed=embed_texts if DOC_EMBEDDINGS_ENABLED else None)
+        except IngestError as e:
+            logging.warning(f"Ingest of '{run.ingest_id}' rejected: {e}")
+            run.finish(error=str(e))
+            return {"type": "error", "content": str(e), "summary": run.summary()}
+        except Exception as e:
+            logging.error(f"Error during ingest of '{run.ingest_id}': {e}")
+            logging.error(traceback.format_exc())
+            run.finish(error=str(e))
+            return {"type": "error", "content": f"An error occurred during ingestion: {str(e)}", "summary": run.summary()}
+
+        if run.analyze and run.source_files and model is not None and not run.cancelled:
+            try:
+                outcome = run_project_analysis(run.source_files, generate_text, f"ingest:{run.ingest_id}")
+                modules = outcome["manifest"]["modules"]
+                summaries = get_project_store().get_summaries([modules[path]["key"] for path in outcome["report"]["analyzed"]])
+                self.save_memory_batch({f"file_summary_{(run.ingest_id + '/' + path).replace('.', '_').replace('/', '_')}": summaries[modules[path]["key"]]
+                                        for path in outcome["report"]["analyzed"] if modules[path]["key"] in summaries})
+                run.analysis = {key: outcome["report"][key] for key in ("modules", "analyzed", "reused", "failed", "wall_time", "usage")}
+            except Exception as e:
+                logging.error(f"Analysis of ingested files failed: {e}")
+                run.analysis = {"error": str(e)}
+            run.events.put({"event": "analysis", "report": run.analysis})
+        run.finish()
+        summary = run.summary()
+        logging.info(f"Ingest '{run.ingest_id}' done: {summary['ingested']} ingested, {summary['unchanged']} unchanged, "
+                     f"{summary['removed']} removed in {summary['wall_time']:.2f}s.")
+        return {"type": "ingest_result", "summary": summary}
+
+    def get_storage_stats(self) -> Dict[str, Any]:
+        return {"type": "storage_stats", "stats": get_blob_store().stats()}
+
+    def index_document(self, file_name: str, lines: Iterable[str], language: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Chunks and indexes a document for retrieval (embedding new chunks when RYAN_DOC_EMBEDDINGS=1). None on failure."""
+        try:
+            return get_document_index().index_document(file_name, lines, language=language,
+                                                       embed=embed_texts if DOC_EMBEDDINGS_ENABLED else None)
+        except Exception as e:
+            logging.error(f"Indexing document '{file_name}' failed: {e}")
+            logging.error(traceback.format_exc())
+            return None
+
+    def index_symbols(self, file_name: str, code: str, language: str) -> Optional[Dict[str, Any]]:
+        """Indexes the definitions, references and imports of a Python/JavaScript file (ryan_symbol_index.py). None on failure."""
+        try:
+            return get_symbol_index().index_file(file_name, code, language)
+        except Exception as e:
+            logging.error(f"Indexing symbols of '{file_name}' failed: {e}")
+            logging.error(traceback.format_exc())
+            return None
+
+    def lookup_symbol(self, name: str, calls_only: bool = False) -> Dict[str, Any]:
+        """Symbol API: definitions, references, callers and imports of a name across the indexed code."""
+        try:
+            return {"type": "symbol_lookup", **get_symbol_index().lookup(name, calls_only=calls_only)}
+        except Exception as e:
+            logging.error(f"Symbol lookup failed: {e}")
+            return {"type": "error", "content": f"Symbol lookup failed: {str(e)}"}
+
+    def symbol_outline(self, file_name: str) -> Dict[str, Any]:
+        outline = get_symbol_index().outline(file_name)
+        if outline is None:
+            return {"type": "error", "content": f"No symbols indexed for file: {file_name}"}
+        return {"type": "symbol_outline", **outline}
+
+    def retrieve_document_chunks(self, query: str, k: Optional[int] = None, doc_ids: Optional[List[str]] = None,
+                                 min_coverage: float = 0.0) -> List[Dict[str, Any]]:
+        """Top-k indexed document chunks for a query (empty when nothing is indexed or nothing matches)."""
+        index = get_document_index()
+        if not query.strip() or index.document_count() == 0:
+            return []
+        query_embedding = None
+        if DOC_EMBEDDINGS_ENABLED:
+            vectors = embed_texts([query[:8000]], task_type="retrieval_query")
+            query_embedding = vectors[0] if vectors else None
+        return index.search(query, k=k or DOC_RETRIEVAL_K, doc_ids=doc_ids, min_coverage=min_coverage, query_embedding=query_embedding)
+
+    def search_documents(self, query: str, k: Optional[int] = None, doc_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Retrieval API: the most relevant chunks of the uploaded documents for a query."""
+        start = time.perf_counter()
+        try:
+            chunks = self.retrieve_document_chunks(query, k=k, doc_ids=doc_ids)
+        except Exception as e:
+            logging.error(f"Document search failed: {e}")
+            return {"type": "error", "content": f"Document search failed: {str(e)}"}
+        return {"type": "document_search", "query": query, "results": chunks, "time": round(time.perf_counter() - start, 6)}
+
+    def list_documents(self) -> Dict[str, Any]:
+        return {"type": "documents", "documents": get_document_index().list_documents()}
+
+    def delete_document(self, doc_id: str) -> Dict[str, Any]:
+        file_name = get_document_index().delete_document(doc_id)
+        if file_name is None:
+            return {"type": "error", "content": f"Unknown document: {doc_id}"}
+        get_blob_store().delete(file_name) # Chunks no other file uses are freed
+        get_symbol_index().remove_file(file_name)
+        self.delete_memory(memory_key_for(file_name)) # The manifest would point at the deleted blob
+        return {"type": "text", "content": f"Document {doc_id} removed from the index."}
     # --- End Document Processing ---
 
 
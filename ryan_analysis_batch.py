@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable
+
+# --- Batch Code Analysis ---
+# Review tooling sends hundreds of snippets; one HTTP round trip and one serial model call
+# per snippet leaves the model idle most of the time. A batch:
+#   - deduplicates identical inputs (sha256 of code, task, context, language, chunked), so
+#     each distinct input is analysed once and its result is copied to every duplicate,
+#   - analyses the distinct inputs with at most max_concurrency model calls in flight
+#     (default RYAN_ANALYSIS_BATCH_CONCURRENCY),
+#   - fetches memory once for the whole batch instead of once per snippet,
+#   - stops starting new items once cancelled (a streaming client disconnected),
+#   - isolates failures: an item whose analysis errors or raises gets success=False and the
+#     rest of the batch carries on.
+# Results are available in input order once everything finishes, or item by item as they
+# complete (next_event), which /analyze_code/batch streams as NDJSON.
+# Event dicts: {"event": "item", "index", "id", "success", "result", ...} per input item
+# (duplicates get their own event with "duplicate_of"), then {"event": "done", "summary"}.
+
+ANALYSIS_BATCH_CONCURRENCY = int(os.getenv("RYAN_ANALYSIS_BATCH_CONCURRENCY", "8"))
+ANALYSIS_BATCH_MAX_ITEMS = int(os.getenv("RYAN_ANALYSIS_BATCH_MAX_ITEMS", "500"))
+
+
+def input_key(item: Dict[str, Any]) -> str:
+    fields = [item.get("code", ""), item.get("task_description"), item.get("context"), (item.get("language") or "").lower(), item.get("chunked")]
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+
+class AnalysisBatch:
+    """One batch of analyze_code inputs. run() blocks until every item has a result."""
+    def __init__(self, items: List[Dict[str, Any]], max_concurrency: Optional[int] = None):
+        self.items = items
+        self.max_concurrency = max(1, min(max_concurrency or ANALYSIS_BATCH_CONCURRENCY, ANALYSIS_BATCH_CONCURRENCY))
+        self.results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        self.events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        # First index of each distinct input, and the indexes that repeat it
+        self.first_index: Dict[str, int] = {}
+        self.duplicates: Dict[int, List[int]] = {}
+        for index, item in enumerate(items):
+            key = input_key(item)
+            if key in self.first_index:
+                self.duplicates[self.first_index[key]].append(index)
+            else:
+                self.first_index[key] = index
+                self.duplicates[index] = []
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cancel(self):
+        """Items that haven't started yet finish as failed without a model call."""
+        self.cancelled = True
+
+    def _record(self, index: int, result: Dict[str, Any], latency: float):
+        success = result.get("type") != "error" and result.get("success", False)
+        entry = {"index": index, "id": self.items[index].get("id"), "success": success, "latency": round(latency, 6), "result": result}
+        self.results[index] = entry
+        self.events.put({"event": "item", **entry})
+        for duplicate in self.duplicates[index]:
+            copy = {**entry, "index": duplicate, "id": self.items[duplicate].get("id"), "duplicate_of": index}
+            self.results[duplicate] = copy
+            self.events.put({"event": "item", **copy})
+
+    def run(self, analyze: Callable[[Dict[str, Any]], Dict[str, Any]]):
+        """analyze(item) -> analyze_code result. Fills self.results and emits the events."""
+        def analyze_one(index: int):
+            start = time.perf_counter()
+            if self.cancelled:
+                return index, {"type": "error", "content": "The batch was cancelled."}, 0.0
+            try:
+                return index, analyze(self.items[index]), time.perf_counter() - start
+            except Exception as e:
+                logging.error(f"Batch analysis item {index} failed: {e}")
+                return index, {"type": "error", "content": f"An error occurred during AI analysis: {str(e)}"}, time.perf_counter() - start
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ryan-batch") as pool:
+                futures = [pool.submit(analyze_one, index) for index in self.duplicates]
+                for future in as_completed(futures):
+                    self._record(*future.result())
+        finally:
+            self.finished_at = time.time()
+            self.events.put({"event": "done", "summary": self.summary()})
+
+    def summary(self) -> Dict[str, Any]:
+        done = [entry for entry in self.results if entry is not None]
+        wall_time = (self.finished_at or time.time()) - self.started_at
+        return {
+            "items": len(self.items),
+            "distinct": len(self.duplicates),
+            "deduplicated": len(self.items) - len(self.duplicates),
+            "succeeded": sum(1 for entry in done if entry["success"]),
+            "failed": sum(1 for entry in done if not entry["success"]),
+            "max_concurrency": self.max_concurrency,
+            "wall_time": round(wall_time, 6),
+            "items_per_second": round(len(done) / wall_time, 3) if wall_time > 0 else None,
+        }
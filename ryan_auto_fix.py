@@ -0,0 +1,221 @@
+import os
+import time
+import uuid
+import queue
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Callable
+
+# --- Closed-Loop Auto Fix ---
+# Run -> debug -> fix -> run again, server-side, instead of four GUI round trips that each
+# re-send the code and re-fetch memory:
+#   1. run the code (or its test cases); stop if it succeeds,
+#   2. debug_code with the error output (memory is fetched once per auto-fix run, not per call),
+#   3. apply the suggestion with fix_code (no model call when debug_code already returned code),
+#   4. run the fixed code, and repeat from 2 until it succeeds or max_iterations is reached.
+# Every step is pushed onto the run's event queue (streamed to the client as Server-Sent Events),
+# and each iteration reports its latency split (debug / fix / run) and the model tokens it used.
+# Runs stay registered for RYAN_AUTO_FIX_RETENTION_SECONDS so the final state can be fetched later.
+# Event dicts: {"event": "start"|"run"|"debug"|"fix"|"iteration"|"done", ...}. 'done' is always last.
+
+AUTO_FIX_MAX_ITERATIONS = int(os.getenv("RYAN_AUTO_FIX_MAX_ITERATIONS", "3"))
+AUTO_FIX_ITERATION_LIMIT = 10 # Upper bound for a caller-supplied max_iterations
+AUTO_FIX_RETENTION_SECONDS = float(os.getenv("RYAN_AUTO_FIX_RETENTION_SECONDS", "1800"))
+_ERROR_CHARS = 4000 # Error output handed to debug_code (the tail holds the exception)
+
+# Run statuses
+RUNNING, SUCCEEDED, FAILED, CANCELLED, ERROR = "running", "succeeded", "failed", "cancelled", "error"
+
+
+def add_usage(total: Dict[str, int], usage: Optional[Dict[str, int]]):
+    """Adds a model usage dict (prompt/output/total token counts) into total."""
+    for key, value in (usage or {}).items():
+        total[key] = total.get(key, 0) + (value or 0)
+
+
+class AutoFixRun:
+    """State of one auto-fix loop. The loop runs on its own thread; consume events with next_event()."""
+    def __init__(self, code: str, language: str, max_iterations: int = AUTO_FIX_MAX_ITERATIONS,
+                 test_cases: Optional[List[Dict[str, Any]]] = None, fix_mode: str = "full"):
+        self.run_id = uuid.uuid4().hex
+        self.language = language
+        self.original_code = code
+        self.current_code = code
+        self.max_iterations = max(1, min(max_iterations, AUTO_FIX_ITERATION_LIMIT))
+        self.test_cases = test_cases
+        self.fix_mode = fix_mode # fix_code mode when debug_code returns no code: 'full' or 'diff'
+        self.status = RUNNING
+        self.reason: Optional[str] = None
+        self.iterations: List[Dict[str, Any]] = []
+        self.usage: Dict[str, int] = {}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+    def emit(self, event: str, **data):
+        self.events.put({"event": event, "run_id": self.run_id, **data})
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def finish(self, status: str, reason: Optional[str] = None):
+        self.status = status
+        self.reason = reason
+        self.finished_at = time.time()
+        self.emit("done", **self.summary())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "language": self.language,
+            "status": self.status,
+            "success": self.status == SUCCEEDED,
+            "reason": self.reason,
+            "iterations": self.iterations,
+            "iteration_count": len(self.iterations),
+            "max_iterations": self.max_iterations,
+            "fixed_code": self.current_code if self.current_code != self.original_code else None,
+            "usage": self.usage,
+            "wall_time": round((self.finished_at or time.time()) - self.started_at, 6),
+        }
+
+
+def _check(run: AutoFixRun, execute: Callable[..., Dict[str, Any]], execute_tests: Callable[..., Dict[str, Any]]) -> Dict[str, Any]:
+    """Runs the current code (or its test cases). Returns {"success", "error_output", "latency", ...}."""
+    start = time.perf_counter()
+    if run.test_cases:
+        result = execute_tests(run.current_code, run.language, run.test_cases)
+        success = result.get("success", False)
+        # The per-case table says which inputs fail; that is what debug_code needs
+        error_output = result.get("table") or result.get("content", "")
+        check = {"success": success, "error_output": "" if success else error_output, "summary": result.get("summary")}
+    else:
+        result = execute(run.current_code, run.language)
+        success = result.get("success", False)
+        error_output = result.get("error") or result.get("content") or f"Process exited with code {result.get('return_code')}"
+        check = {"success": success, "error_output": "" if success else error_output[-_ERROR_CHARS:],
+                 "output": result.get("output", ""), "return_code": result.get("return_code")}
+    check["latency"] = round(time.perf_counter() - start, 6)
+    return check
+
+
+def run_auto_fix(run: AutoFixRun, execute: Callable[..., Dict[str, Any]], execute_tests: Callable[..., Dict[str, Any]],
+                 debug: Callable[..., Dict[str, Any]], fix: Callable[..., Dict[str, Any]], memory: Optional[Dict[str, Any]] = None):
+    """
+    The loop itself. execute/execute_tests/debug/fix are RyanAI.execute_code / execute_tests / debug_code /
+    fix_code; memory is the memory snapshot passed to every debug_code call.
+    """
+    try:
+        run.emit("start", language=run.language, max_iterations=run.max_iterations, tests=len(run.test_cases or []))
+        check = _check(run, execute, execute_tests)
+        run.emit("run", iteration=0, **check)
+        if check["success"]:
+            run.finish(SUCCEEDED, "Code already runs successfully.")
+            return
+        for iteration in range(1, run.max_iterations + 1):
+            if run.cancelled:
+                run.finish(CANCELLED, "Cancelled by client.")
+                return
+            record: Dict[str, Any] = {"iteration": iteration, "usage": {}}
+            iteration_start = time.perf_counter()
+
+            step_start = time.perf_counter()
+            debug_result = debug(run.current_code, check["error_output"], run.language, memory=memory)
+            record["debug_latency"] = round(time.perf_counter() - step_start, 6)
+            add_usage(record["usage"], debug_result.get("usage"))
+            run.emit("debug", iteration=iteration, latency=record["debug_latency"], usage=debug_result.get("usage"),
+                     suggestion=debug_result.get("suggestion") or debug_result.get("content"))
+            if not debug_result.get("success"):
+                run.iterations.append(record)
+                add_usage(run.usage, record["usage"])
+                run.finish(ERROR, debug_result.get("suggestion") or debug_result.get("content") or "Debugging failed.")
+                return
+
+            # A corrected code block from debug_code is applied directly; otherwise fix_code asks the model
+            corrected = debug_result.get("corrected_code")
+            suggested_fix = f"```{run.language}\n{corrected}\n```" if corrected else debug_result.get("suggestion", "")
+            step_start = time.perf_counter()
+            fix_result = fix(run.current_code, suggested_fix, run.language, mode=run.fix_mode)
+            record["fix_latency"] = round(time.perf_counter() - step_start, 6)
+            add_usage(record["usage"], fix_result.get("usage"))
+            run.emit("fix", iteration=iteration, latency=record["fix_latency"], usage=fix_result.get("usage"),
+                     message=fix_result.get("message") or fix_result.get("content"), code=fix_result.get("fixed_code"))
+            fixed_code = fix_result.get("fixed_code")
+            if not fix_result.get("success") or not fixed_code:
+                run.iterations.append(record)
+                add_usage(run.usage, record["usage"])
+                run.finish(FAILED, fix_result.get("message") or fix_result.get("content") or "The fix could not be applied.")
+                return
+            if fixed_code.strip() == run.current_code.strip():
+                run.iterations.append(record)
+                add_usage(run.usage, record["usage"])
+                run.finish(FAILED, "The suggested fix did not change the code.")
+                return
+            run.current_code = fixed_code
+
+            check = _check(run, execute, execute_tests)
+            record["run_latency"] = check["latency"]
+            record["success"] = check["success"]
+            record["latency"] = round(time.perf_counter() - iteration_start, 6)
+            run.emit("run", iteration=iteration, **check)
+            run.iterations.append(record)
+            add_usage(run.usage, record["usage"])
+            run.emit("iteration", **record)
+            if check["success"]:
+                run.finish(SUCCEEDED, f"Fixed after {iteration} iteration{'s' if iteration > 1 else ''}.")
+                return
+        run.finish(FAILED, f"Still failing after {run.max_iterations} iterations.")
+    except Exception as e:
+        logging.error(f"Auto-fix run {run.run_id} failed: {e}")
+        run.finish(ERROR, f"An unexpected error occurred: {e}")
+
+
+class AutoFixRegistry:
+    """Active and recently finished auto-fix runs by run_id."""
+    def __init__(self):
+        self._runs: Dict[str, AutoFixRun] = {}
+        self._lock = threading.Lock()
+
+    def start(self, run: AutoFixRun, loop: Callable[[AutoFixRun], None]) -> AutoFixRun:
+        self._prune()
+        with self._lock:
+            self._runs[run.run_id] = run
+        threading.Thread(target=loop, args=(run,), name=f"ryan-auto-fix-{run.run_id[:8]}", daemon=True).start()
+        return run
+
+    def get(self, run_id: str) -> Optional[AutoFixRun]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def cancel(self, run_id: str) -> Optional[bool]:
+        """Stops the loop after its current step. None for an unknown run, False if it already finished."""
+        run = self.get(run_id)
+        if run is None:
+            return None
+        if run.status != RUNNING:
+            return False
+        run.cancelled = True
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - AUTO_FIX_RETENTION_SECONDS
+        with self._lock:
+            for run_id in [run_id for run_id, run in self._runs.items() if run.finished_at and run.finished_at < cutoff]:
+                del self._runs[run_id]
+
+
+_registry: Optional[AutoFixRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_auto_fix_registry() -> AutoFixRegistry:
+    """Returns the shared auto-fix registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = AutoFixRegistry()
+        return _registry
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import math
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from ryan_exec_scheduler import run_limited, get_execution_scheduler
+
+# --- Micro-Benchmark Mode ---
+# Answers "how fast is this" / "is A faster than B" with measurements instead of guesses.
+# A timeit-style driver runs in its own process (through the scheduler's launcher, under rlimits):
+#   - calibration: the loop count doubles/grows (1, 2, 5, 10, ...) until one sample takes at
+#     least RYAN_BENCH_MIN_SAMPLE_TIME, so timer resolution and loop overhead don't dominate,
+#   - warmup samples are taken and discarded (caches, JIT, lazy imports),
+#   - repeated samples of A and B are interleaved (A B A B ...) so drift affects both equally,
+#   - GC is off while timing in Python (as in timeit); stdout is discarded in both drivers.
+# Samples are reduced here: Tukey fences (1.5 x IQR) reject outliers, then median, IQR and ops/sec
+# are reported, and A vs B is decided with a two-sided Mann-Whitney U test (no normality assumption).
+# Isolation: only one benchmark runs at a time, and the driver pins itself to a single core
+# (RYAN_BENCH_CPU, default the last available core) to avoid migrations between samples.
+# The execution scheduler slot is taken only once the benchmark lock is held, so benchmarks
+# queued behind each other don't occupy slots that ordinary runs could use.
+
+BENCH_MIN_SAMPLE_TIME = float(os.getenv("RYAN_BENCH_MIN_SAMPLE_TIME", "0.02"))
+BENCH_REPEATS = int(os.getenv("RYAN_BENCH_REPEATS", "20"))
+BENCH_WARMUP = int(os.getenv("RYAN_BENCH_WARMUP", "3"))
+BENCH_TIMEOUT = float(os.getenv("RYAN_BENCH_TIMEOUT", "60"))
+BENCH_CPU = os.getenv("RYAN_BENCH_CPU") # Core to pin the driver to (None = last available core)
+BENCH_ALPHA = 0.05 # Significance level for the A/B verdict
+BENCHMARKED_LANGUAGES = ("python", "javascript")
+
+_benchmark_lock = threading.Lock() # One benchmark at a time: two would measure each other
+
+# Python driver, run as a script: argv = spec file, output file
+_PYTHON_BENCH_DRIVER = r'''
+import os, sys, json, timeit
+with open(sys.argv[1], encoding="utf-8") as spec_file:
+    spec = json.load(spec_file)
+sys.path[0] = ""
+if spec["cpu"] is not None and hasattr(os, "sched_setaffinity"):
+    try:
+        os.sched_setaffinity(0, {spec["cpu"]})
+    except OSError:
+        pass
+sys.stdout = open(os.devnull, "w") # Printing inside the timed loop would flood the pipe
+namespace = {"__name__": "__main__"}
+exec(compile(spec["setup"], "<setup>", "exec"), namespace)
+timers = [timeit.Timer(variant, globals=namespace) for variant in spec["variants"]]
+
+def calibrate(timer):
+    # Same idea as Timer.autorange: grow 1, 2, 5, 10, 20, 50, ... until a sample is long enough
+    multiplier = 1
+    while True:
+        for base in (1, 2, 5):
+            loops = base * multiplier
+            elapsed = timer.timeit(loops)
+            if elapsed >= spec["min_sample_time"]:
+                return loops, elapsed
+        multiplier *= 10
+
+calibrated = [calibrate(timer) for timer in timers]
+loops = [count for count, _ in calibrated]
+# Slow snippets get fewer rounds so the run fits the time budget (at least 5 timed rounds)
+rounds = max(5, int(spec["time_budget"] / sum(elapsed for _, elapsed in calibrated)))
+warmup = min(spec["warmup"], max(0, rounds - 5))
+repeats = min(spec["repeats"], rounds - warmup)
+for _ in range(warmup):
+    for timer, count in zip(timers, loops):
+        timer.timeit(count)
+samples = [[] for _ in timers]
+for _ in range(repeats):
+    for index, (timer, count) in enumerate(zip(timers, loops)):
+        samples[index].append(timer.timeit(count) / count)
+with open(sys.argv[2], "w", encoding="utf-8") as out_file:
+    json.dump({"loops": loops, "samples": samples, "warmup": warmup}, out_file)
+'''
+
+# Node driver, run as a script: argv = spec file, output file. Each variant runs inside a function
+# created after the setup code, so setup variables are in scope.
+_NODE_BENCH_DRIVER = r'''
+const fs = require("fs");
+const spec = JSON.parse(fs.readFileSync(process.argv[2], "utf8"));
+console.log = console.info = console.warn = () => {}; // Printing inside the timed loop would flood the pipe
+const fns = spec.variants.map(code => new Function(spec.setup + "\nreturn function () {\n" + code + "\n};")());
+function timeit(fn, loops) {
+  const start = process.hrtime.bigint();
+  for (let i = 0; i < loops; i++) fn();
+  return Number(process.hrtime.bigint() - start) / 1e9;
+}
+function calibrate(fn) {
+  for (let multiplier = 1; ; multiplier *= 10) {
+    for (const base of [1, 2, 5]) {
+      const loops = base * multiplier;
+      const elapsed = timeit(fn, loops);
+      if (elapsed >= spec.min_sample_time) return [loops, elapsed];
+    }
+  }
+}
+const calibrated = fns.map(calibrate);
+const loops = calibrated.map(c => c[0]);
+const rounds = Math.max(5, Math.floor(spec.time_budget / calibrated.reduce((sum, c) => sum + c[1], 0)));
+const warmup = Math.min(spec.warmup, Math.max(0, rounds - 5));
+const repeats = Math.min(spec.repeats, rounds - warmup);
+for (let w = 0; w < warmup; w++) fns.forEach((fn, i) => timeit(fn, loops[i]));
+const samples = fns.map(() => []);
+for (let r = 0; r < repeats; r++) fns.forEach((fn, i) => samples[i].push(timeit(fn, loops[i]) / loops[i]));
+fs.writeFileSync(process.argv[3], JSON.stringify({loops, samples, warmup}));
+'''
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    """Linear interpolation between closest ranks (numpy's default)."""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def reject_outliers(samples: List[float]) -> Tuple[List[float], List[float]]:
+    """Tukey's fences: drops samples outside [Q1 - 1.5 IQR, Q3 + 1.5 IQR]. Returns (kept, rejected)."""
+    ordered = sorted(samples)
+    q1, q3 = _quantile(ordered, 0.25), _quantile(ordered, 0.75)
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    kept = [s for s in samples if low <= s <= high]
+    return kept, [s for s in samples if not low <= s <= high]
+
+
+def summarize_samples(samples: List[float], loops: int) -> Dict[str, Any]:
+    """Per-operation timing statistics (seconds) after outlier rejection."""
+    kept, rejected = reject_outliers(samples)
+    ordered = sorted(kept)
+    median = _quantile(ordered, 0.5)
+    q1, q3 = _quantile(ordered, 0.25), _quantile(ordered, 0.75)
+    mean = sum(ordered) / len(ordered)
+    stdev = math.sqrt(sum((s - mean) ** 2 for s in ordered) / (len(ordered) - 1)) if len(ordered) > 1 else 0.0
+    return {
+        "median_s": median,
+        "q1_s": q1,
+        "q3_s": q3,
+        "iqr_s": q3 - q1,
+        "iqr_pct": round((q3 - q1) / median * 100, 2) if median else None, # Relative spread; > ~5% means a noisy machine
+        "mean_s": mean,
+        "stdev_s": stdev,
+        "min_s": ordered[0],
+        "max_s": ordered[-1],
+        "ops_per_sec": round(1 / median, 2) if median else None,
+        "loops_per_sample": loops,
+        "samples": len(samples),
+        "outliers_rejected": len(rejected),
+        "kept_samples": kept,
+    }
+
+
+def mann_whitney_u(a: List[float], b: List[float]) -> Tuple[float, float]:
+    """Two-sided Mann-Whitney U test (normal approximation with tie and continuity correction). Returns (U of a, p)."""
+    combined = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1 # Average rank for ties
+        tied = j - i + 1
+        tie_term += tied ** 3 - tied
+        i = j + 1
+    n1, n2 = len(a), len(b)
+    rank_sum_a = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u_a = rank_sum_a - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))) if n > 1 else 0
+    if variance <= 0:
+        return u_a, 1.0
+    z = (abs(u_a - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    p_value = math.erfc(max(z, 0) / math.sqrt(2)) # Two-sided
+    return u_a, min(1.0, p_value)
+
+
+def compare_variants(a: Dict[str, Any], b: Dict[str, Any], alpha: float = BENCH_ALPHA) -> Dict[str, Any]:
+    """A/B verdict from the kept samples of two summaries."""
+    u_statistic, p_value = mann_whitney_u(a["kept_samples"], b["kept_samples"])
+    ratio = b["median_s"] / a["median_s"] if a["median_s"] else None # > 1: A is faster
+    if p_value >= alpha or ratio is None:
+        verdict = "no significant difference"
+    elif ratio > 1:
+        verdict = f"A is faster ({ratio:.2f}x)"
+    else:
+        verdict = f"B is faster ({1 / ratio:.2f}x)"
+    return {"verdict": verdict, "p_value": round(p_value, 6), "u_statistic": u_statistic, "alpha": alpha,
+            "median_ratio_b_over_a": round(ratio, 4) if ratio else None}
+
+
+def _format_duration(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * scale >= 1:
+            return f"{seconds * scale:.3g} {unit}"
+    return f"{seconds * 1e9:.3g} ns"
+
+
+def format_benchmark_summary(result: Dict[str, Any]) -> str:
+    lines = []
+    for variant in result["variants"]:
+        lines.append(f"{variant['name']}: median {_format_duration(variant['median_s'])} per op "
+                     f"(IQR {_format_duration(variant['iqr_s'])}, {variant['iqr_pct']}%), {variant['ops_per_sec']:,} ops/sec, "
+                     f"{variant['samples'] - variant['outliers_rejected']}/{variant['samples']} samples x {variant['loops_per_sample']} loops")
+    if result.get("comparison"):
+        comparison = result["comparison"]
+        lines.append(f"Verdict: {comparison['verdict']} (Mann-Whitney p = {comparison['p_value']:.3g})")
+    noisy = [v["name"] for v in result["variants"] if v["iqr_pct"] and v["iqr_pct"] > 5]
+    if noisy:
+        lines.append(f"Note: high spread for {', '.join(noisy)}; the machine may be busy.")
+    return "\n".join(lines)
+
+
+def _pinned_cpu() -> Optional[int]:
+    if BENCH_CPU is not None:
+        return int(BENCH_CPU)
+    if hasattr(os, "sched_getaffinity"):
+        return max(os.sched_getaffinity(0))
+    return None
+
+
+def run_benchmark(code: str, language: str, compare_code: Optional[str] = None, setup: str = "",
+                  repeats: int = BENCH_REPEATS, warmup: int = BENCH_WARMUP,
+                  min_sample_time: float = BENCH_MIN_SAMPLE_TIME, timeout: float = BENCH_TIMEOUT) -> Dict[str, Any]:
+    """
+    Benchmarks code (and compare_code, if given, as variant B) in an isolated driver process.
+    Returns {"variants": [...], "comparison": {...} | None, "summary": str, ...}, or a dict with "error".
+    Raises ValueError for unsupported languages, FileNotFoundError for a missing interpreter and
+    ExecutionRejected when the scheduler turns the run away.
+    """
+    language = language.lower()
+    if language not in BENCHMARKED_LANGUAGES:
+        raise ValueError(f"Benchmarking is supported for {', '.join(BENCHMARKED_LANGUAGES)}, not {language}.")
+    variants = [code] + ([compare_code] if compare_code else [])
+    repeats = max(5, repeats) # Fewer samples make the quartiles and the U test meaningless
+    spec = {"variants": variants, "setup": setup or "", "repeats": repeats, "warmup": max(0, warmup),
+            "min_sample_time": min_sample_time, "cpu": _pinned_cpu(),
+            "time_budget": timeout * 0.6} # Calibration and interpreter startup need the rest
+
+    workspace = tempfile.mkdtemp(prefix="ryan_bench_")
+    try:
+        spec_path = os.path.join(workspace, "spec.json")
+        out_path = os.path.join(workspace, "samples.json")
+        driver_path = os.path.join(workspace, "bench_driver.py" if language == "python" else "bench_driver.js")
+        with open(spec_path, "w", encoding="utf-8") as spec_file:
+            json.dump(spec, spec_file)
+        with open(driver_path, "w", encoding="utf-8") as driver_file:
+            driver_file.write(_PYTHON_BENCH_DRIVER if language == "python" else _NODE_BENCH_DRIVER)
+        interpreter = sys.executable if language == "python" else "node"
+        with _benchmark_lock, get_execution_scheduler().slot():
+            logging.info(f"Benchmarking {len(variants)} {language} variant(s) on cpu {spec['cpu']}.")
+            run = run_limited([interpreter, driver_path, spec_path, out_path], language,
+                              timeout=timeout, cpu_seconds=int(timeout) + 1)
+        try:
+            with open(out_path, encoding="utf-8") as out_file:
+                measured = json.load(out_file)
+        except (OSError, ValueError):
+            if run["timed_out"]:
+                error = f"Benchmark did not finish within {timeout:g} seconds; the snippet may be too slow for repeated timing."
+            else:
+                error = run["stderr"].strip() or f"Benchmark driver exited with code {run['return_code']}."
+            return {"error": error, "return_code": run["return_code"], "timed_out": run["timed_out"]}
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    summaries = []
+    for name, samples, loops in zip("AB", measured["samples"], measured["loops"]):
+        summary = summarize_samples(samples, loops)
+        summary["name"] = name
+        summaries.append(summary)
+    comparison = compare_variants(summaries[0], summaries[1]) if len(summaries) == 2 else None
+    result = {
+        "variants": summaries,
+        "comparison": comparison,
+        "repeats": len(measured["samples"][0]),
+        "warmup": measured["warmup"],
+        "pinned_cpu": spec["cpu"],
+        "wall_time": run["wall_time"],
+    }
+    result["summary"] = format_benchmark_summary(result)
+    for summary in summaries:
+        summary.pop("kept_samples") # Only needed for the U test
+    return result
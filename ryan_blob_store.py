@@ -0,0 +1,337 @@
+import os
+import json
+import time
+import zlib
+import bisect
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple, Callable
+
+try:
+    import zstandard # Optional - zlib is used when it isn't installed
+except ImportError:
+    zstandard = None
+
+# --- Content-Addressed Blob Store ---
+# Uploaded files are kept once, however often they are uploaded:
+#   - chunking  - the bytes are cut at content-defined boundaries: after a newline whose
+#                 preceding BLOB_WINDOW bytes hash (crc32) to 0 mod BLOB_BOUNDARY_MODULUS, once
+#                 the chunk has BLOB_CHUNK_MIN bytes; always at BLOB_CHUNK_MAX (binary data
+#                 without newlines gets fixed-size chunks). Two files that share most of their
+#                 content, or two versions of one file, share most of their chunks.
+#   - storage   - each distinct chunk is stored once in sqlite (RYAN_BLOB_DB) under its sha256,
+#                 compressed with zstd (zlib when zstandard isn't installed; the codec is kept
+#                 per chunk so stores written either way stay readable when zstd is present).
+#   - refcounts - names (file names) point at files, and record the ingest that owns them
+#                 (ryan_ingest.py; NULL for single uploads); a file (sha256 of its content) is a
+#                 manifest of chunk hashes with a count of the names using it; a chunk counts
+#                 the files using it. Dropping the last reference deletes the file, and chunks
+#                 that no file uses any more are deleted with it.
+#   - reads     - a byte range decompresses only the chunks that overlap it.
+# Memory entries for uploaded files hold the small manifest summary, not the content.
+# put/read report the bytes saved by deduplication and compression and the MB/s achieved.
+
+BLOB_DB_PATH = os.getenv("RYAN_BLOB_DB", os.path.join(tempfile.gettempdir(), "ryan_blobs.sqlite3"))
+BLOB_CHUNK_MIN = 4 * 1024
+BLOB_CHUNK_MAX = 64 * 1024
+BLOB_BOUNDARY_MODULUS = 64 # With typical 40-80 byte lines this gives ~8 KB chunks on average
+BLOB_WINDOW = 32
+BLOB_READ_BLOCK = 1024 * 1024
+BLOB_ZSTD_LEVEL = int(os.getenv("RYAN_BLOB_ZSTD_LEVEL", "3"))
+BLOB_CODEC = "zstd" if zstandard is not None else "zlib"
+
+
+class BlobStoreError(Exception):
+    """Raised for unknown names, bad ranges and chunks stored with an unavailable codec."""
+
+
+def split_chunks(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """Content-defined chunks from a stream of byte blocks (at most BLOB_CHUNK_MAX + one block buffered)."""
+    buffer = b""
+    for block in blocks:
+        buffer += block
+        cuts, tail = _cut_points(buffer, final=False)
+        start = 0
+        for cut in cuts:
+            yield buffer[start:cut]
+            start = cut
+        buffer = buffer[tail:]
+    cuts, _ = _cut_points(buffer, final=True)
+    start = 0
+    for cut in cuts:
+        yield buffer[start:cut]
+        start = cut
+
+
+def _cut_points(data: bytes, final: bool) -> Tuple[List[int], int]:
+    """End offsets of the complete chunks in data, and the offset where the unfinished rest starts."""
+    cuts: List[int] = []
+    start = 0
+    size = len(data)
+    while size - start > 0:
+        limit = min(start + BLOB_CHUNK_MAX, size)
+        cut = None
+        position = start + BLOB_CHUNK_MIN
+        while position < limit:
+            newline = data.find(b"\n", position, limit)
+            if newline < 0:
+                break
+            if zlib.crc32(data[max(newline - BLOB_WINDOW, start):newline]) % BLOB_BOUNDARY_MODULUS == 0:
+                cut = newline + 1
+                break
+            position = newline + 1
+        if cut is None:
+            if limit - start >= BLOB_CHUNK_MAX:
+                cut = limit
+            elif final:
+                cut = size
+            else:
+                break # The boundary may be in data that hasn't arrived yet
+        cuts.append(cut)
+        start = cut
+    return cuts, start
+
+
+def _read_blocks(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as handle:
+        while True:
+            block = handle.read(BLOB_READ_BLOCK)
+            if not block:
+                return
+            yield block
+
+
+def _compress(data: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=BLOB_ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise BlobStoreError("This chunk is zstd-compressed but the zstandard package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "raw":
+        return data
+    raise BlobStoreError(f"Unknown chunk codec: {codec}")
+
+
+def prepare_blob(data: bytes) -> Dict[str, Any]:
+    """Chunks and compresses content as plain picklable data (for worker processes); BlobStore.put_prepared stores it."""
+    chunks = []
+    for chunk in split_chunks([data]):
+        codec, compressed = _compress(chunk)
+        chunks.append((hashlib.sha256(chunk).hexdigest(), len(chunk), codec, compressed))
+    return {"file_id": hashlib.sha256(data).hexdigest(), "size": len(data), "chunks": chunks}
+
+
+def _mb_per_s(size: int, seconds: float) -> Optional[float]:
+    return round(size / (1024 * 1024) / seconds, 3) if seconds > 0 else None
+
+
+class BlobStore:
+    """sqlite tables: chunks (hash -> compressed bytes, refs), files (content hash -> manifest, refs) and names."""
+    def __init__(self, db_path: str = BLOB_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL with synchronous=NORMAL: a commit is an append instead of an fsync'd journal rewrite, which is
+        # what per-file writes during bulk ingestion (ryan_ingest.py) spend most of their time on otherwise
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, codec TEXT, size INTEGER, refs INTEGER, data BLOB)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files (file_id TEXT PRIMARY KEY, size INTEGER, manifest TEXT, refs INTEGER, created REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, file_id TEXT, updated REAL, owner TEXT)")
+            if "owner" not in {row[1] for row in self._connection.execute("PRAGMA table_info(names)")}:
+                self._connection.execute("ALTER TABLE names ADD COLUMN owner TEXT") # Stores written before ingest ownership
+            self._connection.execute("CREATE INDEX IF NOT EXISTS names_owner ON names (owner)")
+
+    # --- Writing ---
+
+    def put_bytes(self, name: str, data: bytes, owner: Optional[str] = None) -> Dict[str, Any]:
+        return self._put_blocks(name, [data], owner)
+
+    def put_file(self, name: str, path: str, owner: Optional[str] = None) -> Dict[str, Any]:
+        """Stores a file from disk, reading it block by block."""
+        return self._put_blocks(name, _read_blocks(path), owner)
+
+    def put_prepared(self, name: str, prepared: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
+        """Stores the output of prepare_blob (chunked and compressed elsewhere, e.g. in a worker process)."""
+        records = ((chunk_hash, size, lambda codec=codec, data=data: (codec, data)) for chunk_hash, size, codec, data in prepared["chunks"])
+        return self._put(name, records, lambda: prepared["file_id"], owner)
+
+    def _put_blocks(self, name: str, blocks: Iterable[bytes], owner: Optional[str]) -> Dict[str, Any]:
+        content_hash = hashlib.sha256()
+
+        def records():
+            for chunk in split_chunks(blocks):
+                content_hash.update(chunk)
+                yield hashlib.sha256(chunk).hexdigest(), len(chunk), lambda chunk=chunk: _compress(chunk)
+        return self._put(name, records(), content_hash.hexdigest, owner)
+
+    def _put(self, name: str, records: Iterable[Tuple[str, int, Callable[[], Tuple[str, bytes]]]], file_id_of: Callable[[], str],
+             owner: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Stores content under a name (replacing what the name pointed at, and its owner) from (chunk hash, size,
+        compress()) records; compress() is only called for chunks not already in the store. file_id_of() is read
+        once the records are exhausted. Returns sizes, chunk counts, bytes written and MB/s.
+        """
+        start = time.perf_counter()
+        manifest: List[Tuple[str, int]] = []
+        new_chunks = 0
+        stored_bytes = 0
+        with self._lock, self._connection:
+            for chunk_hash, chunk_size, compress in records:
+                manifest.append((chunk_hash, chunk_size))
+                if self._connection.execute("SELECT 1 FROM chunks WHERE hash = ?", (chunk_hash,)).fetchone():
+                    continue
+                codec, data = compress()
+                # refs start at 0 and are counted below, once the file is known to be new
+                self._connection.execute("INSERT INTO chunks VALUES (?, ?, ?, 0, ?)", (chunk_hash, codec, chunk_size, data))
+                new_chunks += 1
+                stored_bytes += len(data)
+            file_id = file_id_of()
+            size = sum(chunk_size for _, chunk_size in manifest)
+            duplicate = self._connection.execute("SELECT 1 FROM files WHERE file_id = ?", (file_id,)).fetchone() is not None
+            if duplicate:
+                self._connection.execute("UPDATE files SET refs = refs + 1 WHERE file_id = ?", (file_id,))
+            else:
+                self._connection.execute("INSERT INTO files VALUES (?, ?, ?, 1, ?)", (file_id, size, json.dumps(manifest), time.time()))
+                self._connection.executemany("UPDATE chunks SET refs = refs + 1 WHERE hash = ?", [(chunk_hash,) for chunk_hash, _ in manifest])
+            previous = self._connection.execute("SELECT file_id FROM names WHERE name = ?", (name,)).fetchone()
+            self._connection.execute("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", (name, file_id, time.time(), owner))
+            if previous:
+                self._release(previous[0])
+        seconds = time.perf_counter() - start
+        report = {"name": name, "file_id": file_id, "size": size, "chunks": len(manifest), "new_chunks": new_chunks,
+                  "reused_chunks": len(manifest) - new_chunks, "duplicate_file": duplicate, "stored_bytes": stored_bytes,
+                  "saved_bytes": size - stored_bytes, "codec": BLOB_CODEC, "seconds": round(seconds, 6), "mb_per_s": _mb_per_s(size, seconds)}
+        logging.info(f"Stored '{name}': {size} bytes in {len(manifest)} chunks, {new_chunks} new ({stored_bytes} bytes written).")
+        return report
+
+    def _release(self, file_id: str):
+        """Drops one reference to a file (caller holds the lock, inside a transaction)."""
+        self._connection.execute("UPDATE files SET refs = refs - 1 WHERE file_id = ?", (file_id,))
+        row = self._connection.execute("SELECT refs, manifest FROM files WHERE file_id = ?", (file_id,)).fetchone()
+        if row is None or row[0] > 0:
+            return
+        manifest = json.loads(row[1])
+        self._connection.executemany("UPDATE chunks SET refs = refs - 1 WHERE hash = ?", [(chunk_hash,) for chunk_hash, _ in manifest])
+        self._connection.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+        hashes = list({chunk_hash for chunk_hash, _ in manifest})
+        for batch_start in range(0, len(hashes), 500):
+            batch = hashes[batch_start:batch_start + 500]
+            self._connection.execute(f"DELETE FROM chunks WHERE refs <= 0 AND hash IN ({','.join('?' * len(batch))})", batch)
+
+    def delete(self, name: str) -> bool:
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT file_id FROM names WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return False
+            self._connection.execute("DELETE FROM names WHERE name = ?", (name,))
+            self._release(row[0])
+        return True
+
+    def names_owned_by(self, owner: str) -> Dict[str, str]:
+        """{name: file_id} for every stored name owned by owner (the file_id is the content's sha256)."""
+        with self._lock:
+            rows = self._connection.execute("SELECT name, file_id FROM names WHERE owner = ?", (owner,)).fetchall()
+        return dict(rows)
+
+    def owners(self) -> List[str]:
+        """Every owner that still has stored names."""
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT DISTINCT owner FROM names WHERE owner IS NOT NULL")]
+
+    # --- Reading ---
+
+    def manifest(self, name: str) -> Dict[str, Any]:
+        """{"name", "file_id", "size", "chunks"} for a stored name. Raises BlobStoreError if unknown."""
+        with self._lock:
+            row = self._connection.execute("SELECT f.file_id, f.size, f.manifest FROM names n JOIN files f ON f.file_id = n.file_id "
+                                           "WHERE n.name = ?", (name,)).fetchone()
+        if row is None:
+            raise BlobStoreError(f"No stored content for '{name}'.")
+        return {"name": name, "file_id": row[0], "size": row[1], "chunks": json.loads(row[2])}
+
+    def read(self, name: str, offset: int = 0, length: Optional[int] = None) -> Tuple[bytes, Dict[str, Any]]:
+        """
+        Bytes [offset, offset + length) of a stored name (to the end when length is None), decompressing
+        only the chunks that overlap the range. Returns (data, report).
+        """
+        manifest = self.manifest(name)
+        size = manifest["size"]
+        if offset < 0 or offset > size or (length is not None and length < 0):
+            raise BlobStoreError(f"Invalid range for '{name}' ({size} bytes): offset={offset}, length={length}")
+        end = size if length is None else min(size, offset + length)
+        start_time = time.perf_counter()
+        starts = []
+        position = 0
+        for _, chunk_size in manifest["chunks"]:
+            starts.append(position)
+            position += chunk_size
+        first = max(bisect.bisect_right(starts, offset) - 1, 0)
+        last = bisect.bisect_left(starts, end) # Chunks [first, last) overlap the range
+        needed = manifest["chunks"][first:last] if end > offset else []
+        with self._lock:
+            rows = {}
+            hashes = list({chunk_hash for chunk_hash, _ in needed})
+            for batch_start in range(0, len(hashes), 500):
+                batch = hashes[batch_start:batch_start + 500]
+                for chunk_hash, codec, data in self._connection.execute(
+                        f"SELECT hash, codec, data FROM chunks WHERE hash IN ({','.join('?' * len(batch))})", batch):
+                    rows[chunk_hash] = (codec, data)
+        parts = []
+        decoded = 0
+        for index, (chunk_hash, _) in enumerate(needed):
+            if chunk_hash not in rows:
+                raise BlobStoreError(f"Chunk {chunk_hash} of '{name}' is missing from the store.")
+            chunk = _decompress(*rows[chunk_hash])
+            decoded += len(chunk)
+            chunk_start = starts[first + index]
+            parts.append(chunk[max(offset - chunk_start, 0):end - chunk_start])
+        seconds = time.perf_counter() - start_time
+        data = b"".join(parts)
+        report = {"name": name, "file_id": manifest["file_id"], "size": size, "offset": offset, "length": len(data),
+                  "chunks_decoded": len(needed), "chunks_total": len(manifest["chunks"]), "decoded_bytes": decoded,
+                  "decode_seconds": round(seconds, 6), "decode_mb_per_s": _mb_per_s(decoded, seconds)}
+        return data, report
+
+    def stats(self) -> Dict[str, Any]:
+        """Logical bytes (every name's full size) against bytes actually stored."""
+        with self._lock:
+            names, logical = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(f.size), 0) FROM names n JOIN files f ON f.file_id = n.file_id").fetchone()
+            files = self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            chunks, unique, stored = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM chunks").fetchone()
+        return {
+            "names": names,
+            "files": files,
+            "chunks": chunks,
+            "logical_bytes": logical,
+            "unique_bytes": unique,
+            "stored_bytes": stored,
+            "saved_bytes": logical - stored,
+            "dedup_ratio": round(logical / unique, 3) if unique else None,
+            "compression_ratio": round(unique / stored, 3) if stored else None,
+            "codec": BLOB_CODEC,
+        }
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Returns the shared blob store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BlobStore()
+        return _store
@@ -0,0 +1,315 @@
+import os
+import re
+import ast
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+# --- Map-Reduce Analysis for Large Files ---
+# analyze_code sends the whole file in one prompt. For large files that is slow, can
+# exceed the context window, and runs no model calls in parallel. Chunked mode:
+#   1. split  - Python at top-level function/class boundaries (ast); a class larger than a
+#               chunk is split between its methods, and a single over-long function is cut
+#               into line windows. Other languages (or unparsable Python) split before
+#               unindented lines that follow a blank line or a closing bracket line. Pieces
+#               are grouped in order into chunks of at most RYAN_ANALYSIS_CHUNK_LINES lines.
+#               A chunk also ends after any piece whose content hash is 0 mod
+#               ANALYSIS_GROUP_FACTOR, so chunk boundaries depend on content, not position:
+#               a function that grows or shrinks doesn't shift every later chunk.
+#   2. map    - each chunk is summarised by the model, at most RYAN_ANALYSIS_CONCURRENCY
+#               calls at a time across all requests. The map prompt doesn't depend on the
+#               task, so summaries are cached by sha256(language, chunk text): editing one
+#               function re-summarises only the chunk holding it.
+#   3. reduce - the task is answered from the ordered chunk summaries (with their line
+#               ranges). More than RYAN_ANALYSIS_REDUCE_FANIN summaries are first merged in
+#               groups, level by level.
+# analyze_code uses chunked mode automatically from RYAN_ANALYSIS_CHUNK_THRESHOLD_LINES lines.
+
+ANALYSIS_CHUNK_LINES = int(os.getenv("RYAN_ANALYSIS_CHUNK_LINES", "150"))
+ANALYSIS_CHUNK_THRESHOLD_LINES = int(os.getenv("RYAN_ANALYSIS_CHUNK_THRESHOLD_LINES", "400"))
+ANALYSIS_CONCURRENCY = int(os.getenv("RYAN_ANALYSIS_CONCURRENCY", "4"))
+ANALYSIS_REDUCE_FANIN = int(os.getenv("RYAN_ANALYSIS_REDUCE_FANIN", "16"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("RYAN_ANALYSIS_CACHE_MAX_ENTRIES", "2048"))
+ANALYSIS_GROUP_FACTOR = 4 # Average number of small pieces per chunk
+_MAP_PROMPT_VERSION = "1" # Part of the cache key; bump when the map prompt changes
+
+
+class Chunk:
+    """Lines start..end (1-based, inclusive) of the file, and a label naming what they hold."""
+    def __init__(self, start: int, end: int, text: str, label: str):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.label = label
+
+    def key(self, language: str) -> str:
+        return hashlib.sha256(f"{_MAP_PROMPT_VERSION}\0{language}\0{self.text}".encode()).hexdigest()
+
+
+# --- Splitting ---
+
+def _python_pieces(code: str, max_lines: int) -> List[Tuple[int, int, str]]:
+    """(start, end, label) pieces at top-level boundaries; big classes by method, big functions by window."""
+    tree = ast.parse(code)
+    line_count = len(code.splitlines())
+    pieces: List[Tuple[int, int, str]] = []
+
+    def start_of(node: ast.AST) -> int:
+        return min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+
+    def windows(start: int, end: int, label: str):
+        for window_start in range(start, end + 1, max_lines):
+            pieces.append((window_start, min(end, window_start + max_lines - 1), f"{label} (part)"))
+
+    body = tree.body
+    for index, node in enumerate(body):
+        start = start_of(node) if index else 1 # Leading comments belong to the first piece
+        end = start_of(body[index + 1]) - 1 if index + 1 < len(body) else line_count # Trailing comments/blank lines stay with the node
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            label = f"{'class' if isinstance(node, ast.ClassDef) else 'def'} {node.name}"
+        else:
+            label = "module code"
+        if end - start + 1 <= max_lines:
+            pieces.append((start, end, label))
+        elif isinstance(node, ast.ClassDef):
+            members = [member for member in node.body if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            cursor = start
+            for member in members:
+                member_start = start_of(member)
+                if member_start > cursor:
+                    pieces.append((cursor, member_start - 1, label))
+                member_end = member.end_lineno
+                if member_end - member_start + 1 > max_lines:
+                    windows(member_start, member_end, f"{label}.{member.name}")
+                else:
+                    pieces.append((member_start, member_end, f"{label}.{member.name}"))
+                cursor = member_end + 1
+            if cursor <= end:
+                pieces.append((cursor, end, label))
+        else:
+            windows(start, end, label)
+    return pieces
+
+
+def _indentation_pieces(code: str) -> List[Tuple[int, int, str]]:
+    """Pieces that start at an unindented line following a blank line or a line that only closes brackets."""
+    lines = code.splitlines()
+    starts = [1]
+    for number in range(2, len(lines) + 1):
+        line, previous = lines[number - 1], lines[number - 2].strip()
+        if line and not line[0].isspace() and not re.match(r"[)\]}]", line) and (previous == "" or re.fullmatch(r"[)\]};,]+", previous)):
+            starts.append(number)
+    pieces = []
+    for index, start in enumerate(starts):
+        end = starts[index + 1] - 1 if index + 1 < len(starts) else len(lines)
+        first = next((line.strip() for line in lines[start - 1:end] if line.strip()), "")
+        pieces.append((start, end, first[:60]))
+    return pieces
+
+
+def split_code(code: str, language: Optional[str] = None, max_lines: int = ANALYSIS_CHUNK_LINES) -> List[Chunk]:
+    """Splits code into chunks of whole functions/classes (see the module comment)."""
+    lines = code.splitlines()
+    pieces = None
+    if (language or "").lower() == "python":
+        try:
+            pieces = _python_pieces(code, max_lines)
+        except SyntaxError:
+            pieces = None
+    if pieces is None:
+        pieces = []
+        for start, end, label in _indentation_pieces(code):
+            for window_start in range(start, end + 1, max_lines):
+                pieces.append((window_start, min(end, window_start + max_lines - 1), label))
+    chunks: List[Chunk] = []
+    group: List[Tuple[int, int, str]] = []
+
+    def close_group():
+        start, end = group[0][0], group[-1][1]
+        labels = [label for _, _, label in group]
+        label = labels[0] if len(labels) == 1 else f"{labels[0]} ... {labels[-1]}"
+        chunks.append(Chunk(start, end, "\n".join(lines[start - 1:end]), label))
+        group.clear()
+
+    for piece in pieces:
+        if group and piece[1] - group[0][0] + 1 > max_lines:
+            close_group()
+        group.append(piece)
+        piece_text = "\n".join(lines[piece[0] - 1:piece[1]])
+        if int(hashlib.sha256(piece_text.encode()).hexdigest()[:8], 16) % ANALYSIS_GROUP_FACTOR == 0:
+            close_group()
+    if group:
+        close_group()
+    return [chunk for chunk in chunks if chunk.text.strip()]
+
+
+# --- Summary cache ---
+
+class ChunkSummaryCache:
+    """LRU of chunk summaries by content hash."""
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+_cache: Optional[ChunkSummaryCache] = None
+_pool: Optional[ThreadPoolExecutor] = None
+_shared_lock = threading.Lock()
+
+
+def get_chunk_summary_cache() -> ChunkSummaryCache:
+    """Returns the process-wide chunk summary cache."""
+    global _cache
+    with _shared_lock:
+        if _cache is None:
+            _cache = ChunkSummaryCache()
+        return _cache
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """One pool for every request, so RYAN_ANALYSIS_CONCURRENCY bounds the total number of map calls in flight."""
+    global _pool
+    with _shared_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY, thread_name_prefix="ryan-analysis")
+        return _pool
+
+
+# --- Map / reduce ---
+
+def _map_prompt(chunk: Chunk, language: str, total_lines: int) -> str:
+    return f"""
+You are Ryan, an expert coding assistant. Below is one part (lines {chunk.start}-{chunk.end} of {total_lines}) of a larger {language or ''} file.
+
+```{language or ''}
+{chunk.text}
+```
+
+Summarize this part for someone who will combine it with summaries of the other parts:
+- what each function/class/top-level statement here does (name them),
+- what it depends on from elsewhere (imports, globals, other functions),
+- any bugs, risks or notable design choices.
+Be concise (at most about 200 words). Do not speculate about code you cannot see.
+"""
+
+
+def _reduce_prompt(summaries: List[Tuple[int, int, str, str]], language: str, task: str, preamble: str, final: bool) -> str:
+    parts = "\n\n".join(f"### Lines {start}-{end}{': ' + label if label else ''}\n{summary}" for start, end, label, summary in summaries)
+    if final:
+        instruction = f"""Task:
+{task}
+
+Answer the task for the file as a whole, using the summaries of its parts. Provide a clear and concise analysis or explanation. If the task asks whether the code meets certain criteria, answer that question directly."""
+    else:
+        instruction = "Merge these summaries of consecutive parts of a file into one summary that keeps every function/class name, dependency and issue they mention. Be concise."
+    return f"""
+You are Ryan, an expert coding assistant. A large {language or ''} file was analyzed in parts.
+
+{preamble}
+Summaries of the parts, in file order:
+
+{parts}
+
+{instruction}
+"""
+
+
+def analyze_chunked(code: str, language: Optional[str], task: str, generate: Callable[[str], Tuple[str, Optional[Dict[str, int]]]],
+                    preamble: str = "", max_lines: int = ANALYSIS_CHUNK_LINES) -> Dict[str, Any]:
+    """
+    Map-reduce analysis of code. generate(prompt) -> (response text, usage or None) and raises on failure.
+    preamble (memory, caller context) goes into the final reduce prompt only.
+    Returns {"analysis", "report"}; raises RuntimeError when no chunk could be summarised.
+    """
+    start_time = time.perf_counter()
+    total_lines = len(code.splitlines())
+    chunks = split_code(code, language, max_lines)
+    cache = get_chunk_summary_cache()
+    usage: Dict[str, int] = {}
+    usage_lock = threading.Lock()
+
+    def call(prompt: str) -> str:
+        text, call_usage = generate(prompt)
+        with usage_lock:
+            for key, value in (call_usage or {}).items():
+                usage[key] = usage.get(key, 0) + (value or 0)
+        return text.strip()
+
+    summaries: List[Optional[str]] = [None] * len(chunks)
+    pending = []
+    for index, chunk in enumerate(chunks):
+        summaries[index] = cache.get(chunk.key(language or ""))
+        if summaries[index] is None:
+            pending.append(index)
+    futures = {index: _get_pool().submit(call, _map_prompt(chunks[index], language or "", total_lines)) for index in pending}
+    failed = 0
+    for index, future in futures.items():
+        try:
+            summaries[index] = future.result()
+            cache.put(chunks[index].key(language or ""), summaries[index])
+        except Exception as e:
+            logging.warning(f"Summarizing lines {chunks[index].start}-{chunks[index].end} failed: {e}")
+            summaries[index] = f"(This part could not be summarized: {e})"
+            failed += 1
+    if chunks and failed == len(chunks):
+        raise RuntimeError("None of the file's parts could be summarized.")
+    map_time = time.perf_counter() - start_time
+
+    # (start, end, label, summary); intermediate merges keep the line range and drop the label
+    labelled = [(chunk.start, chunk.end, chunk.label, summary) for chunk, summary in zip(chunks, summaries)]
+    levels = 0
+    while len(labelled) > ANALYSIS_REDUCE_FANIN:
+        # Evenly sized groups (18 summaries -> 9 + 9, not 16 + 2)
+        group_count = -(-len(labelled) // ANALYSIS_REDUCE_FANIN)
+        size = -(-len(labelled) // group_count)
+        groups = [labelled[index:index + size] for index in range(0, len(labelled), size)]
+        merged = [_get_pool().submit(call, _reduce_prompt(group, language or "", task, "", final=False)) for group in groups]
+        labelled = [(group[0][0], group[-1][1], "", future.result()) for group, future in zip(groups, merged)]
+        levels += 1
+    analysis = call(_reduce_prompt(labelled, language or "", task, preamble, final=True))
+    logging.info(f"Chunked analysis: {len(chunks)} chunks, {len(chunks) - len(pending)} cached, {failed} failed, {levels} intermediate reduce levels.")
+    return {
+        "analysis": analysis,
+        "report": {
+            "chunks": [{"start": chunk.start, "end": chunk.end, "label": chunk.label, "cached": index not in futures}
+                       for index, chunk in enumerate(chunks)],
+            "chunk_count": len(chunks),
+            "cached": len(chunks) - len(pending),
+            "summarized": len(pending) - failed,
+            "failed": failed,
+            "reduce_levels": levels + 1,
+            "map_time": round(map_time, 6),
+            "reduce_time": round(time.perf_counter() - start_time - map_time, 6),
+            "usage": usage,
+        },
+    }
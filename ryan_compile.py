@@ -0,0 +1,268 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import contextlib
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Optional, Dict, Any, List
+
+from ryan_exec_scheduler import EXEC_LIMITS, run_limited
+
+# --- Compiled-Language Execution ---
+# C, C++, Java and Go snippets are written into a temporary workspace, compiled, and the
+# resulting binary (or class files) is run from a fresh workspace directory.
+# Compilation dominates the cost of small programs (hundreds of ms for g++/javac, seconds
+# for a cold `go build`), so artifacts are kept in an on-disk compile cache:
+#   - key: sha256 of language, toolchain version, compile flags and source,
+#   - layout: <RYAN_COMPILE_CACHE_DIR>/<key>/ holds the artifact; a build happens in a
+#     private "_build-*" directory and is renamed into place, so readers never see a partial one,
+#   - least recently used entries (by directory mtime) beyond RYAN_COMPILE_CACHE_MAX_ENTRIES are removed.
+# Compiler and program both run under the scheduler's rlimits; results report compile time
+# and run time separately.
+
+COMPILE_CACHE_DIR = os.getenv("RYAN_COMPILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ryan_compile_cache"))
+COMPILE_CACHE_MAX_ENTRIES = int(os.getenv("RYAN_COMPILE_CACHE_MAX_ENTRIES", "128"))
+COMPILE_TIMEOUT = float(os.getenv("RYAN_COMPILE_TIMEOUT", "60"))
+C_COMPILER = os.getenv("RYAN_CC", "gcc")
+CXX_COMPILER = os.getenv("RYAN_CXX", "g++")
+
+# The JVM reserves code cache and compressed class space up front; shrink them so it starts under RLIMIT_AS.
+# The heap gets the scheduler's memory limit.
+JVM_FLAGS = ["-XX:ReservedCodeCacheSize=64m", "-XX:CompressedClassSpaceSize=64m", "-XX:+UseSerialGC",
+             "-XX:TieredStopAtLevel=1", f"-Xmx{EXEC_LIMITS.memory_mb}m"]
+
+# Per language: source file name, compile / run command templates ({src}, {out}, {main}) and version command.
+# Templates are part of the cache key, so changing flags invalidates old artifacts.
+TOOLCHAINS: Dict[str, Dict[str, Any]] = {
+    "c": {
+        "source": "main.c",
+        "compile": [C_COMPILER, "-O2", "-std=c17", "-o", "{out}/main", "{src}", "-lm"],
+        "run": ["{out}/main"],
+        "version": [C_COMPILER, "--version"],
+    },
+    "cpp": {
+        "source": "main.cpp",
+        "compile": [CXX_COMPILER, "-O2", "-std=c++17", "-o", "{out}/main", "{src}"],
+        "run": ["{out}/main"],
+        "version": [CXX_COMPILER, "--version"],
+    },
+    "java": {
+        "source": "{main}.java", # javac requires a public class to live in a file of the same name
+        "compile": ["javac", *["-J" + flag for flag in JVM_FLAGS], "-d", "{out}", "{src}"],
+        "run": ["java", *JVM_FLAGS, "-cp", "{out}", "{main}"],
+        "version": ["javac", "-version"],
+    },
+    "go": {
+        "source": "main.go",
+        "compile": ["go", "build", "-o", "{out}/main", "{src}"],
+        "run": ["{out}/main"],
+        "version": ["go", "version"],
+    },
+}
+LANGUAGE_ALIASES = {"c++": "cpp", "cxx": "cpp", "golang": "go"}
+
+
+def normalize_language(language: str) -> str:
+    language = language.lower()
+    return LANGUAGE_ALIASES.get(language, language)
+
+
+def is_compiled_language(language: str) -> bool:
+    return normalize_language(language) in TOOLCHAINS
+
+
+def java_main_class(source: str) -> str:
+    """Name of the class declaring main() (the public class if there is one), defaulting to Main."""
+    public_class = re.search(r"\bpublic\s+(?:final\s+|abstract\s+)*class\s+(\w+)", source)
+    if public_class:
+        return public_class.group(1)
+    main_method = re.search(r"\bstatic\s+void\s+main\s*\(", source)
+    if main_method:
+        # Innermost preceding class declaration is the best guess without a parser
+        classes = [m for m in re.finditer(r"\bclass\s+(\w+)", source) if m.start() < main_method.start()]
+        if classes:
+            return classes[-1].group(1)
+    return "Main"
+
+
+def _fill(template: List[str], **values: str) -> List[str]:
+    return [part.format(**values) for part in template]
+
+
+class CompileCache:
+    """On-disk cache of compiled artifacts, keyed by source hash and toolchain version."""
+    def __init__(self, root: str = COMPILE_CACHE_DIR, max_entries: int = COMPILE_CACHE_MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+        self._versions: Dict[str, str] = {}
+        self._key_locks: Dict[str, List[Any]] = {} # key -> [lock, holders + waiters]; one build per key at a time
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def toolchain_version(self, language: str) -> str:
+        """First line of the compiler's version output. Raises FileNotFoundError if the toolchain is missing."""
+        with self._lock:
+            cached = self._versions.get(language)
+        if cached is not None:
+            return cached
+        command = TOOLCHAINS[language]["version"]
+        try:
+            completed = subprocess.run(command, capture_output=True, text=True, timeout=30)
+        except subprocess.TimeoutExpired:
+            raise FileNotFoundError(f"'{command[0]}' did not report its version.")
+        # javac prints its version on stderr in older releases
+        output = (completed.stdout or completed.stderr).strip()
+        version = output.splitlines()[0] if output else "unknown"
+        with self._lock:
+            self._versions[language] = version
+        return version
+
+    def _environment(self, language: str) -> Dict[str, str]:
+        env = dict(os.environ)
+        if language == "go":
+            # Persistent build cache for the standard library; without it every `go build` recompiles fmt & co.
+            env["GOCACHE"] = os.path.join(self.root, "_gocache")
+            env.setdefault("GOPATH", os.path.join(self.root, "_gopath"))
+            env["GO111MODULE"] = "off" # A single file outside any module
+            env["GOFLAGS"] = "-buildvcs=false"
+        return env
+
+    def build(self, language: str, source: str) -> Dict[str, Any]:
+        """
+        Returns the compiled artifact for source, compiling it on a cache miss.
+        Result: success, cached, compile_time, key, run_command (on success) or
+        output/return_code/timed_out of the failed compiler run.
+        Raises FileNotFoundError if the toolchain is missing.
+        """
+        language = normalize_language(language)
+        toolchain = TOOLCHAINS[language]
+        main_class = java_main_class(source) if language == "java" else "main"
+        digest = hashlib.sha256()
+        for part in (language, self.toolchain_version(language), " ".join(toolchain["compile"]), main_class, source):
+            encoded = part.encode("utf-8", errors="surrogatepass")
+            digest.update(str(len(encoded)).encode() + b":" + encoded)
+        key = digest.hexdigest()
+        artifact_dir = os.path.join(self.root, key)
+
+        with self._key_lock(key):
+            if os.path.isdir(artifact_dir):
+                os.utime(artifact_dir) # Mark as recently used
+                with self._lock:
+                    self.hits += 1
+                logging.info(f"Compile cache hit for {language} ({key[:12]}).")
+                return {"success": True, "cached": True, "compile_time": 0.0, "key": key,
+                        "run_command": _fill(toolchain["run"], out=artifact_dir, main=main_class)}
+            with self._lock:
+                self.misses += 1
+
+            workspace = tempfile.mkdtemp(prefix="_build-", dir=self.root)
+            try:
+                source_path = os.path.join(workspace, toolchain["source"].format(main=main_class))
+                output_dir = os.path.join(workspace, "out")
+                os.makedirs(output_dir)
+                with open(source_path, "w", encoding="utf-8") as source_file:
+                    source_file.write(source)
+                command = _fill(toolchain["compile"], src=source_path, out=output_dir, main=main_class)
+                logging.info(f"Compiling {language} snippet ({key[:12]}): {' '.join(command[:2])} ...")
+                start = time.perf_counter()
+                compiled = run_limited(command, language, timeout=COMPILE_TIMEOUT, cpu_seconds=int(COMPILE_TIMEOUT),
+                                       env=self._environment(language), cwd=workspace)
+                compile_time = round(time.perf_counter() - start, 6)
+                if compiled["return_code"] != 0 or compiled["timed_out"]:
+                    # Compiler diagnostics mention the private workspace path; show just the file name
+                    output = (compiled["stdout"] + compiled["stderr"]).replace(workspace + os.sep, "")
+                    if compiled["timed_out"]:
+                        output += f"\nCompilation timed out after {COMPILE_TIMEOUT:g} seconds."
+                    return {"success": False, "cached": False, "compile_time": compile_time, "key": key,
+                            "output": output, "return_code": compiled["return_code"] or 1, "timed_out": compiled["timed_out"]}
+                try:
+                    os.rename(output_dir, artifact_dir)
+                except OSError:
+                    pass # Another process cached the same key first; its artifact is identical
+            finally:
+                shutil.rmtree(workspace, ignore_errors=True)
+
+        self._evict()
+        logging.info(f"Compiled {language} snippet in {compile_time:.3f}s ({key[:12]}).")
+        return {"success": True, "cached": False, "compile_time": compile_time, "key": key,
+                "run_command": _fill(toolchain["run"], out=artifact_dir, main=main_class)}
+
+    @contextlib.contextmanager
+    def _key_lock(self, key: str):
+        """Serialises builds of one key; concurrent requests wait for it. The lock is dropped once nobody holds or waits for it."""
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _evict(self):
+        try:
+            entries = [os.path.join(self.root, name) for name in os.listdir(self.root) if not name.startswith("_")]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for path in entries[:len(entries) - self.max_entries]:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"root": self.root, "max_entries": self.max_entries, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+_compile_cache: Optional[CompileCache] = None
+_compile_cache_lock = threading.Lock()
+
+
+def get_compile_cache() -> CompileCache:
+    """Returns the process-wide compile cache."""
+    global _compile_cache
+    with _compile_cache_lock:
+        if _compile_cache is None:
+            _compile_cache = CompileCache()
+        return _compile_cache
+
+
+def run_compiled(code: str, language: str, stdin: Optional[str] = None, timeout: float = 30) -> Dict[str, Any]:
+    """
+    Compiles (or fetches from the compile cache) and runs a C/C++/Java/Go snippet in a fresh workspace.
+    Returns run_limited's fields plus compile_time, run_time and compile_cached; a failed compile
+    returns the compiler output as stderr with compile_failed=True.
+    Raises FileNotFoundError if the toolchain is missing.
+    """
+    language = normalize_language(language)
+    artifact = get_compile_cache().build(language, code)
+    if not artifact["success"]:
+        return {"stdout": "", "stderr": artifact["output"], "return_code": artifact["return_code"], "timed_out": False,
+                "wall_time": artifact["compile_time"], "cpu_time": None, "peak_rss_kb": None,
+                "compile_time": artifact["compile_time"], "run_time": 0.0, "compile_cached": False, "compile_failed": True}
+
+    # Each run gets an empty working directory, so files the program writes don't pile up in the API's cwd
+    workspace = tempfile.mkdtemp(prefix="ryan_run_")
+    try:
+        run = run_limited(artifact["run_command"], language, stdin=stdin, timeout=timeout, cwd=workspace)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    run["run_time"] = run["wall_time"]
+    run["compile_time"] = artifact["compile_time"]
+    run["compile_cached"] = artifact["cached"]
+    run["wall_time"] = round(run["wall_time"] + artifact["compile_time"], 6)
+    return run
@@ -0,0 +1,419 @@
+import os
+import re
+import math
+import time
+import zlib
+import array
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from collections import Counter
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Callable
+
+# --- Chunked Document Index ---
+# process_document used to save a whole uploaded file as one memory value, which runs into
+# Firestore's 1 MiB document limit and is pulled in full by every later memory read (and
+# pasted in full into every prompt that includes memory). Documents now go here instead:
+#   - chunking   - the text is cut into chunks at content-defined line boundaries (a blank
+#                  line, or a line whose crc32 % DOC_BOUNDARY_MODULUS == 0, once the chunk has
+#                  DOC_CHUNK_MIN_CHARS; always at DOC_CHUNK_MAX_CHARS). Each chunk repeats up to
+#                  DOC_CHUNK_OVERLAP_CHARS of the previous chunk's last lines so a passage cut
+#                  at a boundary is still found whole. Boundaries depend only on nearby content,
+#                  so an edit changes the chunks around it and leaves the rest alone.
+#   - stable ids - chunk_id = sha256(doc id, chunk text, occurrence); re-uploading a document
+#                  keeps unchanged chunks (and their postings and embeddings) and only writes,
+#                  and embeds, the chunks that changed.
+#   - lexical    - an inverted index (postings: term -> chunk, tf) in sqlite, scored with BM25.
+#                  Identifiers are also indexed by their parts (snake_case, camelCase).
+#   - embeddings - optional (RYAN_DOC_EMBEDDINGS=1 plus an embed callable): chunk vectors are
+#                  stored next to the chunk and searched by cosine similarity; lexical and
+#                  vector rankings are combined with reciprocal rank fusion.
+# search() returns only the top-k chunks, so what a chat or debug prompt pays for depends on
+# relevance, not on the size of the uploaded files. Indexing reads its lines from an iterator,
+# so a spooled upload (ryan_upload.py) is indexed without loading the file.
+
+DOC_INDEX_DB_PATH = os.getenv("RYAN_DOC_INDEX_DB", os.path.join(tempfile.gettempdir(), "ryan_documents.sqlite3"))
+DOC_CHUNK_MAX_CHARS = int(os.getenv("RYAN_DOC_CHUNK_MAX_CHARS", "2400"))
+DOC_CHUNK_MIN_CHARS = DOC_CHUNK_MAX_CHARS // 4
+DOC_CHUNK_OVERLAP_CHARS = int(os.getenv("RYAN_DOC_CHUNK_OVERLAP_CHARS", "300"))
+DOC_BOUNDARY_MODULUS = 8
+DOC_RETRIEVAL_K = int(os.getenv("RYAN_DOC_RETRIEVAL_K", "4"))
+DOC_CONTEXT_MAX_CHARS = int(os.getenv("RYAN_DOC_CONTEXT_MAX_CHARS", "8000"))
+DOC_EMBEDDINGS_ENABLED = os.getenv("RYAN_DOC_EMBEDDINGS", "0") == "1"
+DOC_EMBED_BATCH = 32
+DOC_CHAT_MIN_COVERAGE = 0.25 # Chat questions are short; an excerpt must match a quarter of their terms to be worth the tokens
+DOC_MIN_SIMILARITY = 0.5 # Vector-only matches below this cosine similarity are not returned
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+_RRF_K = 60
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_STOPWORDS = {"the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "was", "were", "be", "it",
+              "this", "that", "with", "as", "at", "by", "from", "what", "how", "do", "does", "can", "you", "me",
+              "my", "i", "about", "tell", "please", "there", "which", "who", "why", "when", "where", "if", "not"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words for the lexical index; identifiers also yield their snake_case/camelCase parts."""
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lowered = word.lower()
+        if len(lowered) > 1 and lowered not in _STOPWORDS:
+            terms.append(lowered)
+        parts = [part.lower() for piece in word.split("_") for part in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if len(part) > 1 and part not in _STOPWORDS and part != lowered)
+    return terms
+
+
+def chunk_lines(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Content-defined, overlapping chunks from an iterable of lines (with or without line endings).
+    Yields {"text", "start_line", "end_line"} with 1-based inclusive line numbers.
+    """
+    current: List[tuple] = [] # (line number, text) of the chunk being built, overlap included
+    size = 0
+    fresh = False # Whether current holds anything beyond the overlap carried from the previous chunk
+
+    def emit():
+        return {"text": "\n".join(text for _, text in current), "start_line": current[0][0], "end_line": current[-1][0]}
+
+    number = 0
+    for raw in lines:
+        number += 1
+        line = raw.rstrip("\r\n")
+        # Over-long lines are split so no chunk grows past the maximum
+        pieces = [line[i:i + DOC_CHUNK_MAX_CHARS] for i in range(0, len(line), DOC_CHUNK_MAX_CHARS)] or [""]
+        for piece in pieces:
+            if fresh and size + len(piece) > DOC_CHUNK_MAX_CHARS:
+                yield emit()
+                current = _overlap(current)
+                size = sum(len(text) + 1 for _, text in current)
+                fresh = False
+            current.append((number, piece))
+            size += len(piece) + 1
+            fresh = True
+            if size >= DOC_CHUNK_MIN_CHARS and (not piece.strip() or zlib.crc32(piece.encode()) % DOC_BOUNDARY_MODULUS == 0):
+                yield emit()
+                current = _overlap(current)
+                size = sum(len(text) + 1 for _, text in current)
+                fresh = False
+    if fresh and any(text.strip() for _, text in current):
+        yield emit()
+
+
+def _overlap(lines: List[tuple]) -> List[tuple]:
+    """The trailing lines of a finished chunk that are carried into the next one."""
+    carried: List[tuple] = []
+    size = 0
+    for number, text in reversed(lines):
+        if size + len(text) + 1 > DOC_CHUNK_OVERLAP_CHARS:
+            break
+        carried.insert(0, (number, text))
+        size += len(text) + 1
+    # Leading blank lines add nothing to the next chunk
+    while carried and not carried[0][1].strip():
+        carried.pop(0)
+    return carried
+
+
+class _CountedLines:
+    """Passes lines through while counting them and hashing their content (read as totals["lines"] etc. afterwards)."""
+    def __init__(self, lines: Iterable[str]):
+        self._lines = lines
+        self._hash = hashlib.sha256()
+        self.counts = {"lines": 0, "bytes": 0}
+
+    def __iter__(self) -> Iterator[str]:
+        for line in self._lines:
+            encoded = line.encode("utf-8", "replace")
+            self.counts["lines"] += 1
+            self.counts["bytes"] += len(encoded)
+            self._hash.update(encoded)
+            yield line
+
+    def __getitem__(self, key: str):
+        return self._hash.hexdigest() if key == "content_hash" else self.counts[key]
+
+
+def _identified_chunks(doc_id: str, lines: Iterable[str]) -> Iterator[tuple]:
+    """(chunk_id, chunk) pairs; the id is derived from the document, the chunk text and its occurrence count."""
+    occurrences: Counter = Counter()
+    for chunk in chunk_lines(lines):
+        text_hash = hashlib.sha256(chunk["text"].encode("utf-8", "replace")).hexdigest()
+        occurrences[text_hash] += 1
+        yield hashlib.sha256(f"{doc_id}\0{text_hash}\0{occurrences[text_hash]}".encode()).hexdigest()[:24], chunk
+
+
+def prepare_document(file_name: str, lines: Iterable[str]) -> Dict[str, Any]:
+    """
+    The CPU-heavy half of indexing (chunking, ids, tokenizing) as plain picklable data, so it can run in a
+    worker process; DocumentIndex.store_prepared writes the result.
+    """
+    doc_id = document_id_for(file_name)
+    counted = _CountedLines(lines)
+    chunks = [(chunk_id, chunk["start_line"], chunk["end_line"], chunk["text"], dict(Counter(tokenize(chunk["text"]))))
+              for chunk_id, chunk in _identified_chunks(doc_id, counted)]
+    return {"file_name": file_name, "doc_id": doc_id, "chunks": chunks, "content_hash": counted["content_hash"],
+            "lines": counted["lines"], "bytes": counted["bytes"]}
+
+
+def document_id_for(file_name: str) -> str:
+    """Documents are keyed by file name, so re-uploading a file replaces it."""
+    return hashlib.sha256(file_name.encode()).hexdigest()[:16]
+
+
+def _pack(vector: List[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> array.array:
+    vector = array.array("f")
+    vector.frombytes(blob)
+    return vector
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class DocumentIndex:
+    """sqlite tables: documents, chunks (text, term count, optional embedding), postings and corpus stats."""
+    def __init__(self, db_path: str = DOC_INDEX_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL with synchronous=NORMAL: a commit is an append instead of an fsync'd journal rewrite, which is
+        # what per-file writes during bulk ingestion (ryan_ingest.py) spend most of their time on otherwise
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, file_name TEXT, language TEXT, "
+                                     "content_hash TEXT, chunks INTEGER, lines INTEGER, bytes INTEGER, updated REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, doc_id TEXT, ordinal INTEGER, "
+                                     "start_line INTEGER, end_line INTEGER, text TEXT, length INTEGER, embedding BLOB)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, chunk_id TEXT, tf INTEGER, "
+                                     "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+            self._connection.execute("INSERT OR IGNORE INTO stats VALUES ('chunks', 0), ('length', 0)")
+
+    # --- Indexing ---
+
+    def index_document(self, file_name: str, lines: Iterable[str], language: Optional[str] = None,
+                       embed: Optional[Callable[[List[str]], Optional[List[List[float]]]]] = None) -> Dict[str, Any]:
+        """
+        (Re)indexes a document from its lines. Chunks whose id already exists are kept as they are;
+        embed(texts) -> vectors (or None) is called for new chunks only.
+        Returns {doc_id, file_name, chunks, added, reused, removed, embedded, seconds}.
+        """
+        doc_id = document_id_for(file_name)
+        counted = _CountedLines(lines)
+        records = ((chunk_id, chunk["start_line"], chunk["end_line"], chunk["text"], None) for chunk_id, chunk in _identified_chunks(doc_id, counted))
+        return self._write(file_name, doc_id, records, counted, language, embed)
+
+    def store_prepared(self, prepared: Dict[str, Any], language: Optional[str] = None,
+                       embed: Optional[Callable[[List[str]], Optional[List[List[float]]]]] = None) -> Dict[str, Any]:
+        """index_document for the output of prepare_document (chunked and tokenized elsewhere, e.g. in a worker process)."""
+        return self._write(prepared["file_name"], prepared["doc_id"], prepared["chunks"], prepared, language, embed)
+
+    def _write(self, file_name: str, doc_id: str, records: Iterable[tuple], totals: Any, language: Optional[str],
+               embed: Optional[Callable[[List[str]], Optional[List[List[float]]]]]) -> Dict[str, Any]:
+        """
+        Writes (chunk_id, start_line, end_line, text, terms or None) records in one transaction and removes the
+        document's chunks that are no longer produced. totals supplies content_hash/lines/bytes once records is exhausted.
+        """
+        start = time.perf_counter()
+        added: List[str] = []
+        reused = 0
+        ordinal = 0
+        with self._lock, self._connection:
+            existing = {row[0] for row in self._connection.execute("SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,))}
+            kept = set()
+            length_delta = 0
+            for chunk_id, start_line, end_line, text, terms in records:
+                if chunk_id in existing:
+                    self._connection.execute("UPDATE chunks SET ordinal = ?, start_line = ?, end_line = ? WHERE chunk_id = ?",
+                                             (ordinal, start_line, end_line, chunk_id))
+                    reused += 1
+                else:
+                    terms = terms if terms is not None else Counter(tokenize(text))
+                    length = sum(terms.values())
+                    self._connection.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                                             (chunk_id, doc_id, ordinal, start_line, end_line, text, length))
+                    self._connection.executemany("INSERT INTO postings VALUES (?, ?, ?)", [(term, chunk_id, tf) for term, tf in terms.items()])
+                    length_delta += length
+                    added.append(chunk_id)
+                kept.add(chunk_id)
+                ordinal += 1
+            removed = list(existing - kept)
+            for batch_start in range(0, len(removed), 500):
+                batch = removed[batch_start:batch_start + 500]
+                marks = ",".join("?" * len(batch))
+                length_delta -= self._connection.execute(f"SELECT COALESCE(SUM(length), 0) FROM chunks WHERE chunk_id IN ({marks})", batch).fetchone()[0]
+                self._connection.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", batch)
+                self._connection.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", batch)
+            self._connection.execute("UPDATE stats SET value = value + ? WHERE name = 'chunks'", (len(added) - len(removed),))
+            self._connection.execute("UPDATE stats SET value = value + ? WHERE name = 'length'", (length_delta,))
+            self._connection.execute("INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (doc_id, file_name, language, totals["content_hash"], ordinal, totals["lines"], totals["bytes"], time.time()))
+
+        embedded = self._embed_chunks(added, embed) if embed else 0
+        report = {"doc_id": doc_id, "file_name": file_name, "chunks": ordinal, "added": len(added), "reused": reused,
+                  "removed": len(removed), "embedded": embedded, "seconds": round(time.perf_counter() - start, 6)}
+        logging.info(f"Indexed document '{file_name}': {ordinal} chunks ({len(added)} new, {reused} unchanged, {len(removed)} removed).")
+        return report
+
+    def _embed_chunks(self, chunk_ids: List[str], embed: Callable[[List[str]], Optional[List[List[float]]]]) -> int:
+        """Embeds chunks in batches; the model calls happen outside the database lock."""
+        embedded = 0
+        for batch_start in range(0, len(chunk_ids), DOC_EMBED_BATCH):
+            batch = chunk_ids[batch_start:batch_start + DOC_EMBED_BATCH]
+            with self._lock:
+                rows = self._connection.execute(f"SELECT chunk_id, text FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch).fetchall()
+            try:
+                vectors = embed([text for _, text in rows])
+            except Exception as e:
+                logging.warning(f"Embedding document chunks failed: {e}")
+                vectors = None
+            if not vectors or len(vectors) != len(rows):
+                logging.warning("Document chunks were indexed without embeddings (lexical search only).")
+                break
+            with self._lock, self._connection:
+                self._connection.executemany("UPDATE chunks SET embedding = ? WHERE chunk_id = ?",
+                                             [(_pack(vector), chunk_id) for (chunk_id, _), vector in zip(rows, vectors)])
+            embedded += len(rows)
+        return embedded
+
+    def delete_document(self, doc_id: str) -> Optional[str]:
+        """Removes a document and its chunks; returns its file name (None if unknown)."""
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT file_name FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            count, length = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE doc_id = ?", (doc_id,)).fetchone()
+            self._connection.execute("DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE doc_id = ?)", (doc_id,))
+            self._connection.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self._connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self._connection.execute("UPDATE stats SET value = value - ? WHERE name = 'chunks'", (count,))
+            self._connection.execute("UPDATE stats SET value = value - ? WHERE name = 'length'", (length,))
+        return row[0]
+
+    def file_name_for(self, doc_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT file_name FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connection.execute("SELECT doc_id, file_name, language, chunks, lines, bytes, updated FROM documents ORDER BY updated DESC").fetchall()
+        return [{"doc_id": r[0], "file_name": r[1], "language": r[2], "chunks": r[3], "lines": r[4], "bytes": r[5], "updated": r[6]} for r in rows]
+
+    def document_count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    # --- Retrieval ---
+
+    def search(self, query: str, k: int = DOC_RETRIEVAL_K, doc_ids: Optional[List[str]] = None, min_coverage: float = 0.0,
+               query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k chunks for a query: BM25 over the postings, fused with cosine similarity when a query
+        embedding is given. min_coverage is the fraction of distinct query terms a lexical match must
+        contain (0 = any one). Returns [{chunk_id, doc_id, file_name, start_line, end_line, text, score}].
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        allowed = set(doc_ids) if doc_ids else None
+        with self._lock:
+            stats = dict(self._connection.execute("SELECT name, value FROM stats").fetchall())
+            total_chunks = stats.get("chunks", 0)
+            if total_chunks <= 0:
+                return []
+            average_length = max(stats.get("length", 0) / total_chunks, 1.0)
+
+            scores: Dict[str, float] = {}
+            matched: Counter = Counter()
+            lengths: Dict[str, int] = {}
+            postings = {term: self._connection.execute("SELECT chunk_id, tf FROM postings WHERE term = ?", (term,)).fetchall() for term in terms}
+            candidates = sorted({chunk_id for rows in postings.values() for chunk_id, _ in rows})
+            chunk_docs: Dict[str, str] = {}
+            for batch_start in range(0, len(candidates), 500):
+                batch = candidates[batch_start:batch_start + 500]
+                for chunk_id, doc_id, length in self._connection.execute(
+                        f"SELECT chunk_id, doc_id, length FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch):
+                    chunk_docs[chunk_id] = doc_id
+                    lengths[chunk_id] = length
+            for term, rows in postings.items():
+                if not rows:
+                    continue
+                idf = math.log(1 + (total_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf in rows:
+                    if chunk_id not in chunk_docs or (allowed is not None and chunk_docs[chunk_id] not in allowed):
+                        continue
+                    norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (_BM25_K1 + 1) / (tf + norm)
+                    matched[chunk_id] += 1
+            needed = max(1, math.ceil(min_coverage * len(terms)))
+            lexical = sorted((chunk_id for chunk_id in scores if matched[chunk_id] >= needed), key=lambda c: -scores[c])
+
+            vector: List[str] = []
+            similarities: Dict[str, float] = {}
+            if query_embedding:
+                for chunk_id, doc_id, blob in self._connection.execute("SELECT chunk_id, doc_id, embedding FROM chunks WHERE embedding IS NOT NULL"):
+                    if allowed is None or doc_id in allowed:
+                        similarity = _cosine(query_embedding, _unpack(blob))
+                        if similarity >= DOC_MIN_SIMILARITY:
+                            similarities[chunk_id] = similarity
+                vector = sorted(similarities, key=lambda c: -similarities[c])
+
+            if vector:
+                fused: Dict[str, float] = {}
+                for ranking in (lexical, vector):
+                    for rank, chunk_id in enumerate(ranking):
+                        fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (_RRF_K + rank + 1)
+                ranked = sorted(fused, key=lambda c: -fused[c])[:k]
+                final_scores = fused
+            else:
+                ranked = lexical[:k]
+                final_scores = scores
+            if not ranked:
+                return []
+            rows = self._connection.execute(
+                f"SELECT c.chunk_id, c.doc_id, d.file_name, c.start_line, c.end_line, c.text FROM chunks c JOIN documents d ON d.doc_id = c.doc_id "
+                f"WHERE c.chunk_id IN ({','.join('?' * len(ranked))})", ranked).fetchall()
+        by_id = {row[0]: row for row in rows}
+        return [{"chunk_id": chunk_id, "doc_id": by_id[chunk_id][1], "file_name": by_id[chunk_id][2], "start_line": by_id[chunk_id][3],
+                 "end_line": by_id[chunk_id][4], "text": by_id[chunk_id][5], "score": round(final_scores[chunk_id], 6)}
+                for chunk_id in ranked if chunk_id in by_id]
+
+
+def format_chunks(chunks: List[Dict[str, Any]], max_chars: int = DOC_CONTEXT_MAX_CHARS) -> str:
+    """Retrieved chunks as a prompt section (empty string when there are none)."""
+    parts = []
+    used = 0
+    for chunk in chunks:
+        block = f"--- {chunk['file_name']} (lines {chunk['start_line']}-{chunk['end_line']}) ---\n{chunk['text']}\n"
+        if parts and used + len(block) > max_chars:
+            break
+        parts.append(block[:max_chars])
+        used += len(block)
+    return "Relevant excerpts from uploaded documents:\n" + "\n".join(parts) + "\n" if parts else ""
+
+
+_index: Optional[DocumentIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_document_index() -> DocumentIndex:
+    """Returns the shared document index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DocumentIndex()
+        return _index
@@ -0,0 +1,299 @@
+import os
+import re
+import sys
+import ast
+import time
+import hashlib
+import builtins
+import importlib
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+from ryan_compile import get_compile_cache, is_compiled_language, normalize_language
+
+# --- Execution Result Cache ---
+# Users often re-run identical code ("Run" clicked repeatedly in the GUI, the same
+# `run python code:` block in chat). For snippets whose output can only depend on the
+# code and its stdin, the previous result is returned instead of running again.
+#   - Opt-in: RYAN_EXEC_CACHE=1, or cache=True per request.
+#   - A snippet is cacheable if the caller marks it deterministic, or if it passes a
+#     conservative static check (no time, randomness, network, file/process I/O,
+#     dynamic code, or anything that prints memory addresses / hash-seeded ordering).
+#     When in doubt the check says no; a wrong "no" only costs a run.
+#   - Key: sha256 of language, interpreter version, code and stdin.
+#   - LRU eviction with caps on entry count and total output bytes.
+# Only clean results are stored: timeouts, rlimit kills and signal deaths are not.
+
+EXEC_CACHE_ENABLED = os.getenv("RYAN_EXEC_CACHE", "0") == "1"
+EXEC_CACHE_MAX_ENTRIES = int(os.getenv("RYAN_EXEC_CACHE_MAX_ENTRIES", "256"))
+EXEC_CACHE_MAX_BYTES = int(os.getenv("RYAN_EXEC_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Standard modules whose behaviour depends only on their inputs
+_PURE_PYTHON_MODULES = {
+    "abc", "array", "base64", "binascii", "bisect", "cmath", "collections", "copy", "dataclasses",
+    "decimal", "difflib", "enum", "fractions", "functools", "hashlib", "heapq", "itertools", "json",
+    "keyword", "math", "numbers", "operator", "pprint", "re", "statistics", "string", "struct",
+    "textwrap", "typing", "unicodedata", "zlib",
+}
+# Builtins that do I/O (other than stdin/stdout), run dynamic code, or expose addresses / hash seeds,
+# plus the reflective ones that can reach any of those by name (getattr(__builtins__, "op" + "en")).
+# Set iteration order over str depends on PYTHONHASHSEED, and default reprs include addresses.
+_IMPURE_PYTHON_BUILTINS = {
+    "open", "exec", "eval", "compile", "__import__", "breakpoint", "globals", "locals", "vars",
+    "id", "hash", "object", "set", "frozenset", "memoryview", "help", "dir",
+    "__builtins__", "builtins", "getattr", "setattr", "delattr", "type",
+}
+# Methods of builtin types: printing one unbound from its instance (print(x.append)) shows an address
+_BUILTIN_METHOD_NAMES = {
+    name for kind in (str, bytes, bytearray, int, float, complex, list, tuple, dict, set, frozenset)
+    for name in dir(kind) if not name.startswith("__") and callable(getattr(kind, name))
+}
+# Builtins whose results have a default repr (<map object at 0x...>)
+_ADDRESS_REPR_CALLS = {"iter", "map", "filter", "zip", "reversed", "enumerate", "aiter"}
+# Clocks, randomness, I/O, timers and dynamic code in JavaScript
+_IMPURE_JS_PATTERN = re.compile(
+    r"\b(Date|Math\.random|performance|process|require|import|fetch|XMLHttpRequest|WebSocket|"
+    r"setTimeout|setInterval|setImmediate|queueMicrotask|crypto|eval|Function|globalThis|global|"
+    r"WeakRef|FinalizationRegistry|Atomics|SharedArrayBuffer|Worker|Intl|toLocale\w*)\b"
+)
+
+_versions: Dict[str, str] = {}
+_versions_lock = threading.Lock()
+
+
+def interpreter_version(language: str) -> str:
+    """Version string of the interpreter that runs the language (part of the cache key)."""
+    language = language.lower()
+    with _versions_lock:
+        if language not in _versions:
+            if language == "python":
+                _versions[language] = sys.version
+            elif language == "javascript":
+                try:
+                    _versions[language] = subprocess.run(["node", "--version"], capture_output=True, text=True, timeout=10).stdout.strip()
+                except (OSError, subprocess.TimeoutExpired):
+                    _versions[language] = "unknown"
+            elif is_compiled_language(language):
+                try:
+                    _versions[language] = get_compile_cache().toolchain_version(normalize_language(language))
+                except FileNotFoundError:
+                    _versions[language] = "unknown"
+            else:
+                _versions[language] = "unknown"
+        return _versions[language]
+
+
+def cache_key(language: str, code: str, stdin: Optional[str] = None) -> str:
+    digest = hashlib.sha256()
+    for part in (language.lower(), interpreter_version(language), code, stdin or ""):
+        encoded = part.encode("utf-8", errors="surrogatepass")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") can't collide
+        digest.update(str(len(encoded)).encode() + b":" + encoded)
+    return digest.hexdigest()
+
+
+def _python_impurity(code: str) -> Optional[str]:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return "code does not parse"
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] not in _PURE_PYTHON_MODULES:
+                    return f"imports '{alias.name}'"
+        elif isinstance(node, ast.ImportFrom):
+            if node.level or (node.module or "").split(".")[0] not in _PURE_PYTHON_MODULES:
+                return f"imports from '{'.' * node.level}{node.module or ''}'"
+        elif isinstance(node, ast.Name) and node.id in _IMPURE_PYTHON_BUILTINS:
+            return f"uses '{node.id}'"
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            return "uses a set (iteration order depends on the hash seed)"
+        elif isinstance(node, ast.Attribute) and node.attr.startswith("__") and node.attr not in ("__name__", "__init__"):
+            return f"uses '{node.attr}'"
+        elif isinstance(node, ast.ClassDef) and not any(isinstance(item, ast.FunctionDef) and item.name in ("__repr__", "__str__") for item in node.body):
+            return "may print an object address"
+    if _prints_default_repr(tree):
+        return "may print an object address"
+    return None
+
+
+def _formatted_values(tree):
+    """Expressions whose repr/str can reach the output: print/repr/str/format/ascii arguments, f-string fields, '%' and .format() operands."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            if (isinstance(func, ast.Name) and func.id in ("print", "repr", "str", "format", "ascii")) or (isinstance(func, ast.Attribute) and func.attr == "format"):
+                yield from node.args
+                yield from (keyword.value for keyword in node.keywords)
+        elif isinstance(node, ast.FormattedValue):
+            yield node.value
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mod) and isinstance(node.left, (ast.Constant, ast.JoinedStr)):
+            yield node.right
+
+
+def _prints_default_repr(tree) -> bool:
+    """
+    True if a function, method, generator or iterator object may be formatted; their
+    default reprs contain an address (print(print), print(x.append), print(map(f, xs))).
+    """
+    functions = set() # Names bound to functions, methods or lambdas
+    generators = set() # Functions whose call returns a generator
+    methods = set()
+    modules = {} # Local name -> imported module, to tell module functions from constants
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.add(node.name)
+            if isinstance(node, ast.AsyncFunctionDef) or any(isinstance(inner, (ast.Yield, ast.YieldFrom)) for inner in ast.walk(node)):
+                generators.add(node.name)
+        elif isinstance(node, ast.ClassDef):
+            methods.update(item.name for item in node.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)))
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    modules[alias.asname] = alias.name
+                else:
+                    modules[alias.name.split(".")[0]] = alias.name.split(".")[0]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                member = _module_member(node.module, alias.name)
+                if callable(member) and not isinstance(member, type):
+                    functions.add(alias.asname or alias.name)
+    # Names the snippet rebinds no longer refer to the builtin of that name
+    assigned = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+    assigned.update(node.arg for node in ast.walk(tree) if isinstance(node, ast.arg))
+
+    def address_repr(expr) -> bool:
+        if isinstance(expr, (ast.Lambda, ast.GeneratorExp)):
+            return True
+        if isinstance(expr, (ast.List, ast.Tuple, ast.Set)):
+            return any(address_repr(elt) for elt in expr.elts)
+        if isinstance(expr, ast.Dict):
+            return any(address_repr(part) for part in expr.keys + expr.values if part is not None)
+        if isinstance(expr, ast.Starred):
+            return address_repr(expr.value)
+        if isinstance(expr, ast.Name):
+            if expr.id in functions:
+                return True
+            builtin = getattr(builtins, expr.id, None)
+            return expr.id not in assigned and callable(builtin) and not isinstance(builtin, type)
+        if isinstance(expr, ast.Attribute):
+            if expr.attr in _BUILTIN_METHOD_NAMES or expr.attr in methods:
+                return True
+            if isinstance(expr.value, ast.Name) and expr.value.id in modules:
+                member = _module_member(modules[expr.value.id], expr.attr)
+                return callable(member) and not isinstance(member, type)
+            return False
+        if isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name):
+            return expr.func.id in generators or (expr.func.id in _ADDRESS_REPR_CALLS and expr.func.id not in assigned)
+        return False
+
+    # Aliases (f = print; g = lambda: 1) format the same as what they were bound to
+    for _ in range(2):
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign) and address_repr(node.value):
+                functions.update(target.id for target in node.targets if isinstance(target, ast.Name))
+    return any(address_repr(expr) for expr in _formatted_values(tree))
+
+
+def _module_member(module: str, name: str):
+    """The named member of a (pure, already allowed) standard module, or None."""
+    if module.split(".")[0] not in _PURE_PYTHON_MODULES:
+        return None
+    try:
+        return getattr(importlib.import_module(module), name, None)
+    except ImportError:
+        return None
+
+
+def deterministic_check(code: str, language: str) -> Tuple[bool, Optional[str]]:
+    """Conservative static check. Returns (cacheable, reason it isn't)."""
+    language = language.lower()
+    if language == "python":
+        reason = _python_impurity(code)
+    elif language == "javascript":
+        match = _IMPURE_JS_PATTERN.search(code)
+        reason = f"uses '{match.group(1)}'" if match else None
+    else:
+        reason = f"no static check for {language}"
+    return reason is None, reason
+
+
+def is_cacheable_result(result: Dict[str, Any]) -> bool:
+    """Only results that a re-run would reproduce are stored."""
+    return (result.get("type") == "code_execution_result"
+            and not result.get("rejected")
+            and not result.get("limit_exceeded")
+            and "timed out" not in (result.get("error") or "")
+            and result.get("return_code", -1) >= 0)
+
+
+class ExecutionResultCache:
+    """Thread-safe LRU of execute_code results with entry-count and byte caps."""
+    def __init__(self, max_entries: int = EXEC_CACHE_MAX_ENTRIES, max_bytes: int = EXEC_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict() # key -> (result, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(result: Dict[str, Any]) -> int:
+        return len((result.get("output") or "").encode()) + len((result.get("error") or "").encode())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            result, _, stored_at = entry
+            return dict(result, cached=True, cached_at=stored_at)
+
+    def put(self, key: str, result: Dict[str, Any]):
+        size = self._size(result)
+        if size > self.max_bytes:
+            return # A single huge output would flush everything else
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (dict(result), size, time.time())
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[ExecutionResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_exec_cache() -> ExecutionResultCache:
+    """Returns the process-wide execution result cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExecutionResultCache()
+        return _cache
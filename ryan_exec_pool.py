@@ -0,0 +1,478 @@
+import os
+import sys
+import time
+import json
+import queue
+import signal
+import logging
+import builtins
+import tempfile
+import threading
+import traceback
+import importlib
+import subprocess
+from typing import Optional, Dict, Any, List
+
+from ryan_workers import WorkerProcess
+from ryan_exec_scheduler import EXEC_LIMITS, get_execution_scheduler, wait_for_process, usage_from_rusage, spawn_limited, LaunchError, read_all_fd, write_all_fd
+
+# --- Warm Pre-Forked Execution Workers ---
+# Cold execution (`python -c` / `node -e` per request) pays interpreter startup
+# plus imports on every run. This pool keeps interpreters warm:
+#
+# Python: a "zygote" process imports RYAN_EXEC_PRELOAD modules once and then
+#   os.fork()s a fresh child for every run. Each run therefore gets a clean
+#   __main__ namespace in its own process (nothing leaks between runs), while
+#   the preloaded modules are already in memory. The zygote itself is recycled
+#   after RYAN_EXEC_ZYGOTE_MAX_RUNS runs to bound any drift.
+# Node: there is no fork(), so the pool keeps RYAN_EXEC_NODE_WORKERS spare
+#   `node` processes that have already started and required RYAN_EXEC_NODE_PRELOAD.
+#   Each spare handles exactly one run and is replaced in the background.
+# Callers run inside an execution scheduler slot, so by default the pool keeps one
+# zygote (and one node spare) per slot: a thread holding a slot never queues for a
+# worker, and the pool never caps parallelism below RYAN_EXEC_MAX_CONCURRENT.
+#
+# Results mirror subprocess.run: stdout, stderr, return_code, timed_out, plus the
+# wall_time / cpu_time / peak_rss_kb usage fields. Runs get the same rlimits as cold
+# runs (ryan_exec_scheduler.EXEC_LIMITS).
+# `python ryan_exec_pool.py check --language javascript` confirms warm and cold runs print the same.
+
+EXEC_POOL_ENABLED = os.getenv("RYAN_EXEC_POOL", "0") == "1"
+EXEC_PRELOAD = [m.strip() for m in os.getenv("RYAN_EXEC_PRELOAD", "").split(",") if m.strip()]
+EXEC_NODE_PRELOAD = [m.strip() for m in os.getenv("RYAN_EXEC_NODE_PRELOAD", "").split(",") if m.strip()]
+# 0 (the default) sizes the pool from the scheduler's slot count
+EXEC_PYTHON_WORKERS = int(os.getenv("RYAN_EXEC_PYTHON_WORKERS", "0"))
+EXEC_NODE_WORKERS = int(os.getenv("RYAN_EXEC_NODE_WORKERS", "0"))
+EXEC_ZYGOTE_MAX_RUNS = int(os.getenv("RYAN_EXEC_ZYGOTE_MAX_RUNS", "100"))
+
+
+class ExecPoolError(Exception):
+    """Raised when the warm pool can't run a request (caller should fall back to a cold run)."""
+
+
+# --- Python zygote (runs in its own process) ---
+
+def _run_forked_child(code: str, args: List[str], stdin_fd: int, stdout_fd: int, stderr_fd: int):
+    """Body of the per-run child process. Never returns."""
+    exit_code = 0
+    try:
+        os.setsid() # Own process group so a timeout can kill anything the snippet spawns
+        EXEC_LIMITS.apply("python")
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        # multiprocessing children point sys.stdin at /dev/null, so rebind the std streams to fds 0-2
+        sys.stdin = sys.__stdin__ = open(0, "r", closefd=False)
+        sys.stdout = sys.__stdout__ = open(1, "w", closefd=False)
+        sys.stderr = sys.__stderr__ = open(2, "w", closefd=False)
+        sys.argv = ["-c"] + list(args)
+        namespace = {"__name__": "__main__", "__builtins__": builtins, "__doc__": None}
+        try:
+            exec(compile(code, "<string>", "exec"), namespace)
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException as e:
+            # Match `python -c` output: drop our own exec() frame from the traceback
+            tb = e.__traceback__.tb_next if e.__traceback__ else None
+            sys.stderr.write("".join(traceback.format_exception(type(e), e, tb)))
+            exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(exit_code)
+
+
+def _python_zygote_main(conn, preload: List[str]):
+    """Zygote loop: preload modules once, then fork one child per run request."""
+    for module_name in preload:
+        try:
+            importlib.import_module(module_name)
+        except Exception as e:
+            logging.warning(f"Exec zygote could not preload '{module_name}': {e}")
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        code, stdin_data, args, timeout = request
+        with tempfile.TemporaryFile() as stdin_file, tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file:
+            if stdin_data:
+                stdin_file.write(stdin_data.encode())
+                stdin_file.seek(0)
+            start = time.perf_counter()
+            pid = os.fork()
+            if pid == 0:
+                conn.close()
+                _run_forked_child(code, args or [], stdin_file.fileno(), stdout_file.fileno(), stderr_file.fileno())
+            status, rusage, timed_out = wait_for_process(pid, timeout)
+            wall_time = time.perf_counter() - start
+            stdout_file.seek(0)
+            stderr_file.seek(0)
+            result = {
+                "stdout": stdout_file.read().decode(errors="replace"),
+                "stderr": stderr_file.read().decode(errors="replace"),
+                "return_code": -signal.SIGKILL if timed_out else os.waitstatus_to_exitcode(status),
+                "timed_out": timed_out,
+                **usage_from_rusage(rusage, wall_time),
+            }
+        try:
+            conn.send(result)
+        except (EOFError, OSError):
+            break
+
+
+class _PythonZygote:
+    def __init__(self, preload: List[str]):
+        self.process = WorkerProcess("ryan_exec_pool", "_python_zygote_main", [preload])
+        self.conn = self.process.conn
+        self.runs = 0
+
+    def stop(self):
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(1.0)
+        except (EOFError, OSError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1.0)
+        self.conn.close()
+
+
+# --- Node one-shot warm workers ---
+
+# The driver requires the preload modules, then reads a length-prefixed JSON header
+# ({code, args}) from stdin. Whatever follows the header on stdin is the snippet's own stdin.
+# Wrapped in a function so its names don't share the global lexical scope the snippet runs in.
+_NODE_DRIVER = r"""
+(() => {
+    const fs = require('fs');
+    for (const name of JSON.parse(process.env.RYAN_NODE_PRELOAD || '[]')) {
+        try { require(name); } catch (e) { }
+    }
+    function readExact(n) {
+        const buf = Buffer.alloc(n);
+        let off = 0;
+        while (off < n) {
+            let r = 0;
+            try { r = fs.readSync(0, buf, off, n - off, null); }
+            catch (e) { if (e.code === 'EAGAIN') continue; throw e; }
+            if (r === 0) break;
+            off += r;
+        }
+        return buf.slice(0, off);
+    }
+    let lenText = '';
+    for (;;) {
+        const ch = readExact(1).toString();
+        if (ch === '' || ch === '\n') break;
+        lenText += ch;
+    }
+    const header = JSON.parse(readExact(parseInt(lenText, 10)).toString());
+    process.argv = [process.argv[0]].concat(header.args || []);
+    delete process.env.RYAN_NODE_PRELOAD;
+    try {
+        require('vm').runInThisContext(header.code, { filename: '[eval]' });
+    } catch (e) {
+        // Drop the driver's own frames so the stack looks like `node -e` output
+        const lines = (e && e.stack ? e.stack : String(e)).split('\n');
+        const cut = lines.findIndex(line => line.includes('runInThisContext'));
+        process.stderr.write((cut > 0 ? lines.slice(0, cut) : lines).join('\n') + '\n');
+        process.exitCode = 1;
+    }
+})();
+"""
+
+
+class _NodeSpare:
+    """A started node driver waiting for its run, plus the parent's ends of its pipes."""
+    def __init__(self, preload: List[str]):
+        env = dict(os.environ, RYAN_NODE_PRELOAD=json.dumps(preload))
+        stdin_read, self.stdin_fd = os.pipe()
+        self.stdout_fd, stdout_write = os.pipe()
+        self.stderr_fd, stderr_write = os.pipe()
+        try:
+            # Started through the scheduler's launcher so the run's peak RSS isn't inflated by the API
+            # process. No launch timeout: the run timeout starts once the spare is handed its code.
+            self.process = spawn_limited(["node", "-e", _NODE_DRIVER], "javascript",
+                                         stdin_read, stdout_write, stderr_write, None, env=env)
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            for fd in (stdin_read, stdout_write, stderr_write):
+                os.close(fd)
+
+    def close(self):
+        for fd in (self.stdin_fd, self.stdout_fd, self.stderr_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def encode_node_request(code: str, args: Optional[List[str]], stdin_data: Optional[str]) -> bytes:
+    """Builds the stdin payload for a node worker: '<len>\\n<json header><user stdin>'."""
+    header = json.dumps({"code": code, "args": args or []}).encode()
+    return str(len(header)).encode() + b"\n" + header + (stdin_data or "").encode()
+
+
+class ExecutionWorkerPool:
+    """Warm Python zygotes and pre-spawned Node workers for execute_code."""
+    def __init__(self, python_workers: int = 2, node_workers: int = 2,
+                 preload: Optional[List[str]] = None, node_preload: Optional[List[str]] = None,
+                 zygote_max_runs: int = EXEC_ZYGOTE_MAX_RUNS):
+        if not hasattr(os, "fork"):
+            raise ExecPoolError("Warm execution pool requires os.fork (POSIX).")
+        self.preload = EXEC_PRELOAD if preload is None else preload
+        self.node_preload = EXEC_NODE_PRELOAD if node_preload is None else node_preload
+        self.zygote_max_runs = zygote_max_runs
+        self._zygotes = queue.Queue()
+        for _ in range(max(1, python_workers)):
+            self._zygotes.put(_PythonZygote(self.preload))
+        self._node_spares = queue.Queue()
+        self._node_workers = node_workers
+        self._node_available = node_workers > 0
+        for _ in range(node_workers):
+            self._refill_node_spare()
+        self.stats = {"python_runs": 0, "node_runs": 0, "zygotes_recycled": 0}
+        logging.info(f"ExecutionWorkerPool started: {python_workers} python zygotes (preload={self.preload}), {node_workers} node spares (preload={self.node_preload}).")
+
+    def _refill_node_spare(self):
+        if not self._node_available:
+            return
+        try:
+            self._node_spares.put(_NodeSpare(self.node_preload))
+        except FileNotFoundError:
+            logging.warning("Node.js not found. Warm JavaScript workers disabled.")
+            self._node_available = False
+
+    def run(self, language: str, code: str, stdin: Optional[str] = None, args: Optional[List[str]] = None, timeout: float = 30) -> Dict[str, Any]:
+        language = language.lower()
+        if language == "python":
+            return self._run_python(code, stdin, args, timeout)
+        if language == "javascript":
+            return self._run_node(code, stdin, args, timeout)
+        raise ExecPoolError(f"No warm workers for language '{language}'.")
+
+    def _run_python(self, code: str, stdin: Optional[str], args: Optional[List[str]], timeout: float) -> Dict[str, Any]:
+        zygote = self._zygotes.get()
+        try:
+            if not zygote.process.is_alive():
+                zygote.stop()
+                zygote = _PythonZygote(self.preload)
+            zygote.conn.send((code, stdin, args, timeout))
+            # The zygote enforces the timeout itself; the extra margin only guards against a dead zygote
+            if not zygote.conn.poll(timeout + 5):
+                zygote.process.kill()
+                raise ExecPoolError("Python zygote did not respond.")
+            result = zygote.conn.recv()
+            zygote.runs += 1
+            self.stats["python_runs"] += 1
+            if zygote.runs >= self.zygote_max_runs:
+                zygote.stop()
+                self.stats["zygotes_recycled"] += 1
+                zygote = _PythonZygote(self.preload)
+            result["worker"] = "warm-python"
+            return result
+        except (EOFError, OSError) as e:
+            zygote.stop()
+            zygote = _PythonZygote(self.preload)
+            raise ExecPoolError(f"Python zygote failed: {e}")
+        finally:
+            self._zygotes.put(zygote)
+
+    def _run_node(self, code: str, stdin: Optional[str], args: Optional[List[str]], timeout: float) -> Dict[str, Any]:
+        if not self._node_available:
+            raise ExecPoolError("Warm Node.js workers are not available.")
+        try:
+            spare = self._node_spares.get(timeout=5)
+        except queue.Empty:
+            raise ExecPoolError("No warm Node.js worker became available.")
+        # Replace the spare right away so the next run doesn't pay startup either
+        threading.Thread(target=self._refill_node_spare, daemon=True).start()
+        start = time.perf_counter()
+        outputs: Dict[str, bytes] = {}
+        readers = [threading.Thread(target=read_all_fd, args=(spare.stdout_fd, outputs, "stdout"), daemon=True),
+                   threading.Thread(target=read_all_fd, args=(spare.stderr_fd, outputs, "stderr"), daemon=True)]
+        for reader in readers:
+            reader.start()
+        try:
+            write_all_fd(spare.stdin_fd, encode_node_request(code, args, stdin))
+            os.close(spare.stdin_fd) # EOF ends the snippet's stdin
+            spare.stdin_fd = -1
+            return_code, timed_out, usage = spare.process.wait(timeout)
+        except LaunchError as e:
+            spare.process.kill()
+            raise ExecPoolError(f"Node worker was lost: {e}")
+        finally:
+            for reader in readers:
+                reader.join()
+            spare.close()
+        self.stats["node_runs"] += 1
+        # Note: cpu_time includes the worker's own startup, which happened before the run
+        return {
+            "stdout": outputs.get("stdout", b"").decode(errors="replace"),
+            "stderr": outputs.get("stderr", b"").decode(errors="replace"),
+            "return_code": return_code,
+            "timed_out": timed_out,
+            **usage,
+            "wall_time": round(time.perf_counter() - start, 6),
+            "worker": "warm-node",
+        }
+
+    def shutdown(self):
+        while not self._zygotes.empty():
+            self._zygotes.get_nowait().stop()
+        self._node_available = False
+        while not self._node_spares.empty():
+            spare = self._node_spares.get_nowait()
+            spare.process.kill()
+            spare.close()
+        logging.info("ExecutionWorkerPool shut down.")
+
+
+_exec_pool = None
+_exec_pool_lock = threading.Lock()
+
+
+def get_exec_pool() -> ExecutionWorkerPool:
+    """Returns the shared execution pool, starting it on first use."""
+    global _exec_pool
+    with _exec_pool_lock:
+        if _exec_pool is None:
+            slots = get_execution_scheduler().max_concurrent
+            _exec_pool = ExecutionWorkerPool(python_workers=EXEC_PYTHON_WORKERS or slots, node_workers=EXEC_NODE_WORKERS or slots)
+        return _exec_pool
+
+
+# --- Benchmark: warm pool vs cold subprocess.run ---
+
+def _cold_run(language: str, code: str, timeout: float = 30) -> Dict[str, Any]:
+    command = [sys.executable, "-c", code] if language == "python" else ["node", "-e", code]
+    start = time.perf_counter()
+    process = subprocess.run(command, capture_output=True, text=True, timeout=timeout, check=False)
+    return {"stdout": process.stdout, "return_code": process.returncode, "wall_time": time.perf_counter() - start}
+
+
+def _latency_summary(latencies: List[float], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "runs": len(latencies),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "throughput_runs_per_sec": round(len(latencies) / elapsed, 2),
+    }
+
+
+def benchmark(language: str, code: str, runs: int, concurrency: int, preload: List[str], pause_ms: float = 0) -> Dict[str, Any]:
+    """
+    Measures latency and throughput of cold subprocess.run against the warm pool.
+    pause_ms inserts think time between a client's runs; one-shot Node spares only
+    help latency when they have time to be replaced, so saturation (pause 0) and
+    interactive load give different pictures.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def measure(run_one):
+        latencies = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for wall_time in executor.map(lambda _: run_one(), range(runs)):
+                latencies.append(wall_time)
+        elapsed = time.perf_counter() - start - (pause_ms / 1000.0) * runs / concurrency
+        return _latency_summary(latencies, max(elapsed, 1e-9))
+
+    def paced(run_one):
+        def wrapper():
+            if pause_ms:
+                time.sleep(pause_ms / 1000.0)
+            return run_one()
+        return wrapper
+
+    cold = measure(paced(lambda: _cold_run(language, code)["wall_time"]))
+    # Only start workers for the benchmarked language, so idle spares starting up don't compete for CPU
+    pool = ExecutionWorkerPool(python_workers=concurrency, node_workers=concurrency if language == "javascript" else 0,
+                               preload=preload if language == "python" else [],
+                               node_preload=preload if language == "javascript" else [])
+    try:
+        pool.run(language, code) # Warm-up so pool startup isn't measured as a run
+        def warm_run():
+            start = time.perf_counter()
+            pool.run(language, code)
+            return time.perf_counter() - start
+        warm = measure(paced(warm_run))
+    finally:
+        pool.shutdown()
+    return {"language": language, "concurrency": concurrency, "preload": preload, "pause_ms": pause_ms, "cold_subprocess": cold, "warm_pool": warm,
+            "p50_speedup": round(cold["p50_ms"] / warm["p50_ms"], 2) if warm["p50_ms"] else None}
+
+
+# Snippets whose warm output must match `python -c` / `node -e`. The JavaScript ones declare the
+# names the Node driver uses internally, which must not collide with the snippet's globals.
+_SELF_CHECK_SNIPPETS = {
+    "python": [
+        "import sys\nprint(__name__, sys.argv[1:])",
+        "x = 1\nprint(x)",
+    ],
+    "javascript": [
+        "const fs = require('fs');\nconst header = 'h';\nfunction readExact() { return 'r'; }\nlet lenText = 1;\nconsole.log(typeof fs.readFileSync, header, readExact(), lenText);",
+        "console.log(process.argv.length, typeof require, typeof module)",
+    ],
+}
+
+
+def self_check(language: str) -> Dict[str, Any]:
+    """Runs the check snippets cold and warm and lists any whose stdout or exit code differ."""
+    pool = ExecutionWorkerPool(python_workers=1, node_workers=1 if language == "javascript" else 0, preload=[], node_preload=[])
+    mismatches = []
+    try:
+        for code in _SELF_CHECK_SNIPPETS[language]:
+            cold = _cold_run(language, code)
+            warm = pool.run(language, code)
+            if (cold["stdout"], cold["return_code"]) != (warm["stdout"], warm["return_code"]):
+                mismatches.append({"code": code, "cold": {"stdout": cold["stdout"], "return_code": cold["return_code"]},
+                                   "warm": {"stdout": warm["stdout"], "stderr": warm["stderr"], "return_code": warm["return_code"]}})
+    finally:
+        pool.shutdown()
+    return {"language": language, "checked": len(_SELF_CHECK_SNIPPETS[language]), "mismatches": mismatches}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark warm execution workers against cold subprocess.run")
+    parser.add_argument("command", choices=["bench", "check"])
+    parser.add_argument("--language", default="python", choices=["python", "javascript"])
+    parser.add_argument("--code", help="Snippet to run (defaults to a small import + print)")
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--preload", default="json,decimal", help="Comma-separated modules to preload in the warm workers")
+    parser.add_argument("--pause-ms", type=float, default=0, help="Think time between runs per client (0 = saturate)")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        result = self_check(args.language)
+        print(json.dumps(result, indent=2))
+        sys.exit(1 if result["mismatches"] else 0)
+
+    preload = [m.strip() for m in args.preload.split(",") if m.strip()]
+    default_code = {
+        "python": "import json, decimal\nprint(json.dumps({'total': str(decimal.Decimal('1.10') * 3)}))",
+        "javascript": "console.log(JSON.stringify({total: [1, 2, 3].reduce((a, b) => a + b, 0)}))",
+    }
+    print(json.dumps(benchmark(args.language, args.code or default_code[args.language], args.runs, args.concurrency, preload, args.pause_ms), indent=2))
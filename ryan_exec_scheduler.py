@@ -0,0 +1,509 @@
+import os
+import time
+import queue
+import select
+import signal
+import socket
+import logging
+import itertools
+import threading
+import subprocess
+from contextlib import contextmanager
+from multiprocessing import reduction
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+from ryan_workers import WorkerProcess
+
+try:
+    import resource # POSIX only - rlimits and rusage
+except ImportError:
+    resource = None
+
+# --- Resource-Governed Execution Scheduler ---
+# Every code run (cold, warm pool or streamed) goes through one scheduler:
+#   - at most RYAN_EXEC_MAX_CONCURRENT runs execute at once,
+#   - up to RYAN_EXEC_MAX_QUEUE more wait for a slot (at most RYAN_EXEC_QUEUE_TIMEOUT
+#     seconds); anything beyond that is rejected right away instead of piling up,
+#   - each run's process gets hard rlimits on CPU time, address space and open files,
+#   - the run is reaped with wait4() so the result can report wall time, CPU time and
+#     peak RSS of that process alongside return_code (see "Launcher process" below for
+#     why runs are not forked from the API process itself).
+# This keeps a burst of CPU-heavy snippets from starving the API process and model calls.
+
+EXEC_MAX_CONCURRENT = int(os.getenv("RYAN_EXEC_MAX_CONCURRENT", str(max(1, (os.cpu_count() or 2) // 2))))
+EXEC_MAX_QUEUE = int(os.getenv("RYAN_EXEC_MAX_QUEUE", "16"))
+EXEC_QUEUE_TIMEOUT = float(os.getenv("RYAN_EXEC_QUEUE_TIMEOUT", "60"))
+EXEC_CPU_SECONDS = int(os.getenv("RYAN_EXEC_CPU_SECONDS", "30"))
+EXEC_MAX_MEMORY_MB = int(os.getenv("RYAN_EXEC_MAX_MEMORY_MB", "512"))
+EXEC_MAX_OPEN_FILES = int(os.getenv("RYAN_EXEC_MAX_OPEN_FILES", "256"))
+EXEC_USE_LAUNCHER = os.getenv("RYAN_EXEC_LAUNCHER", "1") == "1"
+# V8 reserves about 1 GiB of virtual address space at startup (code range, pointer cage),
+# so node's RLIMIT_AS gets this headroom on top of the memory limit. A runaway heap then
+# dies with V8's fatal OOM (SIGABRT). --max-old-space-size would fail more gracefully,
+# but passing any V8 flag costs ~10 ms of node startup, which matters for the warm pool.
+NODE_ADDRESS_SPACE_OVERHEAD_MB = 1024
+# The Go runtime reserves its page-summary arenas (~700 MB virtual) before main() runs, and the
+# JVM reserves code cache and class space up front (see ryan_compile.py for the JVM flags).
+ADDRESS_SPACE_OVERHEAD_MB = {"javascript": NODE_ADDRESS_SPACE_OVERHEAD_MB, "go": 1024, "java": 1024}
+
+
+class ExecutionRejected(Exception):
+    """Raised when a run can't get an execution slot."""
+    def __init__(self, message: str, kind: str = "queue_full"):
+        super().__init__(message)
+        self.kind = kind # 'queue_full' or 'queue_timeout'
+
+
+class ResourceLimits:
+    """Hard per-process limits applied in the child between fork and exec."""
+    def __init__(self, cpu_seconds: int = EXEC_CPU_SECONDS, memory_mb: int = EXEC_MAX_MEMORY_MB,
+                 open_files: int = EXEC_MAX_OPEN_FILES):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.open_files = open_files
+
+    def address_space_bytes(self, language: str) -> int:
+        memory_mb = self.memory_mb + ADDRESS_SPACE_OVERHEAD_MB.get(language.lower(), 0)
+        return memory_mb * 1024 * 1024
+
+    def apply(self, language: str, cpu_seconds: Optional[int] = None):
+        """Sets the rlimits on the current process. Only call this in the child."""
+        if resource is None:
+            return
+        cpu = cpu_seconds or self.cpu_seconds
+        address_space = self.address_space_bytes(language)
+        # Soft CPU limit sends SIGXCPU; the hard limit one second later is SIGKILL
+        for limit, value in ((resource.RLIMIT_CPU, (cpu, cpu + 1)),
+                             (resource.RLIMIT_AS, (address_space, address_space)),
+                             (resource.RLIMIT_NOFILE, (self.open_files, self.open_files))):
+            try:
+                resource.setrlimit(limit, value)
+            except (ValueError, OSError):
+                pass # Can't raise a limit above the inherited hard limit - keep the stricter one
+
+    def preexec_fn(self, language: str, cpu_seconds: Optional[int] = None):
+        """Returns a subprocess preexec_fn that applies these limits (None on non-POSIX)."""
+        if resource is None:
+            return None
+        return lambda: self.apply(language, cpu_seconds)
+
+
+EXEC_LIMITS = ResourceLimits()
+
+
+def wait_for_process(pid: int, timeout: Optional[float]):
+    """Waits for pid with wait4(). Kills its process group on timeout (None = no timeout). Returns (status, rusage, timed_out)."""
+    if timeout is None:
+        _, status, rusage = os.wait4(pid, 0)
+        return status, rusage, False
+    deadline = time.monotonic() + timeout
+    pidfd = None
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+    try:
+        if pidfd is not None:
+            ready, _, _ = select.select([pidfd], [], [], max(0.0, timeout))
+            if ready:
+                _, status, rusage = os.wait4(pid, 0)
+                return status, rusage, False
+        else:
+            delay = 0.0005
+            while time.monotonic() < deadline:
+                waited_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+                if waited_pid == pid:
+                    return status, rusage, False
+                time.sleep(delay)
+                delay = min(delay * 2, 0.02)
+        # Timed out: kill the whole process group, then reap
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+        _, status, rusage = os.wait4(pid, 0)
+        return status, rusage, True
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def usage_from_rusage(rusage, wall_time: float) -> Dict[str, Any]:
+    """Usage fields reported with every execution result."""
+    return {
+        "wall_time": round(wall_time, 6),
+        "cpu_time": round(rusage.ru_utime + rusage.ru_stime, 6),
+        "peak_rss_kb": rusage.ru_maxrss, # KB on Linux
+    }
+
+
+def limit_exceeded(return_code: Optional[int]) -> Optional[str]:
+    """Names the rlimit that killed a run, if its exit status shows one."""
+    if return_code == -signal.SIGXCPU:
+        return "cpu"
+    return None
+
+
+def read_all_fd(fd: int, outputs: Dict[str, bytes], name: str):
+    """Reads fd to EOF into outputs[name] (thread target)."""
+    chunks = []
+    while True:
+        data = os.read(fd, 65536)
+        if not data:
+            break
+        chunks.append(data)
+    outputs[name] = b"".join(chunks)
+
+
+def write_all_fd(fd: int, data: Optional[bytes]):
+    """Writes all of data to fd, ignoring a reader that went away."""
+    try:
+        view = memoryview(data or b"")
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    except OSError:
+        pass # Child exited without reading all of its stdin
+
+
+# --- Launcher process ---
+# ru_maxrss of a child includes the resident size of the process that forked it (the
+# kernel carries the high-water mark across exec). Forked straight from the API process,
+# every run would report the API's own 100+ MB as its peak RSS. Runs are therefore
+# started by a small launcher process (ryan_workers.WorkerProcess): the API process
+# creates the pipes, passes the child's ends over the socket (SCM_RIGHTS), and the
+# launcher forks, applies the rlimits, execs, reaps with wait4() and reports back.
+# If the launcher can't be used (non-POSIX, crashed) runs are started in-process instead.
+
+class LaunchError(Exception):
+    """Raised when the launcher process can't start or supervise a run."""
+
+
+def _launcher_main(conn):
+    """Launcher loop: start each requested command and report its exit and usage."""
+    sock = socket.fromfd(conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM)
+    send_lock = threading.Lock()
+
+    def reply(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (EOFError, OSError):
+                pass
+
+    def supervise(request_id, process, timeout, start):
+        status, rusage, timed_out = wait_for_process(process.pid, timeout)
+        return_code = -signal.SIGKILL if timed_out else os.waitstatus_to_exitcode(status)
+        process.returncode = return_code
+        reply(("exited", request_id, return_code, timed_out, usage_from_rusage(rusage, time.perf_counter() - start)))
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        request_id, command, language, timeout, cpu_seconds, env, cwd = request
+        fds = reduction.recvfds(sock, 3) # stdin, stdout, stderr for the child
+        try:
+            start = time.perf_counter()
+            process = subprocess.Popen(command, stdin=fds[0], stdout=fds[1], stderr=fds[2], start_new_session=True,
+                                       env=env, cwd=cwd, preexec_fn=EXEC_LIMITS.preexec_fn(language, cpu_seconds))
+        except OSError as e:
+            reply(("error", request_id, type(e).__name__, str(e)))
+            continue
+        finally:
+            for fd in fds:
+                os.close(fd)
+        reply(("started", request_id, process.pid))
+        threading.Thread(target=supervise, args=(request_id, process, timeout, start), daemon=True).start()
+
+
+class LaunchedProcess:
+    """A run started by spawn_limited. wait() returns (return_code, timed_out, usage)."""
+    def __init__(self, pid: int, waiter: Callable[[Optional[float]], Tuple[int, bool, Dict[str, Any]]]):
+        self.pid = pid
+        self._waiter = waiter
+        self.finished = False
+
+    def wait(self, timeout: Optional[float] = None) -> Tuple[int, bool, Dict[str, Any]]:
+        """
+        Waits for the run to exit. The timeout given to spawn_limited always applies;
+        timeout here additionally kills the run that many seconds from now (used by
+        pre-started processes whose run only begins once they are handed work).
+        """
+        try:
+            return self._waiter(timeout)
+        finally:
+            self.finished = True
+
+    def kill(self):
+        """Kills the run's whole process group."""
+        if not self.finished:
+            _kill_group(self.pid)
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class _Launcher:
+    """Parent-side handle of the launcher process."""
+    def __init__(self):
+        self._worker = WorkerProcess("ryan_exec_scheduler", "_launcher_main")
+        self._sock = socket.fromfd(self._worker.conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM)
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, "queue.Queue"] = {}
+        self._ids = itertools.count()
+        self.alive = True
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = self._worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            replies = self._pending.get(message[1])
+            if replies is not None:
+                replies.put(message)
+        self.alive = False
+        for replies in list(self._pending.values()):
+            replies.put(("lost", None))
+
+    def launch(self, command: List[str], language: str, fds: List[int], timeout: float,
+               cpu_seconds: Optional[int], env: Optional[Dict[str, str]], cwd: Optional[str] = None) -> LaunchedProcess:
+        request_id = next(self._ids)
+        replies = queue.Queue()
+        self._pending[request_id] = replies
+        try:
+            with self._send_lock:
+                self._worker.conn.send((request_id, command, language, timeout, cpu_seconds, env, cwd))
+                reduction.sendfds(self._sock, fds)
+            try:
+                message = replies.get(timeout=10)
+            except queue.Empty:
+                raise LaunchError("Launcher did not respond.")
+        except (OSError, EOFError) as e:
+            self._pending.pop(request_id, None)
+            self.alive = False
+            raise LaunchError(f"Launcher unavailable: {e}")
+        except BaseException:
+            self._pending.pop(request_id, None)
+            raise
+        if message[0] != "started":
+            self._pending.pop(request_id, None)
+            if message[0] == "error" and message[2] == "FileNotFoundError":
+                raise FileNotFoundError(message[3])
+            raise LaunchError(f"Launcher could not start the run: {message[2:]}")
+
+        pid = message[2]
+
+        def waiter(wait_timeout):
+            killed = False
+            try:
+                # The launcher enforces the launch timeout and reports a dead launcher as "lost"
+                exited = replies.get(timeout=wait_timeout)
+            except queue.Empty:
+                _kill_group(pid)
+                killed = True
+                try:
+                    exited = replies.get(timeout=10)
+                except queue.Empty:
+                    exited = ("lost", None)
+            finally:
+                self._pending.pop(request_id, None)
+            if exited[0] != "exited":
+                raise LaunchError("Launcher exited while supervising the run.")
+            return exited[2], exited[3] or killed, exited[4]
+        return LaunchedProcess(pid, waiter)
+
+    def stop(self):
+        self.alive = False
+        try:
+            self._worker.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self._worker.join(1.0)
+        self._worker.kill()
+
+
+_launcher: Optional[_Launcher] = None
+_launcher_lock = threading.Lock()
+
+
+def _get_launcher() -> Optional[_Launcher]:
+    """Returns the launcher, (re)starting it if needed. None if launching is unsupported or disabled."""
+    global _launcher
+    if not EXEC_USE_LAUNCHER or resource is None:
+        return None
+    with _launcher_lock:
+        if _launcher is None or not _launcher.alive:
+            try:
+                _launcher = _Launcher()
+            except OSError as e:
+                logging.warning(f"Could not start execution launcher, runs will start in-process: {e}")
+                return None
+        return _launcher
+
+
+def spawn_limited(command: List[str], language: str, stdin_fd: int, stdout_fd: int, stderr_fd: int,
+                  timeout: Optional[float], cpu_seconds: Optional[int] = None, env: Optional[Dict[str, str]] = None,
+                  cwd: Optional[str] = None) -> LaunchedProcess:
+    """
+    Starts command under EXEC_LIMITS in its own process group, wired to the given fds (the caller
+    closes its copies), in directory cwd (None = current). It is killed after timeout seconds
+    (None = only when waited on with a timeout). Raises FileNotFoundError if the program is missing.
+    """
+    launcher = _get_launcher()
+    if launcher is not None:
+        try:
+            return launcher.launch(command, language, [stdin_fd, stdout_fd, stderr_fd], timeout, cpu_seconds, env, cwd)
+        except LaunchError as e:
+            logging.warning(f"Execution launcher failed, starting run in-process: {e}")
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdin=stdin_fd, stdout=stdout_fd, stderr=stderr_fd, start_new_session=True,
+                               env=env, cwd=cwd, preexec_fn=EXEC_LIMITS.preexec_fn(language, cpu_seconds))
+
+    def waiter(wait_timeout):
+        limits = [t for t in (timeout, wait_timeout) if t is not None]
+        status, rusage, timed_out = wait_for_process(process.pid, min(limits) if limits else None)
+        return_code = -signal.SIGKILL if timed_out else os.waitstatus_to_exitcode(status)
+        process.returncode = return_code
+        # Note: peak RSS here includes the API process's resident size at fork (see the launcher comment)
+        return return_code, timed_out, usage_from_rusage(rusage, time.perf_counter() - start)
+    return LaunchedProcess(process.pid, waiter)
+
+
+def run_limited(command: List[str], language: str, stdin: Optional[str] = None, timeout: float = 30,
+                cpu_seconds: Optional[int] = None, env: Optional[Dict[str, str]] = None, cwd: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs a command under the resource limits (in directory cwd). Raises FileNotFoundError if the program is missing.
+    Returns stdout, stderr, return_code, timed_out, wall_time, cpu_time, peak_rss_kb (and limit_exceeded).
+    """
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    try:
+        launched = spawn_limited(command, language, stdin_read, stdout_write, stderr_write, timeout, cpu_seconds, env, cwd)
+    except BaseException:
+        for fd in (stdin_write, stdout_read, stderr_read):
+            os.close(fd)
+        raise
+    finally:
+        # The child has its own copies now; closing ours lets EOF propagate
+        for fd in (stdin_read, stdout_write, stderr_write):
+            os.close(fd)
+
+    outputs: Dict[str, bytes] = {}
+    threads = [threading.Thread(target=read_all_fd, args=(stdout_read, outputs, "stdout"), daemon=True),
+               threading.Thread(target=read_all_fd, args=(stderr_read, outputs, "stderr"), daemon=True)]
+    for thread in threads:
+        thread.start()
+    write_all_fd(stdin_write, stdin.encode() if stdin else None)
+    os.close(stdin_write)
+    try:
+        return_code, timed_out, usage = launched.wait()
+    finally:
+        # Readers end once every process holding the pipes has exited
+        for thread in threads:
+            thread.join()
+        os.close(stdout_read)
+        os.close(stderr_read)
+
+    result = {
+        "stdout": outputs.get("stdout", b"").decode(errors="replace"),
+        "stderr": outputs.get("stderr", b"").decode(errors="replace"),
+        "return_code": return_code,
+        "timed_out": timed_out,
+        **usage,
+    }
+    exceeded = limit_exceeded(return_code)
+    if exceeded:
+        result["limit_exceeded"] = exceeded
+    return result
+
+
+class ExecutionScheduler:
+    """Concurrency cap plus a bounded wait queue for code runs."""
+    def __init__(self, max_concurrent: int = EXEC_MAX_CONCURRENT, max_queue: int = EXEC_MAX_QUEUE,
+                 queue_timeout: float = EXEC_QUEUE_TIMEOUT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+        self._counters = {"completed": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0}
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def acquire(self) -> float:
+        """Blocks until a slot is free. Returns the seconds spent waiting. Raises ExecutionRejected."""
+        start = time.perf_counter()
+        with self._condition:
+            if self._running >= self.max_concurrent:
+                if self._waiting >= self.max_queue:
+                    self._counters["rejected_queue_full"] += 1
+                    raise ExecutionRejected(f"Execution queue is full ({self._running} running, {self._waiting} waiting). Try again shortly.", "queue_full")
+                self._waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: self._running < self.max_concurrent, timeout=self.queue_timeout):
+                        self._counters["rejected_queue_timeout"] += 1
+                        raise ExecutionRejected(f"Timed out after {self.queue_timeout} seconds waiting for an execution slot.", "queue_timeout")
+                finally:
+                    self._waiting -= 1
+            self._running += 1
+            waited = time.perf_counter() - start
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            return waited
+
+    def release(self):
+        with self._condition:
+            self._running -= 1
+            self._counters["completed"] += 1
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self):
+        """Context manager around acquire/release. Yields the queue wait in seconds."""
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            admitted = self._counters["completed"] + self._running
+            return {
+                "running": self._running,
+                "waiting": self._waiting,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                **self._counters,
+                "avg_queue_wait_ms": round(self._total_wait / admitted * 1000, 3) if admitted else 0.0,
+                "max_queue_wait_ms": round(self._max_wait * 1000, 3),
+                "limits": {"cpu_seconds": EXEC_LIMITS.cpu_seconds, "memory_mb": EXEC_LIMITS.memory_mb, "open_files": EXEC_LIMITS.open_files},
+            }
+
+
+_scheduler: Optional[ExecutionScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_execution_scheduler() -> ExecutionScheduler:
+    """Returns the process-wide execution scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExecutionScheduler()
+            logging.info(f"Execution scheduler: {_scheduler.max_concurrent} concurrent, queue {_scheduler.max_queue}, limits cpu={EXEC_LIMITS.cpu_seconds}s mem={EXEC_LIMITS.memory_mb}MB files={EXEC_LIMITS.open_files}.")
+        return _scheduler
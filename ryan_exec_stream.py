@@ -0,0 +1,250 @@
+import os
+import uuid
+import time
+import queue
+import codecs
+import logging
+import threading
+from typing import Optional, Dict, Any, List, Callable
+
+from ryan_exec_scheduler import EXEC_LIMITS, spawn_limited, limit_exceeded, LaunchedProcess, LaunchError
+
+# --- Streaming Code Execution ---
+# /execute_code buffers everything with subprocess.run(capture_output=True) and only
+# answers once the process exits. For long-running snippets this module runs the
+# process with pipes and pushes stdout/stderr chunks onto an event queue as soon as
+# they are read, so the API can forward them to the client (Server-Sent Events).
+#   - Output kept in server memory is capped at RYAN_STREAM_MAX_OUTPUT_BYTES. Once the
+#     cap is hit a single 'truncated' marker event is queued and further output is
+#     read and discarded (the pipes must keep draining or the child would block).
+#   - Every run gets a run_id; cancel(run_id) kills the whole process group.
+#   - Runs are killed after RYAN_STREAM_TIMEOUT seconds (a caller may ask for another timeout, up to
+#     RYAN_STREAM_MAX_SECONDS), and get the scheduler's rlimits with the CPU limit raised to the
+#     timeout, since streamed runs are long by design. Neither ever exceeds RYAN_STREAM_MAX_SECONDS.
+# Event dicts: {"event": "stdout"|"stderr"|"truncated"|"exit", ...}. 'exit' is always last.
+
+STREAM_MAX_OUTPUT_BYTES = int(os.getenv("RYAN_STREAM_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+STREAM_MAX_SECONDS = float(os.getenv("RYAN_STREAM_MAX_SECONDS", "600"))
+STREAM_TIMEOUT = min(float(os.getenv("RYAN_STREAM_TIMEOUT", "300")), STREAM_MAX_SECONDS)
+STREAM_RETENTION_SECONDS = 300 # Finished runs stay registered this long for late cancel/status calls
+_READ_CHUNK_BYTES = 4096
+_COALESCE_BYTES = 64 * 1024 # Upper bound when merging queued chunks into one event
+TRUNCATION_MARKER = "\n[... output truncated: {limit} byte limit reached, remaining output discarded ...]\n"
+
+
+class ExecutionStream:
+    """A single streamed run. Start it with start(), consume events with next_event()."""
+    def __init__(self, command: List[str], language: str, timeout: float = STREAM_TIMEOUT,
+                 max_output_bytes: int = STREAM_MAX_OUTPUT_BYTES, on_finish: Optional[Callable[[], None]] = None):
+        self.run_id = uuid.uuid4().hex
+        self.command = command
+        self.language = language
+        self.timeout = min(timeout, STREAM_MAX_SECONDS)
+        self.max_output_bytes = max_output_bytes
+        self.events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.process: Optional[LaunchedProcess] = None
+        self.output_bytes = 0 # Bytes accepted into the event queue
+        self.dropped_bytes = 0 # Bytes read after the cap was hit
+        self.truncated = False
+        self.cancelled = False
+        self.timed_out = False
+        self.return_code: Optional[int] = None
+        self.started_at = 0.0
+        self.finished_at: Optional[float] = None
+        self.usage: Dict[str, Any] = {} # wall_time / cpu_time / peak_rss_kb once finished
+        self.queue_wait = 0.0 # Seconds spent waiting for an execution slot (set by the caller)
+        self.on_finish = on_finish # Called once the process has exited (releases the scheduler slot)
+        self._pending: Optional[Dict[str, Any]] = None # Event read ahead by next_event while coalescing
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the process and the reader/waiter threads. Raises FileNotFoundError if the interpreter is missing."""
+        env = dict(os.environ)
+        env["PYTHONUNBUFFERED"] = "1" # Otherwise Python block-buffers stdout on a pipe and nothing streams
+        self.started_at = time.time()
+        stdout_read, stdout_write = os.pipe()
+        stderr_read, stderr_write = os.pipe()
+        stdin_fd = os.open(os.devnull, os.O_RDONLY)
+        try:
+            # Own process group, so cancel/timeout can kill grandchildren too.
+            # The CPU limit is raised to the stream timeout (itself capped at STREAM_MAX_SECONDS), since streamed runs are long by design.
+            self.process = spawn_limited(self.command, self.language, stdin_fd, stdout_write, stderr_write, self.timeout,
+                                         cpu_seconds=max(EXEC_LIMITS.cpu_seconds, int(min(self.timeout, STREAM_MAX_SECONDS))), env=env)
+        except BaseException:
+            os.close(stdout_read)
+            os.close(stderr_read)
+            raise
+        finally:
+            for fd in (stdin_fd, stdout_write, stderr_write):
+                os.close(fd)
+        readers = [
+            threading.Thread(target=self._read_pipe, args=(stdout_read, "stdout"), daemon=True),
+            threading.Thread(target=self._read_pipe, args=(stderr_read, "stderr"), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        threading.Thread(target=self._wait, args=(readers,), daemon=True).start()
+        logging.info(f"Started streamed {self.language} run {self.run_id} (pid {self.process.pid}).")
+
+    def _read_pipe(self, fd: int, stream_name: str):
+        # Incremental decoder so multi-byte characters split across reads are not mangled
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            while True:
+                data = os.read(fd, _READ_CHUNK_BYTES)
+                if not data:
+                    break
+                text = decoder.decode(data)
+                if text:
+                    self._accept_output(stream_name, text)
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                self._accept_output(stream_name, tail)
+        except OSError as e:
+            logging.warning(f"Error reading {stream_name} of streamed run {self.run_id}: {e}")
+        finally:
+            os.close(fd)
+
+    def _accept_output(self, stream_name: str, text: str):
+        encoded = text.encode("utf-8")
+        with self._lock:
+            if self.truncated:
+                self.dropped_bytes += len(encoded)
+                return
+            remaining = self.max_output_bytes - self.output_bytes
+            if len(encoded) <= remaining:
+                self.output_bytes += len(encoded)
+                self.events.put({"event": stream_name, "data": text})
+                return
+            # Cap hit inside this chunk: keep what fits, then emit the marker once
+            kept = encoded[:remaining].decode("utf-8", errors="ignore")
+            if kept:
+                self.events.put({"event": stream_name, "data": kept})
+            self.output_bytes += len(kept.encode("utf-8"))
+            self.dropped_bytes += len(encoded) - len(kept.encode("utf-8"))
+            self.truncated = True
+            self.events.put({"event": "truncated", "data": TRUNCATION_MARKER.format(limit=self.max_output_bytes), "limit": self.max_output_bytes})
+        logging.warning(f"Streamed run {self.run_id} hit the {self.max_output_bytes} byte output cap.")
+
+    def _wait(self, readers: List[threading.Thread]):
+        try:
+            # Reaped with wait4() so the exit event can report CPU time and peak RSS
+            self.return_code, self.timed_out, self.usage = self.process.wait()
+            if self.timed_out:
+                logging.warning(f"Streamed run {self.run_id} timed out after {self.timeout} seconds.")
+        except LaunchError as e:
+            # Launcher died mid-run: the exit status is unknown, make sure the run is gone
+            logging.error(f"Lost track of streamed run {self.run_id}: {e}")
+            self.process.kill()
+        finally:
+            # Readers finish once every process holding the pipes has exited
+            for reader in readers:
+                reader.join()
+            self.finished_at = time.time()
+            if self.on_finish:
+                self.on_finish()
+        self.events.put({"event": "exit", **self.summary()})
+        logging.info(f"Streamed run {self.run_id} finished. Return code: {self.return_code}")
+
+    def cancel(self) -> bool:
+        """Kills the run. Returns False if it had already finished."""
+        if self.process is None or self.finished_at is not None:
+            return False
+        self.cancelled = True
+        self.process.kill()
+        logging.info(f"Streamed run {self.run_id} cancelled by client.")
+        return True
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the next event, or None if nothing arrived within timeout.
+        Output chunks that are already queued for the same stream are merged into one event,
+        since an unbuffered child writes print('a', b) as several tiny pieces.
+        """
+        event, self._pending = self._pending, None
+        if event is None:
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        if event["event"] not in ("stdout", "stderr"):
+            return event
+        pieces = [event["data"]]
+        size = len(event["data"])
+        while size < _COALESCE_BYTES:
+            try:
+                following = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if following["event"] != event["event"]:
+                self._pending = following # Different stream or a control event - hand it out next time
+                break
+            pieces.append(following["data"])
+            size += len(following["data"])
+        return {"event": event["event"], "data": "".join(pieces)}
+
+    def summary(self) -> Dict[str, Any]:
+        finished = self.finished_at is not None
+        return {
+            "run_id": self.run_id,
+            "language": self.language,
+            "finished": finished,
+            "success": finished and self.return_code == 0 and not self.timed_out and not self.cancelled,
+            "return_code": self.return_code,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "truncated": self.truncated,
+            "output_bytes": self.output_bytes,
+            "dropped_bytes": self.dropped_bytes,
+            "wall_time": self.usage.get("wall_time", round((self.finished_at or time.time()) - self.started_at, 6)),
+            "cpu_time": self.usage.get("cpu_time"),
+            "peak_rss_kb": self.usage.get("peak_rss_kb"),
+            "queue_wait": self.queue_wait,
+            "limit_exceeded": limit_exceeded(self.return_code),
+        }
+
+
+class ExecutionStreamRegistry:
+    """Keeps track of streamed runs by run_id so they can be cancelled from another request."""
+    def __init__(self):
+        self._runs: Dict[str, ExecutionStream] = {}
+        self._lock = threading.Lock()
+
+    def start(self, command: List[str], language: str, timeout: float = STREAM_TIMEOUT,
+              on_finish: Optional[Callable[[], None]] = None) -> ExecutionStream:
+        self._prune()
+        stream = ExecutionStream(command, language, timeout=timeout, on_finish=on_finish)
+        stream.start()
+        with self._lock:
+            self._runs[stream.run_id] = stream
+        return stream
+
+    def get(self, run_id: str) -> Optional[ExecutionStream]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def cancel(self, run_id: str) -> Optional[bool]:
+        """Returns None for an unknown run_id, otherwise whether the run was still going."""
+        stream = self.get(run_id)
+        if stream is None:
+            return None
+        return stream.cancel()
+
+    def _prune(self):
+        cutoff = time.time() - STREAM_RETENTION_SECONDS
+        with self._lock:
+            for run_id in [rid for rid, s in self._runs.items() if s.finished_at is not None and s.finished_at < cutoff]:
+                del self._runs[run_id]
+
+
+_registry: Optional[ExecutionStreamRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_stream_registry() -> ExecutionStreamRegistry:
+    """Returns the process-wide registry of streamed runs."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ExecutionStreamRegistry()
+        return _registry
@@ -6,7 +6,7 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                                QHBoxLayout, QPushButton, QTextEdit, QComboBox,
                                QLabel, QFileDialog, QSplitter, QFrame, QSizePolicy,
                                QMessageBox, QInputDialog, QLineEdit, QStackedWidget,
-                               QListWidget, QListWidgetItem, QDialog, QDialogButtonBox)
+                               QListWidget, QListWidgetItem, QDialog, QDialogButtonBox, QCheckBox)
 from PySide6.QtGui import QFont, QColor, QTextCharFormat, QSyntaxHighlighter, QTextDocument, QIcon, QTextCursor # Import QTextCursor
 from PySide6.QtCore import Qt, QRegularExpression, QThread, Signal, QTimer, QObject
 import traceback
@@ -80,6 +80,72 @@ class ApiWorker(QThread):
         self.wait()
 
 
+# Worker for /execute_code/stream and /auto_fix: parses Server-Sent Events and emits one signal per event
+class StreamWorker(QThread):
+    event_received = Signal(dict) # start / stdout / stderr / truncated events (or auto-fix progress events)
+    finished = Signal(dict) # final event, or the plain JSON result if the run never started
+    error = Signal(str)
+
+    def __init__(self, endpoint, data=None, final_event="exit"):
+        super().__init__()
+        self.endpoint = endpoint
+        self.data = data
+        self.final_event = final_event # 'exit' for code runs, 'done' for auto-fix
+        self.run_id = None
+        self._response = None
+        self._is_running = True
+
+    def run(self):
+        url = f"{API_BASE_URL}/{self.endpoint}"
+        try:
+            # No read timeout: a run can stay quiet for a long time (the server sends keep-alives)
+            self._response = requests.post(url, json=self.data, stream=True, timeout=(5, None))
+            self._response.raise_for_status()
+            if not self._response.headers.get("content-type", "").startswith("text/event-stream"):
+                # Unsupported language etc. - the server answers with a normal JSON result
+                if self._is_running:
+                    self.finished.emit(self._response.json())
+                return
+
+            event_name, data_lines = None, []
+            for line in self._response.iter_lines(decode_unicode=True):
+                if not self._is_running:
+                    break
+                if line is None:
+                    continue
+                if line.startswith(":"):
+                    continue # keep-alive comment
+                if line.startswith("event:"):
+                    event_name = line[6:].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[5:].strip())
+                elif line == "" and data_lines:
+                    # Blank line terminates one event
+                    event = json.loads("\n".join(data_lines))
+                    event.setdefault("event", event_name)
+                    event_name, data_lines = None, []
+                    if event["event"] == "start":
+                        self.run_id = event.get("run_id")
+                    if event["event"] == self.final_event:
+                        self.finished.emit(event)
+                        return
+                    self.event_received.emit(event)
+            if self._is_running:
+                self.error.emit("Stream ended before the run finished.")
+        except requests.exceptions.RequestException as e:
+            if self._is_running:
+                self.error.emit(f"API Request Error to /{self.endpoint} (stream): {e}")
+        except Exception as e:
+            if self._is_running:
+                self.error.emit(f"An unexpected error occurred while streaming: {e}")
+
+    def stop(self):
+        self._is_running = False
+        if self._response is not None:
+            self._response.close() # Unblocks iter_lines
+        self.wait()
+
+
 # --- Simple Syntax Highlighter ---
 # This class does NOT need to be indented under RyanCodingApp
 class PythonHighlighter(QSyntaxHighlighter):
@@ -386,6 +452,27 @@ class RyanCodingApp(QMainWindow):
             QPushButton:pressed { background-color: #5c6370; }
         """)
         self.controls_layout.addWidget(self.clear_button)
+
+        # Run Code targets a persistent interpreter session: variables and imports survive between runs
+        self.session_checkbox = QCheckBox("Session")
+        self.session_checkbox.setToolTip("Keep interpreter state between runs (Python/JavaScript)")
+        self.session_checkbox.setStyleSheet("QCheckBox { color: #abb2bf; padding: 5px; }")
+        self.controls_layout.addWidget(self.session_checkbox)
+
+        self.reset_session_button = QPushButton("Reset Session")
+        self.reset_session_button.clicked.connect(self.reset_session)
+        self.reset_session_button.setStyleSheet("""
+            QPushButton {
+                background-color: #5c6370; /* Grey button */
+                color: #abb2bf; /* Light grey text */
+                padding: 5px 10px;
+                border-radius: 4px;
+                border: none;
+            }
+            QPushButton:hover { background-color: #636b78; } /* Darker grey on hover */
+            QPushButton:pressed { background-color: #5c6370; }
+        """)
+        self.controls_layout.addWidget(self.reset_session_button)
         self.controls_layout.addStretch()
 
         self.code_layout.addWidget(self.controls_frame)
@@ -473,6 +560,41 @@ class RyanCodingApp(QMainWindow):
         """)
         self.actions_layout.addWidget(self.run_button)
 
+        self.stream_button = QPushButton("Stream Run")
+        self.stream_button.clicked.connect(self.stream_code)
+        self.stream_button.setStyleSheet("""
+            QPushButton {
+                background-color: #56b6c2; /* Cyan */
+                color: #282c34; /* Dark text */
+                padding: 8px 15px;
+                border-radius: 4px;
+                border: none;
+                font-weight: bold;
+            }
+            QPushButton:hover { background-color: #4aa5b0; } /* Darker cyan on hover */
+            QPushButton:pressed { background-color: #56b6c2; }
+            QPushButton:disabled { background-color: #3e4451; color: #5c6370; }
+        """)
+        self.actions_layout.addWidget(self.stream_button)
+
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.clicked.connect(self.cancel_stream_run)
+        self.stop_button.setEnabled(False) # Only enabled while a streamed run is active
+        self.stop_button.setStyleSheet("""
+            QPushButton {
+                background-color: #e06c75; /* Red */
+                color: #282c34; /* Dark text */
+                padding: 8px 15px;
+                border-radius: 4px;
+                border: none;
+                font-weight: bold;
+            }
+            QPushButton:hover { background-color: #d05c65; } /* Darker red on hover */
+            QPushButton:pressed { background-color: #e06c75; }
+            QPushButton:disabled { background-color: #3e4451; color: #5c6370; }
+        """)
+        self.actions_layout.addWidget(self.stop_button)
+
         self.debug_button = QPushButton("Debug Code")
         self.debug_button.clicked.connect(self.debug_code)
         self.debug_button.setStyleSheet("""
@@ -520,6 +642,24 @@ class RyanCodingApp(QMainWindow):
             QPushButton:pressed { background-color: #c678dd; }
         """)
         self.actions_layout.addWidget(self.fix_button)
+
+        # Run -> debug -> fix -> re-run on the server until the code works (one request instead of four)
+        self.auto_fix_button = QPushButton("Auto Fix")
+        self.auto_fix_button.clicked.connect(self.auto_fix_code)
+        self.auto_fix_button.setStyleSheet("""
+            QPushButton {
+                background-color: #d19a66; /* Orange */
+                color: #282c34; /* Dark text */
+                padding: 8px 15px;
+                border-radius: 4px;
+                border: none;
+                font-weight: bold;
+            }
+            QPushButton:hover { background-color: #c18a56; } /* Darker orange on hover */
+            QPushButton:pressed { background-color: #d19a66; }
+            QPushButton:disabled { background-color: #3e4451; color: #5c6370; }
+        """)
+        self.actions_layout.addWidget(self.auto_fix_button)
         self.actions_layout.addStretch()
 
         self.code_page_layout.addWidget(self.actions_frame)
@@ -657,6 +797,11 @@ class RyanCodingApp(QMainWindow):
 
         # --- Worker Thread Instance ---
         self.api_worker = None
+        self.stream_worker = None # StreamWorker for the active streamed run, if any
+        self.stream_cancel_path = "execute_code/cancel/{run_id}" # Endpoint Stop posts to for the streamed run
+        self.session_id = None # Backend REPL session used when the Session box is checked
+        self.session_language = None
+        self.session_run_active = False # A session cell is running (Stop interrupts it)
 
         # --- Typing Animation Variables ---
         self.typing_timer = QTimer(self)
@@ -873,9 +1018,11 @@ class RyanCodingApp(QMainWindow):
         self.chat_input_line_page.setEnabled(enabled)
         self.send_chat_button_page.setEnabled(enabled)
         self.run_button.setEnabled(enabled)
+        self.stream_button.setEnabled(enabled)
         self.debug_button.setEnabled(enabled)
         self.analyze_button.setEnabled(enabled)
         self.fix_button.setEnabled(enabled)
+        self.auto_fix_button.setEnabled(enabled)
         self.refresh_memory_button.setEnabled(enabled)
         self.delete_memory_button.setEnabled(enabled)
         self.refresh_logs_button.setEnabled(enabled)
@@ -891,10 +1038,90 @@ class RyanCodingApp(QMainWindow):
             self.update_results("Please enter code to run.", "info")
             return
 
-        data = {"code": code_string, "language": language}
-        self.send_request("execute_code", data, self.handle_code_execution_result)
+        if self.session_checkbox.isChecked():
+            self.run_code_in_session(code_string, language)
+            return
+
+        # Repeated runs of unchanged, deterministic code are answered from the server's result cache
+        data = {"code": code_string, "language": language, "cache": True}
+        self.send_request("execute_code", data, result_callback=self.handle_code_execution_result)
     # End of run_code method
 
+    # Start of run_code_in_session method
+    def run_code_in_session(self, code_string, language):
+        """Runs code in the backend REPL session, starting one first if needed (or if the language changed)."""
+        if self.api_worker and self.api_worker.isRunning():
+            self.update_results("A request is already in progress. Please wait.", "info")
+            return
+        if self.session_id is None or self.session_language != language:
+            self.close_session()
+            try:
+                response = requests.post(f"{API_BASE_URL}/sessions", json={"language": language}, timeout=30)
+                result = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                self.update_results(f"Failed to start a session: {e}", "error")
+                return
+            if result.get("type") != "session_created":
+                self.update_results(result.get("content", "Failed to start a session."), "error")
+                return
+            self.session_id = result["session_id"]
+            self.session_language = language
+            self.update_results(f"Started {language} session {self.session_id[:8]}.", "info")
+
+        self.session_run_active = True
+        self.send_request(f"sessions/{self.session_id}/execute", {"code": code_string},
+                          result_callback=self.handle_session_result, error_callback=self.handle_session_error)
+        self.stop_button.setEnabled(True)
+    # End of run_code_in_session method
+
+    # Start of handle_session_result method
+    def handle_session_result(self, response):
+        self.session_run_active = False
+        self.stop_button.setEnabled(False)
+        self.handle_code_execution_result(response)
+        if response.get("interrupted"):
+            self.update_results("Cell interrupted - session state is kept.", "info")
+        if response.get("session_lost") or response.get("session_closed"):
+            reason = response.get("session_closed") or "kernel killed"
+            self.update_results(f"Session ended ({reason}). The next run starts a new one.", "error")
+            self.session_id = None
+        else:
+            self.statusBar.showMessage(f"Session {self.session_id[:8]}: cell {response.get('execution_count')} finished.")
+    # End of handle_session_result method
+
+    # Start of handle_session_error method
+    def handle_session_error(self, message):
+        self.session_run_active = False
+        self.stop_button.setEnabled(False)
+        self.update_results(message, "error")
+        # The session was reclaimed (idle/memory) or its kernel died - start over on the next run
+        if "404" in message or "410" in message:
+            self.session_id = None
+            self.update_results("The session is gone. The next run starts a new one.", "info")
+    # End of handle_session_error method
+
+    # Start of close_session method
+    def close_session(self):
+        if self.session_id is None:
+            return
+        try:
+            requests.delete(f"{API_BASE_URL}/sessions/{self.session_id}", timeout=5)
+        except requests.exceptions.RequestException:
+            pass # The server reclaims it after the idle timeout anyway
+        self.session_id = None
+        self.session_language = None
+    # End of close_session method
+
+    # Start of reset_session method
+    def reset_session(self):
+        if self.session_run_active:
+            self.update_results("A cell is still running. Press Stop first.", "info")
+            return
+        had_session = self.session_id is not None
+        self.close_session()
+        self.update_results("Session reset." if had_session else "No active session.", "info")
+    # End of reset_session method
+
 
     # Start of handle_code_execution_result method
     def handle_code_execution_result(self, response):
@@ -908,6 +1135,14 @@ class RyanCodingApp(QMainWindow):
 
             self.update_results(f"Success: {success}", "success" if success else "error")
             self.update_results(f"Return Code: {return_code}", "info")
+            if response.get("wall_time") is not None:
+                peak_rss_mb = (response.get("peak_rss_kb") or 0) / 1024
+                self.update_results(f"Wall: {response['wall_time']:.3f}s | CPU: {response.get('cpu_time', 0):.3f}s | Peak RSS: {peak_rss_mb:.1f} MB | Queued: {response.get('queue_wait', 0):.3f}s", "info")
+            if response.get("compile_time") is not None:
+                compile_note = "cached build" if response.get("compile_cached") else f"{response['compile_time']:.3f}s"
+                self.update_results(f"Compile: {compile_note} | Run: {response.get('run_time', 0):.3f}s", "info")
+            if response.get("cached"):
+                self.update_results("(cached result - identical code was run before; timings are from that run)", "info")
             if output:
                 self.update_results("--- STDOUT ---", "info")
                 self.update_results(output, "code")
@@ -921,6 +1156,110 @@ class RyanCodingApp(QMainWindow):
             self.update_results(json.dumps(response, indent=2), "error")
     # End of handle_code_execution_result method
 
+    # Start of stream_code method
+    def stream_code(self):
+        """Runs code via /execute_code/stream and shows stdout/stderr as it is produced."""
+        code_string = self.code_input.toPlainText().strip()
+        language = self.language_combo.currentText()
+
+        if not code_string:
+            self.update_results("Please enter code to run.", "info")
+            return
+        if self.stream_worker and self.stream_worker.isRunning():
+            self.update_results("A streamed run is already in progress. Press Stop to cancel it.", "info")
+            return
+
+        self.stop_typing_animation()
+        self.update_results("--- Streaming Code Execution ---", "info")
+        self.results_display.append("") # Start output on a fresh line
+        self.statusBar.showMessage("Running (streaming)...")
+        self.set_input_enabled(False)
+        self.stop_button.setEnabled(True)
+
+        self.stream_cancel_path = "execute_code/cancel/{run_id}"
+        self.stream_worker = StreamWorker("execute_code/stream", {"code": code_string, "language": language})
+        self.stream_worker.event_received.connect(self.handle_stream_event)
+        self.stream_worker.finished.connect(self.handle_stream_finished)
+        self.stream_worker.error.connect(self.handle_stream_error)
+        self.stream_worker.start()
+    # End of stream_code method
+
+    # Start of append_stream_text method
+    def append_stream_text(self, text, color):
+        """Inserts raw text at the end of the results display (append() would add a paragraph per chunk)."""
+        cursor = self.results_display.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        text_format = QTextCharFormat()
+        text_format.setForeground(QColor(color))
+        cursor.insertText(text, text_format)
+        self.results_display.setTextCursor(cursor)
+        self.results_display.verticalScrollBar().setValue(self.results_display.verticalScrollBar().maximum())
+    # End of append_stream_text method
+
+    # Start of handle_stream_event method
+    def handle_stream_event(self, event):
+        event_type = event.get("event")
+        if event_type == "stdout":
+            self.append_stream_text(event.get("data", ""), "#abb2bf")
+        elif event_type == "stderr":
+            self.append_stream_text(event.get("data", ""), "#e06c75")
+        elif event_type == "truncated":
+            self.append_stream_text(event.get("data", ""), "#e5c07b")
+    # End of handle_stream_event method
+
+    # Start of handle_stream_finished method
+    def handle_stream_finished(self, response):
+        self.stop_button.setEnabled(False)
+        self.set_input_enabled(True)
+        if response.get("event") != "exit":
+            # Run never started (unsupported language, missing interpreter) - render like /execute_code
+            self.statusBar.showMessage("Request completed.")
+            self.handle_code_execution_result(response)
+            return
+
+        success = response.get("success")
+        if response.get("cancelled"):
+            self.update_results("Run cancelled.", "error")
+        elif response.get("timed_out"):
+            self.update_results("Run timed out.", "error")
+        self.update_results(f"Success: {success}", "success" if success else "error")
+        peak_rss_mb = (response.get("peak_rss_kb") or 0) / 1024
+        self.update_results(f"Return Code: {response.get('return_code')} | Wall: {response.get('wall_time')}s | CPU: {response.get('cpu_time')}s | Peak RSS: {peak_rss_mb:.1f} MB", "info")
+        self.statusBar.showMessage("Streamed run finished.")
+    # End of handle_stream_finished method
+
+    # Start of handle_stream_error method
+    def handle_stream_error(self, message):
+        self.stop_button.setEnabled(False)
+        self.set_input_enabled(True)
+        self.update_results(message, "error")
+        self.statusBar.showMessage("Streamed run failed.")
+    # End of handle_stream_error method
+
+    # Start of cancel_stream_run method
+    def cancel_stream_run(self):
+        """Asks the backend to kill the active streamed run. The stream then ends with an exit event."""
+        if self.session_run_active and self.session_id:
+            # Session cells are interrupted rather than killed, so the session's state survives
+            try:
+                requests.post(f"{API_BASE_URL}/sessions/{self.session_id}/interrupt", timeout=5)
+                self.statusBar.showMessage("Interrupting cell...")
+            except requests.exceptions.RequestException as e:
+                self.update_results(f"Failed to interrupt cell: {e}", "error")
+            return
+        if not (self.stream_worker and self.stream_worker.isRunning()):
+            return
+        run_id = self.stream_worker.run_id
+        if not run_id:
+            self.update_results("Run has not started yet, try again in a moment.", "info")
+            return
+        try:
+            requests.post(f"{API_BASE_URL}/{self.stream_cancel_path.format(run_id=run_id)}", timeout=5)
+            self.statusBar.showMessage("Cancelling run...")
+        except requests.exceptions.RequestException as e:
+            self.update_results(f"Failed to cancel run: {e}", "error")
+    # End of cancel_stream_run method
+
     # Start of debug_code method
     def debug_code(self):
         """Gets code and language, prompts for error, sends to /debug_code, displays suggestion."""
@@ -1019,6 +1358,71 @@ class RyanCodingApp(QMainWindow):
         self.send_request("fix_code", data, self.handle_fix_result)
     # End of fix_code method
 
+    # Start of auto_fix_code method
+    def auto_fix_code(self):
+        """Streams /auto_fix: the server runs, debugs, fixes and re-runs the code until it works."""
+        code_string = self.code_input.toPlainText().strip()
+        language = self.language_combo.currentText()
+
+        if not code_string:
+            self.update_results("Please enter code to fix.", "info")
+            return
+        if self.stream_worker and self.stream_worker.isRunning():
+            self.update_results("A streamed run is already in progress. Press Stop to cancel it.", "info")
+            return
+
+        self.stop_typing_animation()
+        self.update_results("--- Auto Fix ---", "info")
+        self.statusBar.showMessage("Auto-fixing...")
+        self.set_input_enabled(False)
+        self.stop_button.setEnabled(True)
+
+        self.stream_cancel_path = "auto_fix/{run_id}/cancel"
+        self.stream_worker = StreamWorker("auto_fix", {"code": code_string, "language": language}, final_event="done")
+        self.stream_worker.event_received.connect(self.handle_auto_fix_event)
+        self.stream_worker.finished.connect(self.handle_auto_fix_finished)
+        self.stream_worker.error.connect(self.handle_stream_error)
+        self.stream_worker.start()
+    # End of auto_fix_code method
+
+    # Start of handle_auto_fix_event method
+    def handle_auto_fix_event(self, event):
+        event_type = event.get("event")
+        iteration = event.get("iteration")
+        tokens = (event.get("usage") or {}).get("total_tokens")
+        token_note = f", {tokens} tokens" if tokens else ""
+        if event_type == "run":
+            state = "passed" if event.get("success") else "failed"
+            self.update_results(f"[{iteration}] Run {state} ({event.get('latency', 0):.2f}s)", "success" if event.get("success") else "error")
+        elif event_type == "debug":
+            self.update_results(f"[{iteration}] Debugged ({event.get('latency', 0):.2f}s{token_note})", "info")
+        elif event_type == "fix":
+            self.update_results(f"[{iteration}] Fix applied ({event.get('latency', 0):.2f}s{token_note})", "info")
+        elif event_type == "iteration":
+            self.statusBar.showMessage(f"Auto fix: iteration {iteration} took {event.get('latency', 0):.2f}s")
+    # End of handle_auto_fix_event method
+
+    # Start of handle_auto_fix_finished method
+    def handle_auto_fix_finished(self, response):
+        self.stop_button.setEnabled(False)
+        self.set_input_enabled(True)
+        if response.get("event") != "done":
+            self.update_results(response.get("content", "Auto fix could not start."), "error")
+            self.statusBar.showMessage("Request completed.")
+            return
+        success = response.get("success")
+        self.update_results(f"{response.get('reason')}", "success" if success else "error")
+        total_tokens = (response.get("usage") or {}).get("total_tokens", 0)
+        self.update_results(f"Iterations: {response.get('iteration_count')} | Wall: {response.get('wall_time', 0):.2f}s | Tokens: {total_tokens}", "info")
+        fixed_code = response.get("fixed_code")
+        if fixed_code:
+            self.update_results("--- Fixed Code ---", "info")
+            self.update_results(fixed_code, "code")
+            if success:
+                self.code_input.setPlainText(fixed_code)
+        self.statusBar.showMessage("Auto fix finished.")
+    # End of handle_auto_fix_finished method
+
     # Start of handle_fix_result method
     def handle_fix_result(self, response):
         # print(f"DEBUG: handle_fix_result called with response: {response}") # DEBUG PRINT
@@ -1251,6 +1655,10 @@ class RyanCodingApp(QMainWindow):
         if self.api_worker and self.api_worker.isRunning():
             # print("DEBUG: closeEvent: Stopping ApiWorker thread.") # DEBUG PRINT
             self.api_worker.stop()
+        self.close_session()
+        if self.stream_worker and self.stream_worker.isRunning():
+            # Closing the connection makes the backend cancel the run
+            self.stream_worker.stop()
         super().closeEvent(event)
     # End of closeEvent method
 
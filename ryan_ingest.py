@@ -0,0 +1,395 @@
+import os
+import time
+import queue
+import hashlib
+import logging
+import tarfile
+import zipfile
+import posixpath
+import threading
+from multiprocessing.connection import wait as wait_for_connections
+from typing import Optional, Dict, Any, List, Iterator, Callable, Tuple
+
+from ryan_workers import WorkerProcess
+from ryan_upload import DOCUMENT_LANGUAGES, parse_key_values
+from ryan_doc_index import prepare_document, document_id_for, get_document_index
+from ryan_blob_store import prepare_blob, get_blob_store
+from ryan_symbol_index import extract_symbols, get_symbol_index, SYMBOL_LANGUAGES
+from ryan_project import SKIPPED_DIRECTORIES, PROJECT_MAX_FILE_BYTES
+
+# --- Archive and Folder Ingestion ---
+# Ingests every text file of a zip/tar archive (spooled to disk by /documents/ingest) or of
+# a server-side folder in one request, instead of one /upload_document call per file:
+#   - skip     - files are stored under "<ingest_id>/<path>". The blob store already maps each
+#                name to the sha256 of its content and records the ingest_id that owns it, which
+#                is the manifest: a file whose hash is unchanged since the last ingest of the same
+#                ingest_id is skipped before any work is done, and files that disappeared are
+#                removed (index, blob, symbols, memory). Only names the ingest_id owns are removed,
+#                never uploads or other ingests that share the prefix, and an ingest_id nested in
+#                another one ("proj/sub" next to "proj") is refused.
+#   - source   - a server-side folder or archive must resolve (symlinks included) inside
+#                RYAN_INGEST_ROOT; without it only uploaded archives can be ingested.
+#   - parallel - the CPU-heavy part of each changed file (decoding, key/value parsing, chunking
+#                and tokenizing for the document index, chunking, hashing and compressing for
+#                the blob store, parsing Python/JavaScript for the symbol index) runs in RYAN_INGEST_WORKERS worker processes (default: one per
+#                core). The parent only reads members and writes the prepared results to sqlite,
+#                so ingest time scales with the core count.
+#   - memory   - the file manifests and "Key: Value" facts are written to memory in batches
+#                (INGEST_MEMORY_BATCH writes per Firestore batch) instead of one call each.
+#   - analysis - optional: Python/JavaScript files are summarised with the project analysis
+#                (ryan_project.py), whose Merkle cache re-analyses only what changed.
+# Progress is emitted as events: {"event": "file", "path", "status", "done", ...} per file
+# (status ingested, unchanged, skipped or failed), {"event": "removed", "path"},
+# {"event": "analysis", "report"} and finally {"event": "done", "summary"}.
+
+INGEST_WORKERS = int(os.getenv("RYAN_INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_MAX_FILES = int(os.getenv("RYAN_INGEST_MAX_FILES", "5000"))
+INGEST_MAX_FILE_BYTES = int(os.getenv("RYAN_INGEST_MAX_FILE_BYTES", str(5 * 1024 * 1024)))
+INGEST_MEMORY_BATCH = 400 # Firestore batches hold at most 500 writes
+INGEST_ROOT = os.getenv("RYAN_INGEST_ROOT") # Directory server-side sources must be under (unset = uploads only)
+_BINARY_SNIFF_BYTES = 8192
+_PROJECT_EXTENSIONS = (".py", ".js", ".mjs", ".cjs")
+
+
+class IngestError(Exception):
+    """Raised for an unusable ingest source (not a folder, zip or tar; too many files)."""
+
+
+def memory_key_for(name: str) -> str:
+    """The memory key process_document uses for a file's manifest."""
+    return f"file_content_{name.replace('.', '_').replace('/', '_')}"
+
+
+def resolve_ingest_path(path: str) -> str:
+    """Real path of a server-side source (relative paths are taken from RYAN_INGEST_ROOT). Raises IngestError outside the root."""
+    if not INGEST_ROOT:
+        raise IngestError("Ingesting server-side paths is disabled (RYAN_INGEST_ROOT is not set); upload an archive instead.")
+    root = os.path.realpath(INGEST_ROOT)
+    target = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, target]) != root:
+        raise IngestError(f"{path} is outside the ingest root.")
+    if not os.path.exists(target):
+        raise IngestError(f"No such folder or archive: {path}")
+    return target
+
+
+def check_ingest_id(ingest_id: str):
+    """Raises IngestError if ingest_id contains, or is contained in, another ingest's id ("proj" and "proj/sub")."""
+    for owner in get_blob_store().owners():
+        if owner != ingest_id and (owner.startswith(ingest_id + "/") or ingest_id.startswith(owner + "/")):
+            raise IngestError(f"Ingest id '{ingest_id}' overlaps the existing ingest '{owner}'; use a separate id.")
+
+
+# --- Reading the source ---
+
+def _wanted(relative_path: str) -> bool:
+    parts = relative_path.split("/")
+    return not relative_path.startswith("..") and not any(part in SKIPPED_DIRECTORIES or part.startswith(".") for part in parts[:-1])
+
+
+def iter_source_members(source: str) -> Iterator[Tuple[str, int, Callable[[], bytes]]]:
+    """
+    (relative posix path, size, read()) for the regular files of a folder or a zip/tar(.gz) archive file, in order.
+    An archive of a single top-level folder is read relative to that folder (as for project archives).
+    """
+    if os.path.isdir(source):
+        root = os.path.abspath(source)
+        for directory, subdirectories, names in os.walk(root):
+            subdirectories[:] = sorted(d for d in subdirectories if d not in SKIPPED_DIRECTORIES and not d.startswith("."))
+            for file_name in sorted(names):
+                full_path = os.path.join(directory, file_name)
+                if os.path.isfile(full_path) and not os.path.islink(full_path):
+                    relative = os.path.relpath(full_path, root).replace(os.sep, "/")
+                    yield relative, os.path.getsize(full_path), lambda full_path=full_path: _read_file(full_path)
+        return
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as bundle:
+            members = [(_normalise(info.filename), info.file_size, lambda info=info: bundle.read(info)) for info in bundle.infolist() if not info.is_dir()]
+            yield from _relative_to_top(members)
+        return
+    try:
+        bundle = tarfile.open(source, mode="r:*")
+    except (tarfile.TarError, OSError):
+        raise IngestError("The source is not a folder, a zip archive or a tar archive.")
+    with bundle:
+        # Listing reads the headers once; the members are then read in archive order, so a compressed tar is
+        # decompressed from the start once more rather than once per member
+        members = [(_normalise(info.name), info.size, lambda info=info: bundle.extractfile(info).read()) for info in bundle.getmembers() if info.isfile()]
+        yield from _relative_to_top(members)
+
+
+def _normalise(name: str) -> str:
+    return posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+
+
+def _relative_to_top(members: List[Tuple[str, int, Callable[[], bytes]]]) -> Iterator[Tuple[str, int, Callable[[], bytes]]]:
+    tops = {relative.split("/")[0] for relative, _, _ in members}
+    strip = len(tops) == 1 and all("/" in relative for relative, _, _ in members)
+    for relative, size, read in members:
+        if strip:
+            relative = relative.split("/", 1)[1]
+        if _wanted(relative):
+            yield relative, size, read
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as handle:
+        return handle.read()
+
+
+# --- Worker side ---
+
+def prepare_member(name: str, data: bytes) -> Dict[str, Any]:
+    """Everything CPU-bound about one file, as picklable data for the parent to write."""
+    if b"\0" in data[:_BINARY_SNIFF_BYTES]:
+        return {"status": "skipped", "reason": "binary"}
+    text = data.decode("utf-8", errors="replace")
+    lines = text.splitlines()
+    language = DOCUMENT_LANGUAGES.get(os.path.splitext(name)[1].lower())
+    facts = [(key, value) for _, key, value in parse_key_values(enumerate(lines, 1))] if language is None else []
+    return {"status": "prepared", "language": language, "facts": facts,
+            "document": prepare_document(name, lines), "blob": prepare_blob(data),
+            "symbols": extract_symbols(text, language) if language in SYMBOL_LANGUAGES else None}
+
+
+def _ingest_worker_main(conn):
+    """Worker loop: (name, data) in, prepare_member result out; None stops the worker."""
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        name, data = task
+        try:
+            result = prepare_member(name, data)
+        except Exception as e:
+            result = {"status": "failed", "error": str(e)}
+        try:
+            conn.send(result)
+        except (EOFError, OSError):
+            break
+
+
+class IngestPool:
+    """Worker processes that prepare files; one ingest uses the whole pool at a time."""
+    def __init__(self, size: int = INGEST_WORKERS):
+        self.size = max(1, size)
+        self._workers: List[WorkerProcess] = []
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.size:
+            self._workers.append(WorkerProcess("ryan_ingest", "_ingest_worker_main"))
+
+    def map_unordered(self, tasks: Iterator[Tuple[str, bytes]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(name, result) for every (name, data) task as workers finish; one task in flight per worker."""
+        with self._lock:
+            self._ensure_workers()
+            idle = list(self._workers)
+            busy: Dict[Any, Tuple[WorkerProcess, str]] = {}
+            exhausted = False
+            try:
+                while True:
+                    while idle and not exhausted:
+                        task = next(tasks, None)
+                        if task is None:
+                            exhausted = True
+                            break
+                        worker = idle.pop()
+                        worker.conn.send(task)
+                        busy[worker.conn] = (worker, task[0])
+                    if not busy:
+                        return
+                    for conn in wait_for_connections(list(busy)):
+                        worker, name = busy.pop(conn)
+                        yield name, self._receive(worker, idle)
+            finally:
+                # The task source raised or the caller stopped early: collect the answers still in flight
+                # so the next ingest doesn't read them as its own
+                for conn, (worker, _) in list(busy.items()):
+                    self._receive(worker, idle)
+
+    def _receive(self, worker: WorkerProcess, idle: List[WorkerProcess]) -> Dict[str, Any]:
+        try:
+            result = worker.conn.recv()
+            idle.append(worker)
+            return result
+        except (EOFError, OSError):
+            # The worker died (e.g. out of memory); replace it and report the file as failed
+            worker.kill()
+            self._workers.remove(worker)
+            replacement = WorkerProcess("ryan_ingest", "_ingest_worker_main")
+            self._workers.append(replacement)
+            idle.append(replacement)
+            return {"status": "failed", "error": "The ingest worker exited while preparing this file."}
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers:
+                try:
+                    worker.conn.send(None)
+                except (EOFError, OSError):
+                    pass
+                worker.join(1.0)
+                worker.kill()
+            self._workers = []
+
+
+_pool: Optional[IngestPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ingest_pool() -> IngestPool:
+    """Returns the shared ingest worker pool (started on first use)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = IngestPool()
+        return _pool
+
+
+# --- Parent side ---
+
+class IngestRun:
+    """One ingest of a folder or archive. run() blocks until every file is handled."""
+    def __init__(self, source: str, ingest_id: str, analyze: bool = False):
+        self.source = source
+        self.ingest_id = ingest_id.strip("/")
+        self.analyze = analyze
+        self.events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+        self.cancelled = False
+        self.counts = {"ingested": 0, "unchanged": 0, "skipped": 0, "failed": 0, "removed": 0}
+        self.files = 0
+        self.bytes_read = 0
+        self.bytes_prepared = 0
+        self.memory_writes = 0
+        self.source_files: Dict[str, str] = {} # Python/JavaScript texts for the optional project analysis
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.analysis: Optional[Dict[str, Any]] = None
+
+    def next_event(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cancel(self):
+        """Stops reading new files; removal of missing files is skipped since the listing is incomplete."""
+        self.cancelled = True
+
+    def _emit(self, path: str, status: str, **details):
+        self.counts[status] += 1
+        self.events.put({"event": "file", "path": path, "status": status, "done": sum(self.counts.values()) - self.counts["removed"], **details})
+
+    def run(self, save_memory_batch: Callable[[Dict[str, Any]], int], delete_memory: Callable[[str], bool],
+            pool: Optional[IngestPool] = None, embed: Optional[Callable] = None):
+        """Reads, prepares (in the worker pool) and writes every changed file, then removes files that disappeared."""
+        check_ingest_id(self.ingest_id) # Again, in case an overlapping ingest was started since
+        prefix = self.ingest_id + "/"
+        index = get_document_index()
+        blobs = get_blob_store()
+        symbols = get_symbol_index()
+        previous = blobs.names_owned_by(self.ingest_id)
+        seen = set()
+        pending_memory: Dict[str, Any] = {}
+
+        def flush_memory(force: bool = False):
+            if pending_memory and (force or len(pending_memory) >= INGEST_MEMORY_BATCH):
+                self.memory_writes += save_memory_batch(dict(pending_memory))
+                pending_memory.clear()
+
+        def tasks() -> Iterator[Tuple[str, bytes]]:
+            for relative, size, read in iter_source_members(self.source):
+                if self.cancelled:
+                    return
+                self.files += 1
+                if self.files > INGEST_MAX_FILES:
+                    raise IngestError(f"The source has more than {INGEST_MAX_FILES} files.")
+                name = prefix + relative
+                seen.add(name)
+                if size > INGEST_MAX_FILE_BYTES:
+                    self._emit(relative, "skipped", reason="too_large", bytes=size)
+                    continue
+                data = read()
+                self.bytes_read += len(data)
+                if self.analyze and relative.endswith(_PROJECT_EXTENSIONS) and len(data) <= PROJECT_MAX_FILE_BYTES:
+                    self.source_files[relative] = data.decode("utf-8", errors="replace")
+                if previous.get(name) == hashlib.sha256(data).hexdigest():
+                    self._emit(relative, "unchanged", bytes=len(data))
+                    continue
+                yield name, data
+
+        try:
+            if pool is not None or INGEST_WORKERS > 0:
+                results = (pool or get_ingest_pool()).map_unordered(tasks())
+            else:
+                results = ((name, _prepare_inline(name, data)) for name, data in tasks())
+            for name, result in results:
+                relative = name[len(prefix):]
+                if result["status"] != "prepared":
+                    self._emit(relative, result["status"], **{key: value for key, value in result.items() if key != "status"})
+                    continue
+                try:
+                    index_report = index.store_prepared(result["document"], language=result["language"], embed=embed)
+                    storage_report = blobs.put_prepared(name, result["blob"], owner=self.ingest_id)
+                    symbol_report = symbols.store_extracted(name, result["symbols"]) if result["symbols"] is not None else None
+                except Exception as e:
+                    logging.error(f"Writing ingested file {name} failed: {e}")
+                    self._emit(relative, "failed", error=str(e))
+                    continue
+                self.bytes_prepared += storage_report["size"]
+                pending_memory[memory_key_for(name)] = {"file_name": name, "blob": storage_report["file_id"], "bytes": storage_report["size"],
+                                                        "chunks": storage_report["chunks"], "doc_id": index_report["doc_id"]}
+                pending_memory.update(dict(result["facts"]))
+                flush_memory()
+                self._emit(relative, "ingested", bytes=storage_report["size"], chunks=index_report["chunks"],
+                           new_chunks=storage_report["new_chunks"], facts=len(result["facts"]),
+                           definitions=symbol_report["definitions"] if symbol_report else None)
+
+            if not self.cancelled:
+                for name in sorted(set(previous) - seen):
+                    index.delete_document(document_id_for(name))
+                    blobs.delete(name)
+                    symbols.remove_file(name)
+                    delete_memory(memory_key_for(name))
+                    self.counts["removed"] += 1
+                    self.events.put({"event": "removed", "path": name[len(prefix):]})
+            flush_memory(force=True)
+        finally:
+            self.finished_at = time.time()
+
+    def finish(self, error: Optional[str] = None):
+        """Emits the final event (after the optional analysis)."""
+        summary = self.summary()
+        if error:
+            summary["error"] = error
+        self.events.put({"event": "done", "summary": summary})
+
+    def summary(self) -> Dict[str, Any]:
+        wall_time = (self.finished_at or time.time()) - self.started_at
+        return {
+            "ingest_id": self.ingest_id,
+            "files": self.files,
+            **self.counts,
+            "bytes_read": self.bytes_read,
+            "bytes_ingested": self.bytes_prepared,
+            "memory_writes": self.memory_writes,
+            "workers": INGEST_WORKERS,
+            "cancelled": self.cancelled,
+            "wall_time": round(wall_time, 6),
+            "files_per_second": round(self.files / wall_time, 3) if wall_time > 0 else None,
+            "mb_per_s": round(self.bytes_read / (1024 * 1024) / wall_time, 3) if wall_time > 0 else None,
+            "analysis": self.analysis,
+        }
+
+
+def _prepare_inline(name: str, data: bytes) -> Dict[str, Any]:
+    """prepare_member in this process (RYAN_INGEST_WORKERS=0), with the worker's error handling."""
+    try:
+        return prepare_member(name, data)
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
@@ -0,0 +1,339 @@
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import logging
+from typing import Optional, Dict, Any, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# --- Local Lightweight Intent Classifier ---
+# Routes a chat message to one of INTENT_LABELS without a model round trip.
+# Features are hashed word unigrams, word bigrams and character trigrams
+# (the "hashing trick", so there is no vocabulary to store), fed into a linear
+# softmax model. Prediction is one gather + sum over the weight matrix, which
+# takes well under 1 ms per message.
+#
+# Model file format (.npz, written with numpy.savez_compressed):
+#   weights      float32 [n_features, n_labels]
+#   bias         float32 [n_labels]
+#   labels       unicode [n_labels]
+#   n_features   int     hash space size (power of two)
+#   version      int     MODEL_FORMAT_VERSION
+#
+# Train:      python ryan_intent.py train [--out intent_model.npz] [--data extra.jsonl]
+# Benchmark:  python ryan_intent.py bench --model intent_model.npz [--data held_out.jsonl]
+# Training data is JSON lines: {"text": "...", "label": "memory|plugin|code|chat"}
+# Evaluation is on a held-out split by template (see split_held_out): every variant of a
+# held-out template is unseen in training, so the accuracy is not measured on examples the
+# model was fitted to. The shipped model (intent_model.npz next to this file, the default
+# for RYAN_INTENT_MODEL whatever the working directory) is trained on the training split
+# only, and bench without --data reports on the same held-out templates.
+
+INTENT_LABELS = ["memory", "plugin", "code", "chat"]
+MODEL_FORMAT_VERSION = 1
+HELD_OUT_BUCKETS = 5 # One in HELD_OUT_BUCKETS templates of each label is held out
+DEFAULT_N_FEATURES = 4096
+INTENT_MODEL_PATH = os.getenv("RYAN_INTENT_MODEL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.npz"))
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("RYAN_INTENT_THRESHOLD", "0.75"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9_']+|```|[?!]")
+
+
+def extract_features(text: str, n_features: int = DEFAULT_N_FEATURES) -> List[int]:
+    """Returns the hashed feature indices for a message (duplicates count twice)."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    mask = n_features - 1 # n_features is a power of two
+    features = []
+    previous = "<s>"
+    for token in tokens:
+        features.append(zlib.crc32(b"w:" + token.encode()) & mask)
+        features.append(zlib.crc32(f"b:{previous} {token}".encode()) & mask)
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            features.append(zlib.crc32(b"c:" + padded[i:i + 3].encode()) & mask)
+        previous = token
+    if "```" in text:
+        features.append(zlib.crc32(b"has_code_fence") & mask)
+    return features
+
+
+class IntentClassifier:
+    """Hashed n-gram + linear softmax intent classifier."""
+    def __init__(self, weights, bias, labels: List[str], n_features: int):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.n_features = n_features
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        if np is None:
+            raise RuntimeError("numpy is required for the intent classifier.")
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version != MODEL_FORMAT_VERSION:
+                raise ValueError(f"Unsupported intent model version {version} (expected {MODEL_FORMAT_VERSION}).")
+            return cls(data["weights"].astype(np.float32), data["bias"].astype(np.float32),
+                       [str(label) for label in data["labels"]], int(data["n_features"]))
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels),
+                            n_features=np.int64(self.n_features), version=np.int64(MODEL_FORMAT_VERSION))
+
+    def predict_proba(self, text: str):
+        indices = extract_features(text, self.n_features)
+        if not indices:
+            scores = self.bias.copy()
+        else:
+            # Sum of the active rows, length-normalized so long messages aren't overconfident
+            scores = self.weights[indices].sum(axis=0) / np.sqrt(len(indices)) + self.bias
+        scores = scores - scores.max()
+        exp_scores = np.exp(scores)
+        return exp_scores / exp_scores.sum()
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Returns (label, confidence) for a message."""
+        probabilities = self.predict_proba(text)
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+
+def _feature_matrix(texts: List[str], n_features: int):
+    matrix = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        indices = extract_features(text, n_features)
+        if indices:
+            np.add.at(matrix[row], indices, 1.0)
+            matrix[row] /= np.sqrt(len(indices))
+    return matrix
+
+
+def train_classifier(examples: List[Dict[str, str]], n_features: int = DEFAULT_N_FEATURES, epochs: int = 60,
+                     learning_rate: float = 0.5, l2: float = 1e-4, batch_size: int = 64, seed: int = 0) -> IntentClassifier:
+    """Trains a softmax regression model with mini-batch gradient descent."""
+    if np is None:
+        raise RuntimeError("numpy is required to train the intent classifier.")
+    labels = INTENT_LABELS + sorted({ex["label"] for ex in examples} - set(INTENT_LABELS))
+    label_index = {label: i for i, label in enumerate(labels)}
+    features = _feature_matrix([ex["text"] for ex in examples], n_features)
+    targets = np.zeros((len(examples), len(labels)), dtype=np.float32)
+    targets[np.arange(len(examples)), [label_index[ex["label"]] for ex in examples]] = 1.0
+
+    rng = np.random.default_rng(seed)
+    weights = np.zeros((n_features, len(labels)), dtype=np.float32)
+    bias = np.zeros(len(labels), dtype=np.float32)
+    for epoch in range(epochs):
+        order = rng.permutation(len(examples))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            x, y = features[batch], targets[batch]
+            scores = x @ weights + bias
+            scores -= scores.max(axis=1, keepdims=True)
+            probabilities = np.exp(scores)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+            error = (probabilities - y) / len(batch)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+        if (epoch + 1) % 20 == 0:
+            logging.info(f"Intent classifier epoch {epoch + 1}/{epochs} trained.")
+    return IntentClassifier(weights, bias, labels, n_features)
+
+
+# --- Seed Training Data ---
+# Small template-generated dataset so the classifier can be trained without any
+# labelled logs. Extra examples (e.g. exported from app.log) can be added with --data.
+_SUBJECTS = ["my dog", "my birthday", "aryan", "my job", "my favorite color", "my sister", "my car", "my address",
+             "my wife", "my project", "the meeting", "my cat", "my password hint", "my boss", "my doctor"]
+_TOPICS = ["the weather", "black holes", "pizza", "the roman empire", "music", "learning spanish", "my weekend",
+           "football", "movies", "philosophy", "cooking pasta", "sleep", "traveling to japan", "dinosaurs"]
+
+_TEMPLATES = {
+    "memory": ["what do you remember about {s}", "do you recall {s}", "what did i tell you about {s}",
+               "remind me what {s} is", "what do you know about {s}", "have i told you about {s}",
+               "what's saved about {s}", "look up {s} in your memory", "do you still remember {s}",
+               "what have i said about {s} before", "anything in memory about {s}?", "recall {s} for me"],
+    "plugin": ["what time is it", "tell me the current time", "what is the date today", "what's today's date",
+               "flip a coin", "can you do a coin flip for me", "heads or tails?", "tell me a joke",
+               "make me laugh with a joke", "know any good jokes?", "search for images of {t}",
+               "show me pictures of {t}", "find pictures of {t}", "image search for {t}", "what time is it right now?",
+               "current date please", "toss a coin", "say something funny"],
+    "code": ["can you run this snippet ```print(1)```", "why does my python function throw an error",
+             "explain this javascript ```console.log(x)```", "execute the following code ```x = 1```",
+             "there's a bug in my code", "fix my script it crashes", "my code gives a TypeError",
+             "what does this function do ```def f(): pass```", "refactor this loop for me",
+             "why is my recursion so slow", "help me debug this traceback", "how do i fix this NameError",
+             "review my {t} code", "optimize this sql query", "write a unit test for this function",
+             "this java class won't compile", "segmentation fault in my c program", "run it again with input 5"],
+    "chat": ["how are you", "tell me about {t}", "what do you think about {t}", "i feel sad today",
+             "recommend a movie", "what is the capital of france", "write me a poem about {t}", "good morning ryan",
+             "tell me a story about {t}", "why is the sky blue", "i'm bored", "what's your favorite food",
+             "can you give me advice on {t}", "thanks, that was helpful", "who invented the telephone",
+             "let's talk about {t}", "how do i get better at {t}", "what should i eat tonight"],
+}
+
+
+def build_seed_dataset(seed: int = 0) -> List[Dict[str, str]]:
+    """Expands the templates into labelled examples; "group" is the template each one came from."""
+    rng = random.Random(seed)
+    examples = []
+    for label, templates in _TEMPLATES.items():
+        for template in templates:
+            if "{s}" in template:
+                for subject in _SUBJECTS:
+                    examples.append({"text": template.format(s=subject), "label": label, "group": template})
+            elif "{t}" in template:
+                for topic in _TOPICS:
+                    examples.append({"text": template.format(t=topic), "label": label, "group": template})
+            else:
+                examples.append({"text": template, "label": label, "group": template})
+                # Light augmentation for fixed phrases so they aren't drowned out by templated ones
+                examples.append({"text": template.capitalize() + "?", "label": label, "group": template})
+                examples.append({"text": "hey ryan, " + template, "label": label, "group": template})
+                examples.append({"text": template + " please", "label": label, "group": template})
+    rng.shuffle(examples)
+    return examples
+
+
+def load_examples(path: str) -> List[Dict[str, str]]:
+    examples = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                examples.append({"text": record["text"], "label": record["label"]})
+    return examples
+
+
+def split_held_out(examples: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    (train, held_out), split by group (template) rather than by example, so no variant of a held-out
+    template is trained on. Per label, groups are ordered by crc32 and every HELD_OUT_BUCKETS-th one is
+    held out, so every label is evaluated and the split is deterministic. Examples without a group
+    (from --data) are grouped by their text.
+    """
+    groups: Dict[str, set] = {}
+    for example in examples:
+        groups.setdefault(example["label"], set()).add(example.get("group") or example["text"].lower())
+    held_out_groups = set()
+    for label, label_groups in groups.items():
+        ordered = sorted(label_groups, key=lambda group: (zlib.crc32(group.encode("utf-8")), group))
+        held_out_groups.update((label, group) for group in ordered[::HELD_OUT_BUCKETS])
+    train, held_out = [], []
+    for example in examples:
+        key = (example["label"], example.get("group") or example["text"].lower())
+        (held_out if key in held_out_groups else train).append(example)
+    return train, held_out
+
+
+def evaluate(classifier: IntentClassifier, examples: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Returns accuracy and per-message latency stats for a labelled set."""
+    correct = 0
+    latencies = []
+    for example in examples:
+        start = time.perf_counter()
+        label, _ = classifier.predict(example["text"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += label == example["label"]
+    latencies.sort()
+    return {
+        "examples": len(examples),
+        "accuracy": round(correct / len(examples), 4) if examples else None,
+        "latency_ms_mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        "latency_ms_p50": round(latencies[len(latencies) // 2], 4) if latencies else None,
+        "latency_ms_p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 4) if latencies else None,
+    }
+
+
+_classifier = None
+_classifier_loaded = False
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Loads the classifier from INTENT_MODEL_PATH once. Returns None if unavailable."""
+    global _classifier, _classifier_loaded
+    if _classifier_loaded:
+        return _classifier
+    _classifier_loaded = True
+    if np is None:
+        logging.info("numpy not installed. Local intent classifier disabled.")
+    elif not os.path.exists(INTENT_MODEL_PATH):
+        logging.info(f"Intent model not found at {INTENT_MODEL_PATH}. Local intent classifier disabled.")
+    else:
+        try:
+            _classifier = IntentClassifier.load(INTENT_MODEL_PATH)
+            logging.info(f"Local intent classifier loaded from {INTENT_MODEL_PATH} (labels={_classifier.labels}).")
+        except Exception as e:
+            logging.error(f"Failed to load intent model from {INTENT_MODEL_PATH}: {e}")
+    return _classifier
+
+
+def classify_intent(text: str) -> Optional[Tuple[str, float]]:
+    """Returns (label, confidence) if the classifier is confident, otherwise None."""
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return None
+    label, confidence = classifier.predict(text)
+    logging.debug(f"Intent classifier: '{text[:60]}' -> {label} ({confidence:.2f})")
+    if confidence < INTENT_CONFIDENCE_THRESHOLD:
+        return None
+    return label, confidence
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Train and benchmark Ryan's local intent classifier")
+    parser.add_argument("command", choices=["train", "bench", "predict"])
+    parser.add_argument("--data", help="JSON lines file with {'text', 'label'} records")
+    parser.add_argument("--no-seed", action="store_true", help="Train only on --data, without the built-in seed set")
+    parser.add_argument("--out", default=INTENT_MODEL_PATH, help="Where to write the trained model")
+    parser.add_argument("--model", default=INTENT_MODEL_PATH, help="Model file for bench/predict")
+    parser.add_argument("--features", type=int, default=DEFAULT_N_FEATURES, help="Hash space size (power of two)")
+    parser.add_argument("--epochs", type=int, default=60)
+    parser.add_argument("--text", help="Message to classify for the predict command")
+    args = parser.parse_args()
+
+    if np is None:
+        print("numpy is required: pip install numpy")
+        sys.exit(1)
+
+    if args.command == "train":
+        if args.features & (args.features - 1):
+            print("--features must be a power of two")
+            sys.exit(1)
+        examples = [] if args.no_seed else build_seed_dataset()
+        if args.data:
+            examples += load_examples(args.data)
+        random.Random(1).shuffle(examples)
+        train_set, held_out = split_held_out(examples)
+        classifier = train_classifier(train_set, n_features=args.features, epochs=args.epochs)
+        print(f"Held-out evaluation ({len(held_out)} examples from unseen templates): {json.dumps(evaluate(classifier, held_out))}")
+        # The shipped model is the one evaluated above, so bench keeps measuring it on unseen templates
+        classifier.save(args.out)
+        print(f"Saved intent model ({len(train_set)} training examples, {args.features} features) to {args.out}")
+
+    elif args.command == "bench":
+        classifier = IntentClassifier.load(args.model)
+        # Without --data, only the seed templates the model was not trained on
+        examples = load_examples(args.data) if args.data else split_held_out(build_seed_dataset(seed=7))[1]
+        # Warm up numpy so the first call's allocation doesn't skew the numbers
+        for example in examples[:20]:
+            classifier.predict(example["text"])
+        print(json.dumps(evaluate(classifier, examples), indent=2))
+
+    elif args.command == "predict":
+        if not args.text:
+            print("--text is required for predict")
+            sys.exit(1)
+        classifier = IntentClassifier.load(args.model)
+        label, confidence = classifier.predict(args.text)
+        print(f"{label} ({confidence:.3f})")
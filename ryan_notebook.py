@@ -0,0 +1,423 @@
+import ast
+import time
+import hashlib
+import logging
+import builtins
+import threading
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from ryan_sessions import get_session_manager, SessionError, SESSION_CELL_TIMEOUT
+
+# --- Notebook Cells with Incremental Re-runs ---
+# A notebook is an ordered list of Python cells executed in one REPL session
+# (ryan_sessions.py). When the document is submitted again, only the cells affected
+# by the edit run; the others keep their previous results, and their variables are
+# still in the session's namespace.
+#   - Each cell is analysed with ast: 'defines' are the names it binds at module level
+#     (assignments, imports, def/class, `global` writes, plus in-place mutation such as
+#     d[k] = v, obj.attr = v or a bare lst.append(x) statement), 'uses' are the names it
+#     reads before binding them itself (including globals read inside its functions).
+#   - Calling a function counts as writing the globals its body assigns (`global x`) or
+#     mutates (d[k] = v, lst.append(x)), following calls between functions, so a cell
+#     running add("a") defines d when add does d[k] = 1.
+#   - Cells that are new, edited, or failed last time re-run. Re-running a cell makes its
+#     defines dirty, and every later cell that uses a dirty name re-runs too. So does every
+#     later cell that defines or mutates a dirty name: x = 2 after an edited x = 1 must run
+#     again, or the cells reading x would see the edited value instead of 2.
+#   - A re-run cell must not see values written by cells *after* it (x = x + 1 edited in
+#     place would otherwise start from the old result). If the namespace's last writer of a
+#     name it uses sits at or after it, the latest earlier cell defining that name re-runs
+#     first. If no earlier cell defines it, the session is restarted and everything runs.
+#   - Cells are matched to the previous submission by content (difflib over cell hashes),
+#     so inserting or deleting a cell doesn't invalidate the cells after it. A deleted
+#     cell's defines count as dirty.
+#   - Execution stops at the first failing cell; later cells that needed to run are
+#     reported as skipped and run again on the next submission.
+# Cells containing `from x import *`, exec/eval or globals()/vars() can't be analysed;
+# everything after such a cell re-runs whenever it does.
+
+NOTEBOOK_MAX_CELLS = 200
+_OPAQUE_CALLS = {"exec", "eval", "globals", "vars", "locals", "__import__"}
+_BUILTIN_NAMES = set(dir(builtins))
+
+# Cell statuses
+RAN, CACHED, ERROR, SKIPPED = "ran", "cached", "error", "skipped"
+
+
+def cell_hash(code: str) -> str:
+    return hashlib.sha256(code.strip().encode()).hexdigest()
+
+
+def _function_locals(node: ast.AST) -> Tuple[Set[str], Set[str]]:
+    """(locals, globals) of a function or lambda: parameters and names bound in its body, minus `global` names."""
+    arguments = node.args
+    params = {arg.arg for arg in arguments.posonlyargs + arguments.args + arguments.kwonlyargs}
+    params |= {arg.arg for arg in (arguments.vararg, arguments.kwarg) if arg is not None}
+    body = node.body if isinstance(node.body, list) else [node.body]
+    declared_global: Set[str] = set()
+    bound: Set[str] = set()
+    for stmt in body:
+        for child in ast.walk(stmt):
+            if isinstance(child, (ast.Global, ast.Nonlocal)):
+                declared_global.update(child.names)
+            elif isinstance(child, ast.Name) and isinstance(child.ctx, (ast.Store, ast.Del)):
+                bound.add(child.id)
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                bound.add(child.name)
+            elif isinstance(child, (ast.Import, ast.ImportFrom)):
+                bound.update((alias.asname or alias.name).split(".")[0] for alias in child.names)
+    return (params | bound) - declared_global, declared_global
+
+
+def _free_loads(node: ast.AST, bound: frozenset) -> Set[str]:
+    """Names node reads that aren't bound by an enclosing function, lambda or comprehension scope."""
+    if isinstance(node, ast.Name):
+        return {node.id} if isinstance(node.ctx, ast.Load) and node.id not in bound else set()
+    if isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+        # total += x reads total before writing it
+        return ({node.target.id} - bound) | _free_loads(node.value, bound)
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        # Decorators, defaults and annotations are evaluated where the function is defined
+        outer = list(getattr(node, "decorator_list", [])) + node.args.defaults + [d for d in node.args.kw_defaults if d is not None]
+        loads: Set[str] = set()
+        for child in outer:
+            loads |= _free_loads(child, bound)
+        local_names, _ = _function_locals(node)
+        inner = bound | local_names
+        for stmt in (node.body if isinstance(node.body, list) else [node.body]):
+            loads |= _free_loads(stmt, frozenset(inner))
+        return loads
+    if isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+        targets = {name.id for generator in node.generators for name in ast.walk(generator.target) if isinstance(name, ast.Name)}
+        # The first iterable is evaluated in the enclosing scope
+        loads = _free_loads(node.generators[0].iter, bound)
+        inner = frozenset(bound | targets)
+        for child in ast.iter_child_nodes(node):
+            if child is not node.generators[0].iter:
+                loads |= _free_loads(child, inner)
+        return loads
+    loads = set()
+    for child in ast.iter_child_nodes(node):
+        loads |= _free_loads(child, bound)
+    return loads
+
+
+def _base_name(node: ast.AST) -> Optional[str]:
+    """'d' for d[k], d.a.b, d[k].x - the variable an in-place mutation changes."""
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _module_bindings(stmt: ast.stmt) -> Tuple[Set[str], bool]:
+    """(names stmt binds or mutates at module level, opaque) - doesn't look inside function or class bodies except for `global`."""
+    names: Set[str] = set()
+    opaque = False
+    pending = [stmt]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+            if not isinstance(node, ast.ClassDef):
+                names |= _function_locals(node)[1] # `global x` inside a function writes the module's x when called
+            pending.extend(getattr(node, "decorator_list", []))
+            continue
+        if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            continue # Own scope
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == "*":
+                    opaque = True
+                else:
+                    names.add((alias.asname or alias.name).split(".")[0])
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Attribute, ast.Subscript)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            base = _base_name(node)
+            if base:
+                names.add(base)
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Attribute):
+            # A method call whose result is discarded is there for its side effect: lst.append(x), df.dropna(inplace=True)
+            base = _base_name(node.value.func.value)
+            if base:
+                names.add(base)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _OPAQUE_CALLS:
+            opaque = True
+        pending.extend(ast.iter_child_nodes(node))
+    return names, opaque
+
+
+def _function_effects(node: ast.AST) -> Tuple[Set[str], Set[str]]:
+    """(module globals the function assigns or mutates when called, names it calls)."""
+    local_names, declared_global = _function_locals(node)
+    writes: Set[str] = set()
+    calls: Set[str] = set()
+    for stmt in node.body:
+        for child in ast.walk(stmt):
+            if isinstance(child, ast.Name) and isinstance(child.ctx, (ast.Store, ast.Del)) and child.id in declared_global:
+                writes.add(child.id)
+            elif isinstance(child, (ast.Attribute, ast.Subscript)) and isinstance(child.ctx, (ast.Store, ast.Del)):
+                writes.add(_base_name(child))
+            elif isinstance(child, ast.Expr) and isinstance(child.value, ast.Call) and isinstance(child.value.func, ast.Attribute):
+                writes.add(_base_name(child.value.func.value))
+            elif isinstance(child, ast.Call) and isinstance(child.func, ast.Name):
+                calls.add(child.func.id)
+    return {name for name in writes if name and name not in local_names}, calls
+
+
+def _calls_and_functions(stmts: List[ast.stmt]) -> Tuple[Set[str], Dict[str, Dict[str, Set[str]]]]:
+    """(names called at module level, {function name: {"writes", "calls"}} for the functions the cell defines)."""
+    calls: Set[str] = set()
+    functions: Dict[str, Dict[str, Set[str]]] = {}
+    pending: List[ast.AST] = list(stmts)
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            writes, inner_calls = _function_effects(node)
+            functions[node.name] = {"writes": writes, "calls": inner_calls}
+            pending.extend(node.decorator_list)
+            continue
+        if isinstance(node, ast.ClassDef):
+            pending.extend(node.decorator_list + node.bases)
+            continue
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            calls.add(node.func.id)
+        pending.extend(ast.iter_child_nodes(node))
+    return calls, functions
+
+
+def _scan_block(stmts: List[ast.stmt], defines: Set[str], uses: Set[str]) -> bool:
+    """
+    Adds the statements' bindings to defines and their upward-exposed reads to uses, in order.
+    Loops, conditionals, with and try are entered so `for i in ...: print(i)` doesn't count i as read
+    before it is bound. Returns True if a statement is opaque.
+    """
+    opaque = False
+    for stmt in stmts:
+        if isinstance(stmt, (ast.For, ast.AsyncFor)):
+            uses |= _free_loads(stmt.iter, frozenset()) - defines
+            defines |= {name.id for name in ast.walk(stmt.target) if isinstance(name, ast.Name)}
+            opaque |= _scan_block(stmt.body + stmt.orelse, defines, uses)
+        elif isinstance(stmt, (ast.While, ast.If)):
+            uses |= _free_loads(stmt.test, frozenset()) - defines
+            opaque |= _scan_block(stmt.body + stmt.orelse, defines, uses)
+        elif isinstance(stmt, (ast.With, ast.AsyncWith)):
+            for item in stmt.items:
+                uses |= _free_loads(item.context_expr, frozenset()) - defines
+                if item.optional_vars is not None:
+                    defines |= {name.id for name in ast.walk(item.optional_vars) if isinstance(name, ast.Name)}
+            opaque |= _scan_block(stmt.body, defines, uses)
+        elif isinstance(stmt, ast.Try):
+            opaque |= _scan_block(stmt.body, defines, uses)
+            for handler in stmt.handlers:
+                if handler.name:
+                    defines.add(handler.name)
+                opaque |= _scan_block(handler.body, defines, uses)
+            opaque |= _scan_block(stmt.orelse + stmt.finalbody, defines, uses)
+        else:
+            uses |= _free_loads(stmt, frozenset()) - defines
+            stmt_defines, stmt_opaque = _module_bindings(stmt)
+            defines |= stmt_defines
+            opaque |= stmt_opaque
+    return opaque
+
+
+def analyze_cell(code: str) -> Dict[str, Any]:
+    """
+    Def/use summary of one Python cell: {"defines", "uses", "opaque", "syntax_error", "calls", "functions"}.
+    uses holds only names read before the cell binds them itself; builtins are left out. The effects of
+    the functions in calls are added to defines by link_calls, which needs the other cells.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        # Can't analyse it; it will fail when run, which is reported like any other error
+        return {"defines": set(), "uses": set(), "opaque": False, "syntax_error": f"{e.msg} (line {e.lineno})",
+                "calls": set(), "functions": {}}
+    defines: Set[str] = set()
+    uses: Set[str] = set()
+    opaque = _scan_block(tree.body, defines, uses)
+    calls, functions = _calls_and_functions(tree.body)
+    return {"defines": defines, "uses": uses - (_BUILTIN_NAMES - defines), "opaque": opaque, "syntax_error": None,
+            "calls": calls, "functions": functions}
+
+
+def link_calls(analyses: List[Dict[str, Any]]):
+    """
+    Adds to each cell's defines (and uses) the globals written by the functions it calls, using the
+    definition visible at that cell: the latest one in the cell itself or an earlier cell. Idempotent.
+    """
+    visible: Dict[str, Dict[str, Set[str]]] = {}
+    for analysis in analyses:
+        visible.update(analysis["functions"])
+        effects: Set[str] = set()
+        pending, seen = list(analysis["calls"]), set()
+        while pending:
+            name = pending.pop()
+            if name in seen or name not in visible:
+                continue
+            seen.add(name)
+            effects |= visible[name]["writes"]
+            pending.extend(visible[name]["calls"])
+        # Mutating d through add("a") reads d first, unless the cell itself bound it
+        analysis["uses"] |= effects - analysis["defines"]
+        analysis["defines"] |= effects
+
+
+class NotebookState:
+    """What the session's namespace reflects: the last submitted cells and who last wrote each name."""
+    def __init__(self):
+        self.hashes: List[str] = []
+        self.records: List[Dict[str, Any]] = [] # Per cell: analysis, last result, ok
+        self.writers: Dict[str, int] = {} # name -> index of the cell whose run last wrote it
+        self.lock = threading.Lock()
+
+
+def plan_runs(analyses: List[Dict[str, Any]], hashes: List[str], state: Optional[NotebookState]) -> Tuple[Set[int], bool, Dict[int, int]]:
+    """
+    Decides which cells must run. Returns (indexes to run, restart needed, new index -> previous index
+    for cells that are unchanged since the previous submission).
+    """
+    count = len(analyses)
+    link_calls(analyses)
+    if state is None or not state.hashes:
+        return set(range(count)), False, {}
+
+    matcher = SequenceMatcher(a=state.hashes, b=hashes, autojunk=False)
+    previous_of: Dict[int, int] = {}
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            previous_of[block.b + offset] = block.a + offset
+    current_of = {old: new for new, old in previous_of.items()}
+
+    removed_defines: Set[str] = set()
+    for old_index, record in enumerate(state.records):
+        if old_index not in current_of:
+            removed_defines |= record["defines"]
+    # Translate the namespace's writers to the new numbering; a deleted writer counts as "after everything"
+    writers = {name: current_of.get(old_index, count) for name, old_index in state.writers.items()}
+
+    need = {index for index in range(count) if index not in previous_of or not state.records[previous_of[index]]["ok"]}
+    restart = False
+    while True:
+        before = len(need)
+        dirty = set(removed_defines)
+        rerun_all_after = False
+        for index, analysis in enumerate(analyses):
+            if rerun_all_after or index in need or (analysis["uses"] | analysis["defines"]) & dirty:
+                need.add(index)
+                dirty |= analysis["defines"]
+                rerun_all_after = rerun_all_after or analysis["opaque"]
+        for index in sorted(need):
+            for name in analyses[index]["uses"]:
+                writer = writers.get(name)
+                if writer is None or writer < index:
+                    continue
+                producers = [earlier for earlier in range(index) if name in analyses[earlier]["defines"]]
+                if producers:
+                    need.add(producers[-1])
+                else:
+                    restart = True
+        if restart:
+            return set(range(count)), True, {}
+        if len(need) == before:
+            return need, False, previous_of
+
+
+def run_notebook(session_id: str, cells: List[str], timeout: float = SESSION_CELL_TIMEOUT) -> Dict[str, Any]:
+    """
+    Runs a notebook in session_id, re-running only the cells affected since the last submission.
+    Returns {"cells": [...], "summary": {...}, "session_id"} - session_id changes if the session had to
+    be restarted. Raises SessionError (unknown/busy session, too many cells).
+    """
+    if len(cells) > NOTEBOOK_MAX_CELLS:
+        raise SessionError(f"Too many cells ({len(cells)}); the limit is {NOTEBOOK_MAX_CELLS}.", "unsupported")
+    manager = get_session_manager()
+    session = manager.get(session_id)
+    if session.language != "python":
+        raise SessionError("Notebook dependency tracking needs Python cells (it is based on the ast module).", "unsupported")
+    if session.notebook is None:
+        session.notebook = NotebookState()
+    state: NotebookState = session.notebook
+    if not state.lock.acquire(blocking=False):
+        raise SessionError("This notebook is already running.", "busy")
+    try:
+        start = time.perf_counter()
+        hashes = [cell_hash(code) for code in cells]
+        analyses = [analyze_cell(code) for code in cells]
+        need, restart, previous_of = plan_runs(analyses, hashes, state)
+        restart_reason = None
+        if restart:
+            # A re-run cell would read a value written by a later (or deleted) cell that nothing earlier redefines
+            restart_reason = "a re-run cell depends on state no earlier cell recreates"
+            logging.info(f"Notebook in session {session_id}: restarting session ({restart_reason}).")
+            fresh = NotebookState()
+            fresh.lock.acquire()
+            manager.close(session_id, "notebook restart")
+            session = manager.create("python")
+            session_id = session.session_id
+            session.notebook = fresh
+            # Nothing between here and the finally can raise, so each lock is released exactly once
+            previous_state, state = state, fresh
+            previous_state.lock.release()
+
+        previous_records = state.records
+        records: List[Dict[str, Any]] = []
+        # Namespace writers in the new numbering; values left by deleted cells stay "after everything"
+        current_of = {old: new for new, old in previous_of.items()}
+        writers = {name: current_of.get(index, len(cells)) for name, index in state.writers.items()}
+        rows: List[Dict[str, Any]] = []
+        failed_at = None
+        saved_time = 0.0
+        for index, code in enumerate(cells):
+            analysis = analyses[index]
+            row: Dict[str, Any] = {"index": index, "defines": sorted(analysis["defines"]), "uses": sorted(analysis["uses"])}
+            if index not in need:
+                previous = previous_records[previous_of[index]]
+                row.update(status=CACHED, **previous["result"])
+                saved_time += previous["result"].get("wall_time") or 0.0
+                records.append({**previous, "defines": analysis["defines"]})
+                rows.append(row)
+                continue
+            if failed_at is not None:
+                row.update(status=SKIPPED, output="", error="", return_code=None, wall_time=None)
+                records.append({"defines": analysis["defines"], "result": {}, "ok": False})
+                rows.append(row)
+                continue
+            run = manager.execute(session_id, code, timeout=timeout)
+            result = {"output": run["stdout"], "error": run["stderr"], "return_code": run["return_code"], "wall_time": run.get("wall_time")}
+            ok = run["return_code"] == 0 and not run["timed_out"]
+            row.update(status=RAN if ok else ERROR, **result)
+            records.append({"defines": analysis["defines"], "result": result, "ok": ok})
+            rows.append(row)
+            for name in analysis["defines"]:
+                writers[name] = index
+            if run.get("session_lost") or run.get("session_closed"):
+                # The kernel is gone, so nothing cached is valid any more
+                state.hashes, state.records, state.writers = [], [], {}
+                rows[-1]["session_closed"] = run.get("session_closed") or "kernel killed"
+                failed_at = index
+                continue
+            if not ok:
+                failed_at = index
+
+        if not rows or not any(row.get("session_closed") for row in rows):
+            state.hashes, state.records, state.writers = hashes, records, writers
+        ran = [row for row in rows if row["status"] in (RAN, ERROR)]
+        summary = {
+            "total": len(cells),
+            "ran": len(ran),
+            "cached": sum(1 for row in rows if row["status"] == CACHED),
+            "skipped": sum(1 for row in rows if row["status"] == SKIPPED),
+            "failed_cell": failed_at,
+            "run_time": round(sum(row.get("wall_time") or 0.0 for row in ran), 6),
+            "saved_time": round(saved_time, 6), # Previous run time of the cells served from cache
+            "wall_time": round(time.perf_counter() - start, 6),
+            "restarted": restart_reason,
+        }
+        logging.info(f"Notebook in session {session_id}: ran {summary['ran']}/{summary['total']} cells, {summary['cached']} cached.")
+        return {"cells": rows, "summary": summary, "session_id": session_id}
+    finally:
+        state.lock.release()
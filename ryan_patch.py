@@ -0,0 +1,192 @@
+import os
+import re
+import logging
+from difflib import SequenceMatcher
+from typing import Optional, Dict, Any, List, Tuple
+
+# --- Edit-Based Fix Application ---
+# Instead of re-emitting a whole corrected file, the model can answer with just the edits:
+#   SEARCH/REPLACE blocks           or   a unified diff
+#   <<<<<<< SEARCH                       --- a/file
+#   old lines                            +++ b/file
+#   =======                              @@ -3,2 +3,2 @@
+#   new lines                             context
+#   >>>>>>> REPLACE                      -old line
+#                                        +new line
+# Unified diff hunks are turned into search/replace pairs (context + removed lines ->
+# context + added lines); hunk line numbers are ignored, since models get them wrong.
+# Each edit's search text is located in the current code, always on whole lines (so
+# 'a = 1' never matches inside 'beta = 1'), trying in order:
+#   1. an exact match,
+#   2. a line match ignoring leading/trailing whitespace (re-indented or reflowed code),
+#   3. the most similar window of lines (difflib ratio >= RYAN_PATCH_FUZZ_THRESHOLD), with
+#      windows one line shorter or longer than the search text, for dropped/added blank lines.
+#      If a window that doesn't overlap the best one scores within RYAN_PATCH_FUZZ_TIE of it,
+#      the edit is ambiguous rather than applied to whichever came first.
+# Replacement lines are re-indented by the difference between the search text's and the
+# matched text's indentation. apply_edits raises PatchError when any edit can't be placed or
+# matches more than one place, so the caller can fall back to full regeneration.
+
+PATCH_FUZZ_THRESHOLD = float(os.getenv("RYAN_PATCH_FUZZ_THRESHOLD", "0.85"))
+PATCH_FUZZ_TIE = float(os.getenv("RYAN_PATCH_FUZZ_TIE", "0.02"))
+_SEARCH_REPLACE_RE = re.compile(r"^<{5,9} SEARCH[^\n]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} REPLACE[^\n]*$", re.DOTALL | re.MULTILINE)
+_HUNK_HEADER_RE = re.compile(r"^@@ .*@@")
+
+
+class PatchError(Exception):
+    """Raised when edits can't be parsed or applied."""
+
+
+def parse_search_replace(text: str) -> List[Tuple[str, str]]:
+    """(search, replace) pairs from SEARCH/REPLACE blocks."""
+    return [(match.group(1), match.group(2)) for match in _SEARCH_REPLACE_RE.finditer(text)]
+
+
+def parse_unified_diff(text: str) -> List[Tuple[str, str]]:
+    """(search, replace) pairs from the @@ hunks of a unified diff."""
+    edits = []
+    old_lines: Optional[List[str]] = None
+    new_lines: List[str] = []
+    for line in text.splitlines():
+        if _HUNK_HEADER_RE.match(line):
+            if old_lines is not None:
+                edits.append(("\n".join(old_lines) + "\n", "\n".join(new_lines) + "\n"))
+            old_lines, new_lines = [], []
+            continue
+        if old_lines is None or line.startswith(("--- ", "+++ ", "```")):
+            continue
+        if line.startswith("-"):
+            old_lines.append(line[1:])
+        elif line.startswith("+"):
+            new_lines.append(line[1:])
+        elif line.startswith("\\"):
+            continue # "\ No newline at end of file"
+        else:
+            # Context line (a blank line may have lost its leading space)
+            old_lines.append(line[1:] if line.startswith(" ") else line)
+            new_lines.append(line[1:] if line.startswith(" ") else line)
+    if old_lines is not None:
+        edits.append(("\n".join(old_lines) + "\n", "\n".join(new_lines) + "\n"))
+    return edits
+
+
+def parse_edits(text: str) -> List[Tuple[str, str]]:
+    """Edits from a model response: SEARCH/REPLACE blocks if present, else unified diff hunks."""
+    edits = parse_search_replace(text)
+    if not edits and re.search(r"^@@ ", text, re.MULTILINE):
+        edits = parse_unified_diff(text)
+    return edits
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _reindent(replace_lines: List[str], search_first: str, matched_first: str) -> List[str]:
+    """Shifts replace_lines by the indentation difference between the search text and the code it matched."""
+    search_indent, matched_indent = _indent(search_first), _indent(matched_first)
+    if search_indent == matched_indent:
+        return replace_lines
+    if matched_indent.startswith(search_indent):
+        extra = matched_indent[len(search_indent):]
+        return [extra + line if line.strip() else line for line in replace_lines]
+    if search_indent.startswith(matched_indent):
+        cut = len(search_indent) - len(matched_indent)
+        return [line[cut:] if line[:cut].strip() == "" else line.lstrip() for line in replace_lines]
+    return replace_lines
+
+
+def _locate(lines: List[str], search_lines: List[str]) -> Tuple[Optional[Tuple[int, int]], str, float]:
+    """Finds search_lines in lines. Returns ((start, end) or None, match kind, similarity)."""
+    size = len(search_lines)
+    stripped_search = [line.strip() for line in search_lines]
+    # 1. Exact match, 2. whitespace-insensitive line match
+    for kind, normalize in (("exact", lambda line: line), ("whitespace", str.strip)):
+        wanted = [normalize(line) for line in search_lines]
+        starts = [start for start in range(len(lines) - size + 1)
+                  if [normalize(line) for line in lines[start:start + size]] == wanted]
+        if len(starts) > 1:
+            return None, "ambiguous", 1.0
+        if starts:
+            return (starts[0], starts[0] + size), kind, 1.0
+    # 3. Most similar window; every window within PATCH_FUZZ_TIE of the best is scored, to detect ties
+    target = "\n".join(stripped_search)
+    best, best_ratio = None, 0.0
+    scored: List[Tuple[float, Tuple[int, int]]] = []
+    for window in (size, size - 1, size + 1):
+        if window <= 0:
+            continue
+        for start in range(len(lines) - window + 1):
+            candidate = "\n".join(line.strip() for line in lines[start:start + window])
+            matcher = SequenceMatcher(None, target, candidate, autojunk=False)
+            floor = best_ratio - PATCH_FUZZ_TIE
+            if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                continue
+            ratio = matcher.ratio()
+            scored.append((ratio, (start, start + window)))
+            if ratio > best_ratio:
+                best, best_ratio = (start, start + window), ratio
+    if best is None or best_ratio < PATCH_FUZZ_THRESHOLD:
+        return None, "none", round(best_ratio, 3)
+    runner_up = max((ratio for ratio, (start, end) in scored if end <= best[0] or start >= best[1]), default=0.0)
+    if runner_up >= best_ratio - PATCH_FUZZ_TIE:
+        return None, "ambiguous", round(best_ratio, 3)
+    return best, "fuzzy", round(best_ratio, 3)
+
+
+def apply_edits(source: str, edits: List[Tuple[str, str]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Applies (search, replace) edits in order. Returns (new source, per-edit report).
+    Raises PatchError if there are no edits or any edit can't be located.
+    """
+    if not edits:
+        raise PatchError("No edits found in the response.")
+    code = source
+    report = []
+    for index, (search, replace) in enumerate(edits):
+        if not search.strip():
+            # Nothing to find: the edit appends new code
+            code = code.rstrip("\n") + "\n" + replace
+            report.append({"edit": index, "match": "append"})
+            continue
+        preview = search.strip().splitlines()[0][:80]
+        lines = code.split("\n")
+        search_lines = search.rstrip("\n").split("\n")
+        span, kind, ratio = _locate(lines, search_lines)
+        if kind == "ambiguous":
+            raise PatchError(f"Edit {index + 1} matches more than one place in the code: {preview!r}")
+        if span is None:
+            raise PatchError(f"Edit {index + 1} did not match the code (best similarity {ratio}): {preview!r}")
+        start, end = span
+        replace_lines = replace.rstrip("\n").split("\n") if replace.strip() else []
+        replace_lines = _reindent(replace_lines, search_lines[0], lines[start])
+        lines[start:end] = replace_lines
+        code = "\n".join(lines)
+        report.append({"edit": index, "match": kind, "similarity": ratio, "lines": [start + 1, end]})
+    logging.info(f"Applied {len(edits)} edits: {[entry['match'] for entry in report]}")
+    return code, report
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for when the model reports no usage."""
+    return max(1, len(text) // 4)
+
+
+def token_savings(output_tokens: Optional[int], response_text: str, full_code: str, language: str) -> Dict[str, Any]:
+    """
+    Compares the edit response's output tokens with what re-emitting the whole fixed file would cost.
+    The full-file figure scales the measured tokens-per-character of this response to the fenced full code.
+    """
+    fenced = f"```{language}\n{full_code}\n```"
+    if output_tokens:
+        per_char = output_tokens / max(1, len(response_text))
+        full_tokens = max(1, round(per_char * len(fenced)))
+    else:
+        output_tokens, full_tokens = estimate_tokens(response_text), estimate_tokens(fenced)
+    saved = full_tokens - output_tokens
+    return {
+        "output_tokens": output_tokens,
+        "estimated_full_output_tokens": full_tokens,
+        "saved_tokens": saved,
+        "saved_pct": round(100.0 * saved / full_tokens, 1),
+    }
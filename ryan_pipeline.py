@@ -0,0 +1,89 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable, Union
+
+# --- Staged Request Pipeline ---
+# A request is processed by a list of steps. Each step is either a single Stage
+# or a list of Stages that run concurrently on a shared thread pool.
+# Any stage may short-circuit the pipeline by returning a response dict.
+# Inside a concurrent group, responses are honoured in list order (priority):
+# the group waits for higher-priority stages before accepting a lower-priority
+# stage's response, and stops waiting as soon as one is accepted.
+# Every stage's wall time is recorded in PipelineContext.timings (milliseconds).
+
+
+class PipelineContext:
+    """Per-request state shared between stages."""
+    def __init__(self, user_input: str, creative_context: Optional[str] = None):
+        self.user_input = user_input
+        self.lower_input = user_input.lower().strip()
+        self.creative_context = creative_context
+        self.data: Dict[str, Any] = {} # Stage outputs, keyed by whatever the stage chooses
+        self.timings: Dict[str, float] = {} # stage name -> milliseconds
+        self.short_circuited_by: Optional[str] = None
+
+
+class Stage:
+    """Base class for a pipeline stage. Return a response dict from run() to short-circuit."""
+    name = "stage"
+
+    def run(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class FunctionStage(Stage):
+    """Wraps a plain callable taking the context as a stage."""
+    def __init__(self, name: str, func: Callable[[PipelineContext], Optional[Dict[str, Any]]]):
+        self.name = name
+        self.func = func
+
+    def run(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        return self.func(ctx)
+
+
+class Pipeline:
+    """Runs stages in order, with concurrent groups, timing and short-circuiting."""
+    def __init__(self, name: str, steps: List[Union[Stage, List[Stage]]], executor: Optional[ThreadPoolExecutor] = None):
+        self.name = name
+        self.steps = steps
+        self.executor = executor or ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"{name}-stage")
+
+    def _timed(self, stage: Stage, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            return stage.run(ctx)
+        finally:
+            ctx.timings[stage.name] = round((time.perf_counter() - start) * 1000, 3)
+
+    def _run_group(self, stages: List[Stage], ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        futures = [(stage, self.executor.submit(self._timed, stage, ctx)) for stage in stages]
+        for stage, future in futures:
+            response = future.result() # Exceptions propagate just like in a sequential stage
+            if response is not None:
+                ctx.short_circuited_by = stage.name
+                # Stages that haven't started yet are dropped; running ones finish in the background
+                for _, other in futures:
+                    other.cancel()
+                return response
+        return None
+
+    def run(self, ctx: PipelineContext) -> Optional[Dict[str, Any]]:
+        """Runs the pipeline. Returns the first response produced, or None."""
+        pipeline_start = time.perf_counter()
+        try:
+            for step in self.steps:
+                if isinstance(step, list):
+                    group_start = time.perf_counter()
+                    response = self._run_group(step, ctx)
+                    ctx.timings["+".join(stage.name for stage in step)] = round((time.perf_counter() - group_start) * 1000, 3)
+                else:
+                    response = self._timed(step, ctx)
+                    if response is not None:
+                        ctx.short_circuited_by = step.name
+                if response is not None:
+                    return response
+            return None
+        finally:
+            ctx.timings["total"] = round((time.perf_counter() - pipeline_start) * 1000, 3)
+            logging.info(f"Pipeline '{self.name}' timings (ms): {ctx.timings} (short-circuited by: {ctx.short_circuited_by})")
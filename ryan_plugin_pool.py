@@ -0,0 +1,337 @@
+import os
+import sys
+import time
+import queue
+import pickle
+import logging
+import threading
+import traceback
+import importlib
+from typing import Optional, Dict, Any, List, Callable
+
+from ryan_workers import WorkerProcess
+
+try:
+    import resource # POSIX only - used for RSS/CPU limits inside the workers
+except ImportError:
+    resource = None
+
+# --- Process-Isolated Plugin Execution Pool ---
+# Third-party plugins normally run inside the API process (see RyanAI.run_plugin).
+# A plugin that leaks memory or burns CPU then degrades every request.
+# Plugins listed in RYAN_ISOLATED_PLUGINS are instead run inside a small pool of
+# warm worker processes. Each worker:
+#   - imports plugins once and keeps them loaded between calls (warm),
+#   - runs under RLIMIT_AS / RLIMIT_CPU hard limits (when the OS supports them),
+#   - reports its RSS and CPU time after every call so the pool can recycle it
+#     once it goes over the soft limits or after max_calls calls,
+#   - constructs plugin classes with a proxy instead of the RyanAI instance; the proxy's
+#     query_model() is answered by the API process over the same Pipe.
+# IPC is a single pickled tuple per message over a multiprocessing Pipe, so a call
+# costs a round trip of a few hundred microseconds instead of a fresh interpreter.
+
+ISOLATED_PLUGINS = {name.strip() for name in os.getenv("RYAN_ISOLATED_PLUGINS", "").split(",") if name.strip()}
+PLUGIN_POOL_SIZE = int(os.getenv("RYAN_PLUGIN_WORKERS", "2"))
+PLUGIN_MAX_CALLS = int(os.getenv("RYAN_PLUGIN_MAX_CALLS", "200"))
+PLUGIN_MAX_RSS_MB = int(os.getenv("RYAN_PLUGIN_MAX_RSS_MB", "256"))
+PLUGIN_MAX_CPU_SECONDS = float(os.getenv("RYAN_PLUGIN_MAX_CPU_SECONDS", "60"))
+PLUGIN_CALL_TIMEOUT = float(os.getenv("RYAN_PLUGIN_CALL_TIMEOUT", "15"))
+PLUGIN_ACQUIRE_TIMEOUT = float(os.getenv("RYAN_PLUGIN_ACQUIRE_TIMEOUT", "30")) # Longest wait for an idle worker
+
+# Message layouts (kept as plain tuples to keep the pickles small):
+#   request:        (call_id, plugin_name, entry_point, payload)
+#   response:       (call_id, ok, result_or_error, error_kind, rss_kb, cpu_seconds)
+#   model request:  (call_id, "query_model", prompt, temperature, max_new_tokens) - worker to API process
+#   model response: (call_id, text_or_None)
+_PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+class PluginWorkerError(Exception):
+    """Raised when an isolated plugin call fails (plugin error, crash or timeout)."""
+    def __init__(self, message: str, kind: str = "exception"):
+        super().__init__(message)
+        self.kind = kind # 'import_error', 'not_runnable', 'exception', 'timeout', 'crashed', 'unavailable'
+
+
+def _current_rss_kb() -> int:
+    """Returns the current resident set size of this process in KB."""
+    try:
+        # /proc/self/statm gives the *current* RSS (in pages), unlike ru_maxrss which is the peak
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return rss_pages * (os.sysconf("SC_PAGE_SIZE") // 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        if resource:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return 0
+
+
+def _cpu_seconds() -> float:
+    """Returns user + system CPU time consumed by this process."""
+    times = os.times()
+    return times.user + times.system
+
+
+def _plugin_class_name(plugin_name: str) -> str:
+    # Plugin classes follow the file naming convention: time_plugin.py -> TimePlugin
+    return "".join(part.capitalize() for part in plugin_name.split("_"))
+
+
+def _apply_worker_limits(max_rss_mb: int, max_cpu_seconds: float):
+    """Applies hard OS limits inside a worker. Soft limits are enforced by the pool."""
+    if resource is None:
+        return
+    try:
+        # Address space is larger than RSS (shared libs, arenas), so give it generous headroom.
+        # The pool recycles on the RSS soft limit long before this hard limit is hit.
+        address_space = max_rss_mb * 4 * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (address_space, address_space))
+    except (ValueError, OSError) as e:
+        logging.warning(f"Could not set RLIMIT_AS for plugin worker: {e}")
+    try:
+        # Hard CPU cap: the kernel sends SIGXCPU/SIGKILL if a plugin spins past it
+        cpu_cap = int(max_cpu_seconds) + 5
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_cap, cpu_cap + 5))
+    except (ValueError, OSError) as e:
+        logging.warning(f"Could not set RLIMIT_CPU for plugin worker: {e}")
+
+
+class _ModelProxy:
+    """
+    Stands in for the RyanAI instance that plugin classes are constructed with: the real one lives
+    in the API process, so query_model() is forwarded to it over the worker's connection.
+    """
+    def __init__(self, conn):
+        self._conn = conn
+        self.call_id = None
+
+    def query_model(self, prompt: str, temperature: Optional[float] = None, max_new_tokens: Optional[int] = None) -> Optional[str]:
+        self._conn.send_bytes(pickle.dumps((self.call_id, "query_model", prompt, temperature, max_new_tokens), protocol=_PICKLE_PROTOCOL))
+        _, text = pickle.loads(self._conn.recv_bytes())
+        return text
+
+
+def _plugin_worker_main(conn, max_rss_mb: int, max_cpu_seconds: float):
+    """Worker process loop: receive a call, run the plugin, send back the result."""
+    _apply_worker_limits(max_rss_mb, max_cpu_seconds)
+    modules = {} # plugin_name -> imported module (kept warm between calls)
+    instances = {} # plugin_name -> plugin class instance for handle_command calls
+    model_proxy = _ModelProxy(conn)
+
+    while True:
+        try:
+            message = conn.recv_bytes()
+        except (EOFError, OSError):
+            break # Parent went away
+        call_id, plugin_name, entry_point, payload = pickle.loads(message)
+        if call_id is None:
+            break # Shutdown request
+
+        ok, result, error_kind = False, None, None
+        model_proxy.call_id = call_id
+        try:
+            module = modules.get(plugin_name)
+            if module is None:
+                module = importlib.import_module(f"plugins.{plugin_name}")
+                modules[plugin_name] = module
+
+            if entry_point == "handle_command":
+                instance = instances.get(plugin_name)
+                if instance is None:
+                    plugin_class = getattr(module, _plugin_class_name(plugin_name), None)
+                    if plugin_class is None:
+                        raise PluginWorkerError(f"Plugin '{plugin_name}' has no class '{_plugin_class_name(plugin_name)}'.", "not_runnable")
+                    # The RyanAI instance lives in the API process and cannot cross the process boundary
+                    instance = plugin_class(model_proxy)
+                    instances[plugin_name] = instance
+                result = instance.handle_command(payload)
+            else:
+                entry = getattr(module, entry_point, None)
+                if not callable(entry):
+                    raise PluginWorkerError(f"Plugin '{plugin_name}' does not have a '{entry_point}' function.", "not_runnable")
+                result = entry(payload)
+            ok = True
+        except PluginWorkerError as e:
+            result, error_kind = str(e), e.kind
+        except ImportError as e:
+            result, error_kind = f"Plugin '{plugin_name}' not found: {e}", "import_error"
+        except MemoryError:
+            result, error_kind = f"Plugin '{plugin_name}' ran out of memory.", "exception"
+        except Exception as e:
+            result, error_kind = f"{type(e).__name__}: {e}\n{traceback.format_exc()}", "exception"
+
+        try:
+            response = pickle.dumps((call_id, ok, result, error_kind, _current_rss_kb(), _cpu_seconds()), protocol=_PICKLE_PROTOCOL)
+        except Exception as e:
+            # Plugin returned something that cannot be pickled - report it instead of dying
+            response = pickle.dumps((call_id, False, f"Plugin result is not serializable: {e}", "exception", _current_rss_kb(), _cpu_seconds()), protocol=_PICKLE_PROTOCOL)
+        try:
+            conn.send_bytes(response)
+        except (EOFError, OSError):
+            break
+
+
+class _PluginWorker:
+    """Handle for a single worker process, owned by PluginWorkerPool."""
+    def __init__(self, max_rss_mb: int, max_cpu_seconds: float):
+        self.process = WorkerProcess("ryan_plugin_pool", "_plugin_worker_main", [max_rss_mb, max_cpu_seconds])
+        self.conn = self.process.conn
+        self.calls = 0
+        self.rss_kb = 0
+        self.cpu_seconds = 0.0
+        self.started_at = time.time()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self, timeout: float = 1.0):
+        try:
+            if self.process.is_alive():
+                self.conn.send_bytes(pickle.dumps((None, None, None, None), protocol=_PICKLE_PROTOCOL))
+                self.process.join(timeout)
+        except (EOFError, OSError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout)
+        self.conn.close()
+
+
+class PluginWorkerPool:
+    """A pool of warm worker processes that run plugins out-of-process."""
+    def __init__(self, size: int = PLUGIN_POOL_SIZE, max_calls: int = PLUGIN_MAX_CALLS,
+                 max_rss_mb: int = PLUGIN_MAX_RSS_MB, max_cpu_seconds: float = PLUGIN_MAX_CPU_SECONDS,
+                 call_timeout: float = PLUGIN_CALL_TIMEOUT):
+        self.size = max(1, size)
+        self.max_calls = max_calls
+        self.max_rss_mb = max_rss_mb
+        self.max_cpu_seconds = max_cpu_seconds
+        self.call_timeout = call_timeout
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._call_counter = 0
+        self._closed = False
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "recycled": 0, "crashed": 0}
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        logging.info(f"PluginWorkerPool started with {self.size} workers (max_calls={max_calls}, max_rss_mb={max_rss_mb}, max_cpu_seconds={max_cpu_seconds}).")
+
+    def _spawn(self) -> _PluginWorker:
+        return _PluginWorker(self.max_rss_mb, self.max_cpu_seconds)
+
+    def _recycle(self, worker: _PluginWorker, reason: str) -> _PluginWorker:
+        logging.info(f"Recycling plugin worker pid={worker.process.pid} ({reason}) after {worker.calls} calls, rss={worker.rss_kb}KB, cpu={worker.cpu_seconds:.2f}s.")
+        self.stats["recycled"] += 1
+        worker.stop()
+        try:
+            return self._spawn()
+        except Exception as e:
+            # Hand back the stopped worker so the pool keeps its size; the next call finds it dead and respawns it
+            logging.error(f"Could not start a replacement plugin worker: {e}")
+            return worker
+
+    def _receive(self, worker: _PluginWorker, call_id: int, timeout: float, query_model: Optional[Callable]) -> tuple:
+        """Waits for the call's response, serving the plugin's query_model requests meanwhile. None on timeout."""
+        while True:
+            if not worker.conn.poll(timeout):
+                return None
+            message = pickle.loads(worker.conn.recv_bytes())
+            if len(message) == 6:
+                return message
+            _, _, prompt, temperature, max_new_tokens = message
+            try:
+                text = query_model(prompt, temperature=temperature, max_new_tokens=max_new_tokens) if query_model else None
+            except Exception as e:
+                logging.error(f"query_model for isolated plugin failed: {e}")
+                text = None
+            worker.conn.send_bytes(pickle.dumps((call_id, text), protocol=_PICKLE_PROTOCOL))
+
+    def call(self, plugin_name: str, payload: Any, entry_point: str = "run", timeout: Optional[float] = None,
+             query_model: Optional[Callable[..., Optional[str]]] = None) -> Any:
+        """
+        Runs `plugins.<plugin_name>.<entry_point>(payload)` in a worker and returns its result. query_model serves
+        the plugin's self.ryan_ai.query_model() calls (the timeout applies to the plugin's own work between them).
+        Raises PluginWorkerError if the plugin fails, the worker crashes, the call times out or no worker frees up.
+        """
+        if self._closed:
+            raise PluginWorkerError("Plugin worker pool is shut down.", "crashed")
+        timeout = timeout if timeout is not None else self.call_timeout
+        try:
+            worker = self._idle.get(timeout=PLUGIN_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise PluginWorkerError(f"No plugin worker became available within {PLUGIN_ACQUIRE_TIMEOUT} seconds.", "unavailable")
+        with self._lock:
+            self._call_counter += 1
+            call_id = self._call_counter
+            self.stats["calls"] += 1
+
+        try:
+            if not worker.is_alive():
+                worker = self._recycle(worker, "found dead")
+            worker.conn.send_bytes(pickle.dumps((call_id, plugin_name, entry_point, payload), protocol=_PICKLE_PROTOCOL))
+
+            try:
+                response = self._receive(worker, call_id, timeout, query_model)
+            except (EOFError, OSError):
+                # Worker died mid-call (segfault, RLIMIT hit, OOM kill)
+                self.stats["crashed"] += 1
+                worker = self._recycle(worker, "crashed during call")
+                raise PluginWorkerError(f"Plugin '{plugin_name}' crashed the worker process.", "crashed")
+            if response is None:
+                # Plugin is stuck (infinite loop, blocking I/O) - kill the worker, never reuse it
+                self.stats["timeouts"] += 1
+                worker.process.kill()
+                worker = self._recycle(worker, "call timed out")
+                raise PluginWorkerError(f"Plugin '{plugin_name}' timed out after {timeout} seconds.", "timeout")
+            _, ok, result, error_kind, rss_kb, cpu_seconds = response
+
+            worker.calls += 1
+            worker.rss_kb = rss_kb
+            worker.cpu_seconds = cpu_seconds
+
+            # Soft limits: recycle after the call so the next request gets a fresh worker
+            if worker.calls >= self.max_calls:
+                worker = self._recycle(worker, "max calls reached")
+            elif rss_kb > self.max_rss_mb * 1024:
+                worker = self._recycle(worker, "RSS over limit")
+            elif cpu_seconds > self.max_cpu_seconds:
+                worker = self._recycle(worker, "CPU time over limit")
+
+            if not ok:
+                self.stats["errors"] += 1
+                raise PluginWorkerError(result, error_kind or "exception")
+            return result
+        finally:
+            self._idle.put(worker)
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        """Returns a snapshot of the idle workers (pid, calls, rss, cpu)."""
+        snapshot = []
+        for worker in list(self._idle.queue):
+            snapshot.append({"pid": worker.process.pid, "calls": worker.calls, "rss_kb": worker.rss_kb,
+                             "cpu_seconds": round(worker.cpu_seconds, 3), "alive": worker.is_alive()})
+        return snapshot
+
+    def shutdown(self):
+        self._closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait().stop()
+        logging.info("PluginWorkerPool shut down.")
+
+
+_plugin_pool = None
+_plugin_pool_lock = threading.Lock()
+
+
+def get_plugin_pool() -> PluginWorkerPool:
+    """Returns the shared plugin pool, starting it on first use."""
+    global _plugin_pool
+    with _plugin_pool_lock:
+        if _plugin_pool is None:
+            _plugin_pool = PluginWorkerPool()
+        return _plugin_pool
+
+
+def is_isolated(plugin_name: str) -> bool:
+    """True if the plugin is configured to run in the worker pool."""
+    return plugin_name in ISOLATED_PLUGINS or "*" in ISOLATED_PLUGINS
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import glob
+import shutil
+import logging
+import tempfile
+from typing import Optional, Dict, Any, List, Tuple
+
+from ryan_exec_scheduler import run_limited
+
+# --- Profiling Mode ---
+# execute_code(profile=True) runs the snippet under a profiler instead of plain:
+#   - Python: cProfile for per-function call counts and self/cumulative time, tracemalloc for the
+#     allocation sites still holding memory at exit and the traced peak,
+#   - Node: V8's --cpu-prof (sampling CPU profile) and --heap-prof (sampling heap profile).
+# The raw profiles are reduced to a ranked hot-function table, a top-allocation list and
+# totals, plus a few-line text summary that analyze_code can take as compact context.
+# Profilers add overhead (cProfile roughly 2x on call-heavy code), so timings are relative.
+
+PROFILE_TOP_N = int(os.getenv("RYAN_PROFILE_TOP_N", "10"))
+NODE_CPU_PROF_INTERVAL_US = int(os.getenv("RYAN_PROFILE_NODE_INTERVAL_US", "100")) # V8 default is 1000
+PROFILED_LANGUAGES = ("python", "javascript")
+
+# Written to the run's workspace and run as a script: argv = code file, output JSON file, top N.
+# Being a real file keeps its frames apart from the snippet's, which is compiled as "<string>"
+# so tracebacks match a plain `python -c` run.
+_PYTHON_PROFILE_DRIVER = r'''
+import sys, json, time, linecache, cProfile, pstats, tracemalloc, traceback
+code_path, out_path, top_n = sys.argv[1], sys.argv[2], int(sys.argv[3])
+with open(code_path, encoding="utf-8") as code_file:
+    code = code_file.read()
+sys.argv = ["-c"]
+sys.path[0] = "" # As for `python -c`: imports resolve from the working directory, not the workspace
+linecache.cache["<string>"] = (len(code), None, code.splitlines(True), "<string>")
+namespace = {"__name__": "__main__", "__builtins__": __builtins__, "__doc__": None}
+profiler = cProfile.Profile()
+profiled = False
+snapshot = None
+traced_peak = 0
+exit_code = 0
+cpu_time = 0.0
+try:
+    compiled = compile(code, "<string>", "exec")
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    profiler.enable()
+    profiled = True
+    try:
+        exec(compiled, namespace)
+    finally:
+        # Stop measuring before error handling and reporting allocate anything
+        profiler.disable()
+        cpu_time = time.process_time() - cpu_start
+        snapshot = tracemalloc.take_snapshot()
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+except SystemExit as e:
+    if isinstance(e.code, int) or e.code is None:
+        exit_code = e.code or 0
+    else:
+        print(e.code, file=sys.stderr)
+        exit_code = 1
+except BaseException as e:
+    tb = e.__traceback__.tb_next if e.__traceback__ else None
+    sys.stderr.write("".join(traceback.format_exception(type(e), e, tb)))
+    exit_code = 1
+try:
+    sys.stdout.flush()
+except Exception:
+    pass
+
+functions = []
+for (filename, line, name), (primitive_calls, calls, self_time, cumulative_time, _) in (pstats.Stats(profiler).stats.items() if profiled else []):
+    if filename == __file__ or name in ("<built-in method builtins.exec>", "<method 'disable' of '_lsprof.Profiler' objects>"):
+        continue # The driver's own frames
+    functions.append({"function": name, "file": filename, "line": line, "calls": calls,
+                      "primitive_calls": primitive_calls, "self_s": self_time, "cumulative_s": cumulative_time})
+functions.sort(key=lambda f: f["self_s"], reverse=True)
+
+allocations = []
+if snapshot is not None:
+    ignored = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    for stat in snapshot.filter_traces(ignored).statistics("lineno")[:top_n]:
+        frame = stat.traceback[0]
+        allocations.append({"file": frame.filename, "line": frame.lineno, "size": stat.size, "count": stat.count,
+                            "source": linecache.getline(frame.filename, frame.lineno).strip()})
+
+with open(out_path, "w", encoding="utf-8") as out_file:
+    json.dump({"functions": functions[:top_n], "function_count": len(functions), "allocations": allocations,
+               "cpu_time": cpu_time, "traced_peak": traced_peak}, out_file)
+sys.exit(exit_code)
+'''
+
+
+def _python_location(filename: str, line: int) -> str:
+    if filename == "<string>":
+        return f"line {line}"
+    if filename == "~":
+        return "built-in"
+    return f"{os.path.basename(filename)}:{line}"
+
+
+def _reduce_python_profile(raw: Dict[str, Any]) -> Dict[str, Any]:
+    total_self = sum(f["self_s"] for f in raw["functions"]) or 1e-9
+    hot = [{
+        "function": f["function"],
+        "location": _python_location(f["file"], f["line"]),
+        "calls": f["calls"],
+        "self_ms": round(f["self_s"] * 1000, 3),
+        "cumulative_ms": round(f["cumulative_s"] * 1000, 3),
+        "self_pct": round(f["self_s"] / total_self * 100, 1),
+        "user_code": f["file"] == "<string>",
+    } for f in raw["functions"]]
+    allocations = [{
+        "location": _python_location(a["file"], a["line"]),
+        "size_kb": round(a["size"] / 1024, 1),
+        "count": a["count"],
+        "source": a["source"],
+    } for a in raw["allocations"]]
+    return {
+        "tool": "cProfile + tracemalloc",
+        "hot_functions": hot,
+        "allocations": allocations,
+        "allocations_kind": "live at exit",
+        "total_cpu_ms": round(raw["cpu_time"] * 1000, 3),
+        "peak_traced_memory_kb": round(raw["traced_peak"] / 1024, 1),
+    }
+
+
+def _node_frame_key(call_frame: Dict[str, Any]) -> Tuple[str, str, int]:
+    return (call_frame["functionName"] or "(anonymous)", call_frame["url"], call_frame["lineNumber"])
+
+
+def _node_location(url: str, line: int) -> str:
+    if url == "[eval]":
+        return f"line {line + 1}" # V8 lines are 0-based
+    if not url:
+        return "V8"
+    return f"{url}:{line + 1}"
+
+
+def _reduce_cpu_profile(profile: Dict[str, Any], top_n: int) -> Tuple[List[Dict[str, Any]], float]:
+    """Per-function self and cumulative time from a .cpuprofile (recursion counted once)."""
+    nodes = {node["id"]: node for node in profile["nodes"]}
+    self_us: Dict[int, float] = {}
+    # timeDeltas[i] is the time since the previous sample, i.e. roughly how long sample i-1 ran
+    samples, deltas = profile.get("samples", []), profile.get("timeDeltas", [])
+    for i, node_id in enumerate(samples):
+        duration = deltas[i + 1] if i + 1 < len(deltas) else 0
+        self_us[node_id] = self_us.get(node_id, 0) + max(duration, 0)
+
+    totals: Dict[Tuple[str, str, int], Dict[str, float]] = {}
+
+    def visit(node_id: int, on_stack: frozenset) -> float:
+        node = nodes[node_id]
+        key = _node_frame_key(node["callFrame"])
+        subtree = self_us.get(node_id, 0) + sum(visit(child, on_stack | {key}) for child in node.get("children", []))
+        entry = totals.setdefault(key, {"self": 0.0, "cumulative": 0.0, "samples": 0})
+        entry["self"] += self_us.get(node_id, 0)
+        entry["samples"] += node.get("hitCount", 0)
+        if key not in on_stack: # Only the outermost frame of a recursive chain adds to cumulative time
+            entry["cumulative"] += subtree
+        return subtree
+
+    root_id = profile["nodes"][0]["id"]
+    total_us = visit(root_id, frozenset())
+    skipped = {"(root)", "(program)", "(idle)"}
+    hot = []
+    for (name, url, line), entry in totals.items():
+        if name in skipped or url.startswith("node:") or entry["self"] <= 0:
+            continue # Node's own bootstrap, not the snippet
+        hot.append({
+            "function": name,
+            "location": _node_location(url, line),
+            "samples": entry["samples"],
+            "self_ms": round(entry["self"] / 1000, 3),
+            "cumulative_ms": round(entry["cumulative"] / 1000, 3),
+            "self_pct": round(entry["self"] / (total_us or 1) * 100, 1),
+            "user_code": url == "[eval]",
+        })
+    hot.sort(key=lambda f: f["self_ms"], reverse=True)
+    return hot[:top_n], total_us / 1000
+
+
+def _reduce_heap_profile(profile: Dict[str, Any], top_n: int) -> List[Dict[str, Any]]:
+    """Sampled allocation sites from a .heapprofile, largest first."""
+    sites: Dict[Tuple[str, str, int], int] = {}
+    stack = [profile["head"]]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.get("children", []))
+        if node.get("selfSize"):
+            key = _node_frame_key(node["callFrame"])
+            sites[key] = sites.get(key, 0) + node["selfSize"]
+    ranked = sorted(sites.items(), key=lambda item: item[1], reverse=True)
+    # Snippet allocations first: Node's own startup allocations are rarely what the user is after
+    ranked.sort(key=lambda item: item[0][1] != "[eval]")
+    return [{"location": _node_location(url, line), "function": name, "size_kb": round(size / 1024, 1)}
+            for (name, url, line), size in ranked[:top_n]]
+
+
+def format_profile_summary(profile: Dict[str, Any], run: Optional[Dict[str, Any]] = None) -> str:
+    """A few lines describing where time and memory went, compact enough for a model prompt."""
+    if profile.get("error"):
+        return f"Profile unavailable: {profile['error']}"
+    totals = [f"CPU {profile['total_cpu_ms']:.1f} ms"]
+    if profile.get("peak_traced_memory_kb") is not None:
+        totals.append(f"peak traced memory {profile['peak_traced_memory_kb'] / 1024:.2f} MB")
+    if run and run.get("peak_rss_kb"):
+        totals.append(f"peak RSS {run['peak_rss_kb'] / 1024:.1f} MB")
+    lines = [f"Profile ({profile['tool']}): " + ", ".join(totals)]
+    if profile["hot_functions"]:
+        lines.append("Hot functions by self time:")
+        for rank, f in enumerate(profile["hot_functions"], 1):
+            count = f"{f['calls']} calls" if "calls" in f else f"{f['samples']} samples"
+            lines.append(f"  {rank}. {f['function']} ({f['location']}): self {f['self_ms']:.1f} ms ({f['self_pct']}%), "
+                         f"cumulative {f['cumulative_ms']:.1f} ms, {count}")
+    if profile["allocations"]:
+        lines.append(f"Top allocations ({profile['allocations_kind']}):")
+        for a in profile["allocations"]:
+            detail = f" in {a['count']} blocks" if "count" in a else ""
+            source = f": {a['source']}" if a.get("source") else (f" [{a['function']}]" if a.get("function") else "")
+            lines.append(f"  {a['location']}: {a['size_kb']} KB{detail}{source}")
+    return "\n".join(lines)
+
+
+def run_profiled(code: str, language: str, stdin: Optional[str] = None, timeout: float = 30,
+                 top_n: int = PROFILE_TOP_N) -> Dict[str, Any]:
+    """
+    Runs code under the language's profiler. Returns run_limited's fields plus "profile"
+    (hot_functions, allocations, totals and a text "summary").
+    Raises ValueError for languages without a profiler and FileNotFoundError for a missing interpreter.
+    """
+    language = language.lower()
+    if language not in PROFILED_LANGUAGES:
+        raise ValueError(f"Profiling is supported for {', '.join(PROFILED_LANGUAGES)}, not {language}.")
+    workspace = tempfile.mkdtemp(prefix="ryan_profile_")
+    try:
+        if language == "python":
+            driver_path = os.path.join(workspace, "profile_driver.py")
+            code_path = os.path.join(workspace, "snippet.py")
+            out_path = os.path.join(workspace, "profile.json")
+            with open(driver_path, "w", encoding="utf-8") as driver_file:
+                driver_file.write(_PYTHON_PROFILE_DRIVER)
+            with open(code_path, "w", encoding="utf-8") as code_file:
+                code_file.write(code)
+            command = [sys.executable, driver_path, code_path, out_path, str(top_n)]
+        else:
+            command = ["node", "--cpu-prof", "--cpu-prof-dir", workspace, "--cpu-prof-interval", str(NODE_CPU_PROF_INTERVAL_US),
+                       "--heap-prof", "--heap-prof-dir", workspace, "-e", code]
+        run = run_limited(command, language, stdin=stdin, timeout=timeout)
+
+        try:
+            if language == "python":
+                with open(out_path, encoding="utf-8") as out_file:
+                    profile = _reduce_python_profile(json.load(out_file))
+            else:
+                with open(glob.glob(os.path.join(workspace, "*.cpuprofile"))[0], encoding="utf-8") as cpu_file:
+                    hot, total_ms = _reduce_cpu_profile(json.load(cpu_file), top_n)
+                heap_files = glob.glob(os.path.join(workspace, "*.heapprofile"))
+                allocations = []
+                if heap_files:
+                    with open(heap_files[0], encoding="utf-8") as heap_file:
+                        allocations = _reduce_heap_profile(json.load(heap_file), top_n)
+                profile = {"tool": "V8 --cpu-prof + --heap-prof", "hot_functions": hot, "allocations": allocations,
+                           "allocations_kind": "sampled, live at exit", "total_cpu_ms": round(total_ms, 3)}
+        except (OSError, IndexError, ValueError, KeyError) as e:
+            # Killed runs (timeout, rlimit) exit before the profiler writes anything
+            logging.warning(f"No {language} profile was produced: {e}")
+            profile = {"error": "The run ended before a profile was written (timed out or killed)."}
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    profile["summary"] = format_profile_summary(profile, run)
+    run["profile"] = profile
+    return run
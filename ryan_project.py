@@ -0,0 +1,549 @@
+import io
+import os
+import re
+import ast
+import json
+import time
+import base64
+import hashlib
+import logging
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import posixpath
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable
+
+from ryan_chunked_analysis import analyze_chunked, ANALYSIS_CHUNK_THRESHOLD_LINES
+
+# --- Project-Level Incremental Analysis ---
+# Analyses a whole project (a directory on the server or an uploaded zip/tar archive)
+# instead of one file:
+#   1. load     - Python and JavaScript sources, skipping VCS, dependency and build
+#                 directories (RYAN_PROJECT_MAX_FILES / RYAN_PROJECT_MAX_FILE_BYTES caps, and
+#                 RYAN_PROJECT_MAX_TOTAL_BYTES for everything read). Sizes are checked before
+#                 a file or archive member is read, so a zip bomb is refused, not inflated.
+#                 Server paths must resolve (symlinks included) inside RYAN_PROJECT_ROOT;
+#                 without it only uploaded archives are accepted.
+#   2. graph    - imports resolved to modules of the project: Python absolute and relative
+#                 imports (`from . import x`, `from pkg import mod`), JavaScript relative
+#                 require()/import/import() with extension and index.js resolution.
+#                 Import cycles are collapsed into strongly connected components.
+#   3. analyse  - modules are summarised layer by layer in dependency order, each layer in
+#                 parallel (RYAN_PROJECT_CONCURRENCY), with the summaries of the module's
+#                 dependencies in its prompt. Large modules go through the chunked
+#                 map-reduce analysis (ryan_chunked_analysis.py).
+#   4. store    - summaries live in sqlite (RYAN_PROJECT_DB) under a Merkle key:
+#                 sha256(module content hash + the keys of its dependencies). A changed module
+#                 changes its key and the key of everything that depends on it, so a
+#                 re-submission re-analyses exactly those modules and reuses the rest.
+# Whole-project questions are answered from the stored summaries and the import graph,
+# without re-reading the code (most relevant modules first when they don't all fit).
+
+PROJECT_DB_PATH = os.getenv("RYAN_PROJECT_DB", os.path.join(tempfile.gettempdir(), "ryan_projects.sqlite3"))
+PROJECT_CONCURRENCY = int(os.getenv("RYAN_PROJECT_CONCURRENCY", "4"))
+PROJECT_MAX_FILES = int(os.getenv("RYAN_PROJECT_MAX_FILES", "2000"))
+PROJECT_MAX_FILE_BYTES = int(os.getenv("RYAN_PROJECT_MAX_FILE_BYTES", str(1024 * 1024)))
+PROJECT_MAX_TOTAL_BYTES = int(os.getenv("RYAN_PROJECT_MAX_TOTAL_BYTES", str(64 * 1024 * 1024)))
+PROJECT_ROOT = os.getenv("RYAN_PROJECT_ROOT") # Directory server-side project paths must be under (unset = archives only)
+PROJECT_ASK_MAX_CHARS = int(os.getenv("RYAN_PROJECT_ASK_MAX_CHARS", "120000"))
+PROJECT_MODULE_MAX_CHARS = 60000 # Larger modules are analysed in chunks even under the line threshold
+_SUMMARY_PROMPT_VERSION = "1" # Part of every summary key; bump when the module prompt changes
+
+_SOURCE_EXTENSIONS = {".py": "python", ".js": "javascript", ".mjs": "javascript", ".cjs": "javascript"}
+SKIPPED_DIRECTORIES = {".git", ".hg", ".svn", "node_modules", "__pycache__", "venv", ".venv", "env", "site-packages",
+                        "dist", "build", ".tox", ".mypy_cache", ".pytest_cache", ".idea", ".vscode"}
+_JS_IMPORT_RE = re.compile(r"""(?:\brequire\s*\(\s*|\bimport\s*\(\s*|\bfrom\s+|^\s*import\s+)['"]([^'"]+)['"]""", re.MULTILINE)
+
+
+class ProjectError(Exception):
+    """Raised for unusable project input (nothing to analyse, bad archive, unknown project)."""
+
+
+# --- Loading ---
+
+def _wanted(relative_path: str) -> bool:
+    parts = relative_path.split("/")
+    if any(part in SKIPPED_DIRECTORIES or part.startswith(".") for part in parts[:-1]):
+        return False
+    return os.path.splitext(relative_path)[1].lower() in _SOURCE_EXTENSIONS
+
+
+def _within(root: str, target: str) -> bool:
+    return os.path.commonpath([root, target]) == root
+
+
+def resolve_project_path(path: str) -> str:
+    """Real path of a server-side project path (relative paths are taken from RYAN_PROJECT_ROOT). Raises ProjectError outside the root."""
+    if not PROJECT_ROOT:
+        raise ProjectError("Server-side project paths are disabled (RYAN_PROJECT_ROOT is not set); upload an archive instead.")
+    root = os.path.realpath(PROJECT_ROOT)
+    target = os.path.realpath(os.path.join(root, path))
+    if not _within(root, target):
+        raise ProjectError(f"{path} is outside the project root.")
+    return target
+
+
+def _add_file(files: Dict[str, str], relative_path: str, size: int, read: Callable[[int], bytes], budget: List[int]):
+    """Reads one source file if it is within the per-file cap; budget[0] is what's left of RYAN_PROJECT_MAX_TOTAL_BYTES."""
+    if len(files) >= PROJECT_MAX_FILES:
+        raise ProjectError(f"The project has more than {PROJECT_MAX_FILES} source files.")
+    if size > PROJECT_MAX_FILE_BYTES:
+        logging.warning(f"Skipping {relative_path}: larger than {PROJECT_MAX_FILE_BYTES} bytes.")
+        return
+    if size > budget[0]:
+        raise ProjectError(f"The project's sources are larger than {PROJECT_MAX_TOTAL_BYTES} bytes.")
+    data = read(PROJECT_MAX_FILE_BYTES + 1) # The declared size can lie; never read past the cap
+    budget[0] -= len(data)
+    if len(data) > PROJECT_MAX_FILE_BYTES:
+        logging.warning(f"Skipping {relative_path}: larger than {PROJECT_MAX_FILE_BYTES} bytes.")
+        return
+    try:
+        files[relative_path] = data.decode("utf-8")
+    except UnicodeDecodeError:
+        logging.warning(f"Skipping {relative_path}: not UTF-8.")
+
+
+def _read_file(path: str, limit: int) -> bytes:
+    with open(path, "rb") as handle:
+        return handle.read(limit)
+
+
+def load_project_files(path: Optional[str] = None, archive: Optional[bytes] = None, archive_name: Optional[str] = None) -> Dict[str, str]:
+    """
+    Source files of a directory under RYAN_PROJECT_ROOT or a zip/tar(.gz) archive: {relative posix path: text}.
+    Archives are read in memory, never extracted. Raises ProjectError for paths outside the root and oversized input.
+    """
+    files: Dict[str, str] = {}
+    budget = [PROJECT_MAX_TOTAL_BYTES]
+    if path:
+        root = resolve_project_path(path)
+        if not os.path.isdir(root):
+            if os.path.isfile(root):
+                if os.path.getsize(root) > PROJECT_MAX_TOTAL_BYTES:
+                    raise ProjectError(f"{os.path.basename(root)} is larger than {PROJECT_MAX_TOTAL_BYTES} bytes.")
+                return load_project_files(archive=_read_file(root, PROJECT_MAX_TOTAL_BYTES), archive_name=os.path.basename(root))
+            raise ProjectError(f"No such directory: {path}")
+        for directory, subdirectories, names in os.walk(root):
+            subdirectories[:] = sorted(d for d in subdirectories if d not in SKIPPED_DIRECTORIES and not d.startswith("."))
+            for name in sorted(names):
+                relative = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/")
+                full_path = os.path.realpath(os.path.join(directory, name))
+                if not _wanted(relative) or not os.path.isfile(full_path):
+                    continue
+                if not _within(root, full_path):
+                    logging.warning(f"Skipping {relative}: it links outside the project.")
+                    continue
+                _add_file(files, relative, os.path.getsize(full_path), lambda limit, full_path=full_path: _read_file(full_path, limit), budget)
+    elif archive is not None:
+        members: List[Tuple[str, int, Callable[[int], bytes]]] = []
+        if zipfile.is_zipfile(io.BytesIO(archive)):
+            bundle = zipfile.ZipFile(io.BytesIO(archive))
+            members = [(info.filename, info.file_size, lambda limit, info=info: bundle.open(info).read(limit))
+                       for info in bundle.infolist() if not info.is_dir()]
+        else:
+            try:
+                bundle = tarfile.open(fileobj=io.BytesIO(archive), mode="r:*")
+            except tarfile.TarError:
+                raise ProjectError(f"{archive_name or 'The archive'} is not a zip or tar archive.")
+            members = [(info.name, info.size, lambda limit, info=info: bundle.extractfile(info).read(limit))
+                       for info in bundle.getmembers() if info.isfile()]
+        for name, size, read in members:
+            relative = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+            if relative.startswith("..") or not _wanted(relative):
+                continue
+            _add_file(files, relative, size, read, budget)
+        # An archive of a single top-level folder: make paths relative to it
+        tops = {relative.split("/")[0] for relative in files}
+        if len(tops) == 1 and all("/" in relative for relative in files):
+            prefix = next(iter(tops)) + "/"
+            files = {relative[len(prefix):]: text for relative, text in files.items()}
+    if not files:
+        raise ProjectError("No Python or JavaScript source files found.")
+    return files
+
+
+# --- Dependency graph ---
+
+def _python_module_name(relative_path: str) -> str:
+    name = relative_path[:-3].replace("/", ".")
+    return name[:-9] if name.endswith(".__init__") else name
+
+
+def _python_imports(relative_path: str, code: str, modules: Dict[str, str]) -> Set[str]:
+    """Project files imported by a Python file (modules maps module name -> path)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    package = _python_module_name(relative_path)
+    if not relative_path.endswith("__init__.py"):
+        package = package.rpartition(".")[0]
+    found: Set[str] = set()
+
+    def resolve(name: str):
+        # The longest prefix that is a project module (import a.b.c may refer to package a.b)
+        parts = name.split(".")
+        for length in range(len(parts), 0, -1):
+            candidate = ".".join(parts[:length])
+            if candidate in modules:
+                found.add(modules[candidate])
+                return
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                resolve(alias.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base_parts = package.split(".") if package else []
+                base_parts = base_parts[:len(base_parts) - (node.level - 1)] if node.level > 1 else base_parts
+                base = ".".join(part for part in base_parts + ([node.module] if node.module else []) if part)
+            else:
+                base = node.module or ""
+            for alias in node.names:
+                # from pkg import mod (a submodule) or from pkg import name (an attribute of pkg)
+                if base and f"{base}.{alias.name}" in modules:
+                    found.add(modules[f"{base}.{alias.name}"])
+                elif base:
+                    resolve(base)
+    found.discard(relative_path)
+    return found
+
+
+def _javascript_imports(relative_path: str, code: str, paths: Set[str]) -> Set[str]:
+    """Project files reached by relative require()/import specifiers of a JavaScript file."""
+    found: Set[str] = set()
+    directory = posixpath.dirname(relative_path)
+    for specifier in _JS_IMPORT_RE.findall(code):
+        if not specifier.startswith("."):
+            continue # Packages from node_modules
+        target = posixpath.normpath(posixpath.join(directory, specifier))
+        for candidate in (target, target + ".js", target + ".mjs", target + ".cjs", target + "/index.js"):
+            if candidate in paths:
+                found.add(candidate)
+                break
+    found.discard(relative_path)
+    return found
+
+
+def build_dependency_graph(files: Dict[str, str]) -> Dict[str, Set[str]]:
+    """{path: paths it imports} for every file."""
+    python_modules = {_python_module_name(path): path for path in files if path.endswith(".py")}
+    # Code is often run from a src/ directory: let `import pkg` also find src/pkg
+    for name, path in list(python_modules.items()):
+        if name.startswith("src."):
+            python_modules.setdefault(name[4:], path)
+    paths = set(files)
+    graph: Dict[str, Set[str]] = {}
+    for path, code in files.items():
+        if path.endswith(".py"):
+            graph[path] = _python_imports(path, code, python_modules)
+        else:
+            graph[path] = _javascript_imports(path, code, paths)
+    return graph
+
+
+def strongly_connected_components(graph: Dict[str, Set[str]]) -> List[List[str]]:
+    """Tarjan's algorithm (iterative). Components come out dependencies first."""
+    index_of: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    on_stack: Set[str] = set()
+    stack: List[str] = []
+    components: List[List[str]] = []
+    counter = 0
+    for root in sorted(graph):
+        if root in index_of:
+            continue
+        work = [(root, iter(sorted(graph[root])))]
+        index_of[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index_of:
+                    index_of[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(graph[child]))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index_of[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                low[work[-1][0]] = min(low[work[-1][0]], low[node])
+            if low[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(sorted(component))
+    return components
+
+
+def dependency_layers(graph: Dict[str, Set[str]]) -> List[List[List[str]]]:
+    """Components grouped into layers: every component's dependencies are in earlier layers."""
+    components = strongly_connected_components(graph)
+    component_of = {member: index for index, component in enumerate(components) for member in component}
+    depth: Dict[int, int] = {}
+    for index, component in enumerate(components): # Tarjan order: dependencies already have a depth
+        dependencies = {component_of[dep] for member in component for dep in graph[member]} - {index}
+        depth[index] = 1 + max((depth[dep] for dep in dependencies), default=-1)
+    layers: List[List[List[str]]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for index, component in enumerate(components):
+        layers[depth[index]].append(component)
+    return layers
+
+
+# --- Summary store ---
+
+class ProjectStore:
+    """sqlite tables: summaries (Merkle key -> summary) and projects (id -> last manifest)."""
+    def __init__(self, db_path: str = PROJECT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, path TEXT, summary TEXT, created REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS projects (project_id TEXT PRIMARY KEY, manifest TEXT, updated REAL)")
+
+    def get_summaries(self, keys: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._connection.execute(f"SELECT key, summary FROM summaries WHERE key IN ({','.join('?' * len(batch))})", batch)
+                found.update(dict(rows.fetchall()))
+        return found
+
+    def put_summary(self, key: str, path: str, summary: str):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", (key, path, summary, time.time()))
+
+    def get_manifest(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute("SELECT manifest FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_manifest(self, project_id: str, manifest: Dict[str, Any]):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO projects VALUES (?, ?, ?)", (project_id, json.dumps(manifest), time.time()))
+
+
+_store: Optional[ProjectStore] = None
+_pool: Optional[ThreadPoolExecutor] = None
+_shared_lock = threading.Lock()
+
+
+def get_project_store() -> ProjectStore:
+    """Returns the shared project summary store."""
+    global _store
+    with _shared_lock:
+        if _store is None:
+            _store = ProjectStore()
+        return _store
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _shared_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PROJECT_CONCURRENCY, thread_name_prefix="ryan-project")
+        return _pool
+
+
+# --- Analysis ---
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _module_prompt(path: str, language: str, code: str, dependency_summaries: List[Tuple[str, str]]) -> str:
+    dependencies = "\n\n".join(f"### {dep}\n{summary}" for dep, summary in dependency_summaries) or "(none within the project)"
+    return f"""
+You are Ryan, an expert coding assistant. Summarize one module of a larger project.
+
+Summaries of the project modules it imports:
+{dependencies}
+
+Module {path}:
+```{language}
+{code}
+```
+
+Summarize this module for someone answering questions about the whole project:
+- its purpose,
+- its public API (functions/classes with their parameters),
+- what it uses from the modules it imports, and any side effects (I/O, global state, network),
+- bugs or risks you notice.
+Be concise (at most about 250 words).
+"""
+
+
+def analyze_project(files: Dict[str, str], generate: Callable[[str], Tuple[str, Optional[Dict[str, int]]]],
+                    project_id: str, store: Optional[ProjectStore] = None) -> Dict[str, Any]:
+    """
+    Summarises every module whose Merkle key has no stored summary, in dependency order.
+    generate(prompt) -> (text, usage or None). Returns the manifest plus a report of what was analysed.
+    """
+    start_time = time.perf_counter()
+    store = store or get_project_store()
+    previous = store.get_manifest(project_id) or {"modules": {}}
+    graph = build_dependency_graph(files)
+    layers = dependency_layers(graph)
+    content_hashes = {path: _content_hash(text) for path, text in files.items()}
+    keys: Dict[str, str] = {}
+    summaries: Dict[str, str] = {}
+    analysed: List[str] = []
+    failed: Dict[str, str] = {}
+    usage: Dict[str, int] = {}
+    usage_lock = threading.Lock()
+
+    def summarise(path: str, dependencies: List[str]) -> str:
+        language = _SOURCE_EXTENSIONS[os.path.splitext(path)[1].lower()]
+        code = files[path]
+        dependency_summaries = [(dep, summaries.get(dep, "(not available)")) for dep in dependencies]
+        if len(code.splitlines()) >= ANALYSIS_CHUNK_THRESHOLD_LINES or len(code) > PROJECT_MODULE_MAX_CHARS:
+            preamble = "Summaries of the project modules it imports:\n" + "\n\n".join(f"### {dep}\n{summary}" for dep, summary in dependency_summaries) + "\n"
+            outcome = analyze_chunked(code, language, f"Summarize module {path} for someone answering questions about the whole project: "
+                                      "purpose, public API, what it uses from its imports, side effects, bugs or risks.", generate, preamble=preamble)
+            text, call_usage = outcome["analysis"], outcome["report"]["usage"]
+        else:
+            text, call_usage = generate(_module_prompt(path, language, code, dependency_summaries))
+        with usage_lock:
+            for key, value in (call_usage or {}).items():
+                usage[key] = usage.get(key, 0) + (value or 0)
+        return text.strip()
+
+    for layer in layers:
+        jobs = {}
+        for component in layer:
+            members = set(component)
+            external = sorted({dep for member in component for dep in graph[member]} - members)
+            # Merkle key: own content + dependency keys (a cycle shares the hash of all its members' contents)
+            component_hash = _content_hash("\0".join(content_hashes[member] for member in component))
+            for member in component:
+                own = content_hashes[member] if len(component) == 1 else f"{content_hashes[member]}:{component_hash}"
+                keys[member] = _content_hash(f"{_SUMMARY_PROMPT_VERSION}\0{member}\0{own}\0" + "\0".join(keys[dep] for dep in external))
+            stored = store.get_summaries([keys[member] for member in component])
+            for member in component:
+                if keys[member] in stored:
+                    summaries[member] = stored[keys[member]]
+                else:
+                    # Cycle members see the external dependencies' summaries, not each other's
+                    jobs[member] = _get_pool().submit(summarise, member, sorted(graph[member] - members) + sorted(graph[member] & members - {member}))
+        for member, future in jobs.items():
+            try:
+                summaries[member] = future.result()
+                store.put_summary(keys[member], member, summaries[member])
+                analysed.append(member)
+            except Exception as e:
+                logging.warning(f"Summarizing {member} failed: {e}")
+                failed[member] = str(e)
+                summaries[member] = f"(Summary unavailable: {e})"
+                keys[member] = "failed:" + keys[member] # Never reused; dependents get new keys next time too
+
+    changed = sorted(path for path in files if previous["modules"].get(path, {}).get("content_hash") != content_hashes[path])
+    removed = sorted(set(previous["modules"]) - set(files))
+    manifest = {
+        "project_id": project_id,
+        "modules": {path: {"content_hash": content_hashes[path], "key": keys[path], "imports": sorted(graph[path]),
+                           "language": _SOURCE_EXTENSIONS[os.path.splitext(path)[1].lower()], "lines": len(files[path].splitlines())}
+                    for path in sorted(files)},
+        "layers": [[member for component in layer for member in component] for layer in layers],
+        "cycles": [component for layer in layers for component in layer if len(component) > 1],
+        "updated": time.time(),
+    }
+    store.put_manifest(project_id, manifest)
+    logging.info(f"Project {project_id}: {len(files)} modules, {len(analysed)} analysed, {len(files) - len(analysed) - len(failed)} reused, {len(failed)} failed.")
+    return {
+        "manifest": manifest,
+        "report": {
+            "modules": len(files),
+            "analyzed": sorted(analysed),
+            "reused": len(files) - len(analysed) - len(failed),
+            "failed": failed,
+            "changed": changed,
+            "removed": removed,
+            # Unchanged modules re-analysed because something they import changed
+            "invalidated_by_dependencies": sorted(set(analysed) - set(changed)),
+            "layers": len(layers),
+            "wall_time": round(time.perf_counter() - start_time, 6),
+            "usage": usage,
+        },
+    }
+
+
+def _question_words(question: str) -> Set[str]:
+    return {word for word in re.findall(r"[a-z_][a-z0-9_]{2,}", question.lower())}
+
+
+def project_context(manifest: Dict[str, Any], question: str, store: Optional[ProjectStore] = None,
+                    max_chars: int = PROJECT_ASK_MAX_CHARS) -> Tuple[str, List[str]]:
+    """
+    The stored summaries and import graph as prompt text for a question, and the modules included.
+    When they don't all fit, modules mentioned by the question come first, then the most imported ones.
+    """
+    store = store or get_project_store()
+    modules = manifest["modules"]
+    summaries = store.get_summaries([info["key"] for info in modules.values()])
+    imported_by: Dict[str, int] = {path: 0 for path in modules}
+    for info in modules.values():
+        for dep in info["imports"]:
+            if dep in imported_by:
+                imported_by[dep] += 1
+    words = _question_words(question)
+
+    def relevance(path: str) -> Tuple[int, int, int]:
+        summary = summaries.get(modules[path]["key"], "")
+        path_hits = len(words & _question_words(path.replace("/", " ").replace(".", " ")))
+        summary_hits = len(words & _question_words(summary))
+        return (-path_hits, -summary_hits, -imported_by[path])
+
+    graph_text = "\n".join(f"- {path} imports: {', '.join(info['imports']) or '(nothing in the project)'}" for path, info in modules.items())
+    budget = max_chars - len(graph_text)
+    included: List[str] = []
+    sections: List[str] = []
+    for path in sorted(modules, key=relevance):
+        summary = summaries.get(modules[path]["key"])
+        if summary is None:
+            continue
+        section = f"### {path}\n{summary}"
+        if len(section) > budget:
+            continue
+        budget -= len(section)
+        included.append(path)
+        sections.append(section)
+    omitted = len(modules) - len(included)
+    text = f"Import graph ({len(modules)} modules):\n{graph_text}\n\nModule summaries:\n\n" + "\n\n".join(sections)
+    if omitted:
+        text += f"\n\n({omitted} module summaries omitted for length.)"
+    return text, included
+
+
+def project_id_for(name: Optional[str], path: Optional[str]) -> str:
+    """A stable id for a project: its given name, else a hash of its path."""
+    if name:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", name)[:100]
+    if path:
+        return "path-" + hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    raise ProjectError("An uploaded archive needs a project name.")
+
+
+def decode_archive(archive_base64: str) -> bytes:
+    try:
+        return base64.b64decode(archive_base64, validate=True)
+    except ValueError as e:
+        raise ProjectError(f"The archive is not valid base64: {e}")
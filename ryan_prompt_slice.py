@@ -0,0 +1,331 @@
+import os
+import re
+import ast
+import logging
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+from ryan_patch import parse_edits, apply_edits, PatchError
+
+# --- Traceback-Driven Prompt Slicing for debug_code ---
+# For a large file, the error is nearly always explained by a few functions: the ones on
+# the traceback, and what they call. Instead of the whole file, debug_code's prompt gets:
+#   1. the failing frames, parsed from the Python or Node traceback in error_output. A frame
+#      counts as the user's code when its line exists in the file (for Python, the source line
+#      the traceback prints must match too), which skips library and runtime frames,
+#   2. the enclosing function or class of each frame (a method comes with its class header),
+#      or a few lines around it for module-level code,
+#   3. the top-level functions/classes (and, for methods, sibling methods via self.x()) that
+#      those segments call directly,
+#   4. the imports and short module-level assignments whose names the segments use.
+# Segments are shown in file order under "# --- lines a-b ---" headers, so line numbers in
+# the traceback still point at the right code. The model answers with SEARCH/REPLACE
+# edits, which are applied to the whole original file (ryan_patch.py); a corrected block
+# that redefines functions by name is spliced in instead. Either way corrected_code is the
+# full file, with every line outside the edits where it was.
+# Files under RYAN_DEBUG_SLICE_MIN_LINES, errors without a usable frame, and slices that
+# would keep more than SLICE_MAX_FRACTION of the file use the full-file prompt.
+
+SLICE_MIN_LINES = int(os.getenv("RYAN_DEBUG_SLICE_MIN_LINES", "80"))
+SLICE_MAX_FRACTION = 0.6
+_MODULE_CONTEXT_LINES = 3 # Lines shown around a failing module-level statement
+_ASSIGNMENT_MAX_LINES = 5 # Longer module-level assignments aren't pulled in as context
+
+_PYTHON_FRAME_RE = re.compile(r'^\s*File "([^"]+)", line (\d+), in (\S+)\n(?:[ \t]+(\S.*)\n)?', re.MULTILINE)
+# Script files, or "[eval]" for `node -e` code (its "[eval]-wrapper" and node:internal frames aren't user code)
+_NODE_FRAME_RE = re.compile(r"(?:\(|\bat |^)((?:/|[A-Za-z]:\\|file://)[^\s():]+\.(?:js|mjs|cjs)|\[eval\]):(\d+)(?::\d+)?", re.MULTILINE)
+
+
+def parse_traceback(error_output: str, code: str, language: str) -> List[int]:
+    """Line numbers (1-based, innermost frame last) of the traceback frames that are in this file."""
+    lines = code.splitlines()
+    frames: List[int] = []
+    if language == "python":
+        for match in _PYTHON_FRAME_RE.finditer(error_output or ""):
+            number, source = int(match.group(2)), match.group(4)
+            if 1 <= number <= len(lines) and (source is None or lines[number - 1].strip() == source.strip()):
+                frames.append(number)
+        # SyntaxErrors and some runtime errors report just "line N" of the script
+        if not frames:
+            frames = [int(number) for number in re.findall(r'File "[^"]+", line (\d+)', error_output or "") if 1 <= int(number) <= len(lines)]
+    elif language in ("javascript", "js"):
+        # Node prints stack frames innermost first
+        for match in reversed(list(_NODE_FRAME_RE.finditer(error_output or ""))):
+            path, number = match.group(1), int(match.group(2))
+            if "node_modules" in path or path.startswith("node:"):
+                continue
+            if 1 <= number <= len(lines):
+                frames.append(number)
+    deduped: List[int] = []
+    for number in frames:
+        if number not in deduped:
+            deduped.append(number)
+    return deduped
+
+
+# --- Python segments ---
+
+def _python_segments(code: str, frames: List[int]) -> Optional[List[Tuple[int, int]]]:
+    tree = ast.parse(code)
+    top_defs: Dict[str, ast.AST] = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            top_defs[node.name] = node
+
+    def span(node: ast.AST) -> Tuple[int, int]:
+        start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+        return start, node.end_lineno
+
+    def enclosing(line: int) -> List[ast.AST]:
+        """Path of def/class nodes from the module down to line."""
+        path: List[ast.AST] = []
+        body = tree.body
+        while True:
+            for node in body:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and span(node)[0] <= line <= node.end_lineno:
+                    path.append(node)
+                    body = node.body
+                    break
+            else:
+                return path
+
+    segments: List[Tuple[int, int]] = []
+    focus: List[Tuple[ast.AST, Optional[ast.ClassDef]]] = [] # (function or statement, its class)
+    for line in frames:
+        path = enclosing(line)
+        functions = [node for node in path if not isinstance(node, ast.ClassDef)]
+        if not functions:
+            if path: # Class body statement
+                segments.append(span(path[-1]))
+                continue
+            statement = next((node for node in tree.body if node.lineno <= line <= node.end_lineno), None)
+            start = max(1, line - _MODULE_CONTEXT_LINES)
+            end = line + _MODULE_CONTEXT_LINES
+            if statement is not None:
+                start, end = min(start, statement.lineno), max(end, statement.end_lineno)
+                focus.append((statement, None))
+            segments.append((start, end))
+            continue
+        # The outermost function holds nested helpers and closures; a method keeps its class header
+        function = functions[0]
+        position = path.index(function)
+        owner = path[position - 1] if position > 0 and isinstance(path[position - 1], ast.ClassDef) else None
+        segments.append(span(function))
+        if owner is not None:
+            segments.append((span(owner)[0], owner.body[0].lineno - 1 if owner.body[0].lineno > owner.lineno else owner.lineno))
+            init = next((node for node in owner.body if isinstance(node, ast.FunctionDef) and node.name == "__init__"), None)
+            if init is not None:
+                segments.append(span(init))
+        focus.append((function, owner))
+
+    # Direct callees of the focus code
+    used: Set[str] = set()
+    for node, owner in focus:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                used.add(child.id)
+            if not isinstance(child, ast.Call):
+                continue
+            callee = child.func
+            if isinstance(callee, ast.Name) and callee.id in top_defs and top_defs[callee.id] is not node:
+                segments.append(span(top_defs[callee.id]))
+            elif isinstance(callee, ast.Attribute) and isinstance(callee.value, ast.Name) and callee.value.id in ("self", "cls") and owner is not None:
+                method = next((item for item in owner.body if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == callee.attr), None)
+                if method is not None and method is not node:
+                    segments.append(span(method))
+    segments = _merge(segments)
+    # Names used anywhere in the chosen code decide which imports and constants come along
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and any(start <= node.lineno <= end for start, end in segments):
+            used.add(node.id)
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound = {(alias.asname or alias.name).split(".")[0] for alias in node.names}
+            if bound & used or any(alias.name == "*" for alias in node.names):
+                segments.append((node.lineno, node.end_lineno))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.end_lineno - node.lineno < _ASSIGNMENT_MAX_LINES:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if {name.id for target in targets for name in ast.walk(target) if isinstance(name, ast.Name)} & used:
+                segments.append((node.lineno, node.end_lineno))
+    return _merge(segments)
+
+
+# --- JavaScript segments (brace matching; no parser in Python) ---
+
+def line_depths(code: str) -> List[int]:
+    """Brace depth at the start of each line (strings, template literals and comments skipped)."""
+    depths = [0]
+    depth, index, quote = 0, 0, None
+    while index < len(code):
+        char = code[index]
+        if char == "\n":
+            depths.append(depth)
+        elif quote:
+            if char == "\\":
+                index += 1
+            elif char == quote:
+                quote = None
+        elif code.startswith("//", index):
+            newline = code.find("\n", index)
+            index = (len(code) if newline < 0 else newline) - 1
+        elif code.startswith("/*", index):
+            end = code.find("*/", index + 2)
+            depths.extend([depth] * code.count("\n", index, len(code) if end < 0 else end))
+            index = len(code) if end < 0 else end + 1
+        elif char in "'\"`":
+            quote = char
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth = max(0, depth - 1)
+        index += 1
+    return depths
+
+
+_JS_IMPORT_WORDS = {"import", "from", "as", "const", "let", "var", "default", "type"}
+JS_DECLARATION_RE = re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\s*\*?\s*(\w+)|class\s+(\w+)|(?:const|let|var)\s+(\w+)\s*=)")
+
+
+def _javascript_segments(code: str, frames: List[int]) -> Optional[List[Tuple[int, int]]]:
+    lines = code.splitlines()
+    depths = line_depths(code)
+    depths += [0] * (len(lines) + 1 - len(depths))
+
+    def block(line: int) -> Tuple[int, int]:
+        """The top-level statement containing line: back to a depth-0 start, forward until depth returns to 0."""
+        start = line
+        while start > 1 and depths[start - 1] > 0:
+            start -= 1
+        end = start
+        while end < len(lines) and depths[end] > 0:
+            end += 1
+        return start, end
+
+    declarations: Dict[str, Tuple[int, int]] = {}
+    for number, text in enumerate(lines, 1):
+        if depths[number - 1] == 0:
+            match = JS_DECLARATION_RE.match(text)
+            if match:
+                declarations[next(group for group in match.groups() if group)] = block(number)
+    segments = [block(line) for line in frames]
+    focus_text = "\n".join("\n".join(lines[start - 1:end]) for start, end in segments)
+    for name in set(re.findall(r"\b([A-Za-z_$][\w$]*)\s*\(", focus_text)) | set(re.findall(r"\bnew\s+([A-Za-z_$][\w$]*)", focus_text)):
+        if name in declarations:
+            segments.append(declarations[name])
+    segments = _merge(segments)
+    used = set(re.findall(r"[A-Za-z_$][\w$]*", "\n".join("\n".join(lines[start - 1:end]) for start, end in segments)))
+    for number, text in enumerate(lines, 1):
+        if depths[number - 1] == 0 and re.match(r"\s*(import\b|(?:const|let|var)\s.*\brequire\s*\()", text):
+            bound = set(re.findall(r"[A-Za-z_$][\w$]*", text.split("require")[0].split(" from ")[0])) - _JS_IMPORT_WORDS
+            if bound & used:
+                segments.append((number, number))
+    return _merge(segments)
+
+
+def _merge(segments: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sorted, with overlapping or adjacent ranges joined."""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(segments):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def slice_for_traceback(code: str, error_output: str, language: str) -> Optional[Dict[str, Any]]:
+    """
+    The prompt slice for code and its traceback, or None when the full file should be sent.
+    Returns {"text", "segments": [[start, end], ...], "frames", "original_lines", "sliced_lines"}.
+    """
+    language = (language or "").lower()
+    lines = code.splitlines()
+    if len(lines) < SLICE_MIN_LINES or language not in ("python", "javascript", "js"):
+        return None
+    frames = parse_traceback(error_output, code, language)
+    if not frames:
+        return None
+    try:
+        segments = _python_segments(code, frames) if language == "python" else _javascript_segments(code, frames)
+    except SyntaxError:
+        return None
+    if not segments:
+        return None
+    segments = [(max(1, start), min(len(lines), end)) for start, end in segments]
+    sliced_lines = sum(end - start + 1 for start, end in segments)
+    if sliced_lines > SLICE_MAX_FRACTION * len(lines):
+        return None
+    parts = []
+    for start, end in segments:
+        parts.append(f"# --- lines {start}-{end} ---" if language == "python" else f"// --- lines {start}-{end} ---")
+        parts.append("\n".join(lines[start - 1:end]))
+    logging.info(f"Debug prompt sliced to {sliced_lines}/{len(lines)} lines around traceback lines {frames}.")
+    return {
+        "text": "\n".join(parts),
+        "segments": [list(segment) for segment in segments],
+        "frames": frames,
+        "original_lines": len(lines),
+        "sliced_lines": sliced_lines,
+    }
+
+
+def _splice_definitions(code: str, block: str) -> Optional[str]:
+    """Replaces the top-level functions/classes (or methods) that block redefines, by name. None if it can't."""
+    try:
+        tree, new_tree = ast.parse(code), ast.parse(block)
+    except SyntaxError:
+        return None
+    block_lines = block.splitlines()
+    lines = code.splitlines()
+    originals: Dict[str, ast.AST] = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            originals[node.name] = node
+            if isinstance(node, ast.ClassDef):
+                for item in node.body:
+                    if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        originals.setdefault(item.name, item)
+    replacements: List[Tuple[int, int, List[str]]] = []
+    for node in new_tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) or node.name not in originals:
+            continue
+        original = originals[node.name]
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        original_start = min([original.lineno] + [d.lineno for d in original.decorator_list])
+        new_lines = block_lines[start - 1:node.end_lineno]
+        # Re-indent to the original's indentation (a method given at top level, or the reverse)
+        shift = original.col_offset - node.col_offset
+        if shift > 0:
+            new_lines = [" " * shift + line if line.strip() else line for line in new_lines]
+        elif shift < 0:
+            new_lines = [line[-shift:] if line[:-shift].strip() == "" else line for line in new_lines]
+        replacements.append((original_start, original.end_lineno, new_lines))
+    if not replacements:
+        return None
+    for start, end, new_lines in sorted(replacements, reverse=True):
+        lines[start - 1:end] = new_lines
+    spliced = "\n".join(lines) + ("\n" if code.endswith("\n") else "")
+    try:
+        ast.parse(spliced)
+    except SyntaxError:
+        return None
+    return spliced
+
+
+def apply_sliced_fix(code: str, response_text: str, language: str) -> Tuple[Optional[str], str]:
+    """
+    The full corrected file from a response to a sliced prompt: (corrected code or None, how it was applied).
+    SEARCH/REPLACE edits are applied to the whole file; otherwise a Python code block's definitions are spliced in by name.
+    """
+    edits = parse_edits(response_text)
+    if edits:
+        try:
+            corrected, _ = apply_edits(code, edits)
+            return corrected, "edits"
+        except PatchError as e:
+            logging.warning(f"Sliced debug edits did not apply: {e}")
+    block = re.search(r"```(?:\w+)?\n(.*?)\n```", response_text, re.DOTALL)
+    if block and (language or "").lower() == "python":
+        spliced = _splice_definitions(code, block.group(1))
+        if spliced is not None:
+            return spliced, "definitions"
+    return None, "none"
@@ -0,0 +1,577 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import select
+import signal
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+from ryan_exec_scheduler import EXEC_MAX_MEMORY_MB, spawn_limited, write_all_fd, LaunchError
+
+# --- Persistent REPL Sessions ---
+# execute_code starts every run from an empty interpreter, so iterative work pays for
+# imports and data loading again on each step. A session keeps one interpreter "kernel"
+# alive between calls: variables, imports and loaded data from earlier cells stay in
+# its namespace, like a notebook or an interactive REPL.
+#   - Kernels are started through the scheduler's launcher with the usual rlimits, in
+#     their own working directory (files written by a cell are there for the next one).
+#     The CPU rlimit covers the kernel's whole life, so it is raised to RYAN_SESSION_CPU_SECONDS.
+#   - Requests and replies are length-prefixed JSON ('<len>\n<json>') over the kernel's
+#     stdin/stdout. The Python kernel moves that channel off fds 0-2 and points them at
+#     per-cell files instead, so print(), subprocesses and os.write all land in the cell's output.
+#     The Node kernel captures process.stdout/stderr.write; it has no per-cell stdin.
+#   - interrupt() sends SIGINT: the running cell stops with KeyboardInterrupt (Python) or
+#     "Script execution interrupted" (Node) and the namespace survives. A cell that runs past
+#     its timeout is interrupted the same way; if it ignores that too, the kernel is killed.
+#   - A reaper thread closes sessions idle for RYAN_SESSION_IDLE_TIMEOUT seconds and sessions
+#     whose resident memory exceeds RYAN_SESSION_MAX_MEMORY_MB (default 3/4 of the scheduler's
+#     memory limit: RSS can't pass the address-space rlimit, so a cap equal to it would never fire).
+#     The hard rlimit still applies on top (a runaway allocation gets MemoryError).
+#   - Node callbacks (timers, promises) can outlive their cell. Output is tagged with the
+#     execution that scheduled the callback, so a late callback never writes into a later
+#     cell's output; callbacks already due when the cell ends are drained into their own cell.
+# Cell results use the execute_code fields: stdout, stderr, return_code, timed_out, wall_time,
+# cpu_time, plus interrupted and execution_count. The last expression's value is echoed like a REPL.
+
+SESSION_LANGUAGES = ("python", "javascript")
+SESSION_MAX = int(os.getenv("RYAN_SESSION_MAX", "8"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("RYAN_SESSION_IDLE_TIMEOUT", "900"))
+SESSION_MAX_MEMORY_MB = int(os.getenv("RYAN_SESSION_MAX_MEMORY_MB", str(EXEC_MAX_MEMORY_MB * 3 // 4)))
+SESSION_CPU_SECONDS = int(os.getenv("RYAN_SESSION_CPU_SECONDS", "600"))
+SESSION_CELL_TIMEOUT = float(os.getenv("RYAN_SESSION_CELL_TIMEOUT", "30"))
+SESSION_MAX_CELL_TIMEOUT = float(os.getenv("RYAN_SESSION_MAX_CELL_TIMEOUT", "300")) # Upper bound for a client-supplied cell timeout
+SESSION_MAX_OUTPUT_BYTES = int(os.getenv("RYAN_SESSION_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+SESSION_REAP_INTERVAL = 10.0 # Seconds between reaper passes
+SESSION_INTERRUPT_GRACE = 3.0 # Seconds a timed-out cell gets to honour SIGINT before the kernel is killed
+_RECLAIMED_HISTORY = 100 # Closed session ids remembered so late calls get the reason instead of "unknown"
+
+
+class SessionError(Exception):
+    """Raised for session lookups and lifecycle problems."""
+    def __init__(self, message: str, kind: str = "not_found"):
+        super().__init__(message)
+        self.kind = kind # 'not_found', 'limit', 'busy', 'lost' or 'unsupported'
+
+
+# --- Kernel drivers (run as the session process) ---
+
+_PYTHON_KERNEL = r"""
+import os, sys, ast, json, time, signal, builtins, tempfile, traceback
+PROTOCOL_IN, PROTOCOL_OUT = os.dup(0), os.dup(1)
+MAX_OUTPUT = int(os.environ.pop('RYAN_SESSION_MAX_OUTPUT', '1048576'))
+DEVNULL = os.open(os.devnull, os.O_RDWR)
+for fd in (0, 1, 2):
+    os.dup2(DEVNULL, fd) # Stray output between cells goes nowhere
+sys.stdout = sys.__stdout__ = open(1, 'w', closefd=False)
+sys.stderr = sys.__stderr__ = open(2, 'w', closefd=False)
+sys.argv = ['']
+executing = False
+
+def on_sigint(signum, frame):
+    if executing:
+        raise KeyboardInterrupt
+signal.signal(signal.SIGINT, on_sigint)
+
+def read_exact(n):
+    data = b''
+    while len(data) < n:
+        chunk = os.read(PROTOCOL_IN, n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def read_message():
+    length = b''
+    while not length.endswith(b'\n'):
+        ch = os.read(PROTOCOL_IN, 1)
+        if not ch:
+            return None
+        length += ch
+    body = read_exact(int(length))
+    return None if body is None else json.loads(body)
+
+def write_message(message):
+    data = json.dumps(message).encode()
+    data = str(len(data)).encode() + b'\n' + data
+    while data:
+        data = data[os.write(PROTOCOL_OUT, data):]
+
+def captured(f):
+    f.seek(0)
+    data = f.read(MAX_OUTPUT + 1)
+    text = data[:MAX_OUTPUT].decode(errors='replace')
+    if len(data) > MAX_OUTPUT:
+        text += f'\n[... output truncated at {MAX_OUTPUT} bytes ...]\n'
+    return text
+
+def format_error(e):
+    # Drop the kernel's own frames (exec call, SIGINT handler) so the traceback shows only the cell's
+    tb = e.__traceback__
+    while tb is not None and not tb.tb_frame.f_code.co_filename.startswith('<cell'):
+        tb = tb.tb_next
+    frames = [frame for frame in traceback.extract_tb(tb) if frame.name != 'on_sigint']
+    lines = ['Traceback (most recent call last):\n'] + traceback.format_list(frames) if frames else []
+    return ''.join(lines + traceback.format_exception_only(type(e), e))
+
+namespace = {'__name__': '__main__', '__builtins__': builtins, '__doc__': None}
+count = 0
+while True:
+    request = read_message()
+    if request is None:
+        break
+    count += 1
+    filename = f'<cell {count}>'
+    stdin_file, stdout_file, stderr_file = tempfile.TemporaryFile(), tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    stdin_file.write((request.get('stdin') or '').encode())
+    stdin_file.seek(0)
+    os.dup2(stdin_file.fileno(), 0)
+    os.dup2(stdout_file.fileno(), 1)
+    os.dup2(stderr_file.fileno(), 2)
+    sys.stdin = sys.__stdin__ = open(0, 'r', closefd=False) # Fresh buffer: nothing left over from the last cell
+    return_code, interrupted = 0, False
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        executing = True
+        tree = ast.parse(request['code'], filename, 'exec')
+        last = None
+        if tree.body and isinstance(tree.body[-1], ast.Expr):
+            last = ast.Expression(tree.body.pop().value)
+        exec(compile(tree, filename, 'exec'), namespace)
+        if last is not None:
+            value = eval(compile(last, filename, 'eval'), namespace)
+            if value is not None:
+                namespace['_'] = value
+                print(repr(value))
+    except SystemExit as e:
+        if isinstance(e.code, int) or e.code is None:
+            return_code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            return_code = 1
+    except KeyboardInterrupt as e:
+        interrupted, return_code = True, 130
+        sys.stderr.write(format_error(e))
+    except BaseException as e:
+        return_code = 1
+        sys.stderr.write(format_error(e))
+    finally:
+        executing = False
+    wall_time, cpu_time = time.perf_counter() - start, time.process_time() - cpu_start
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    for fd in (0, 1, 2):
+        os.dup2(DEVNULL, fd)
+    write_message({'stdout': captured(stdout_file), 'stderr': captured(stderr_file), 'return_code': return_code,
+                   'interrupted': interrupted, 'wall_time': round(wall_time, 6), 'cpu_time': round(cpu_time, 6),
+                   'execution_count': count})
+    for f in (stdin_file, stdout_file, stderr_file):
+        f.close()
+"""
+
+_NODE_KERNEL = r"""
+(async () => {
+    // Kernel state lives in this function: cells run in the global lexical scope, where these
+    // names would collide with the cell's own declarations (const fs) or be overwritten (sink = 1)
+    const fs = require('fs');
+    const vm = require('vm');
+    const util = require('util');
+    const { AsyncLocalStorage } = require('async_hooks');
+    const execution = new AsyncLocalStorage(); // Execution count of the cell that scheduled the running callback
+    const MAX_OUTPUT = parseInt(process.env.RYAN_SESSION_MAX_OUTPUT || '1048576', 10);
+    delete process.env.RYAN_SESSION_MAX_OUTPUT;
+    process.on('SIGINT', () => {}); // Running cells are interrupted through breakOnSigint; idle SIGINTs are ignored
+    function readExact(n) {
+        const buf = Buffer.alloc(n);
+        let off = 0;
+        while (off < n) {
+            let r = 0;
+            try { r = fs.readSync(0, buf, off, n - off, null); }
+            catch (e) { if (e.code === 'EAGAIN') continue; throw e; }
+            if (r === 0) return null;
+            off += r;
+        }
+        return buf;
+    }
+    function readMessage() {
+        let lenText = '';
+        for (;;) {
+            const ch = readExact(1);
+            if (ch === null) return null;
+            if (ch.toString() === '\n') break;
+            lenText += ch.toString();
+        }
+        const body = readExact(parseInt(lenText, 10));
+        return body === null ? null : JSON.parse(body.toString());
+    }
+    function writeMessage(message) {
+        const body = Buffer.from(JSON.stringify(message));
+        const data = Buffer.concat([Buffer.from(body.length + '\n'), body]);
+        let off = 0;
+        while (off < data.length) {
+            try { off += fs.writeSync(1, data, off, data.length - off); }
+            catch (e) { if (e.code !== 'EAGAIN') throw e; }
+        }
+    }
+    class CellExit extends Error {
+        constructor(code) { super('process.exit(' + code + ')'); this.exitCode = code; }
+    }
+    // process.exit() would end the whole session; end just the cell instead
+    process.exit = (code) => { throw new CellExit(code === undefined ? 0 : code); };
+    let sink = null;
+    function capture(name) {
+        return (chunk, encoding, callback) => {
+            if (sink !== null && execution.getStore() === sink.id) sink[name].push(typeof chunk === 'string' ? chunk : Buffer.from(chunk).toString());
+            if (typeof encoding === 'function') encoding(); else if (typeof callback === 'function') callback();
+            return true;
+        };
+    }
+    process.stdout.write = capture('stdout');
+    process.stderr.write = capture('stderr');
+    function joined(parts) {
+        const text = parts.join('');
+        return text.length > MAX_OUTPUT ? text.slice(0, MAX_OUTPUT) + '\n[... output truncated at ' + MAX_OUTPUT + ' bytes ...]\n' : text;
+    }
+    function cleanStack(e) {
+        const lines = (e && e.stack ? e.stack : String(e)).split('\n');
+        const cut = lines.findIndex(line => line.includes('runInThisContext') || line.includes('sigintHandlersWrap'));
+        return (cut > 0 ? lines.slice(0, cut) : lines).join('\n') + '\n';
+    }
+    let count = 0;
+    for (;;) {
+        const request = readMessage();
+        if (request === null) break;
+        count += 1;
+        sink = { id: count, stdout: [], stderr: [] };
+        let returnCode = 0, interrupted = false;
+        const start = process.hrtime.bigint();
+        const cpuStart = process.cpuUsage();
+        try {
+            await execution.run(count, async () => {
+                const script = new vm.Script(request.code, { filename: '<cell ' + count + '>' });
+                let value = script.runInThisContext({ breakOnSigint: true });
+                if (value && typeof value.then === 'function') value = await value;
+                if (value !== undefined) console.log(util.inspect(value));
+            });
+        } catch (e) {
+            if (e instanceof CellExit) {
+                returnCode = e.exitCode;
+            } else if (e && e.code === 'ERR_SCRIPT_EXECUTION_INTERRUPTED') {
+                interrupted = true;
+                returnCode = 130;
+                sink.stderr.push('Script execution interrupted.\n');
+            } else {
+                returnCode = 1;
+                sink.stderr.push(cleanStack(e));
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, 0)); // Let callbacks that are already due write into this cell
+        const cpu = process.cpuUsage(cpuStart);
+        const output = sink;
+        sink = null;
+        writeMessage({ stdout: joined(output.stdout), stderr: joined(output.stderr), return_code: returnCode,
+                       interrupted: interrupted, wall_time: Number(process.hrtime.bigint() - start) / 1e9,
+                       cpu_time: (cpu.user + cpu.system) / 1e6, execution_count: count });
+    }
+})();
+"""
+
+
+def _kernel_command(language: str) -> List[str]:
+    if language == "python":
+        return [sys.executable, "-c", _PYTHON_KERNEL]
+    return ["node", "-e", _NODE_KERNEL]
+
+
+def _resident_memory_kb(pid: int) -> Optional[int]:
+    """Current RSS of pid from /proc (None where /proc isn't available)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class ReplSession:
+    """One kernel process and its namespace. Cells run one at a time."""
+    def __init__(self, language: str):
+        self.session_id = uuid.uuid4().hex
+        self.language = language
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.execution_count = 0
+        self.busy = False
+        self.alive = True
+        self.exit_code: Optional[int] = None
+        self.notebook = None # NotebookState when the session backs a notebook (ryan_notebook.py)
+        self.workdir = tempfile.mkdtemp(prefix="ryan_session_")
+        self._buffer = b""
+        self._lock = threading.Lock()
+        env = dict(os.environ, RYAN_SESSION_MAX_OUTPUT=str(SESSION_MAX_OUTPUT_BYTES))
+        stdin_read, self._request_fd = os.pipe()
+        self._response_fd, stdout_write = os.pipe()
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        try:
+            self.process = spawn_limited(_kernel_command(language), language, stdin_read, stdout_write, devnull, None,
+                                         cpu_seconds=SESSION_CPU_SECONDS, env=env, cwd=self.workdir)
+        except BaseException:
+            self._close_fds()
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            raise
+        finally:
+            for fd in (stdin_read, stdout_write, devnull):
+                os.close(fd)
+        # Reaps the kernel and notices when it dies (crash, os._exit, CPU rlimit, reaper kill)
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        try:
+            self.exit_code, _, _ = self.process.wait()
+        except LaunchError:
+            pass
+        self.alive = False
+
+    def _read_response(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Reads one '<len>\\n<json>' reply. Returns None on timeout or if the kernel's stdout closed."""
+        deadline = time.monotonic() + timeout
+        while True:
+            if b"\n" in self._buffer:
+                length_text, rest = self._buffer.split(b"\n", 1)
+                length = int(length_text)
+                if len(rest) >= length:
+                    self._buffer = rest[length:]
+                    return json.loads(rest[:length])
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([self._response_fd], [], [], remaining)
+            if not readable:
+                return None
+            chunk = os.read(self._response_fd, 65536)
+            if not chunk:
+                return None
+            self._buffer += chunk
+
+    def execute(self, code: str, stdin: Optional[str] = None, timeout: float = SESSION_CELL_TIMEOUT) -> Dict[str, Any]:
+        """Runs one cell in the session's namespace. Raises SessionError if busy, dead or given unsupported input."""
+        timeout = min(timeout, SESSION_MAX_CELL_TIMEOUT)
+        if stdin and self.language == "javascript":
+            raise SessionError("JavaScript sessions can't feed stdin to a cell (the kernel reads its requests from stdin).", "unsupported")
+        if not self._lock.acquire(blocking=False):
+            raise SessionError("The session is still running another cell. Interrupt it or wait.", "busy")
+        try:
+            if not self.alive:
+                raise SessionError(f"The session's kernel has exited (code {self.exit_code}).", "lost")
+            self.busy = True
+            self.last_used = time.time()
+            try:
+                write_all_fd(self._request_fd, self._encode({"code": code, "stdin": stdin}))
+            except OSError as e:
+                raise SessionError(f"The session's kernel is not accepting input: {e}", "lost")
+            timed_out = False
+            response = self._read_response(timeout)
+            if response is None and self.alive:
+                # Ask the cell to stop; if it does, the namespace survives
+                timed_out = True
+                logging.warning(f"Session {self.session_id} cell exceeded {timeout}s, interrupting.")
+                self.interrupt()
+                response = self._read_response(SESSION_INTERRUPT_GRACE)
+            if response is None:
+                self.kill()
+                return {"stdout": "", "return_code": None, "timed_out": timed_out, "interrupted": False,
+                        "stderr": "Cell did not stop after an interrupt; the session was killed." if timed_out
+                                  else "The session's kernel exited while running the cell (memory or CPU limit, or the code ended the process).",
+                        "session_lost": True, "execution_count": self.execution_count}
+            self.execution_count = response["execution_count"]
+            response["timed_out"] = timed_out
+            return response
+        finally:
+            self.busy = False
+            self.last_used = time.time()
+            self._lock.release()
+
+    @staticmethod
+    def _encode(message: Dict[str, Any]) -> bytes:
+        body = json.dumps(message).encode()
+        return str(len(body)).encode() + b"\n" + body
+
+    def interrupt(self) -> bool:
+        """Sends SIGINT to the kernel. Returns True if a cell was running."""
+        if self.alive:
+            try:
+                os.kill(self.process.pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+        return self.busy
+
+    def resident_memory_kb(self) -> Optional[int]:
+        return _resident_memory_kb(self.process.pid) if self.alive else None
+
+    def kill(self):
+        self.alive = False
+        self.process.kill()
+
+    def close(self):
+        """Kills the kernel and removes its working directory."""
+        self.kill()
+        self._close_fds()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _close_fds(self):
+        for fd in (self._request_fd, self._response_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "language": self.language,
+            "created_at": self.created_at,
+            "idle_seconds": round(time.time() - self.last_used, 3),
+            "execution_count": self.execution_count,
+            "busy": self.busy,
+            "alive": self.alive,
+            "rss_kb": self.resident_memory_kb(),
+        }
+
+
+class SessionManager:
+    """Open sessions by id, plus the reaper that reclaims idle and oversized ones."""
+    def __init__(self, max_sessions: int = SESSION_MAX, idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 max_memory_mb: int = SESSION_MAX_MEMORY_MB):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_memory_mb = max_memory_mb
+        self._sessions: Dict[str, ReplSession] = {}
+        self._reclaimed: "OrderedDict[str, str]" = OrderedDict() # session_id -> why it was closed
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self.stats_counters = {"created": 0, "cells": 0, "closed": 0, "reclaimed_idle": 0, "reclaimed_memory": 0, "kernel_exited": 0}
+
+    def create(self, language: str) -> ReplSession:
+        """Starts a session. Raises SessionError for unsupported languages or when the session limit is reached."""
+        language = language.lower()
+        if language not in SESSION_LANGUAGES:
+            raise SessionError(f"Sessions are supported for {', '.join(SESSION_LANGUAGES)} only.", "unsupported")
+        self.reap()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionError(f"Too many open sessions ({self.max_sessions}). Close one first.", "limit")
+            session = ReplSession(language)
+            self._sessions[session.session_id] = session
+            self.stats_counters["created"] += 1
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="ryan-session-reaper", daemon=True)
+                self._reaper.start()
+        logging.info(f"Started {language} session {session.session_id} (pid {session.process.pid}).")
+        return session
+
+    def get(self, session_id: str) -> ReplSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                reason = self._reclaimed.get(session_id)
+                raise SessionError(f"Session {session_id} was closed ({reason})." if reason else f"Unknown session: {session_id}", "not_found")
+            return session
+
+    def execute(self, session_id: str, code: str, stdin: Optional[str] = None, timeout: float = SESSION_CELL_TIMEOUT) -> Dict[str, Any]:
+        session = self.get(session_id)
+        result = session.execute(code, stdin=stdin, timeout=timeout)
+        self.stats_counters["cells"] += 1
+        # Check the memory cap right away instead of waiting for the next reaper pass
+        reason = self._reclaim_reason(session)
+        if reason:
+            self._reclaim(session, reason)
+            result["session_closed"] = reason
+        return result
+
+    def interrupt(self, session_id: str) -> bool:
+        return self.get(session_id).interrupt()
+
+    def close(self, session_id: str, reason: str = "closed by client"):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return
+            self._reclaimed[session_id] = reason
+            while len(self._reclaimed) > _RECLAIMED_HISTORY:
+                self._reclaimed.popitem(last=False)
+        session.close()
+        self.stats_counters["closed"] += 1
+        logging.info(f"Closed session {session_id}: {reason}.")
+
+    def _reclaim_reason(self, session: ReplSession) -> Optional[str]:
+        if not session.alive:
+            return "kernel exited"
+        rss_kb = session.resident_memory_kb()
+        if rss_kb is not None and rss_kb > self.max_memory_mb * 1024:
+            return f"memory cap: {rss_kb // 1024} MB resident, limit {self.max_memory_mb} MB"
+        if not session.busy and time.time() - session.last_used > self.idle_timeout:
+            return f"idle timeout: unused for {self.idle_timeout:.0f}s"
+        return None
+
+    def _reclaim(self, session: ReplSession, reason: str):
+        counter = "kernel_exited" if reason == "kernel exited" else "reclaimed_memory" if reason.startswith("memory") else "reclaimed_idle"
+        self.stats_counters[counter] += 1
+        self.close(session.session_id, reason)
+
+    def reap(self):
+        """Closes dead, idle and over-memory sessions. An over-memory session is killed even mid-cell."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            reason = self._reclaim_reason(session)
+            if reason is not None:
+                self._reclaim(session, reason)
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(SESSION_REAP_INTERVAL)
+            try:
+                self.reap()
+            except Exception as e:
+                logging.error(f"Session reaper failed: {e}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [session.info() for session in sessions]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._sessions)
+        return {"active": active, "max_sessions": self.max_sessions, "idle_timeout": self.idle_timeout,
+                "max_memory_mb": self.max_memory_mb, **self.stats_counters}
+
+    def shutdown(self):
+        with self._lock:
+            session_ids = list(self._sessions)
+        for session_id in session_ids:
+            self.close(session_id, "server shutdown")
+
+
+_session_manager: Optional[SessionManager] = None
+_session_manager_lock = threading.Lock()
+
+
+def get_session_manager() -> SessionManager:
+    """Returns the shared session manager."""
+    global _session_manager
+    with _session_manager_lock:
+        if _session_manager is None:
+            _session_manager = SessionManager()
+        return _session_manager
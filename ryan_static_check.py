@@ -0,0 +1,538 @@
+import os
+import re
+import ast
+import sys
+import time
+import shutil
+import logging
+import builtins
+import symtable
+import tempfile
+import threading
+import subprocess
+from typing import Optional, Dict, Any, List, Set, Tuple
+
+# --- Local Static Pre-Check for debug_code ---
+# Many errors sent to debug_code don't need the model: a SyntaxError, a NameError from
+# a typo, a forgotten import. precheck() looks at the code (and the error output) locally
+# in milliseconds before any model call:
+#   Python      ast.parse, then a symtable pass for names that are read but never bound
+#               (undefined names), imports that are never read (unused imports), and
+#               typo candidates for each undefined name (edit distance <= 1 for names
+#               up to 4 characters, <= 2 for longer ones, against the names visible where
+#               it is used: its scope, the enclosing functions, the module, builtins).
+#   JavaScript  `node --check` (syntax only; skipped when node isn't installed).
+# It answers on its own only when it is confident, which means it has a corrected program
+# that parses again and, for runtime errors, that fixes the exact error in the output:
+#   - a syntax error repaired by a one-line edit (missing ':', missing closing bracket,
+#     Python 2 print, '=' in a condition, unclosed JS blocks at the end of the file),
+#   - "NameError: name 'x' is not defined" where exactly one visible name is closest to x:
+#     it is renamed (resource -> resources beats `import resource`). Not when x or the
+#     candidate is shorter than 3 characters (n -> i is as likely wrong as right), or when x
+#     is bound in an enclosing class body (the fix there is self.x / A.x, not a rename),
+#   - the same NameError with no typo candidate where x is a well-known name (np, List,
+#     defaultdict, ...) or a stdlib module used as x.attr (os.path, json.dumps): the import
+#     is added. A well-known name that also has a typo candidate is left to the model,
+#   - "No module named 'x'" where exactly one installed module is closest to x (same length rule).
+# Otherwise the findings are added to the model prompt. The counters show the share of
+# debug requests answered locally (GET /debug_code/stats).
+
+STATIC_PRECHECK_ENABLED = os.getenv("RYAN_STATIC_PRECHECK", "1") != "0"
+NODE_CHECK_TIMEOUT = 10 # Seconds for `node --check`
+_BUILTIN_NAMES = set(dir(builtins)) | {"__file__", "__name__", "__doc__", "__builtins__", "__spec__", "__loader__"}
+_NAME_ERROR_RE = re.compile(r"NameError: name '(\w+)' is not defined")
+_MODULE_ERROR_RE = re.compile(r"ModuleNotFoundError: No module named '([\w.]+)'")
+
+# Names that are almost always an import away: name -> import statement
+_COMMON_IMPORTS = {
+    "np": "import numpy as np", "pd": "import pandas as pd", "plt": "import matplotlib.pyplot as plt",
+    "sns": "import seaborn as sns", "tf": "import tensorflow as tf",
+    "List": "from typing import List", "Dict": "from typing import Dict", "Optional": "from typing import Optional",
+    "Any": "from typing import Any", "Tuple": "from typing import Tuple", "Set": "from typing import Set",
+    "Callable": "from typing import Callable", "Union": "from typing import Union", "Iterable": "from typing import Iterable",
+    "defaultdict": "from collections import defaultdict", "Counter": "from collections import Counter",
+    "deque": "from collections import deque", "namedtuple": "from collections import namedtuple",
+    "OrderedDict": "from collections import OrderedDict", "dataclass": "from dataclasses import dataclass",
+    "field": "from dataclasses import field", "Path": "from pathlib import Path", "datetime": "from datetime import datetime",
+    "partial": "from functools import partial", "reduce": "from functools import reduce", "lru_cache": "from functools import lru_cache",
+    "sleep": "from time import sleep", "pprint": "from pprint import pprint",
+}
+_STDLIB_MODULES = set(getattr(sys, "stdlib_module_names", ())) - {"this", "antigravity"}
+# Shorter names are renamed only by the model: one edit away from too many others
+MIN_AUTO_RENAME_LENGTH = 3
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def edit_distance(a: str, b: str, limit: int = 3) -> int:
+    """Levenshtein distance with adjacent transpositions (optimal string alignment); stops counting above limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = 0 if char_a == char_b else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def typo_candidates(name: str, pool: Set[str]) -> List[str]:
+    """Names in pool closest to name, within the allowed distance (all tied ones, sorted)."""
+    limit = 1 if len(name) <= 4 else 2
+    best, matches = limit + 1, []
+    for candidate in pool:
+        if candidate == name or candidate.startswith("__"):
+            continue
+        distance = edit_distance(name.lower(), candidate.lower(), limit)
+        if distance < best:
+            best, matches = distance, [candidate]
+        elif distance == best:
+            matches.append(candidate)
+    return sorted(matches) if best <= limit else []
+
+
+# --- Python ---
+
+def _python_names(code: str) -> Tuple[Set[str], Set[str], Dict[str, int]]:
+    """(names read from module/global scope, names bound at module level, imported name -> line)."""
+    table = symtable.symtable(code, "<code>", "exec")
+    read_globals: Set[str] = set()
+    module_bound: Set[str] = set()
+    pending = [table]
+    while pending:
+        scope = pending.pop()
+        is_module = scope.get_type() == "module"
+        for symbol in scope.get_symbols():
+            name = symbol.get_name()
+            if is_module:
+                if symbol.is_assigned() or symbol.is_imported():
+                    module_bound.add(name)
+                if symbol.is_referenced():
+                    read_globals.add(name)
+            elif symbol.is_global():
+                if symbol.is_referenced():
+                    read_globals.add(name)
+                if symbol.is_declared_global() and symbol.is_assigned():
+                    module_bound.add(name)
+        pending.extend(scope.get_children())
+    imports: Dict[str, int] = {}
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and not (isinstance(node, ast.ImportFrom) and node.module == "__future__"):
+            for alias in node.names:
+                if alias.name != "*":
+                    imports.setdefault((alias.asname or alias.name).split(".")[0], node.lineno)
+    return read_globals, module_bound, imports
+
+
+def _scope_pools(code: str, names: Set[str], module_bound: Set[str]) -> Dict[str, Set[str]]:
+    """
+    For each of names, the bound names visible in every scope that reads it: the scope itself, its
+    enclosing function scopes and the module (class bodies aren't visible from their methods).
+    """
+    pools: Dict[str, Set[str]] = {}
+
+    def visit(scope, enclosing: Set[str]):
+        is_module = scope.get_type() == "module"
+        bound = module_bound if is_module else {symbol.get_name() for symbol in scope.get_symbols()
+                                                 if symbol.is_assigned() or symbol.is_imported() or symbol.is_parameter()}
+        visible = enclosing | bound
+        for symbol in scope.get_symbols():
+            name = symbol.get_name()
+            if name in names and symbol.is_referenced() and (is_module or symbol.is_global()):
+                pools[name] = pools[name] & visible if name in pools else set(visible)
+        for child in scope.get_children():
+            visit(child, enclosing if scope.get_type() == "class" else visible)
+
+    visit(symtable.symtable(code, "<code>", "exec"), set())
+    return pools
+
+
+def _binds_locally(scope: ast.AST, name: str) -> bool:
+    """True if the scope itself (not a nested one) binds name and doesn't declare it global."""
+    bound = False
+    pending = list(ast.iter_child_nodes(scope))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, ast.Global) and name in node.names:
+            return False
+        if ((isinstance(node, ast.Name) and node.id == name and isinstance(node.ctx, (ast.Store, ast.Del)))
+                or (isinstance(node, ast.arg) and node.arg == name)
+                or (isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.name == name)
+                or (isinstance(node, ast.ExceptHandler) and node.name == name)
+                or (isinstance(node, (ast.Import, ast.ImportFrom)) and any((alias.asname or alias.name).split(".")[0] == name for alias in node.names))):
+            bound = True
+        if not isinstance(node, _SCOPE_NODES):
+            pending.extend(ast.iter_child_nodes(node))
+    return bound
+
+
+def _global_reads(tree: ast.AST, name: str) -> Tuple[List[int], List[str]]:
+    """
+    (lines where name is read from the module scope, classes whose body binds name around such a read).
+    Reads in a class body that binds name, or in a function that binds it, are local and not listed.
+    """
+    lines: Set[int] = set()
+    classes: Set[str] = set()
+
+    def visit(node, shadowed: bool, inherited: bool, enclosing_classes: Tuple[str, ...]):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                # A class body's bindings are visible in the body itself but not in its methods
+                in_body = _binds_locally(child, name)
+                visit(child, inherited or in_body, inherited, enclosing_classes + ((child.name,) if in_body else ()))
+            elif isinstance(child, _SCOPE_NODES):
+                local = inherited or _binds_locally(child, name)
+                visit(child, local, local, enclosing_classes)
+            elif isinstance(child, ast.Name):
+                if child.id == name and isinstance(child.ctx, ast.Load) and not shadowed:
+                    lines.add(child.lineno)
+                    classes.update(enclosing_classes)
+            else:
+                visit(child, shadowed, inherited, enclosing_classes)
+
+    visit(tree, False, False, ())
+    return sorted(lines), sorted(classes)
+
+
+def _only_attribute_base(tree: ast.AST, name: str) -> bool:
+    """True if every read of name is the base of an attribute access (name.attr), as with a module."""
+    bases = {id(node.value) for node in ast.walk(tree) if isinstance(node, ast.Attribute)}
+    reads = [node for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id == name and isinstance(node.ctx, ast.Load)]
+    return bool(reads) and all(id(node) in bases for node in reads)
+
+
+def _loaded_names(tree: ast.AST) -> Set[str]:
+    """Every name read anywhere, plus strings listed in __all__ (re-exported imports aren't unused)."""
+    loaded = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == "__all__" for target in node.targets):
+            loaded |= {element.value for element in ast.walk(node.value) if isinstance(element, ast.Constant) and isinstance(element.value, str)}
+    return loaded
+
+
+def _rename(code: str, tree: ast.AST, old: str, new: str) -> str:
+    """Replaces every read of the name old with new, using the AST positions (UTF-8 byte offsets)."""
+    lines = code.splitlines(keepends=True)
+    spots = sorted(((node.lineno, node.col_offset) for node in ast.walk(tree)
+                    if isinstance(node, ast.Name) and node.id == old and isinstance(node.ctx, ast.Load)), reverse=True)
+    for lineno, column in spots:
+        raw = lines[lineno - 1].encode()
+        lines[lineno - 1] = (raw[:column] + new.encode() + raw[column + len(old.encode()):]).decode()
+    return "".join(lines)
+
+
+def _add_import(code: str, tree: ast.Module, statement: str) -> str:
+    """Inserts statement after the module docstring and the existing top-level imports."""
+    insert_after = 0
+    for index, node in enumerate(tree.body):
+        is_docstring = index == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+        if is_docstring or isinstance(node, (ast.Import, ast.ImportFrom)):
+            insert_after = node.end_lineno
+        else:
+            break
+    lines = code.splitlines(keepends=True)
+    lines.insert(insert_after, statement + "\n")
+    return "".join(lines)
+
+
+def _parses(code: str) -> bool:
+    try:
+        ast.parse(code)
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+
+def _repair_python_syntax(code: str, error: SyntaxError) -> Optional[Tuple[str, str]]:
+    """A one-line repair for common syntax errors: (corrected code, what was changed), or None."""
+    if not error.lineno:
+        return None
+    lines = code.splitlines(keepends=True)
+    index = error.lineno - 1
+    if index >= len(lines):
+        return None
+    line = lines[index]
+    body = line.rstrip("\r\n")
+    ending = line[len(body):] or ""
+    message = error.msg or ""
+    candidates: List[Tuple[str, str]] = []
+    if "expected ':'" in message or (message == "invalid syntax" and re.match(r"\s*(if|elif|else|for|while|def|class|try|except|finally|with)\b", body)):
+        code_part, hash_mark, comment = body.partition("#")
+        fixed = code_part.rstrip() + ":" + (" " + hash_mark + comment if hash_mark else "")
+        candidates.append((fixed, f"added the missing ':' at the end of line {error.lineno}"))
+    closing = re.match(r"'([(\[{])' was never closed", message)
+    if closing:
+        # Close it at the end of the opening line or of one of the next few lines, whichever parses
+        closer = {"(": ")", "[": "]", "{": "}"}[closing.group(1)]
+        for offset in range(min(5, len(lines) - index)):
+            target = lines[index + offset]
+            target_body = target.rstrip("\r\n")
+            corrected = "".join(lines[:index + offset]) + target_body + closer + target[len(target_body):] + "".join(lines[index + offset + 1:])
+            if _parses(corrected):
+                return corrected, f"closed the '{closing.group(1)}' opened on line {error.lineno} at the end of line {error.lineno + offset}"
+    if message.startswith("Missing parentheses in call to 'print'"):
+        printed = re.match(r"(\s*)print\s+(.*)$", body)
+        if printed:
+            candidates.append((f"{printed.group(1)}print({printed.group(2).rstrip()})", f"turned the Python 2 print statement on line {error.lineno} into a call"))
+    if "Maybe you meant '==' or ':=' instead of '='" in message:
+        condition = re.match(r"(\s*(?:if|elif|while)\s+)(.*)$", body)
+        if condition and condition.group(2).count("=") - 2 * condition.group(2).count("==") == 1:
+            fixed = condition.group(1) + re.sub(r"(?<![=!<>])=(?!=)", "==", condition.group(2), count=1)
+            candidates.append((fixed, f"replaced the assignment '=' in the condition on line {error.lineno} with '=='"))
+    for fixed_line, change in candidates:
+        corrected = "".join(lines[:index]) + fixed_line + ending + "".join(lines[index + 1:])
+        if _parses(corrected):
+            return corrected, change
+    return None
+
+
+def _installed_modules() -> Set[str]:
+    import pkgutil
+    return _STDLIB_MODULES | {module.name for module in pkgutil.iter_modules()}
+
+
+def check_python(code: str, error_output: str = "") -> Dict[str, Any]:
+    """Static findings for Python code, and a local answer when one is certain. See the module comment."""
+    findings: List[Dict[str, Any]] = []
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        findings.append({"kind": "syntax_error", "line": e.lineno, "column": e.offset, "message": e.msg,
+                         "text": (e.text or "").rstrip()})
+        answer = None
+        repaired = _repair_python_syntax(code, e)
+        if repaired:
+            corrected, change = repaired
+            answer = {"suggestion": f"SyntaxError on line {e.lineno} ({e.msg}). Fix: {change}.", "corrected_code": corrected}
+        return {"findings": findings, "answer": answer}
+    except ValueError as e:
+        # e.g. source code containing null bytes
+        return {"findings": [{"kind": "syntax_error", "line": None, "message": str(e)}], "answer": None}
+
+    read_globals, module_bound, imports = _python_names(code)
+    undefined = sorted(read_globals - module_bound - _BUILTIN_NAMES)
+    pools = _scope_pools(code, set(undefined), module_bound)
+    for name in undefined:
+        lines, classes = _global_reads(tree, name)
+        finding = {"kind": "undefined_name", "name": name, "lines": lines}
+        if classes:
+            # Bound in a class body but read from a method: an attribute access is missing
+            finding["class_attribute_of"] = classes
+        # A curated alias is only challenged by names the code binds (List vs the builtin list isn't a typo)
+        suggestions = typo_candidates(name, pools.get(name, set()) | (set() if name in _COMMON_IMPORTS else _BUILTIN_NAMES))
+        if suggestions:
+            finding["did_you_mean"] = suggestions
+        if name in _COMMON_IMPORTS:
+            finding["missing_import"] = _COMMON_IMPORTS[name]
+        elif name in _STDLIB_MODULES and _only_attribute_base(tree, name):
+            finding["missing_import"] = f"import {name}"
+        findings.append(finding)
+    loaded = _loaded_names(tree)
+    for name, line in sorted(imports.items(), key=lambda item: item[1]):
+        if name not in loaded:
+            findings.append({"kind": "unused_import", "name": name, "line": line})
+
+    answer = None
+    name_error = _NAME_ERROR_RE.search(error_output or "")
+    module_error = _MODULE_ERROR_RE.search(error_output or "")
+    if name_error and name_error.group(1) in undefined:
+        name = name_error.group(1)
+        finding = next(f for f in findings if f.get("name") == name and f["kind"] == "undefined_name")
+        suggestions = finding.get("did_you_mean", [])
+        # An in-scope typo beats a stdlib module guess; a curated alias (np, List) with a typo candidate is ambiguous
+        if (len(suggestions) == 1 and name not in _COMMON_IMPORTS and not finding.get("class_attribute_of")
+                and min(len(name), len(suggestions[0])) >= MIN_AUTO_RENAME_LENGTH):
+            replacement = suggestions[0]
+            answer = {"suggestion": f"NameError: '{name}' is not defined on line(s) {', '.join(map(str, finding['lines']))}; "
+                                    f"it looks like a typo for '{replacement}'. Fix: rename it to '{replacement}'.",
+                      "corrected_code": _rename(code, tree, name, replacement)}
+        elif "missing_import" in finding and not suggestions and not finding.get("class_attribute_of"):
+            statement = finding["missing_import"]
+            answer = {"suggestion": f"NameError: '{name}' is used without being imported. Fix: add `{statement}` at the top of the file.",
+                      "corrected_code": _add_import(code, tree, statement)}
+    elif module_error:
+        missing = module_error.group(1)
+        suggestions = typo_candidates(missing.split(".")[0], _installed_modules())
+        findings.append({"kind": "missing_module", "name": missing, **({"did_you_mean": suggestions} if suggestions else {})})
+        if len(suggestions) == 1 and min(len(missing.split(".")[0]), len(suggestions[0])) >= MIN_AUTO_RENAME_LENGTH:
+            top = missing.split(".")[0]
+            corrected = re.sub(rf"^(\s*(?:import|from)\s+){re.escape(top)}\b", rf"\g<1>{suggestions[0]}", code, flags=re.MULTILINE)
+            if corrected != code:
+                # `import jsn` ... jsn.dumps(): the module's name changes at every use too
+                corrected = _rename(corrected, ast.parse(corrected), top, suggestions[0])
+                answer = {"suggestion": f"ModuleNotFoundError: there is no module '{missing}'; it looks like a typo for '{suggestions[0]}'. "
+                                        f"Fix: import '{suggestions[0]}' instead.", "corrected_code": corrected}
+    if answer and not _parses(answer["corrected_code"]):
+        answer = None
+    return {"findings": findings, "answer": answer}
+
+
+# --- JavaScript ---
+
+def _node_check(code: str) -> Optional[Tuple[int, str]]:
+    """Runs `node --check`. None if the code parses (or node is unavailable), else (line, message)."""
+    node = shutil.which("node")
+    if node is None:
+        return None
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False) as handle:
+        handle.write(code)
+        path = handle.name
+    try:
+        completed = subprocess.run([node, "--check", path], capture_output=True, text=True, timeout=NODE_CHECK_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return None
+    finally:
+        os.unlink(path)
+    if completed.returncode == 0:
+        return None
+    stderr = completed.stderr
+    location = re.search(re.escape(path) + r":(\d+)", stderr)
+    message = re.search(r"^(SyntaxError: .*)$", stderr, re.MULTILINE)
+    if message:
+        text = message.group(1)
+    else:
+        text = stderr.strip().splitlines()[-1] if stderr.strip() else "SyntaxError"
+    return (int(location.group(1)) if location else 0, text)
+
+
+def _unclosed_brackets(code: str) -> str:
+    """The closers for brackets still open at the end of code (strings and comments skipped; no regex literals)."""
+    stack: List[str] = []
+    pairs = {"(": ")", "[": "]", "{": "}"}
+    index, quote = 0, None
+    while index < len(code):
+        char = code[index]
+        if quote:
+            if char == "\\":
+                index += 1
+            elif char == quote:
+                quote = None
+        elif code.startswith("//", index):
+            newline = code.find("\n", index)
+            index = len(code) if newline < 0 else newline
+        elif code.startswith("/*", index):
+            end = code.find("*/", index + 2)
+            index = len(code) if end < 0 else end + 1
+        elif char in "'\"`":
+            quote = char
+        elif char in pairs:
+            stack.append(pairs[char])
+        elif char in ")]}" and stack and stack[-1] == char:
+            stack.pop()
+        index += 1
+    return "".join(reversed(stack))
+
+
+def check_javascript(code: str, error_output: str = "") -> Dict[str, Any]:
+    """Syntax check with node; repairs brackets left open at the end of the file."""
+    problem = _node_check(code)
+    if problem is None:
+        return {"findings": [], "answer": None}
+    line, message = problem
+    findings = [{"kind": "syntax_error", "line": line, "message": message}]
+    answer = None
+    if "Unexpected end of input" in message:
+        closers = _unclosed_brackets(code)
+        if closers:
+            corrected = code.rstrip() + "\n" + "\n".join(closers) + "\n"
+            if _node_check(corrected) is None:
+                answer = {"suggestion": f"{message}: {len(closers)} bracket(s) are never closed. Fix: close them at the end of the file ({' '.join(closers)}).",
+                          "corrected_code": corrected}
+    return {"findings": findings, "answer": answer}
+
+
+def precheck(code: str, error_output: str, language: str) -> Optional[Dict[str, Any]]:
+    """
+    Runs the local analysis for language. Returns None when there's no analyser for it (or it is disabled),
+    else {"findings": [...], "answer": {"suggestion", "corrected_code"} or None, "time": seconds}.
+    """
+    language = (language or "").lower()
+    if not STATIC_PRECHECK_ENABLED or language not in ("python", "javascript", "js"):
+        return None
+    start = time.perf_counter()
+    try:
+        report = check_python(code, error_output) if language == "python" else check_javascript(code, error_output)
+    except Exception as e:
+        # The pre-check must never stand between the user and the model
+        logging.warning(f"Static pre-check failed: {e}")
+        return None
+    report["time"] = round(time.perf_counter() - start, 6)
+    return report
+
+
+def format_findings(findings: List[Dict[str, Any]]) -> str:
+    """Findings as prompt lines."""
+    lines = []
+    for finding in findings:
+        kind = finding["kind"]
+        if kind == "syntax_error":
+            lines.append(f"- Syntax error on line {finding.get('line')}: {finding.get('message')}")
+        elif kind == "undefined_name":
+            line = f"- '{finding['name']}' is read but never defined (line(s) {', '.join(map(str, finding['lines']))})"
+            if finding.get("class_attribute_of"):
+                owner = finding["class_attribute_of"][0]
+                line += f"; it is bound in the body of class {' and '.join(finding['class_attribute_of'])}, which methods can't see: self.{finding['name']} or {owner}.{finding['name']}?"
+            elif finding.get("missing_import"):
+                line += f"; missing `{finding['missing_import']}`?"
+            elif finding.get("did_you_mean"):
+                line += f"; did you mean {' or '.join(repr(name) for name in finding['did_you_mean'])}?"
+            lines.append(line)
+        elif kind == "unused_import":
+            lines.append(f"- '{finding['name']}' is imported on line {finding['line']} but never used")
+        elif kind == "missing_module":
+            line = f"- Module '{finding['name']}' is not installed"
+            if finding.get("did_you_mean"):
+                line += f"; did you mean {' or '.join(repr(name) for name in finding['did_you_mean'])}?"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+class PrecheckStats:
+    """How many debug requests the pre-check answered locally, added findings to, or passed on unchanged."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.answered_locally = 0
+        self.prompt_augmented = 0
+        self.check_time = 0.0
+
+    def record(self, report: Optional[Dict[str, Any]]):
+        with self._lock:
+            self.requests += 1
+            if report is None:
+                return
+            self.check_time += report.get("time", 0.0)
+            if report.get("answer"):
+                self.answered_locally += 1
+            elif report.get("findings"):
+                self.prompt_augmented += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": STATIC_PRECHECK_ENABLED,
+                "debug_requests": self.requests,
+                "answered_locally": self.answered_locally,
+                "local_share": round(self.answered_locally / self.requests, 4) if self.requests else 0.0,
+                "prompt_augmented": self.prompt_augmented,
+                "check_time": round(self.check_time, 6),
+            }
+
+
+_stats: Optional[PrecheckStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_precheck_stats() -> PrecheckStats:
+    """Returns the process-wide pre-check counters."""
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = PrecheckStats()
+        return _stats
@@ -0,0 +1,528 @@
+import os
+import re
+import ast
+import time
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+
+from ryan_prompt_slice import line_depths, JS_DECLARATION_RE
+
+# --- Code Symbol Index ---
+# "Where is fix_code defined" or "what calls save_memory" used to go to the model, which had
+# to be given (and re-read) whole files to answer. Code ingested through process_document or
+# /documents/ingest is now indexed by symbol instead:
+#   - extraction  - Python is parsed with ast: definitions (functions, methods, classes and
+#                   module/class-level assignments) with qualified names (Class.method),
+#                   signatures and the first docstring line, every name and attribute
+#                   reference (calls marked, with the enclosing definition) and imports.
+#                   JavaScript has no parser in Python, so it uses the declaration regex and
+#                   brace depths of ryan_prompt_slice.py plus identifier scanning.
+#                   extract_symbols() is plain data in and out, so ingest workers run it.
+#   - storage     - sqlite, compact: names and qualified names are interned once in a names
+#                   table and rows hold integer ids; references are a WITHOUT ROWID table
+#                   keyed (name, file, line, call, scope), so all uses of a name are one
+#                   contiguous range scan. A file whose content hash is unchanged is skipped.
+#   - queries     - lookup(name) returns definitions, references, callers (grouped by the
+#                   calling definition) and imports; outline(file_name) lists a file's
+#                   definitions. Both are index reads, typically well under a millisecond.
+# The chat pipeline answers symbol questions (parse_symbol_question) from the index before any
+# model call, and falls through to the model when the index knows nothing about the name.
+# References carry the bare name only (`a.run()` can't be tied to A or B without types), so
+# "what calls A.run" / "where is A.run used" go to the model too instead of listing every .run.
+
+SYMBOL_DB_PATH = os.getenv("RYAN_SYMBOL_DB", os.path.join(tempfile.gettempdir(), "ryan_symbols.sqlite3"))
+SYMBOL_MAX_RESULTS = int(os.getenv("RYAN_SYMBOL_MAX_RESULTS", "200"))
+SYMBOL_CHAT_MAX_LINES = 20 # Locations listed in a chat answer; the rest are counted
+SYMBOL_LANGUAGES = {"python", "javascript"}
+_SIGNATURE_MAX_CHARS = 200
+_DOC_MAX_CHARS = 200
+_SQL_VARIABLES = 500
+
+_JS_KEYWORDS = {
+    "async", "await", "break", "case", "catch", "class", "const", "continue", "debugger", "default", "delete", "do",
+    "else", "export", "extends", "false", "finally", "for", "from", "function", "if", "import", "in", "instanceof",
+    "let", "new", "null", "of", "return", "static", "super", "switch", "this", "throw", "true", "try", "typeof",
+    "undefined", "var", "void", "while", "with", "yield", "get", "set",
+}
+_JS_METHOD_RE = re.compile(r"^\s*(?:static\s+)?(?:async\s+)?(?:get\s+|set\s+)?\*?\s*([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*\{")
+_JS_FUNCTION_VALUE_RE = re.compile(r"=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)")
+_JS_STRING_RE = re.compile(r"\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`")
+_JS_IDENTIFIER_RE = re.compile(r"(?<![\w$])([A-Za-z_$][\w$]*)(\s*\()?")
+_JS_IMPORT_RE = re.compile(r"^\s*import\s+(?:(.+?)\s+from\s+)?[\"']([^\"']+)[\"']")
+_JS_REQUIRE_RE = re.compile(r"^\s*(?:const|let|var)\s+(\{[^}]*\}|[\w$]+)\s*=\s*require\(\s*[\"']([^\"']+)[\"']\s*\)")
+
+
+# --- Extraction (worker-safe: plain data in, plain data out) ---
+
+def _first_line(text: Optional[str], limit: int) -> Optional[str]:
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if line:
+            return line[:limit]
+    return None
+
+
+class _PythonSymbols(ast.NodeVisitor):
+    def __init__(self):
+        self.scope: List[str] = []
+        self.kinds: List[str] = []
+        self.calls = set()
+        self.definitions: List[Tuple] = []
+        self.references = set()
+        self.imports: List[Tuple] = []
+
+    def _define(self, node: ast.AST, name: str, kind: str, signature: str, doc: Optional[str] = None):
+        qualname = ".".join(self.scope + [name])
+        self.definitions.append((name, qualname, kind, node.lineno, node.end_lineno, signature[:_SIGNATURE_MAX_CHARS], doc))
+
+    def _reference(self, name: str, node: ast.AST, line: int):
+        self.references.add((name, line, int(id(node) in self.calls), ".".join(self.scope)))
+
+    def _enter(self, name: str, kind: str, body: List[ast.stmt]):
+        self.scope.append(name)
+        self.kinds.append(kind)
+        for statement in body:
+            self.visit(statement)
+        self.scope.pop()
+        self.kinds.pop()
+
+    def visit_FunctionDef(self, node):
+        # Decorators, defaults and annotations are evaluated in the enclosing scope
+        for expression in node.decorator_list:
+            self.visit(expression)
+        self.visit(node.args)
+        if node.returns:
+            self.visit(node.returns)
+        prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+        signature = f"{prefix} {node.name}({ast.unparse(node.args)})" + (f" -> {ast.unparse(node.returns)}" if node.returns else "")
+        kind = "method" if self.kinds and self.kinds[-1] == "class" else "function"
+        self._define(node, node.name, kind, signature, _first_line(ast.get_docstring(node), _DOC_MAX_CHARS))
+        self._enter(node.name, "function", node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        for expression in node.decorator_list + node.bases + [keyword.value for keyword in node.keywords]:
+            self.visit(expression)
+        bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+        signature = f"class {node.name}({bases})" if bases else f"class {node.name}"
+        self._define(node, node.name, "class", signature, _first_line(ast.get_docstring(node), _DOC_MAX_CHARS))
+        self._enter(node.name, "class", node.body)
+
+    def _visit_assignment(self, node, targets: List[ast.expr]):
+        if not self.kinds or self.kinds[-1] == "class":
+            kind = "attribute" if self.kinds else "variable"
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        self._define(node, name.id, kind, _first_line(ast.unparse(node), _SIGNATURE_MAX_CHARS) or name.id)
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        self._visit_assignment(node, node.targets)
+
+    def visit_AnnAssign(self, node):
+        self._visit_assignment(node, [node.target])
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.imports.append((alias.name, None, alias.asname, node.lineno))
+
+    def visit_ImportFrom(self, node):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self.imports.append((module, alias.name, alias.asname, node.lineno))
+
+    def visit_Call(self, node):
+        self.calls.add(id(node.func))
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if not isinstance(node.ctx, ast.Store): # Bindings are not uses
+            self._reference(node.id, node, node.lineno)
+
+    def visit_Attribute(self, node):
+        self._reference(node.attr, node, node.end_lineno) # The attribute name ends the expression
+        self.visit(node.value)
+
+
+def _with_aliases(references: set, imports: List[Tuple]) -> List[Tuple]:
+    """Uses of an import alias ("from b import helper as h"; h()) also count as uses of the imported name."""
+    aliases = {alias: name or module for module, name, alias, _ in imports if alias}
+    references |= {(aliases[name], line, call, scope) for name, line, call, scope in references if name in aliases}
+    return sorted(references)
+
+
+def _python_symbols(code: str) -> Dict[str, Any]:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return {"definitions": [], "references": [], "imports": [], "error": f"SyntaxError: {e.msg} (line {e.lineno})"}
+    visitor = _PythonSymbols()
+    visitor.visit(tree)
+    return {"definitions": visitor.definitions, "references": _with_aliases(visitor.references, visitor.imports), "imports": visitor.imports}
+
+
+def _javascript_doc(lines: List[str], number: int) -> Optional[str]:
+    """The first line of the /** */ block or // comments directly above line number."""
+    index = number - 2
+    if index < 0:
+        return None
+    above = lines[index].strip()
+    comment: List[str] = []
+    if above.endswith("*/"):
+        while index >= 0:
+            comment.insert(0, lines[index].strip())
+            if lines[index].strip().startswith("/*"):
+                break
+            index -= 1
+        texts = [line.strip("/*").strip() for line in comment]
+    elif above.startswith("//"):
+        while index >= 0 and lines[index].strip().startswith("//"):
+            comment.insert(0, lines[index].strip())
+            index -= 1
+        texts = [line.lstrip("/").strip() for line in comment]
+    else:
+        return None
+    return _first_line("\n".join(text for text in texts if not text.startswith("@")), _DOC_MAX_CHARS)
+
+
+def _javascript_symbols(code: str) -> Dict[str, Any]:
+    lines = code.splitlines()
+    depths = line_depths(code)
+    depths += [0] * (len(lines) + 1 - len(depths))
+    definitions: List[Tuple] = []
+    uses: List[Tuple[str, int, int]] = [] # (name, line, call); scopes are assigned once all definitions are known
+    imports: List[Tuple] = []
+    stack: List[Tuple[str, str, int, int]] = [] # (qualname, kind, depth, end line) of the enclosing definitions
+    in_comment = False
+
+    for number, text in enumerate(lines, 1):
+        depth = depths[number - 1]
+        while stack and stack[-1][3] < number:
+            stack.pop()
+        scope = stack[-1][0] if stack else ""
+
+        stripped = text.strip()
+        if in_comment or stripped.startswith("/*"):
+            in_comment = "*/" not in stripped
+            continue
+
+        name, kind = None, None
+        declaration = JS_DECLARATION_RE.match(text)
+        if declaration:
+            name = declaration.group(1) or declaration.group(2) or declaration.group(3)
+            kind = "function" if declaration.group(1) else "class" if declaration.group(2) else \
+                "function" if _JS_FUNCTION_VALUE_RE.search(text) else "variable"
+        elif stack and stack[-1][1] == "class" and depth == stack[-1][2] + 1:
+            method = _JS_METHOD_RE.match(text)
+            if method and method.group(1) not in _JS_KEYWORDS:
+                name, kind = method.group(1), "method"
+        if name:
+            end = number
+            while end < len(lines) and depths[end] > depth:
+                end += 1
+            qualname = f"{scope}.{name}" if scope and stack[-1][1] == "class" else name
+            signature = stripped.split("{")[0].rstrip() if "{" in stripped else stripped
+            definitions.append((name, qualname, kind, number, end, signature[:_SIGNATURE_MAX_CHARS], _javascript_doc(lines, number)))
+            if end > number:
+                stack.append((qualname, kind, depth, end))
+
+        imported = _JS_IMPORT_RE.match(text) or _JS_REQUIRE_RE.match(text)
+        if imported:
+            module = imported.group(2)
+            for part in re.split(r"[{},]", imported.group(1) or ""):
+                part = part.strip()
+                if part:
+                    original, _, alias = part.partition(" as ")
+                    imports.append((module, original.strip(), alias.strip() or None, number))
+            if not imported.group(1):
+                imports.append((module, None, None, number))
+
+        code_text = _JS_STRING_RE.sub('""', text).split("//")[0]
+        for match in _JS_IDENTIFIER_RE.finditer(code_text):
+            identifier = match.group(1)
+            if identifier in _JS_KEYWORDS or identifier == name:
+                continue
+            uses.append((identifier, number, int(bool(match.group(2)))))
+
+    # A use belongs to the innermost function, method or class whose lines contain it, one-line
+    # definitions included (`go() { return load(x); }`, `const f = (a) => load(a);`). A class's
+    # own header line (`class B extends A {`) belongs to the enclosing scope, as in Python.
+    spans = sorted(((line + 1 if kind == "class" else line, end, qualname) for _, qualname, kind, line, end, _, _ in definitions
+                    if kind in ("function", "method", "class")), key=lambda span: (span[0], -span[1]))
+    line_scopes: List[str] = [""]
+    open_spans: List[Tuple[int, int, str]] = []
+    next_span = 0
+    for number in range(1, len(lines) + 1):
+        while next_span < len(spans) and spans[next_span][0] <= number:
+            open_spans.append(spans[next_span])
+            next_span += 1
+        open_spans = [span for span in open_spans if span[1] >= number]
+        line_scopes.append(open_spans[-1][2] if open_spans else "")
+    references = {(identifier, number, call, line_scopes[number]) for identifier, number, call in uses}
+
+    return {"definitions": definitions, "references": _with_aliases(references, imports), "imports": imports}
+
+
+def extract_symbols(code: str, language: str) -> Dict[str, Any]:
+    """
+    Definitions, references and imports of a Python or JavaScript file:
+    {"language", "content_hash", "definitions": [(name, qualname, kind, line, end_line, signature, doc)],
+     "references": [(name, line, call, scope qualname)], "imports": [(module, name, alias, line)], "error"?}.
+    """
+    extracted = _python_symbols(code) if language == "python" else _javascript_symbols(code)
+    extracted.update({"language": language, "content_hash": hashlib.sha256(code.encode("utf-8")).hexdigest()})
+    return extracted
+
+
+# --- Chat questions ---
+
+_SYMBOL = r"`?([A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*)(?:\(\))?`?"
+_SYMBOL_KIND = r"(?:the\s+)?(?:(?:function|class|method|variable|constant|symbol)\s+)?"
+_SYMBOL_QUESTIONS = [(question, re.compile(pattern.format(kind=_SYMBOL_KIND, symbol=_SYMBOL), re.IGNORECASE)) for question, pattern in [
+    ("definition", r"^(?:where(?:'s|\s+is|\s+are)|in\s+which\s+file\s+is)\s+{kind}{symbol}\s+(?:defined|declared|implemented)\s*\??$"),
+    ("definition", r"^(?:find|show(?:\s+me)?|go\s+to)\s+(?:the\s+)?(?:definition|declaration|source)\s+of\s+{kind}{symbol}\s*\??$"),
+    ("definition", r"^which\s+files?\s+(?:defines|declares)\s+{kind}{symbol}\s*\??$"),
+    ("callers", r"^(?:what|who|which\s+functions?)\s+calls?\s+{kind}{symbol}\s*\??$"),
+    ("callers", r"^(?:find|show(?:\s+me)?|list)\s+(?:all\s+)?(?:the\s+)?callers\s+of\s+{kind}{symbol}\s*\??$"),
+    ("callers", r"^where(?:'s|\s+is|\s+are)\s+{kind}{symbol}\s+called(?:\s+from)?\s*\??$"),
+    ("references", r"^where(?:'s|\s+is|\s+are)\s+{kind}{symbol}\s+(?:used|referenced)\s*\??$"),
+    ("references", r"^(?:find|show(?:\s+me)?|list)\s+(?:all\s+)?(?:the\s+)?(?:uses|usages|references)\s+(?:of|to)\s+{kind}{symbol}\s*\??$"),
+    ("signature", r"^what(?:'s|\s+is)\s+the\s+signature\s+of\s+{kind}{symbol}\s*\??$"),
+]]
+
+
+def parse_symbol_question(text: str) -> Optional[Tuple[str, str]]:
+    """(question, symbol name) for "where is X defined", "what calls X", "where is X used", ...; None otherwise."""
+    text = text.strip()
+    for question, pattern in _SYMBOL_QUESTIONS:
+        match = pattern.match(text)
+        if match:
+            return question, match.group(1)
+    return None
+
+
+def _location(entry: Dict[str, Any]) -> str:
+    if entry.get("end_line") and entry["end_line"] != entry["line"]:
+        return f"{entry['file_name']}:{entry['line']}-{entry['end_line']}"
+    return f"{entry['file_name']}:{entry['line']}"
+
+
+def _listed(lines: List[str], shown: int, total: int) -> str:
+    if total > shown:
+        lines.append(f"... and {total - shown} more.")
+    return "\n".join(lines)
+
+
+def format_symbol_answer(question: str, name: str, result: Dict[str, Any]) -> Optional[str]:
+    """
+    A chat answer for a parse_symbol_question question, or None when the index knows nothing about the name
+    or, for callers/references of a dotted name, can't tell its uses from those of other names sharing the last part.
+    """
+    definitions = result["definitions"]
+    if question in ("callers", "references") and "." in name:
+        return None
+    if question in ("definition", "signature"):
+        if not definitions:
+            return None
+        lines = [f"`{name}` is defined in {len(definitions)} place{'s' if len(definitions) != 1 else ''}:"]
+        for entry in definitions[:SYMBOL_CHAT_MAX_LINES]:
+            lines.append(f"- {_location(entry)} ({entry['kind']} `{entry['qualname']}`): `{entry['signature']}`")
+            if entry["doc"]:
+                lines.append(f"  {entry['doc']}")
+        return _listed(lines, min(len(definitions), SYMBOL_CHAT_MAX_LINES), len(definitions))
+    if question == "callers":
+        callers = result["callers"]
+        if not callers:
+            return f"`{name}` is defined at {_location(definitions[0])}, but no calls to it were found in the indexed files." if definitions else None
+        lines = [f"`{name}` is called from {len(callers)} place{'s' if len(callers) != 1 else ''}:"]
+        for caller in callers[:SYMBOL_CHAT_MAX_LINES]:
+            where = f"`{caller['scope']}`" if caller["scope"] else "module level"
+            count = f", {caller['calls']} calls" if caller["calls"] > 1 else ""
+            lines.append(f"- {where} in {caller['file_name']} (line {caller['line']}{count})")
+        return _listed(lines, min(len(callers), SYMBOL_CHAT_MAX_LINES), len(callers))
+    references = result["references"]
+    if not references and not definitions:
+        return None
+    lines = [f"`{name}` is used {result['references_total']} time{'s' if result['references_total'] != 1 else ''}:"]
+    for reference in references[:SYMBOL_CHAT_MAX_LINES]:
+        where = f" in `{reference['scope']}`" if reference["scope"] else ""
+        lines.append(f"- {reference['file_name']}:{reference['line']}{where}{' (call)' if reference['call'] else ''}")
+    return _listed(lines, min(len(references), SYMBOL_CHAT_MAX_LINES), result["references_total"])
+
+
+# --- Store ---
+
+class SymbolIndex:
+    """sqlite tables: files, names (interned), definitions, refs and imports."""
+    def __init__(self, db_path: str = SYMBOL_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS files (file_id INTEGER PRIMARY KEY, file_name TEXT UNIQUE, language TEXT, "
+                                     "content_hash TEXT, definitions INTEGER, refs INTEGER, error TEXT, updated REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS names (name_id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS definitions (name_id INTEGER, qualname_id INTEGER, file_id INTEGER, "
+                                     "kind TEXT, line INTEGER, end_line INTEGER, signature TEXT, doc TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS definitions_name ON definitions (name_id)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS definitions_qualname ON definitions (qualname_id)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS definitions_file ON definitions (file_id)")
+            # scope_id 0 is module level
+            self._connection.execute("CREATE TABLE IF NOT EXISTS refs (name_id INTEGER, file_id INTEGER, line INTEGER, call INTEGER, "
+                                     "scope_id INTEGER, PRIMARY KEY (name_id, file_id, line, call, scope_id)) WITHOUT ROWID")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS refs_file ON refs (file_id)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS imports (file_id INTEGER, module TEXT, name TEXT, alias TEXT, line INTEGER)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS imports_file ON imports (file_id)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS imports_name ON imports (name)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS imports_module ON imports (module)")
+
+    # --- Indexing ---
+
+    def index_file(self, file_name: str, code: str, language: str) -> Dict[str, Any]:
+        """
+        Extracts and stores the symbols of a file, unless its content is unchanged since it was last indexed.
+        Returns {file_name, language, definitions, references, imports, unchanged, error, seconds}.
+        """
+        start = time.perf_counter()
+        content_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._connection.execute("SELECT content_hash, definitions, refs, error FROM files WHERE file_name = ?", (file_name,)).fetchone()
+        if row and row[0] == content_hash:
+            return {"file_name": file_name, "language": language, "definitions": row[1], "references": row[2], "unchanged": True,
+                    "error": row[3], "seconds": round(time.perf_counter() - start, 6)}
+        report = self.store_extracted(file_name, extract_symbols(code, language))
+        report["seconds"] = round(time.perf_counter() - start, 6)
+        return report
+
+    def store_extracted(self, file_name: str, extracted: Dict[str, Any]) -> Dict[str, Any]:
+        """Replaces the stored symbols of file_name with the output of extract_symbols (run elsewhere, e.g. in a worker process)."""
+        definitions, references, imports = extracted["definitions"], extracted["references"], extracted["imports"]
+        with self._lock, self._connection:
+            cursor = self._connection.cursor()
+            cursor.execute("INSERT OR IGNORE INTO files (file_name) VALUES (?)", (file_name,))
+            file_id = cursor.execute("SELECT file_id FROM files WHERE file_name = ?", (file_name,)).fetchone()[0]
+            cursor.execute("UPDATE files SET language = ?, content_hash = ?, definitions = ?, refs = ?, error = ?, updated = ? WHERE file_id = ?",
+                           (extracted["language"], extracted["content_hash"], len(definitions), len(references), extracted.get("error"), time.time(), file_id))
+            for table in ("definitions", "refs", "imports"):
+                cursor.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+            ids = self._intern(cursor, {entry[0] for entry in definitions} | {entry[1] for entry in definitions}
+                               | {entry[0] for entry in references} | {entry[3] for entry in references if entry[3]})
+            cursor.executemany("INSERT INTO definitions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               [(ids[name], ids[qualname], file_id, kind, line, end_line, signature, doc)
+                                for name, qualname, kind, line, end_line, signature, doc in definitions])
+            cursor.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?, ?, ?, ?)",
+                               [(ids[name], file_id, line, call, ids[scope] if scope else 0) for name, line, call, scope in references])
+            cursor.executemany("INSERT INTO imports VALUES (?, ?, ?, ?, ?)", [(file_id, *entry) for entry in imports])
+        if extracted.get("error"):
+            logging.debug(f"Symbols of {file_name} not extracted: {extracted['error']}")
+        return {"file_name": file_name, "language": extracted["language"], "definitions": len(definitions), "references": len(references),
+                "imports": len(imports), "unchanged": False, "error": extracted.get("error")}
+
+    def _intern(self, cursor: sqlite3.Cursor, names: set) -> Dict[str, int]:
+        """name -> name_id, adding the names not seen before."""
+        names = list(names)
+        cursor.executemany("INSERT OR IGNORE INTO names (name) VALUES (?)", [(name,) for name in names])
+        ids: Dict[str, int] = {}
+        for offset in range(0, len(names), _SQL_VARIABLES):
+            batch = names[offset:offset + _SQL_VARIABLES]
+            ids.update(cursor.execute(f"SELECT name, name_id FROM names WHERE name IN ({','.join('?' * len(batch))})", batch).fetchall())
+        return ids
+
+    def remove_file(self, file_name: str) -> bool:
+        """Drops a file's symbols (interned names stay; they are shared). False when the file was not indexed."""
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT file_id FROM files WHERE file_name = ?", (file_name,)).fetchone()
+            if row is None:
+                return False
+            for table in ("definitions", "refs", "imports", "files"):
+                self._connection.execute(f"DELETE FROM {table} WHERE file_id = ?", row)
+        return True
+
+    # --- Queries ---
+
+    def lookup(self, name: str, calls_only: bool = False, limit: int = SYMBOL_MAX_RESULTS) -> Dict[str, Any]:
+        """
+        Everything known about a name: definitions, references (capped at limit; references_total counts all),
+        callers grouped by calling definition, and imports. A dotted name ("RyanAI.save_memory") matches
+        definitions by qualified name; references and callers are by the last part, whatever its receiver,
+        which "reference_name" reports.
+        """
+        start = time.perf_counter()
+        short = name.rsplit(".", 1)[-1]
+        result: Dict[str, Any] = {"name": name, "reference_name": short, "definitions": [], "references": [], "references_total": 0,
+                                  "callers": [], "imports": []}
+        with self._lock:
+            row = self._connection.execute("SELECT name_id FROM names WHERE name = ?", (short,)).fetchone()
+            if row is not None:
+                name_id = row[0]
+                for file_name, language, qualname, kind, line, end_line, signature, doc in self._connection.execute(
+                        "SELECT f.file_name, f.language, q.name, d.kind, d.line, d.end_line, d.signature, d.doc FROM definitions d "
+                        "JOIN files f ON f.file_id = d.file_id JOIN names q ON q.name_id = d.qualname_id "
+                        "WHERE d.name_id = ? ORDER BY f.file_name, d.line", (name_id,)):
+                    if short == name or qualname == name or qualname.endswith("." + name):
+                        result["definitions"].append({"file_name": file_name, "language": language, "qualname": qualname, "kind": kind,
+                                                      "line": line, "end_line": end_line, "signature": signature, "doc": doc})
+                call_filter = " AND r.call = 1" if calls_only else ""
+                result["references_total"] = self._connection.execute(
+                    f"SELECT COUNT(*) FROM refs r WHERE r.name_id = ?{call_filter}", (name_id,)).fetchone()[0]
+                result["references"] = [{"file_name": file_name, "line": line, "call": bool(call), "scope": scope}
+                                        for file_name, line, call, scope in self._connection.execute(
+                                            "SELECT f.file_name, r.line, r.call, s.name FROM refs r JOIN files f ON f.file_id = r.file_id "
+                                            f"LEFT JOIN names s ON s.name_id = r.scope_id WHERE r.name_id = ?{call_filter} "
+                                            "ORDER BY f.file_name, r.line LIMIT ?", (name_id, limit))]
+                result["callers"] = [{"file_name": file_name, "scope": scope, "line": line, "calls": calls}
+                                     for file_name, scope, line, calls in self._connection.execute(
+                                         "SELECT f.file_name, s.name, MIN(r.line), COUNT(*) FROM refs r JOIN files f ON f.file_id = r.file_id "
+                                         "LEFT JOIN names s ON s.name_id = r.scope_id WHERE r.name_id = ? AND r.call = 1 "
+                                         "GROUP BY r.file_id, r.scope_id ORDER BY f.file_name, MIN(r.line) LIMIT ?", (name_id, limit))]
+            result["imports"] = [{"file_name": file_name, "module": module, "name": imported, "alias": alias, "line": line}
+                                 for file_name, module, imported, alias, line in self._connection.execute(
+                                     "SELECT f.file_name, i.module, i.name, i.alias, i.line FROM imports i JOIN files f ON f.file_id = i.file_id "
+                                     "WHERE i.name = ? OR i.alias = ? OR i.module = ? ORDER BY f.file_name, i.line LIMIT ?", (short, short, name, limit))]
+        result["seconds"] = round(time.perf_counter() - start, 6)
+        return result
+
+    def outline(self, file_name: str) -> Optional[Dict[str, Any]]:
+        """A file's definitions and imports in line order (None when the file is not indexed)."""
+        with self._lock:
+            row = self._connection.execute("SELECT file_id, language, error FROM files WHERE file_name = ?", (file_name,)).fetchone()
+            if row is None:
+                return None
+            file_id, language, error = row
+            definitions = [{"qualname": qualname, "kind": kind, "line": line, "end_line": end_line, "signature": signature, "doc": doc}
+                           for qualname, kind, line, end_line, signature, doc in self._connection.execute(
+                               "SELECT q.name, d.kind, d.line, d.end_line, d.signature, d.doc FROM definitions d "
+                               "JOIN names q ON q.name_id = d.qualname_id WHERE d.file_id = ? ORDER BY d.line", (file_id,))]
+            imports = [{"module": module, "name": imported, "alias": alias, "line": line}
+                       for module, imported, alias, line in self._connection.execute(
+                           "SELECT module, name, alias, line FROM imports WHERE file_id = ? ORDER BY line", (file_id,))]
+        return {"file_name": file_name, "language": language, "error": error, "definitions": definitions, "imports": imports}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {table: self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in ("files", "names", "definitions", "refs", "imports")}
+            page_count = self._connection.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._connection.execute("PRAGMA page_size").fetchone()[0]
+        return {**counts, "bytes": page_count * page_size}
+
+
+_index: Optional[SymbolIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_symbol_index() -> SymbolIndex:
+    """Returns the shared symbol index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SymbolIndex()
+        return _index
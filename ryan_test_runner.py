@@ -0,0 +1,177 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+from ryan_exec_scheduler import get_execution_scheduler, run_limited, ExecutionRejected
+from ryan_exec_pool import get_exec_pool, ExecPoolError
+from ryan_compile import get_compile_cache, is_compiled_language, normalize_language
+
+# --- Parallel Multi-Input Test Runner ---
+# Runs one snippet against many stdin/argument cases and compares each output with the
+# expected one. Instead of one /execute_code round trip (and one cold interpreter) per case:
+#   - Python/JavaScript cases run in the warm worker pool (ryan_exec_pool.py), falling back
+#     to cold runs if the pool is unavailable,
+#   - compiled languages are built once (ryan_compile.py) and only the binary runs per case,
+#   - cases run concurrently, each holding an execution scheduler slot, so a batch spreads
+#     across the cores the scheduler allows without starving other requests.
+# Each case is a dict: {"stdin": str, "args": [str], "expected": str, "expected_return_code": int, "name": str},
+# all optional. Without "expected" a case passes if it exits with the expected return code (default 0).
+
+TEST_MAX_CASES = int(os.getenv("RYAN_TEST_MAX_CASES", "200"))
+TEST_CASE_TIMEOUT = float(os.getenv("RYAN_TEST_CASE_TIMEOUT", "10"))
+_OUTPUT_PREVIEW_CHARS = 500 # Output kept in the table for failed cases
+
+# Case statuses
+PASS, FAIL, ERROR, TIMEOUT, REJECTED = "pass", "fail", "error", "timeout", "rejected"
+
+
+def normalize_output(text: str, mode: str = "strip") -> str:
+    """
+    'exact' compares byte for byte, 'strip' ignores trailing whitespace on each line and trailing
+    blank lines (print() newlines, \\r\\n), 'tokens' compares whitespace-separated tokens only.
+    """
+    if mode == "exact":
+        return text
+    if mode == "tokens":
+        return " ".join(text.split())
+    return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").split("\n")).rstrip("\n")
+
+
+def _preview(text: str) -> str:
+    if len(text) <= _OUTPUT_PREVIEW_CHARS:
+        return text
+    return text[:_OUTPUT_PREVIEW_CHARS] + f"... [{len(text) - _OUTPUT_PREVIEW_CHARS} more chars]"
+
+
+def _run_case(command: List[str], language: str, case: Dict[str, Any], warm: bool, timeout: float,
+              cwd: Optional[str]) -> Dict[str, Any]:
+    """Runs one case inside a scheduler slot. Raises ExecutionRejected if no slot is available."""
+    args = [str(arg) for arg in case.get("args") or []]
+    stdin = case.get("stdin")
+    with get_execution_scheduler().slot():
+        if warm:
+            try:
+                # command[-1] is the code for `python -c` / `node -e`
+                return get_exec_pool().run(language, command[-1], stdin=stdin, args=args, timeout=timeout)
+            except ExecPoolError as e:
+                logging.warning(f"Warm pool unavailable for test case, running cold: {e}")
+        return run_limited(command + args, language, stdin=stdin, timeout=timeout, cwd=cwd)
+
+
+def _judge(run: Dict[str, Any], case: Dict[str, Any], compare: str) -> Dict[str, Any]:
+    expected_code = int(case.get("expected_return_code", 0))
+    row: Dict[str, Any] = {
+        "return_code": run["return_code"],
+        "wall_time": run.get("wall_time"),
+        "cpu_time": run.get("cpu_time"),
+    }
+    if run["timed_out"]:
+        row["status"] = TIMEOUT
+    elif run["return_code"] != expected_code:
+        row["status"] = ERROR
+        row["stderr"] = run["stderr"][-_OUTPUT_PREVIEW_CHARS:] # The tail holds the error message
+    elif case.get("expected") is not None and normalize_output(run["stdout"], compare) != normalize_output(str(case["expected"]), compare):
+        row["status"] = FAIL
+        row["expected"] = _preview(str(case["expected"]))
+        row["actual"] = _preview(run["stdout"])
+    else:
+        row["status"] = PASS
+    return row
+
+
+def run_test_cases(code: str, language: str, cases: List[Dict[str, Any]], command: Optional[List[str]] = None,
+                   warm: bool = True, compare: str = "strip", timeout: float = TEST_CASE_TIMEOUT,
+                   parallelism: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Runs code once per case in parallel and returns {"cases": [...], "summary": {...}}.
+    command is the interpreter command line for Python/JavaScript (RyanAI._execution_command);
+    compiled languages are built through the compile cache instead.
+    Raises ValueError for an empty/oversized case list and FileNotFoundError for a missing toolchain.
+    """
+    if not cases:
+        raise ValueError("At least one test case is required.")
+    if len(cases) > TEST_MAX_CASES:
+        raise ValueError(f"Too many test cases ({len(cases)}); the limit is {TEST_MAX_CASES}.")
+    start = time.perf_counter()
+    language = normalize_language(language)
+    summary: Dict[str, Any] = {"total": len(cases), "language": language}
+
+    workspace = None
+    if is_compiled_language(language):
+        artifact = get_compile_cache().build(language, code)
+        summary["compile_time"] = artifact["compile_time"]
+        summary["compile_cached"] = artifact["cached"]
+        if not artifact["success"]:
+            # Nothing can run; every case fails with the compiler output
+            rows = [{"index": i, "name": case.get("name") or f"case {i + 1}", "status": ERROR} for i, case in enumerate(cases)]
+            summary.update(passed=0, failed=len(cases), compile_failed=True, compile_output=artifact["output"],
+                           wall_time=round(time.perf_counter() - start, 6))
+            return {"cases": rows, "summary": summary}
+        command = artifact["run_command"]
+        warm = False
+        workspace = tempfile.mkdtemp(prefix="ryan_tests_")
+    elif command is None:
+        raise ValueError(f"Unsupported language: {language}")
+    else:
+        warm = warm and language in ("python", "javascript")
+
+    # More threads than execution slots would only wait in the scheduler queue (and could overflow it)
+    scheduler = get_execution_scheduler()
+    workers = max(1, min(len(cases), parallelism or scheduler.max_concurrent, scheduler.max_concurrent))
+
+    def run_one(index: int, case: Dict[str, Any]) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"index": index, "name": case.get("name") or f"case {index + 1}"}
+        try:
+            run = _run_case(command, language, case, warm, timeout, workspace)
+            row.update(_judge(run, case, compare))
+        except ExecutionRejected as e:
+            row.update(status=REJECTED, error=str(e))
+        except FileNotFoundError as e:
+            row.update(status=ERROR, error=f"Interpreter not found: {e.filename or command[0]}")
+        return row
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ryan-tests") as executor:
+            rows = list(executor.map(lambda item: run_one(*item), enumerate(cases)))
+    finally:
+        if workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    case_times = [row["wall_time"] for row in rows if row.get("wall_time") is not None]
+    passed = sum(1 for row in rows if row["status"] == PASS)
+    summary.update(
+        passed=passed,
+        failed=len(rows) - passed,
+        all_passed=passed == len(rows),
+        parallelism=workers,
+        warm=warm,
+        wall_time=round(time.perf_counter() - start, 6),
+        case_time_total=round(sum(case_times), 6), # What the cases would cost back to back
+        case_time_max=round(max(case_times), 6) if case_times else None,
+    )
+    logging.info(f"Test run: {passed}/{len(rows)} {language} cases passed in {summary['wall_time']:.3f}s ({workers} parallel).")
+    return {"cases": rows, "summary": summary}
+
+
+def format_test_table(result: Dict[str, Any]) -> str:
+    """Compact text table of a run_test_cases result (one line per case), for chat and the GUI."""
+    summary = result["summary"]
+    lines = [f"{summary['passed']}/{summary['total']} passed in {summary['wall_time']:.3f}s"]
+    if summary.get("compile_failed"):
+        lines.append("Compilation failed:\n" + summary["compile_output"].strip())
+        return "\n".join(lines)
+    for row in result["cases"]:
+        timing = f"{row['wall_time'] * 1000:.1f} ms" if row.get("wall_time") is not None else "-"
+        line = f"  {row['status'].upper():<8} {row['name']:<20} {timing}"
+        if row["status"] == FAIL:
+            line += f"  expected {row['expected']!r}, got {row['actual']!r}"
+        elif row["status"] == ERROR:
+            # Last stderr line is usually the exception / error message
+            detail = (row.get("stderr") or row.get("error") or "").strip().splitlines()
+            line += f"  exit {row.get('return_code')}" + (f": {detail[-1][-120:]}" if detail else "")
+        lines.append(line)
+    return "\n".join(lines)
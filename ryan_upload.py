@@ -0,0 +1,114 @@
+import os
+import re
+import time
+import uuid
+import logging
+import tempfile
+from typing import Optional, Dict, Any, Iterable, Iterator, AsyncIterator, Tuple
+
+# --- Streaming Document Upload ---
+# /upload_document takes the file inside a JSON string, so the whole file is held (several
+# times over) by the browser, the JSON parser, pydantic and process_document's splitlines().
+# /upload_document/stream takes the raw file as the request body instead:
+#   - the body is written to a spool file under RYAN_UPLOAD_DIR chunk by chunk as it arrives,
+#     so server memory stays flat whatever the file size,
+#   - RYAN_UPLOAD_MAX_BYTES is enforced from Content-Length up front and again while reading
+#     (chunked bodies have no length),
+#   - text documents are parsed for "Key: Value" facts line by line with a generator over
+#     the spool file (lines longer than UPLOAD_MAX_LINE_CHARS are skipped, not buffered),
+#   - code files still go through process_document (the model needs the whole file), up to
+#     RYAN_UPLOAD_MAX_CODE_BYTES.
+# The response reports receive and processing throughput in MB/s.
+
+UPLOAD_DIR = os.getenv("RYAN_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "ryan_uploads"))
+UPLOAD_MAX_BYTES = int(os.getenv("RYAN_UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_MAX_CODE_BYTES = int(os.getenv("RYAN_UPLOAD_MAX_CODE_BYTES", str(2 * 1024 * 1024)))
+UPLOAD_MAX_LINE_CHARS = 64 * 1024
+UPLOAD_REPORTED_ACTIONS = 50 # Facts listed individually in the confirmation; the rest are counted
+
+# Same extension mapping as process_document
+DOCUMENT_LANGUAGES = {".py": "python", ".js": "javascript", ".java": "java", ".cpp": "cpp", ".cxx": "cpp", ".cc": "cpp", ".c": "c", ".h": "c"}
+_KEY_VALUE_RE = re.compile(r"^(.*?):\s*(.*?)$")
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds RYAN_UPLOAD_MAX_BYTES."""
+
+
+class SpooledUpload:
+    """An upload written to disk: path, size in bytes and how long receiving it took."""
+    def __init__(self, file_name: str, path: str, size: int, receive_seconds: float):
+        self.file_name = file_name
+        self.path = path
+        self.size = size
+        self.receive_seconds = receive_seconds
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(file_name: str, chunks: AsyncIterator[bytes], max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """Writes the body chunks to a spool file as they arrive. Raises UploadTooLarge (and removes the partial file)."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.upload")
+    size = 0
+    start = time.perf_counter()
+    try:
+        with open(path, "wb") as handle:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"The upload is larger than the {max_bytes // (1024 * 1024)} MB limit.")
+                handle.write(chunk)
+    except BaseException:
+        # Too large, client disconnected, or the server is shutting down
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return SpooledUpload(file_name, path, size, time.perf_counter() - start)
+
+
+def iter_lines(path: str) -> Iterator[Tuple[int, str]]:
+    """(line number, line) from a text file, read incrementally; over-long lines are skipped."""
+    with open(path, "r", encoding="utf-8", errors="replace", newline=None) as handle:
+        number = 0
+        while True:
+            line = handle.readline(UPLOAD_MAX_LINE_CHARS)
+            if not line:
+                return
+            number += 1
+            if len(line) >= UPLOAD_MAX_LINE_CHARS and not line.endswith("\n"):
+                # Drain the rest of the over-long line without keeping it
+                while True:
+                    rest = handle.readline(UPLOAD_MAX_LINE_CHARS)
+                    if not rest or rest.endswith("\n"):
+                        break
+                logging.debug(f"Skipping over-long line {number} of {path}.")
+                continue
+            yield number, line
+
+
+def iter_key_values(path: str) -> Iterator[Tuple[int, str, str]]:
+    """(line number, key, value) for each "Key: Value" line, like process_document's text parsing."""
+    return parse_key_values(iter_lines(path))
+
+
+def parse_key_values(numbered_lines: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str, str]]:
+    """The "Key: Value" facts of (line number, line) pairs."""
+    for number, line in numbered_lines:
+        line = line.strip()
+        if not line:
+            continue
+        match = _KEY_VALUE_RE.match(line)
+        if match:
+            key, value = match.group(1).strip(), match.group(2).strip()
+            if key and value:
+                yield number, key, value
+
+
+def throughput(size: int, seconds: float) -> Optional[float]:
+    """MB/s (None when too fast to measure)."""
+    return round(size / (1024 * 1024) / seconds, 3) if seconds > 0 else None
@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+import subprocess
+import multiprocessing
+from typing import Optional, List, Any
+
+# --- Worker Process Launcher ---
+# Starts a long-lived helper process running `<module>.<function>(conn, *args)`,
+# where conn is a multiprocessing Connection back to the parent.
+# Workers are started as a fresh `python -c` bootstrap rather than through
+# multiprocessing's spawn/forkserver, because those re-import the parent's
+# __main__ module in every worker (for `python ryan.py` that would re-run the
+# Firebase/Gemini setup in each one). Only the worker module itself is imported.
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class WorkerProcess:
+    """A helper process plus the parent's end of its Connection."""
+    def __init__(self, module_name: str, function_name: str, args: Optional[List[Any]] = None):
+        self.conn, child_conn = multiprocessing.Pipe()
+        child_fd = child_conn.fileno()
+        bootstrap = (
+            "import sys, json\n"
+            "from multiprocessing.connection import Connection\n"
+            f"import {module_name} as worker_module\n"
+            f"worker_module.{function_name}(Connection({child_fd}), *json.loads(sys.argv[1]))\n"
+        )
+        env = dict(os.environ)
+        env["PYTHONPATH"] = _REPO_DIR + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+        self.process = subprocess.Popen([sys.executable, "-c", bootstrap, json.dumps(args or [])],
+                                        pass_fds=[child_fd], env=env, stdin=subprocess.DEVNULL)
+        child_conn.close()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.is_alive():
+            self.process.kill()
+
+    def join(self, timeout: Optional[float] = None):
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass